@@ -8,13 +8,1279 @@ bl_info = {
 }
 
 import bpy
+import contextlib
+import csv
+import hashlib
+import io
+import json
 import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
 
 # =========================
-#   Helpers / Settings
+#   Code dùng chung
 # =========================
 
+# Profiler, ngân sách bộ nhớ, ghép kênh / resample, bộ lọc LOD, encoder, đọc header
+# ảnh, ghi file nguyên tử, NameIndex, manifest, kho blob, archive, pool / ExportRun,
+# hàm vẽ panel, kiểm tra preset (EXT_MAP, SOURCE_KEYWORDS, kênh) và xếp ô atlas được
+# sinh từ quick_export_core.py (dùng chung với Quick Unpack Pro). Phần đó dùng các
+# tên sau của add-on này:
+LOG_PREFIX = "[QEMP]"
+TMP_SUFFIX = ".qemp-tmp"
+MANIFEST_NAME = ".qemp_manifest.json"
+BLOB_DIR = ".qemp_blobs"
+# Bật "Đo thời gian" trong panel (hoặc --profile ở batch CLI): mỗi lần xuất ghi
+# qemp_profile.json + .csv vào thư mục xuất (archive: cạnh file archive).
+# Giai đoạn: plan.* (duyệt material, đọc header, hash), read_pixels, pack.*,
+# lod.filter, encode.<định dạng>, save.<định dạng> (image.save()), write,
+# makedirs, blob.link, manifest.save. Giai đoạn con nằm trong giai đoạn cha
+# (plan.hash nằm trong plan); thời gian của worker cộng dồn theo từng thread,
+# nên tổng có thể lớn hơn wall_seconds.
+PROFILE_NAME = "qemp_profile"
+
+def blob_key(job):
+    """Cùng loại job + cùng nội dung nguồn + cùng định dạng -> cùng file output"""
+    record = job["record"]
+    key = f"{job['kind']}|{record['hash']}|{record['format']}"
+    if record.get("encode"):
+        key += "|" + json.dumps(record["encode"], sort_keys=True)  # cùng nội dung, khác mức nén / thu gọn
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+# >>> quick_export_core: shared code, edit quick_export_core.py and run it to update >>>
+# --- quick_export_core section: base ---
+PIXEL_DTYPE = np.float32
+STRIP_ROWS = 256  # rows per strip for strip-wise passes: temporaries stay one strip big
+
+# ---------- Profiling ----------
+class _ProfileStage:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.started)
+
+NULL_STAGE = contextlib.nullcontext()
+
+class Profiler:
+    """Per-stage timings + counters of one export run, safe from worker threads.
+    Disabled: stage() is an empty context and count() does nothing."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start(False)
+
+    def start(self, enabled):
+        self.enabled = enabled
+        self.stages = {}  # name -> [calls, seconds]
+        self.counters = Counter()
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _ProfileStage(self, name) if self.enabled else NULL_STAGE
+
+    def add(self, name, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def report(self, **info):
+        """JSON-friendly: wall_seconds, `info`, stages (slowest first), counters"""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            return {
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                **info,
+                "stages": {name: {"calls": calls, "seconds": round(seconds, 6)} for name, (calls, seconds) in stages},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write(self, base, report):
+        """<base>.json + <base>.csv (kind, name, calls, value)"""
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        with open(base + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("kind", "name", "calls", "value"))
+            for name, stage in report["stages"].items():
+                writer.writerow(("stage", name, stage["calls"], stage["seconds"]))
+            for name, value in report["counters"].items():
+                writer.writerow(("counter", name, "", value))
+
+PROFILE = Profiler()  # the current run (one export at a time)
+
+# ---------- Memory budget ----------
+class MemoryBudget:
+    """Pixel memory held by the export itself: decoded buffers it loaded plus
+    snapshots / packed bytes waiting in the pool. limit_mb 0 = unlimited."""
+
+    def __init__(self, limit_mb=0):
+        self.limit = limit_mb * 1048576
+        self.in_use = 0
+        self.peak = 0
+
+    def fits(self, nbytes):
+        return not self.limit or self.in_use + nbytes <= self.limit
+
+    def acquire(self, nbytes):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def release(self, nbytes):
+        self.in_use -= nbytes
+
+def store_uint8(strip, out):
+    """Float 0..1 strip -> uint8 `out` (rounded, clamped); modifies `strip` in place"""
+    strip *= 255.0
+    strip += 0.5
+    np.clip(strip, 0.0, 255.0, out=strip)
+    out[...] = strip
+
+# --- quick_export_core section: resample ---
+# ---------- Channel packing / resampling ----------
+# taps = [(source channel, out (height, width) uint8, invert 1-x)]: every output
+# channel taken from one decoded source, written straight into `out`.
+def quantize_channels(pixels, channels, width, taps):
+    """Channels of a flat float buffer -> uint8. One pass in STRIP_ROWS strips:
+    every tap reads the source strip while it is still in cache, temporaries
+    stay one strip big."""
+    src = pixels.reshape(-1, width, channels)
+    height = src.shape[0]
+    tmp = np.empty((min(STRIP_ROWS, height), width), dtype=PIXEL_DTYPE)
+    with PROFILE.stage("pack.quantize"):
+        for y in range(0, height, STRIP_ROWS):
+            t = tmp[:min(STRIP_ROWS, height - y)]
+            for channel, out, invert in taps:
+                if invert:
+                    np.subtract(1.0, src[y:y + len(t), :, channel], out=t)
+                else:
+                    t[...] = src[y:y + len(t), :, channel]
+                store_uint8(t, out[y:y + len(t)])
+
+# separable resample filters: name -> (weight function, radius)
+def _box(x):
+    return ((x > -0.5) & (x <= 0.5)).astype(PIXEL_DTYPE)
+
+def _triangle(x):
+    return np.maximum(0.0, 1.0 - np.abs(x))
+
+def _lanczos3(x):
+    return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+RESAMPLE_FILTERS = {'BOX': (_box, 0.5), 'BILINEAR': (_triangle, 1.0), 'LANCZOS': (_lanczos3, 3.0)}
+
+def resample_weights(n_in, n_out, filter_name):
+    """Indices + weights (n_out, taps) for one axis. Downscaling widens the filter
+    by the scale (anti-aliased, like PIL); edges repeat the border pixel."""
+    fn, support = RESAMPLE_FILTERS[filter_name]
+    scale = n_in / n_out
+    fscale = max(scale, 1.0)
+    support *= fscale
+    centers = (np.arange(n_out) + 0.5) * scale
+    taps = int(np.ceil(2 * support)) + 1
+    idx = np.ceil(centers - support - 0.5).astype(np.int64)[:, None] + np.arange(taps)
+    weights = fn((idx + 0.5 - centers[:, None]) / fscale).astype(PIXEL_DTYPE)
+    # drop taps that weigh 0 on every row (each tap is one pass over the strip)
+    keep = weights.any(axis=0)
+    idx, weights = idx[:, keep], weights[:, keep]
+    total = weights.sum(axis=1, keepdims=True)
+    weights /= np.where(total == 0, 1.0, total)
+    return np.clip(idx, 0, n_in - 1), weights
+
+def resample_channels(pixels, channels, src_width, src_height, taps, filter_name='BILINEAR'):
+    """quantize_channels for a source (src_height, src_width) of another size than
+    `out`. Vertical then horizontal pass per STRIP_ROWS output rows, one gather +
+    multiply-add per filter tap; BOX at an integer factor only adds strided views."""
+    with PROFILE.stage("pack.resample"):
+        _resample_channels(pixels, channels, src_width, src_height, taps, filter_name)
+
+def _resample_channels(pixels, channels, src_width, src_height, taps, filter_name):
+    src = pixels.reshape(src_height, src_width, channels)
+    height, width = taps[0][1].shape
+    box = filter_name == 'BOX' and src_height % height == 0 and src_width % width == 0
+    if box:
+        fy, fx = src_height // height, src_width // width
+    else:
+        yi, yw = resample_weights(src_height, height, filter_name)
+        xi, xw = resample_weights(src_width, width, filter_name)
+        rows_buf = np.empty((2, min(STRIP_ROWS, height), src_width), dtype=PIXEL_DTYPE)
+    cols_buf = np.empty((2, min(STRIP_ROWS, height), width), dtype=PIXEL_DTYPE)
+    for y in range(0, height, STRIP_ROWS):
+        n = min(STRIP_ROWS, height - y)
+        for channel, out, invert in taps:
+            plane = src[..., channel]
+            strip, tap = cols_buf[0, :n], cols_buf[1, :n]
+            strip.fill(0.0)
+            if box:
+                for dy in range(fy):
+                    for dx in range(fx):
+                        strip += plane[y * fy + dy:(y + n) * fy:fy, dx::fx]
+                strip *= 1.0 / (fy * fx)
+            else:
+                rows, rows_tap = rows_buf[0, :n], rows_buf[1, :n]
+                rows.fill(0.0)
+                for k in range(yi.shape[1]):
+                    # plane is a strided view (one channel of RGBA): fancy indexing beats np.take(out=) here
+                    np.multiply(plane[yi[y:y + n, k]], yw[y:y + n, k, None], out=rows_tap)
+                    rows += rows_tap
+                for k in range(xi.shape[1]):
+                    np.take(rows, xi[:, k], axis=1, out=tap)
+                    tap *= xw[:, k]
+                    strip += tap
+            if invert:
+                np.subtract(1.0, strip, out=strip)
+            store_uint8(strip, out[y:y + n])
+
+# --- quick_export_core section: lod ---
+# ---------- LOD filters ----------
+# Each level is filtered from the previous one in linear space: sRGB data is
+# linearized first and re-encoded after; normal maps are filtered as [-1, 1]
+# vectors and renormalized.
+LOD_KAISER_RADIUS = 4  # source pixels on each side
+LOD_KAISER_BETA = 4.0
+
+def lod_sizes(width, height, levels, min_size=1):
+    """Sizes below the source: halved (rounded up) per level, stopping after
+    `levels` or once the long side drops below min_size"""
+    sizes = []
+    while len(sizes) < levels and max(width, height) > 1:
+        width, height = max(1, (width + 1) // 2), max(1, (height + 1) // 2)
+        if max(width, height) < min_size:
+            break
+        sizes.append((width, height))
+    return sizes
+
+def srgb_to_linear(x):
+    return np.where(x <= 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4).astype(PIXEL_DTYPE)
+
+def linear_to_srgb(x):
+    x = np.maximum(x, 0.0)
+    return np.where(x <= 0.0031308, x * 12.92, 1.055 * x ** (1 / 2.4) - 0.055).astype(PIXEL_DTYPE)
+
+SRGB_TO_LINEAR_U8 = srgb_to_linear(np.arange(256, dtype=PIXEL_DTYPE) / 255.0)
+NORMAL_FROM_U8 = np.arange(256, dtype=PIXEL_DTYPE) * (2.0 / 255.0) - 1.0
+LINEAR_TO_SRGB_BITS = 14  # linear -> sRGB uint8 through a 2^14 entry table: < 0.25 LSB off in the darks
+LINEAR_TO_SRGB_U8 = (linear_to_srgb(np.arange(2 ** LINEAR_TO_SRGB_BITS, dtype=PIXEL_DTYPE)
+                                    / (2 ** LINEAR_TO_SRGB_BITS - 1)) * 255.0 + 0.5).astype(np.uint8)
+
+def _lod_taps(filter_name):
+    """Offset pairs (source rows/columns) and weights for one output pixel. Its
+    centre sits between source offsets 0 and 1, so the filter is symmetric
+    around 0.5: add each pair first, multiply once."""
+    if filter_name == 'BOX':
+        return ((0, 1),), (0.5,)
+    r = LOD_KAISER_RADIUS
+    offsets = np.arange(1 - r, 1)
+    x = offsets - 0.5
+    window = np.i0(LOD_KAISER_BETA * np.sqrt(np.clip(1.0 - (x / r) ** 2, 0.0, None))) / np.i0(LOD_KAISER_BETA)
+    weights = np.sinc(x / 2.0) * window
+    return tuple((int(d), int(1 - d)) for d in offsets), tuple(weights / (2 * weights.sum()))
+
+def halve(arr, axis, filter_name):
+    """Halve `arr` along `axis`. Each tap pair is two strided views added, scaled
+    and accumulated; the few edge rows whose taps fall outside repeat the border."""
+    n = arr.shape[axis]
+    if n == 1:
+        return arr
+    m = (n + 1) // 2
+    shape = list(arr.shape)
+    shape[axis] = m
+    out = np.zeros(shape, dtype=PIXEL_DTYPE)
+    src, dst = np.moveaxis(arr, axis, 0), np.moveaxis(out, axis, 0)
+    tmp = np.empty_like(dst)
+    for (first, second), weight in zip(*_lod_taps(filter_name)):
+        lo = min(m, max(0, (1 - first) // 2))  # first output row with 2i + first >= 0
+        hi = min(m, (n - 1 - second) // 2 + 1)  # and 2i + second <= n - 1
+        if hi > lo:
+            np.add(src[2 * lo + first:2 * hi + first - 1:2], src[2 * lo + second:2 * hi + second - 1:2],
+                   out=tmp[lo:hi])
+            tmp[lo:hi] *= weight
+            dst[lo:hi] += tmp[lo:hi]
+        for i in (*range(lo), *range(max(hi, lo), m)):
+            dst[i] += weight * (src[min(max(2 * i + first, 0), n - 1)] + src[min(2 * i + second, n - 1)])
+    return out
+
+def lod_decode(base, mode):
+    """Source level (uint8, or float 0..1, shaped (h, w, c)) -> float32 to filter"""
+    rgb = min(base.shape[2], 3)
+    lut = {'SRGB': SRGB_TO_LINEAR_U8, 'NORMAL': NORMAL_FROM_U8 if rgb == 3 else None}.get(mode)
+    if base.dtype == np.uint8 and lut is not None:
+        work = lut[base]  # one table gather for every channel, alpha redone below
+        if base.shape[2] > rgb:
+            np.multiply(base[..., rgb:], 1.0 / 255.0, out=work[..., rgb:])
+        return work
+    if base.dtype == np.uint8:
+        work = base.astype(PIXEL_DTYPE)
+        work *= 1.0 / 255.0
+    else:
+        work = base.astype(PIXEL_DTYPE)
+        if mode == 'SRGB':
+            work[..., :rgb] = srgb_to_linear(work[..., :rgb])
+    if mode == 'NORMAL' and rgb == 3:
+        work[..., :3] *= 2.0
+        work[..., :3] -= 1.0
+    return work
+
+def lod_encode(work, mode, as_uint8):
+    """Inverse of lod_decode. Normals are renormalized in `work` too, so the
+    next level is filtered from unit vectors."""
+    rgb = min(work.shape[2], 3)
+    if mode == 'SRGB' and as_uint8:
+        out = np.empty(work.shape, dtype=np.uint8)
+        if work.shape[2] > rgb:
+            store_uint8(work[..., rgb:].copy(), out[..., rgb:])
+        scaled = work[..., :rgb] * (2 ** LINEAR_TO_SRGB_BITS - 1)
+        scaled += 0.5
+        np.clip(scaled, 0.0, 2 ** LINEAR_TO_SRGB_BITS - 1, out=scaled)
+        out[..., :rgb] = LINEAR_TO_SRGB_U8[scaled.astype(np.uint16)]
+        return out
+    out = work.copy()
+    if mode == 'NORMAL' and rgb == 3:
+        length = np.sqrt(np.einsum('...i,...i->...', work[..., :3], work[..., :3]))[..., None]
+        work[..., :3] /= np.maximum(length, 1e-8)
+        out[..., :3] = work[..., :3] * 0.5 + 0.5
+    elif mode == 'SRGB':
+        out[..., :rgb] = linear_to_srgb(work[..., :rgb])
+    if not as_uint8:
+        return np.clip(out, 0.0, None if mode == 'LINEAR' else 1.0, out=out)
+    np.clip(out, 0.0, 1.0, out=out)
+    out *= 255.0
+    out += 0.5
+    return out.astype(np.uint8)
+
+def lod_chain(base, levels, mode, filter_name, as_uint8=True):
+    """`levels` levels below `base` (h, w, c), each filtered from the previous one"""
+    with PROFILE.stage("lod.filter"):
+        work = lod_decode(base, mode)
+        chain = []
+        for _ in range(levels):
+            work = halve(halve(work, 0, filter_name), 1, filter_name)
+            chain.append(lod_encode(work, mode, as_uint8))
+    return chain
+
+def build_lod_chain(make_base, args, levels, mode, filter_name):
+    """Worker: uint8 source level = make_base(*args), then the whole chain"""
+    return lod_chain(make_base(*args), levels, mode, filter_name)
+
+# --- quick_export_core section: encode ---
+# ---------- Encoders (uint8 (h, w, c), rows bottom-up like Blender) ----------
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+def encode_png(img, level=6):
+    h, w, c = img.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[c]
+    rows = img[::-1].reshape(h, w * c)
+    # "Up" filter on every row: vectorized, and compresses textures better than
+    # "None". Filtered + compressed in STRIP_ROWS strips, so the temporary is
+    # one strip, not a second copy of the image.
+    comp = zlib.compressobj(level)
+    idat = []
+    filtered = np.empty((min(STRIP_ROWS, h), w * c + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    for y in range(0, h, STRIP_ROWS):
+        f = filtered[:min(STRIP_ROWS, h - y)]
+        if y == 0:
+            f[0, 1:] = rows[0]
+            np.subtract(rows[1:len(f)], rows[:len(f) - 1], out=f[1:, 1:])
+        else:
+            np.subtract(rows[y:y + len(f)], rows[y - 1:y + len(f) - 1], out=f[:, 1:])
+        idat.append(comp.compress(f))
+    idat.append(comp.flush())
+    ihdr = struct.pack(">IIBBBBB", w, h, 8, color_type, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", ihdr),
+        _png_chunk(b"IDAT", b"".join(idat)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+def encode_tga(img):
+    h, w, c = img.shape
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    if c == 1:
+        image_type, data = 3, img
+    else:
+        image_type, data = 2, img[..., [2, 1, 0, 3][:c]]
+    descriptor = 8 if c == 4 else 0  # alpha bits, bottom-left origin
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0, w, h, c * 8, descriptor)
+    return header + data.tobytes()
+
+def encode_tiff(img, level=6):
+    h, w, c = img.shape
+    strip = zlib.compress(img[::-1].tobytes(), level)
+    tags = [
+        (256, 4, 1, w),
+        (257, 4, 1, h),
+        (258, 3, c, None),                 # BitsPerSample
+        (259, 3, 1, 8),                    # Deflate
+        (262, 3, 1, 2 if c >= 3 else 1),   # RGB / BlackIsZero
+        (273, 4, 1, None),                 # StripOffsets
+        (277, 3, 1, c),
+        (278, 4, 1, h),
+        (279, 4, 1, len(strip)),
+        (284, 3, 1, 1),
+    ]
+    if c in (2, 4):
+        tags.append((338, 3, 1, 2))        # ExtraSamples: unassociated alpha
+    ifd_size = 2 + 12 * len(tags) + 4
+    bits_offset = 8 + ifd_size
+    bits = struct.pack(f"<{c}H", *([8] * c)) if c > 2 else b""
+    strip_offset = bits_offset + len(bits)
+
+    entries = []
+    for tag, typ, count, value in tags:
+        if tag == 258:
+            if c > 2:
+                entries.append(struct.pack("<HHII", tag, typ, count, bits_offset))
+            else:
+                entries.append(struct.pack("<HHI", tag, typ, count) + struct.pack("<2H", 8, 8 if c == 2 else 0))
+            continue
+        if tag == 273:
+            value = strip_offset
+        if typ == 3:
+            entries.append(struct.pack("<HHIH2x", tag, typ, count, value))
+        else:
+            entries.append(struct.pack("<HHII", tag, typ, count, value))
+    ifd = struct.pack("<H", len(tags)) + b"".join(entries) + struct.pack("<I", 0)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + bits + strip
+
+BMP_GRAY_PALETTE = bytes(v for i in range(256) for v in (i, i, i, 0))  # BGR0 entries
+
+def encode_bmp(img):
+    """BI_RGB, bottom-up: 1 channel as 8-bit with a gray palette, RGB(A) as
+    24 / 32-bit BGR(A). Gray + alpha has no BMP form and is widened to BGRA."""
+    h, w, c = img.shape
+    palette = BMP_GRAY_PALETTE if c == 1 else b""
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    data = img[..., [0] if c == 1 else [2, 1, 0, 3][:c]].reshape(h, w * c)
+    pad = (-w * c) % 4
+    if pad:
+        data = np.pad(data, ((0, 0), (0, pad)))
+    data = data.tobytes()
+    offset = 14 + 40 + len(palette)
+    header = b"BM" + struct.pack("<IHHI", offset + len(data), 0, 0, offset)
+    info = struct.pack("<IiiHHIIiiII", 40, w, h, 1, c * 8, 0, len(data), 2835, 2835, len(palette) // 4, 0)
+    return header + info + palette + data
+
+ENCODERS = {
+    'PNG': encode_png,
+    'TARGA': encode_tga,
+    'TIFF': encode_tiff,
+    'BMP': encode_bmp,
+}
+
+def encode_image(fmt, img, level=None):
+    """level: zlib level for PNG / TIFF, None = encoder default"""
+    with PROFILE.stage(f"encode.{fmt}"):
+        if level is not None:
+            return ENCODERS[fmt](img, level)
+        return ENCODERS[fmt](img)
+
+# ---------- Image headers ----------
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def header_size(data, fmt=None):
+    """(width, height, channels) from a PNG / JPEG / BMP header (found by their
+    magic) or a TGA header (fmt 'TARGA': TGA has no magic), None if unknown.
+    Avoids image.size, which decodes the whole image."""
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            width, height = struct.unpack(">II", data[16:24])
+            return width, height, {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(data[25], 4)
+        if data[:3] == b'\xff\xd8\xff':
+            i = 2
+            while i + 10 <= len(data) and data[i] == 0xFF:
+                marker = data[i + 1]
+                if marker == 0xFF:
+                    i += 1
+                    continue
+                if marker in JPEG_SOF:
+                    height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                    return width, height, data[i + 9]
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+            return None
+        if data[:2] == b'BM':
+            width, height = struct.unpack("<ii", data[18:26])
+            return width, abs(height), max(1, struct.unpack("<H", data[28:30])[0] // 8)
+        if fmt == 'TARGA':
+            width, height = struct.unpack("<HH", data[12:16])
+            return width, height, max(1, data[16] // 8)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+# --- quick_export_core section: output ---
+# ---------- Output files (atomic, collision-aware) ----------
+# Every output is written to <name><TMP_SUFFIX> next to its target and moved in
+# place with os.replace: a crash or error leaves a temp file behind, never a
+# truncated output. os.replace also swaps an earlier output that is a
+# hardlink / symlink into the blob store without writing through it.
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@contextlib.contextmanager
+def atomic_file(filepath, buffering=-1):
+    """open(filepath, 'wb') that only replaces filepath once the block completes"""
+    tmp = filepath + TMP_SUFFIX
+    try:
+        with open(tmp, 'wb', buffering=buffering) as f:
+            yield f
+        os.replace(tmp, filepath)
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+
+def write_atomic(filepath, data):
+    with atomic_file(filepath) as f:
+        f.write(data)
+    return len(data)
+
+def write_output(target, data):
+    """Write encoded bytes to a file path or an ArchiveEntry, returns bytes written"""
+    PROFILE.count("bytes_written", len(data))
+    with PROFILE.stage("write"):
+        if isinstance(target, ArchiveEntry):
+            return target.write(data)
+        return write_atomic(target, data)
+
+class NameIndex:
+    """File names of every output folder, listed once with os.scandir.
+    Existence, size and collision checks are looked up in memory instead of
+    one stat per file (a round-trip each on a network share)."""
+
+    def __init__(self, on_disk=True):
+        self.on_disk = on_disk  # False (archive): only avoid names used by this run
+        self.folders = {}  # folder -> {name: DirEntry}, None if it does not exist
+        self.reserved = set()  # paths used by this run
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def listing(self, folder):
+        key = self.key(folder)
+        if key not in self.folders:
+            entries = None
+            if self.on_disk:
+                PROFILE.count("scandir")
+                try:
+                    with os.scandir(folder) as it:
+                        entries = {os.path.normcase(entry.name): entry for entry in it}
+                except OSError:
+                    pass
+            self.folders[key] = entries
+        return self.folders[key]
+
+    def entry(self, path):
+        entries = self.listing(os.path.dirname(path))
+        return entries.get(os.path.normcase(os.path.basename(path))) if entries else None
+
+    def exists(self, path):
+        return self.entry(path) is not None
+
+    def size(self, path):
+        """Size when listed (cached by scandir on Windows), None if missing"""
+        entry = self.entry(path)
+        try:
+            return entry.stat().st_size if entry is not None else None
+        except OSError:
+            return None
+
+    def reserve(self, path):
+        self.reserved.add(self.key(path))
+
+    def unique(self, path, reusable=None):
+        """`path`, or `path_001`, `_002`... not used by this run and not on disk,
+        except files reusable(path) allows to overwrite (the add-on's own outputs)"""
+        base, ext = os.path.splitext(path)
+        candidate, c = path, 1
+        while self.key(candidate) in self.reserved or (
+                self.exists(candidate) and not (reusable and reusable(candidate))):
+            candidate = f"{base}_{c:03d}{ext}"
+            c += 1
+        self.reserve(candidate)
+        return candidate
+
+    def missing_folders(self, folders):
+        """Folders of `folders` that do not exist yet (listed ones are skipped)"""
+        return sorted(folder for folder in set(folders) if self.listing(folder) is None)
+
+    def created(self, folder):
+        self.folders[self.key(folder)] = {}
+
+# ---------- Manifest (incremental export) ----------
+MANIFEST_VERSION = 1
+
+class ExportManifest:
+    """Manifest in the export root: output file -> source, content hash, format
+    and settings. Unchanged outputs are skipped on the next run. `names` indexes
+    the output folders (on_disk=False: archive output, files on disk don't matter)."""
+
+    def __init__(self, root, incremental=True, on_disk=True):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.incremental = incremental
+        self.entries = {}
+        self.skipped = 0
+        self.names = NameIndex(on_disk)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        self.by_key = None  # (record key, ext) -> previous output, built on first previous_path()
+
+    def relpath(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def claim(self, filepath):
+        """Collision-free output path: overwrites an earlier output listed in the
+        manifest, gets _001, _002... next to foreign files or this run's outputs"""
+        return self.names.unique(filepath, lambda path: self.relpath(path) in self.entries)
+
+    def previous_path(self, key, ext):
+        """Previous output of record `key` if it is still on disk, so a rerun
+        overwrites its own file (even a _001 one). Also used without incremental."""
+        if self.by_key is None:
+            self.by_key = {(tuple(e.get("key", ())), os.path.splitext(rel)[1]): rel
+                           for rel, e in self.entries.items()}
+        rel = self.by_key.get((tuple(key), ext))
+        if not rel:
+            return None
+        path = os.path.join(self.root, *rel.split("/"))
+        return path if self.names.exists(path) else None
+
+    def is_current(self, filepath, record):
+        """Output on disk still matches `record` (nothing counted)"""
+        if not self.incremental:
+            return False
+        entry = self.entries.get(self.relpath(filepath))
+        if not entry or any(entry.get(k) != v for k, v in record.items()):
+            return False
+        return self.names.size(filepath) == entry.get("bytes")
+
+    def skip(self, filepath, record):
+        if not self.is_current(filepath, record):
+            return False
+        self.skipped += 1
+        return True
+
+    def record(self, filepath, record, size=None):
+        entry = dict(record)
+        entry["bytes"] = os.path.getsize(filepath) if size is None else size
+        self.entries[self.relpath(filepath)] = entry
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+# ---------- Content-addressed blobs (dedupe) ----------
+FICLONE = 0x40049409  # linux/fs.h
+
+def _reflink(src, dst):
+    import fcntl  # ImportError on Windows -> next mode
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+
+def _symlink(src, dst):
+    os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+# tried in order; a mode that fails once is not retried in the same run
+LINKERS = (
+    ("hardlink", os.link),
+    ("reflink", _reflink),
+    ("symlink", _symlink),
+    ("copy", shutil.copyfile),
+)
+
+class BlobStore:
+    """Content-addressed store in <export root>/<BLOB_DIR>. Each unique output
+    is encoded and written once, every output using it is linked to the blob."""
+
+    def __init__(self, root, enabled=True):
+        self.dir = os.path.join(root, BLOB_DIR)
+        self.enabled = enabled
+        self.modes = [name for name, _ in LINKERS]  # still usable on this filesystem
+        self.linked = Counter()  # mode -> outputs
+        self.deduped = 0  # extra outputs of a group (the carrier job counts the first)
+        self.saved = 0  # bytes not encoded / written again
+
+    def path(self, key, ext):
+        return os.path.join(self.dir, key + ext)
+
+    def link(self, blob, dst):
+        """Make dst a link (or copy) of blob, replacing dst atomically"""
+        tmp = dst + ".qlink"
+        for name, fn in LINKERS:
+            if name not in self.modes:
+                continue
+            try:
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                fn(blob, tmp)
+                os.replace(tmp, dst)
+                self.linked[name] += 1
+                return name
+            except (OSError, ImportError) as e:
+                if name == "copy":
+                    raise
+                print(f"{LOG_PREFIX} Không dùng được {name} ({e}), thử cách khác")
+                self.modes.remove(name)
+        raise OSError(f"Không link được {blob} -> {dst}")
+
+    def publish(self, job, manifest):
+        """Main thread, after the carrier job: move the finished blob in place
+        and link every output of the group to it (ExportRun created the folders)"""
+        blob = job["blob"]
+        reused = job["action"] == "link"
+        if not reused:
+            os.replace(blob + ".part", blob)
+        size = os.path.getsize(blob)
+        for i, (path, record) in enumerate(job["links"]):
+            with PROFILE.stage("blob.link"):
+                self.link(blob, path)
+            manifest.record(path, dict(record, blob=manifest.relpath(blob)), size)
+            if i:
+                self.deduped += 1
+            if i or reused:
+                self.saved += size
+
+    def prune(self, manifest):
+        """Drop blobs no manifest entry points to any more, and leftover .part files"""
+        if not os.path.isdir(self.dir):
+            return
+        used = {entry.get("blob") for entry in manifest.entries.values()}
+        for entry in os.scandir(self.dir):
+            if manifest.relpath(entry.path) not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"{LOG_PREFIX} Không xoá được blob thừa {entry.path}: {e}")
+
+def dedupe_plan(plan, store, names, reuse=True):
+    """Group jobs with identical output (blob_key). The first job of a group (the
+    carrier) writes one blob, the others become "dedupe" and are linked to it.
+    Content whose blob survives from an earlier run is only linked ("link").
+    reuse=False (archive output): groups only, blobs on disk are ignored."""
+    if not store.enabled:
+        return
+    groups = {}
+    for job in plan:
+        # LOD jobs write several files from one decode: not shared
+        if job["action"] != "skip" and not job.get("lods"):
+            groups.setdefault(blob_key(job), []).append(job)
+    for key, jobs in groups.items():
+        carrier = jobs[0]
+        blob = store.path(key, os.path.splitext(carrier["path"])[1])
+        reused = reuse and names.exists(blob)
+        if len(jobs) < 2 and not reused:
+            continue  # unique content: write it directly
+        carrier["blob"] = blob
+        carrier["links"] = [(job["path"], job["record"]) for job in jobs]
+        if reused:
+            carrier["action"] = "link"
+            carrier["memory"] = 0
+        for job in jobs[1:]:
+            job["action"] = "dedupe"
+
+# ---------- Archive output (zip / tar.zst) ----------
+ARCHIVE_EXT = {'ZIP': ".zip", 'TAR_ZST': ".tar.zst"}
+STORED_EXTS = {".png", ".jpg"}  # already compressed: deflating again only costs time
+ZSTD_MISSING = "Xuất .tar.zst cần package 'zstandard' (pip install zstandard), hoặc chọn .zip"
+
+def archive_path(export_dir, kind):
+    """export dir "//maps/" -> archive "//maps.zip" next to it"""
+    return export_dir.rstrip("/\\") + ARCHIVE_EXT[kind]
+
+def zstd_module():
+    """`zstandard` package, else Python 3.14+ `compression.zstd`, else None"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        pass
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        return None
+
+def zstd_stream_writer(fileobj, level):
+    """zstd compressing writer over fileobj (multi-threaded with `zstandard`)"""
+    zstd = zstd_module()
+    if zstd is None:
+        raise RuntimeError(ZSTD_MISSING)
+    if hasattr(zstd, "ZstdCompressor"):
+        return zstd.ZstdCompressor(level=level, threads=-1).stream_writer(fileobj)
+    return zstd.ZstdFile(fileobj, "w", level=level)
+
+class ArchiveWriter:
+    """Streams outputs into one zip / tar.zst instead of the export dir.
+    Entries keep the folder layout (Material/Material_MapType.ext). Workers add
+    encoded bytes under a lock; nothing is written to disk besides the archive
+    (<archive>.part until close()). Opened on the first entry, so dry runs and
+    empty exports create no file."""
+
+    def __init__(self, root, kind, level):
+        self.root = root
+        self.kind = kind
+        self.level = level
+        self.path = archive_path(root, kind)
+        self.lock = threading.Lock()
+        self.zip = self.tar = self.stream = None
+        self.entries = 0
+
+    def name(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def open(self):
+        try:
+            with PROFILE.stage("makedirs"):
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        except OSError as e:
+            raise OSError(f"Không tạo được thư mục cho archive: {e}") from e
+        tmp = self.path + ".part"
+        if self.kind == 'ZIP':
+            level = min(self.level, 9)
+            self.zip = zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED,
+                                       compresslevel=level or None)
+        else:
+            self.stream = zstd_stream_writer(open(tmp, "wb"), max(self.level, 1))
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add(self, names, data):
+        """One payload under one or more entry names (dedupe group).
+        tar stores the extra names as hardlinks, zip repeats the data."""
+        with self.lock:
+            if self.zip is None and self.tar is None:
+                self.open()
+            now = time.time()
+            for i, name in enumerate(names):
+                if self.zip is not None:
+                    stored = os.path.splitext(name)[1].lower() in STORED_EXTS
+                    self.zip.writestr(name, data, compress_type=zipfile.ZIP_STORED if stored else None)
+                    continue
+                info = tarfile.TarInfo(name)
+                info.mtime = now
+                info.mode = 0o644
+                if i:
+                    info.type = tarfile.LNKTYPE
+                    info.linkname = names[0]
+                    self.tar.addfile(info)
+                else:
+                    info.size = len(data)
+                    self.tar.addfile(info, io.BytesIO(data))
+            self.entries += len(names)
+        return len(data)
+
+    def close(self):
+        """Finish the archive and move it into place (no-op if never opened)"""
+        with self.lock:
+            if self.zip is not None:
+                self.zip.close()
+            elif self.tar is not None:
+                self.tar.close()
+                self.stream.close()
+            else:
+                return
+            os.replace(self.path + ".part", self.path)
+
+class ArchiveEntry:
+    """Write target of one job in archive mode: the output name plus the
+    names of its dedupe group"""
+
+    def __init__(self, archive, names):
+        self.archive = archive
+        self.names = names
+        self.size = 0
+
+    def write(self, data):
+        self.size = self.archive.add(self.names, data)
+        return self.size
+
+# --- quick_export_core section: run ---
+# ---------- Export pool ----------
+class ExportPool:
+    """Main thread snapshots pixels / packed bytes, worker threads encode + write.
+    Results are collected in submit order so `failed` and the reports stay
+    deterministic. `kind` counts successful jobs ("encoded", "copied", "linked")."""
+
+    def __init__(self, workers=0, budget=None, operator=None, failed=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix=LOG_PREFIX.strip("[]").lower())
+        self.budget = budget or MemoryBudget()
+        self.operator = operator  # reports every file written / failed when set
+        self.pending = deque()  # (label, filepath, kind, future, on_done, weight, memory)
+        self.failed = [] if failed is None else failed
+        self.counts = Counter()  # successful jobs per kind
+        self.done_weight = 0  # estimated bytes of collected jobs (progress)
+        self.bytes_written = 0
+
+    def submit(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0, memory=0):
+        """`memory`: bytes the queued buffer holds until the job is collected"""
+        self.budget.acquire(memory)
+        self.pending.append((label, filepath, kind, self.executor.submit(fn, *args), on_done, weight, memory))
+        # bound queued snapshots so memory does not grow with image count
+        while len(self.pending) > self.workers * 2:
+            self.collect_one()
+
+    def run_inline(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0):
+        """Main-thread-only job (image.save()), queued to keep report order"""
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        self.pending.append((label, filepath, kind, fut, on_done, weight, 0))
+
+    def has_capacity(self):
+        return len(self.pending) < self.workers * 2
+
+    def collect_ready(self):
+        """Collect finished jobs at the head of the queue without blocking"""
+        while self.pending and self.pending[0][3].done():
+            self.collect_one()
+
+    def collect_one(self):
+        label, filepath, kind, fut, on_done, weight, memory = self.pending.popleft()
+        self.done_weight += weight
+        self.budget.release(memory)
+        try:
+            written = fut.result()
+            if on_done:
+                on_done()
+            self.counts[kind] += 1
+            # archive entries have no file of their own: use the size the job reported
+            self.bytes_written += written if isinstance(written, int) else os.path.getsize(filepath)
+            if self.operator:
+                self.operator.report({'INFO'}, f"✅ Xuất {label}: {filepath}")
+        except Exception as e:
+            self.fail(label, filepath, e)
+
+    def fail(self, label, filepath, error):
+        self.failed.append((filepath, str(error)))
+        print(f"{LOG_PREFIX} Lỗi khi lưu {label} -> {filepath}: {error}")
+        print("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+        if self.operator:
+            self.operator.report({'ERROR'}, f"❌ Lỗi khi lưu {label}: {filepath} ({error})")
+
+    def close(self):
+        while self.pending:
+            self.collect_one()
+        self.executor.shutdown(wait=True)
+
+# ---------- Profile report ----------
+def finish_profile(base, **info):
+    """Write the report of the run that just ended (when enabled); the panel shows it"""
+    if not PROFILE.enabled:
+        return None
+    report = PROFILE.report(**info)
+    try:
+        PROFILE.write(base, report)
+        print(f"{LOG_PREFIX} Profiling {report['wall_seconds']:.2f} s → {base}.json / .csv")
+    except OSError as e:
+        print(f"{LOG_PREFIX} Không ghi được report profiling {base}: {e}")
+    EXPORT_STATE["profile"] = report
+    return report
+
+def dry_run_profile():
+    """A dry run writes nothing: its report (plan stages only) is only shown in the panel"""
+    if not PROFILE.enabled:
+        return None
+    EXPORT_STATE["profile"] = PROFILE.report(dry_run=True)
+    return EXPORT_STATE["profile"]
+
+# ---------- Execution (blocking, or stepped from a modal timer) ----------
+MODAL_TIMER_SECONDS = 0.05
+MODAL_BATCH = 4  # jobs queued per timer tick
+MODAL_TICK_SECONDS = 0.04  # main-thread budget per tick (snapshots, image.save())
+
+# run: the modal export in progress (the panel draws its progress)
+# profile: profile report of the last export (the panel draws a summary)
+EXPORT_STATE = {"run": None, "profile": None}
+
+def safe_makedirs(path):
+    """Try create directory, returns (success, used_path, message)"""
+    try:
+        with PROFILE.stage("makedirs"):
+            os.makedirs(path, exist_ok=True)
+        return True, path, ""
+    except Exception as e:
+        # detect probable network path issue on Windows
+        msg = str(e).lower()
+        winerr = getattr(e, "winerror", None)
+        network_issue = (winerr == 53) or ("network path" in msg) or path.startswith('\\\\')
+        return False, path, str(e) + (" (network?)" if network_issue else "")
+
+def job_files(job):
+    """Files a job writes: its output + one per LOD level"""
+    return 1 + len(job.get("lods", ()))
+
+def job_bytes(job):
+    return job["bytes"] + sum(lod["bytes"] for lod in job.get("lods", ()))
+
+def execution_order(plan):
+    """Jobs to run, largest first so big encodes start early and the tail is
+    made of small ones (stable: ties keep plan order)"""
+    return sorted((job for job in plan if job["action"] not in ("skip", "dedupe")), key=lambda job: -job["bytes"])
+
+class ExportRun:
+    """Runs a plan job by job, largest first. The blocking export drives it to
+    the end in one go; the modal operator calls step() from a timer instead.
+    Each add-on subclasses it: queue(job) hands one job to its run_job()."""
+
+    # result() keys copied into the profile report
+    profile_keys = ("exported", "deduped", "skipped", "cancelled", "bytes_written", "peak_memory")
+
+    def __init__(self, plan, manifest, workers=0, memory_mb=0, store=None, archive=None, operator=None,
+                 failed=None):
+        self.plan = plan
+        self.jobs = deque(execution_order(plan))
+        self.total = sum(job_files(job) for job in self.jobs)
+        self.total_bytes = sum(job_bytes(job) for job in self.jobs)
+        self.manifest = manifest
+        self.export_dir = manifest.root
+        self.store = store or BlobStore(self.export_dir, enabled=False)
+        self.archive = archive  # ArchiveWriter, or None to write into export_dir
+        self.budget = MemoryBudget(memory_mb)
+        self.pool = ExportPool(workers, self.budget, operator, failed)
+        self.failed = self.pool.failed
+        self.folders = None  # output folder -> makedirs error, filled before the first write
+        self.dropped = 0  # jobs that never reached the pool
+        self.cancelled = False
+        self.started = time.perf_counter()
+        self.profile = None  # profile report, after finish()
+        self.info = {}  # added to the profile report and the result (atlas: its summary)
+
+    def queue(self, job):
+        """Hand one planned job to the pool"""
+        raise NotImplementedError
+
+    def next_job(self, wait=True):
+        """Largest queued job that fits the memory budget. Waits for queued
+        writes to release memory (wait=True) or returns None (modal tick).
+        A job bigger than the whole budget runs once nothing else is in flight."""
+        while True:
+            for i, job in enumerate(self.jobs):
+                if self.budget.fits(job["memory"]):
+                    del self.jobs[i]
+                    return job
+            if not self.pool.pending:
+                return self.jobs.popleft()
+            if not wait:
+                return None
+            self.pool.collect_one()
+
+    def run_next(self, wait=True):
+        """Queue the next job (blocks only when the pool is full or over budget).
+        Returns False when a modal tick has to wait for memory instead."""
+        job = self.next_job(wait)
+        if job is None:
+            return False
+        if self.folders is None:
+            self.create_folders()
+        if os.path.dirname(job.get("blob") or job["path"]) in self.folders:
+            self.dropped += 1  # reported once by create_folders
+            return True
+        try:
+            self.queue(job)
+        except Exception as e:
+            self.dropped += 1
+            self.pool.fail(job["label"], job["path"], e)
+        return True
+
+    def create_folders(self):
+        """makedirs every output folder of the plan in one pass before the first
+        write (folders the name index could list already exist)"""
+        self.folders = {}
+        if self.archive is not None:
+            return
+        wanted = set()
+        for job in self.plan:
+            if job["action"] == "skip":
+                continue
+            wanted.add(os.path.dirname(job.get("blob") or job["path"]))
+            wanted.update(os.path.dirname(path) for path, _ in job.get("links", ()))
+        names = self.manifest.names
+        for folder in names.missing_folders(wanted):
+            ok, _, msg = safe_makedirs(folder)
+            if ok:
+                names.created(folder)
+                continue
+            self.folders[folder] = msg
+            self.failed.append((folder, f"Không tạo được thư mục: {msg}"))
+            print(f"{LOG_PREFIX} Không tạo được thư mục {folder}: {msg}")
+
+    def step(self, max_jobs=MODAL_BATCH, budget=MODAL_TICK_SECONDS):
+        """Queue a bounded batch without waiting on workers.
+        Returns True once every job is written."""
+        deadline = time.perf_counter() + budget
+        self.pool.collect_ready()
+        queued = 0
+        while self.jobs and queued < max_jobs and self.pool.has_capacity() and time.perf_counter() < deadline:
+            if not self.run_next(wait=False):
+                break
+            queued += 1
+        self.pool.collect_ready()
+        return not self.jobs and not self.pool.pending
+
+    def cancel(self):
+        """Drop jobs not started yet. Writes already queued still finish and
+        are recorded, so the export dir + manifest stay consistent."""
+        self.cancelled = True
+        self.jobs.clear()
+
+    def progress(self):
+        done = self.total - sum(job_files(job) for job in self.jobs) - len(self.pool.pending)
+        if self.total_bytes:
+            fraction = self.pool.done_weight / self.total_bytes
+        else:
+            fraction = done / self.total if self.total else 1.0
+        elapsed = time.perf_counter() - self.started
+        eta = elapsed * (1.0 - fraction) / fraction if fraction > 0 else None
+        return {
+            "done": done,
+            "total": self.total,
+            "fraction": min(fraction, 1.0),
+            "bytes_written": self.pool.bytes_written,
+            "eta": eta,
+        }
+
+    def finish(self):
+        """Wait for queued writes, then close the archive or save the manifest,
+        and write the profile report"""
+        try:
+            self.pool.close()
+        finally:
+            if self.archive is not None:
+                try:
+                    self.close_archive()
+                finally:
+                    self.write_profile()
+            else:
+                self.close_folder()
+
+    def close_archive(self):
+        try:
+            self.archive_extras()
+            with PROFILE.stage("archive.close"):
+                self.archive.close()
+        except (OSError, RuntimeError, zipfile.BadZipFile, tarfile.TarError) as e:
+            self.failed.append((self.archive.path, str(e)))
+            print(f"{LOG_PREFIX} Không đóng được archive {self.archive.path}: {e}")
+
+    def archive_extras(self):
+        """Entries added after the last job, right before the archive is closed"""
+
+    def close_folder(self):
+        """Drop unused blobs, save the manifest, then write the profile report"""
+        try:
+            try:
+                os.makedirs(self.export_dir, exist_ok=True)
+                self.store.prune(self.manifest)
+                with PROFILE.stage("manifest.save"):
+                    self.manifest.save()
+            except OSError as e:
+                print(f"{LOG_PREFIX} Không ghi được manifest {self.manifest.path}: {e}")
+        finally:
+            self.write_profile()
+
+    def profile_base(self):
+        if self.archive is not None:
+            return f"{self.archive.path}.profile"
+        return os.path.join(self.export_dir, PROFILE_NAME)
+
+    def write_profile(self):
+        result = self.result()
+        self.profile = finish_profile(
+            self.profile_base(), export_dir=self.export_dir, workers=self.pool.workers, jobs=self.total,
+            **{key: result[key] for key in self.profile_keys}, failed=len(self.failed), **self.info)
+
+    def result(self):
+        deduped = self.store.deduped + self.pool.counts["linked"]  # outputs served from blobs
+        return {
+            "exported": sum(self.pool.counts.values()) + self.store.deduped,
+            "deduped": deduped,
+            "dedupe_saved_bytes": self.store.saved,
+            "link_modes": dict(self.store.linked),
+            "skipped": self.manifest.skipped,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "bytes_written": self.pool.bytes_written,
+            "estimated_bytes": self.total_bytes,
+            "peak_memory": self.budget.peak,
+            "export_dir": self.export_dir,
+            "archive": self.archive.path if self.archive is not None and self.archive.entries else None,
+            "profile": self.profile,
+            **self.info,
+        }
+
+# ---------- Panel helpers ----------
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def tag_redraw_panels(context):
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+PROFILE_PANEL_STAGES = 6
+PROFILE_PANEL_COUNTERS = ("images", "bytes_read", "bytes_written", "scandir")
+
+def draw_profile(box, report):
+    box.label(text=f"Lần xuất gần nhất: {report['wall_seconds']:.2f} s", icon='TIME')
+    col = box.column(align=True)
+    for name, stage in list(report["stages"].items())[:PROFILE_PANEL_STAGES]:
+        row = col.row()
+        row.label(text=name)
+        row.label(text=f"{stage['seconds']:.3f} s × {stage['calls']}")
+    counters = report["counters"]
+    col = box.column(align=True)
+    for name in PROFILE_PANEL_COUNTERS:
+        if name in counters:
+            value = counters[name]
+            row = col.row()
+            row.label(text=name)
+            row.label(text=f"{value / 1048576:.1f} MB" if name.startswith("bytes") else str(value))
+
+# --- quick_export_core section: presets ---
+# ---------- Export presets (formats, source keywords, channel specs) ----------
 EXT_MAP = {
     "PNG": "png",
     "JPEG": "jpg",
@@ -23,37 +1289,284 @@ EXT_MAP = {
     "TIFF": "tif",
 }
 
+# source name -> keywords that find its image in a material (image / node name, label)
+SOURCE_KEYWORDS = {
+    "BaseColor": ("base", "albedo", "diffuse"),
+    "Normal": ("normal",),
+    "Roughness": ("rough",),
+    "Metallic": ("metal",),
+    "AO": ("ao", "occlusion", "ambient"),
+    "Emissive": ("emis", "emit"),
+    "Height": ("height", "disp", "displacement"),
+    "Opacity": ("alpha", "opacity", "trans"),
+    "Specular": ("spec",),
+    "DetailMask": ("detail",),
+}
+
+CHANNEL_INDEX = {"r": 0, "g": 1, "b": 2, "a": 3}
+
+def parse_channel(spec):
+    """Kênh trong preset -> (nguồn, kênh nguồn, đảo 1-x, hằng số):
+    0.5 -> (None, 0, False, 0.5), "1-Normal.g" -> ("Normal", 1, True, None)"""
+    if isinstance(spec, (int, float)):
+        if not 0.0 <= spec <= 1.0:
+            raise ValueError(f"hằng số kênh phải trong 0..1: {spec!r}")
+        return None, 0, False, float(spec)
+    text = spec.strip()
+    invert = text.startswith("1-")
+    source, _, channel = text[2:].strip().partition(".") if invert else text.partition(".")
+    if not source or (channel and channel.lower() not in CHANNEL_INDEX):
+        raise ValueError(f"kênh không hợp lệ: {spec!r}")
+    return source, CHANNEL_INDEX.get(channel.lower(), 0), invert, None
+
+def validate_preset(key, preset):
+    """Check one preset read from a file (ValueError naming the preset and the
+    output index), returns the preset itself. Output sources must be known:
+    SOURCE_KEYWORDS or the preset's own "sources"."""
+    if preset.get("image_format", "PNG") not in EXT_MAP:
+        raise ValueError(f"preset {key}: image_format không hỗ trợ: {preset['image_format']!r}")
+    known = set(SOURCE_KEYWORDS) | set(preset.get("sources", {}))
+    suffixes = set()
+    for i, output in enumerate(preset.get("outputs", ())):
+        suffix = output.get("suffix")
+        where = f"preset {key} output {i} ({suffix})"
+        if not suffix or suffix in suffixes:
+            raise ValueError(f"{where}: thiếu 'suffix' hoặc trùng")
+        suffixes.add(suffix)
+        if "source" in output:
+            sources = [output["source"]]
+        else:
+            channels = output.get("channels") or ()
+            if len(channels) not in (3, 4):
+                raise ValueError(f"{where}: cần 'source' hoặc 3-4 kênh (R, G, B[, A])")
+            try:
+                specs = [parse_channel(spec) for spec in channels]
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}") from None
+            sources = [source for source, _, _, constant in specs if constant is None]
+        for source in sources:
+            if not isinstance(source, str) or source not in known:
+                raise ValueError(f"{where}: không có nguồn {source!r} (có: {', '.join(sorted(known))}; "
+                                 "thêm nguồn mới trong \"sources\")")
+    for name, value in preset.get("fallback", {}).items():
+        if not 0.0 <= float(value) <= 1.0:
+            raise ValueError(f"preset {key}: fallback {name} phải trong 0..1")
+    return preset
+
+# --- quick_export_core section: atlas ---
+# ---------- Atlas packing ----------
+def pack_skyline(sizes, width, height):
+    """Place (width, height) tiles in a width x height frame, skyline bottom-left:
+    tallest first, each where its top ends lowest (then leftmost).
+    [(x, y)] in the order of `sizes`, None if they do not fit."""
+    skyline = [[0, 0, width]]  # adjacent [x, y, width] segments covering the whole width
+    positions = [None] * len(sizes)
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        w, h = sizes[i]
+        best = None
+        for start, (x, _, _) in enumerate(skyline):
+            if x + w > width:
+                break
+            y = 0
+            j = start
+            while j < len(skyline) and skyline[j][0] < x + w:
+                y = max(y, skyline[j][1])
+                j += 1
+            if y + h <= height and (best is None or (y + h, x) < best[:2]):
+                best = (y + h, x, start, y)
+        if best is None:
+            return None
+        top, x, start, y = best
+        positions[i] = (x, y)
+        # the tile becomes one segment; trim the segments it covers
+        skyline.insert(start, [x, top, w])
+        j = start + 1
+        while j < len(skyline) and skyline[j][0] < x + w:
+            cut = x + w - skyline[j][0]
+            if skyline[j][2] <= cut:
+                del skyline[j]
+                continue
+            skyline[j][0] += cut
+            skyline[j][2] -= cut
+            break
+        # merge neighbours of the same height
+        j = 1
+        while j < len(skyline):
+            if skyline[j][1] == skyline[j - 1][1]:
+                skyline[j - 1][2] += skyline[j][2]
+                del skyline[j]
+            else:
+                j += 1
+    return positions
+
+def _pow2(n):
+    return 1 << max(0, int(np.ceil(np.log2(max(n, 1)))))
+
+def atlas_layout(sizes, max_size, padding):
+    """Atlas size (powers of 2, the smallest that fits) + scale + tile positions.
+    If max_size x max_size is too small every tile is scaled down alike and packed again.
+    (width, height, scale, [(x, y, width, height)] without padding)."""
+    scale = 1.0
+    while True:
+        tiles = [(max(1, int(w * scale)), max(1, int(h * scale))) for w, h in sizes]
+        padded = [(w + 2 * padding, h + 2 * padding) for w, h in tiles]
+        area = sum(w * h for w, h in padded)
+        side = _pow2(max(np.sqrt(area), *(max(w, h) for w, h in padded)))
+        candidates = []
+        while side <= max_size:
+            candidates += [(side, side // 2), (side, side)]
+            side *= 2
+        for width, height in candidates:
+            if width * height < area or height < max(h for _, h in padded) or width < max(w for w, _ in padded):
+                continue
+            positions = pack_skyline(padded, width, height)
+            if positions is not None:
+                rects = [(x + padding, y + padding, w, h) for (x, y), (w, h) in zip(positions, tiles)]
+                return width, height, scale, rects
+        if all(w == 1 and h == 1 for w, h in tiles):
+            raise ValueError(f"{len(sizes)} ô không vừa atlas {max_size}px (giảm viền hoặc tăng kích thước atlas)")
+        # shrink by the area ratio (at least 10%) and try again
+        scale *= min(0.9, float(np.sqrt(max_size * max_size / area)))
+# <<< quick_export_core <<<
+
+# =========================
+#   Helpers / Settings
+# =========================
+
+# Preset xuất là dữ liệu, không phải code. Mỗi preset:
+#   name, description             tên + mô tả trong menu
+#   image_format, prefix, suffix  giá trị đặt lại khi chọn preset
+#   outputs   các texture đầu ra của mỗi material:
+#               {"suffix": "BaseColor", "source": "BaseColor"}               xuất nguyên ảnh nguồn
+#               {"suffix": "ORM", "channels": ["AO", "Roughness", "Metallic"]}  ghép kênh R, G, B[, A]
+#             kênh: số 0..1, hoặc "[1-]<nguồn>[.r|.g|.b|.a]" (mặc định .r)
+#   fallback  giá trị kênh khi material thiếu ảnh nguồn đó (mặc định 0)
+#   sources   thêm / ghi đè từ khoá nhận diện ảnh nguồn (xem SOURCE_KEYWORDS);
+#             "source" và kênh chỉ được dùng nguồn có trong SOURCE_KEYWORDS hoặc ở đây
+#   others    xuất thêm các ảnh không làm nguồn cho output nào (như preset Default)
+# Không có "outputs": xuất mọi ảnh theo loại nhận diện từ tên (Default).
+# Preset riêng: file JSON {"ID": {...}, ...} chọn ở "File preset", trùng ID thì ghi đè preset có sẵn.
+BUILTIN_PRESETS = {
+    "DEFAULT": {
+        "name": "Default",
+        "description": "Preset mặc định",
+        "image_format": "PNG",
+    },
+    "UNREAL_PBR": {
+        "name": "Unreal Engine PBR",
+        "description": "BaseColor, Normal DirectX (lật kênh G), ORM (R=AO, G=Roughness, B=Metallic)",
+        "image_format": "TARGA",
+        "outputs": [
+            {"suffix": "BaseColor", "source": "BaseColor"},
+            {"suffix": "Normal", "channels": ["Normal.r", "1-Normal.g", "Normal.b"]},
+            {"suffix": "ORM", "channels": ["AO", "Roughness", "Metallic"]},
+        ],
+        "fallback": {"AO": 1.0, "Roughness": 0.5},
+        "others": True,
+    },
+    "UNITY_HDRP": {
+        "name": "Unity HDRP",
+        "description": "BaseColor, Normal OpenGL, Mask Map (R=Metallic, G=AO, B=Detail mask, A=1-Roughness)",
+        "image_format": "PNG",
+        "outputs": [
+            {"suffix": "BaseColor", "source": "BaseColor"},
+            {"suffix": "Normal", "source": "Normal"},
+            {"suffix": "MaskMap", "channels": ["Metallic", "AO", "DetailMask", "1-Roughness"]},
+        ],
+        "fallback": {"AO": 1.0, "DetailMask": 1.0, "Roughness": 0.5},
+        "others": True,
+    },
+    "PACKED_MRAO": {
+        "name": "Packed MRAO",
+        "description": "Packed Metallic-Roughness-AO",
+        "image_format": "TARGA",
+        "prefix": "packed_",
+        "outputs": [
+            {"suffix": "packedMRAO", "channels": ["Metallic", "Roughness", "AO"]},
+        ],
+    },
+}
+
+# mức nén PNG / TIFF theo nhóm loại map (props.png_level_<nhóm>)
+PNG_LEVEL_DEFAULT = 6
+PNG_LEVEL_FORMATS = {'PNG', 'TIFF'}
+PNG_LEVEL_KEYWORDS = (
+    ("normal", ("normal",)),
+    ("color", ("base", "albedo", "diffuse", "color", "emis")),
+)
+
+def map_group(map_type):
+    """Nhóm mức nén của 1 loại map: normal, color, còn lại (map dữ liệu, ghép kênh) là data"""
+    name = map_type.lower()
+    for group, keywords in PNG_LEVEL_KEYWORDS:
+        if any(k in name for k in keywords):
+            return group
+    return "data"
+
+PRESET_CACHE = {}  # file preset -> (mtime, {ID: preset})
+
+def load_presets(path=""):
+    """Preset có sẵn + preset trong file JSON `path` (đọc lại khi file đổi).
+    Preset sai bị bỏ qua, lý do in ra Console."""
+    presets = dict(BUILTIN_PRESETS)
+    path = bpy.path.abspath(path) if path else ""
+    if not path or not os.path.isfile(path):
+        return presets
+    mtime = os.path.getmtime(path)
+    cached = PRESET_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        loaded = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[QEMP] Không đọc được file preset {path}: {e}")
+            data = {}
+        for key, preset in data.items():
+            try:
+                loaded[key] = validate_preset(key, preset)
+            except ValueError as e:
+                print(f"[QEMP] Bỏ qua {e}")
+            except (TypeError, AttributeError) as e:
+                print(f"[QEMP] Bỏ qua preset {key}: {e}")
+        PRESET_CACHE[path] = cached = (mtime, loaded)
+    presets.update(cached[1])
+    return presets
+
+def active_preset(props):
+    return load_presets(props.preset_file).get(props.preset, BUILTIN_PRESETS["DEFAULT"])
+
+PRESET_ITEMS = []  # Blender chỉ giữ con trỏ tới chuỗi của enum động: list phải còn sống
+
+def preset_items(self, context):
+    PRESET_ITEMS[:] = [(key, preset.get("name", key), preset.get("description", ""))
+                       for key, preset in load_presets(self.preset_file).items()]
+    return PRESET_ITEMS
+
+def update_auto_export(self, context):
+    # mốc dữ liệu packed lúc bật: thay đổi từ giờ tới lần lưu đầu tiên vẫn được bắt
+    if self.auto_export:
+        AUTO_EXPORT.baseline()
+
 def update_preset(self, context):
-    preset = self.preset
-    if preset == 'UNREAL_PBR':
-        self.image_format = 'TARGA'
-        self.prefix = ""
-        self.suffix = ""
-    elif preset == 'UNITY_HDRP':
-        self.image_format = 'PNG'
-        self.prefix = ""
-        self.suffix = ""
-    elif preset == 'PACKED_MRAO':
-        self.image_format = 'TARGA'
-        self.prefix = "packed_"
-        self.suffix = ""
-    else:
-        self.image_format = 'PNG'
-        self.prefix = ""
-        self.suffix = ""
+    preset = active_preset(self)
+    self.image_format = preset.get("image_format", 'PNG')
+    self.prefix = preset.get("prefix", "")
+    self.suffix = preset.get("suffix", "")
 
 class QEMPProperties(bpy.types.PropertyGroup):
     preset: bpy.props.EnumProperty(
         name="Export Preset",
-        items=[
-            ('DEFAULT', "Default", "Preset mặc định"),
-            ('UNREAL_PBR', "Unreal Engine PBR", "Xuất maps chuẩn Unreal"),
-            ('UNITY_HDRP', "Unity HDRP", "Xuất maps chuẩn Unity HDRP"),
-            ('PACKED_MRAO', "Packed MRAO", "Packed Metallic-Roughness-AO")
-        ],
-        default='DEFAULT',
+        items=preset_items,
+        default=0,
         update=update_preset
     )
+    preset_file: bpy.props.StringProperty(
+        name="File preset",
+        description="File JSON định nghĩa thêm preset (ghép kênh, đảo kênh, đổi tên) — xem BUILTIN_PRESETS",
+        subtype='FILE_PATH',
+        default=""
+    )
 
     directory: bpy.props.StringProperty(
         name="Export Path",
@@ -73,210 +1586,1934 @@ class QEMPProperties(bpy.types.PropertyGroup):
         ],
         default='PNG'
     )
+    incremental: bpy.props.BoolProperty(
+        name="Chỉ xuất thay đổi",
+        description="Bỏ qua file có nguồn, nội dung và preset không đổi so với lần xuất trước (theo manifest)",
+        default=True
+    )
+    workers: bpy.props.IntProperty(
+        name="Workers",
+        description="Số luồng encode/ghi file song song (0 = theo số CPU)",
+        default=0,
+        min=0,
+        max=64
+    )
+    memory_budget: bpy.props.IntProperty(
+        name="RAM tối đa (MB)",
+        description="Giới hạn RAM pixel mà lần xuất giữ cùng lúc (buffer đã decode + buffer chờ ghi). "
+                    "Ảnh lớn hơn giới hạn vẫn được xuất, nhưng một mình. 0 = không giới hạn",
+        default=4096,
+        min=0
+    )
+    dedupe: bpy.props.BoolProperty(
+        name="Gộp texture trùng",
+        description="Texture trùng nội dung chỉ encode + ghi 1 lần vào thư mục ẩn .qemp_blobs, các file còn lại là "
+                    "hardlink (hoặc reflink / symlink / bản copy nếu ổ đĩa không hỗ trợ)",
+        default=True
+    )
+    output: bpy.props.EnumProperty(
+        name="Xuất ra",
+        description="Ghi file vào thư mục xuất, hoặc gói tất cả vào 1 archive cạnh thư mục đó "
+                    "(cùng cấu trúc Material/Material_MapType.ext, không tạo file trung gian)",
+        items=[
+            ('FOLDER', "Thư mục", "Ghi từng file vào thư mục xuất"),
+            ('ZIP', ".zip", "Một file zip (PNG/JPEG lưu không nén lại)"),
+            ('TAR_ZST', ".tar.zst", "Một file tar nén zstd (cần package zstandard)")
+        ],
+        default='FOLDER'
+    )
+    archive_level: bpy.props.IntProperty(
+        name="Mức nén",
+        description="Mức nén archive: zip 0-9 (0 = không nén), zstd 1-22",
+        default=3,
+        min=0,
+        max=22
+    )
+    mrao_target: bpy.props.EnumProperty(
+        name="Kích thước ghép kênh",
+        description="Texture ghép kênh (Packed MRAO, ORM, Mask Map...) có ảnh nguồn khác kích thước: "
+                    "resample về kích thước này thay vì bỏ material",
+        items=[
+            ('LARGEST', "Lớn nhất", "Theo ảnh nguồn lớn nhất"),
+            ('SMALLEST', "Nhỏ nhất", "Theo ảnh nguồn nhỏ nhất"),
+            ('FIXED', "Cố định", "Cạnh dài bằng giá trị bên dưới (mọi ảnh nguồn khác kích thước đều được resample)")
+        ],
+        default='LARGEST'
+    )
+    mrao_size: bpy.props.IntProperty(
+        name="Cạnh dài (px)",
+        description="Kích thước cố định của texture ghép kênh (cạnh dài, giữ tỉ lệ)",
+        default=2048,
+        min=1,
+        max=65536
+    )
+    mrao_filter: bpy.props.EnumProperty(
+        name="Bộ lọc resample",
+        items=[
+            ('BOX', "Box", "Trung bình vùng: nhanh nhất, hợp khi thu nhỏ theo bội số"),
+            ('BILINEAR', "Bilinear", "Tam giác (chống răng cưa khi thu nhỏ)"),
+            ('LANCZOS', "Lanczos", "Lanczos-3: sắc nét nhất, chậm nhất")
+        ],
+        default='BILINEAR'
+    )
+    lod_levels: bpy.props.IntProperty(
+        name="Mức LOD",
+        description="Xuất thêm N mức 1/2, 1/4, ... của mỗi map (`_1024`, `_512`...), "
+                    "tính từ cùng buffer đã decode. 0 = tắt",
+        default=0,
+        min=0,
+        max=12
+    )
+    lod_min_size: bpy.props.IntProperty(
+        name="Cạnh nhỏ nhất (px)",
+        description="Không xuất mức LOD có cạnh dài nhỏ hơn giá trị này",
+        default=64,
+        min=1
+    )
+    lod_filter: bpy.props.EnumProperty(
+        name="Bộ lọc LOD",
+        items=[
+            ('BOX', "Box", "Trung bình 2x2: nhanh, hơi mềm"),
+            ('KAISER', "Kaiser", "Sinc cửa sổ Kaiser 8 tap: giữ chi tiết tốt hơn")
+        ],
+        default='BOX'
+    )
+    atlas_name: bpy.props.StringProperty(
+        name="Tên atlas",
+        description="Tên thư mục + file của atlas (<tên>_<MapType>.ext, <tên>.json)",
+        default="Atlas"
+    )
+    atlas_size: bpy.props.IntProperty(
+        name="Atlas tối đa (px)",
+        description="Cạnh lớn nhất của atlas; material không vừa thì mọi ô được thu nhỏ cùng tỉ lệ",
+        default=4096,
+        min=64,
+        max=16384
+    )
+    atlas_padding: bpy.props.IntProperty(
+        name="Viền (px)",
+        description="Viền lặp pixel mép quanh mỗi ô để mip map không lem sang ô bên cạnh",
+        default=4,
+        min=0,
+        max=64
+    )
+    profile: bpy.props.BoolProperty(
+        name="Đo thời gian",
+        description="Ghi thời gian từng giai đoạn + bộ đếm (ảnh, byte đọc/ghi, thời gian encode theo định dạng, "
+                    "số lần stat) vào qemp_profile.json/.csv trong thư mục xuất, tóm tắt hiện trong panel",
+        default=False
+    )
+    optimize: bpy.props.EnumProperty(
+        name="Thu gọn map",
+        description="Phân tích buffer trước khi encode (PNG, TARGA, TIFF, BMP): map 1 màu, ảnh xám lưu trong RGB, "
+                    "alpha toàn trắng",
+        items=[
+            ('OFF', "Tắt", "Ghi nguyên số kênh + độ phân giải"),
+            ('CHANNELS', "Bớt kênh", "Ảnh xám -> L / LA (TGA / BMP không có LA: giữ RGBA), "
+                                      "bỏ alpha không dùng; giữ độ phân giải"),
+            ('SHRINK', "Bớt kênh + 1×1", "Như Bớt kênh, map 1 màu ghi thành ảnh 1×1"),
+            ('SIDECAR', "Bớt kênh + 1×1 + JSON", "Như Bớt kênh + 1×1, giá trị map 1 màu còn được ghi vào "
+                                                "qemp_constants.json để tool import dùng thẳng, không cần đọc ảnh")
+        ],
+        default='OFF'
+    )
+    png_level_color: bpy.props.IntProperty(
+        name="Màu",
+        description="Mức nén PNG / TIFF cho BaseColor, Emissive (0 = không nén, 9 = nhỏ nhất, chậm nhất)",
+        default=PNG_LEVEL_DEFAULT,
+        min=0,
+        max=9
+    )
+    png_level_normal: bpy.props.IntProperty(
+        name="Normal",
+        description="Mức nén PNG / TIFF cho normal map",
+        default=PNG_LEVEL_DEFAULT,
+        min=0,
+        max=9
+    )
+    png_level_data: bpy.props.IntProperty(
+        name="Data",
+        description="Mức nén PNG / TIFF cho map dữ liệu (Roughness, Metallic, AO, Height..., texture ghép kênh)",
+        default=PNG_LEVEL_DEFAULT,
+        min=0,
+        max=9
+    )
+    auto_export: bpy.props.BoolProperty(
+        name="Tự xuất khi lưu",
+        description="Mỗi lần lưu .blend, xuất lại (chạy nền, preset + thư mục hiện tại) chỉ các material "
+                    "có ảnh / node thay đổi kể từ lần xuất trước. Chỉ khi xuất ra thư mục và không bật dry run",
+        default=False,
+        update=update_auto_export
+    )
+    dry_run: bpy.props.BoolProperty(
+        name="Dry run",
+        description="Chỉ lập danh sách file sẽ xuất (đường dẫn, định dạng, độ phân giải, dung lượng ước tính), không ghi gì ra đĩa",
+        default=False
+    )
+
+# =========================
+#   Pixel I/O
+# =========================
+
+# Buffer pixel luôn là float32 và đọc/ghi bằng foreach_get/foreach_set,
+# không đi qua list Python (mỗi float Python ~24 byte + 8 byte con trỏ).
+# bpy chỉ đọc được cả ảnh một lần, nên texture ghép kênh (Packed MRAO, ORM...)
+# đọc từng ảnh nguồn rồi tính mọi kênh đầu ra lấy từ ảnh đó trong 1 lượt theo
+# dải STRIP_ROWS hàng (đảo 1-x, resample), thẳng vào kết quả uint8.
+# Ngân sách bộ nhớ khi ghép kênh, tính trên mỗi megapixel đầu ra:
+#   - 1 buffer đọc RGBA dùng lại cho mọi ảnh nguồn: 16 MB
+#   - kết quả uint8 RGB (RGBA):                   3 (4) MB
+#   - mảng tạm 1 dải (STRIP_ROWS hàng):         không đáng kể
+#   => đỉnh ~19 MB/MP (8K ≈ 1.3 GB, 16K ≈ 5.1 GB), chưa tính buffer 8-bit
+#      Blender tự giữ cho mỗi ảnh (4 MB/MP).
+#   (cũ: 2 buffer float RGBA ~32 MB/MP; trước nữa list(image.pixels[:]) + float64 ~ 100+ MB/MP mỗi kênh).
+# UDIM: mỗi tile là 1 job riêng nên đỉnh tính theo 1 tile, và pool encode các tile song song.
+# Thời gian thực tế (ms/MP) được đo mỗi lần pack và in trong report.
+
+def swizzle_memory_budget(width, height, read_pixels=None, out_channels=3):
+    """Ước tính bộ nhớ đỉnh (byte) khi ghép kênh ở kích thước width x height.
+    read_pixels: số pixel ảnh nguồn lớn nhất nếu khác kích thước đầu ra (resample)."""
+    if read_pixels is None:
+        read_pixels = width * height
+    return read_pixels * 4 * np.dtype(PIXEL_DTYPE).itemsize + width * height * out_channels
+
+def pixel_count(image):
+    """Số phần tử float trong image.pixels (0 nếu ảnh không load được)"""
+    try:
+        return len(image.pixels)
+    except Exception:
+        return 0
+
+def read_pixels(image, out=None):
+    """Đọc image.pixels vào buffer float32 phẳng; dùng lại `out` nếu đủ kích thước"""
+    with PROFILE.stage("read_pixels"):
+        count = pixel_count(image)
+        if out is None or out.size != count:
+            out = np.empty(count, dtype=PIXEL_DTYPE)
+        image.pixels.foreach_get(out)
+    PROFILE.count("bytes_read", out.nbytes)
+    return out
+
+def write_pixels(image, buf):
+    """Ghi buffer float32 phẳng vào image.pixels"""
+    image.pixels.foreach_set(buf)
+    image.update()
+
+def expand_uint8(packed, out):
+    """uint8 (height, width, c) -> buffer float32 RGBA phẳng `out` (image.save()), theo dải"""
+    height, width, c = packed.shape
+    rgba = out.reshape(height, width, 4)
+    rgba[..., 3] = 1.0
+    for y in range(0, height, STRIP_ROWS):
+        np.multiply(packed[y:y + STRIP_ROWS], 1.0 / 255.0, out=rgba[y:y + STRIP_ROWS, :, :c])
+    return out
+
+def image_has_data(image):
+    """Ảnh đã có buffer decode sẵn trong RAM (user đang mở / tool khác đã load)?"""
+    return getattr(image, "has_data", True)
+
+def decoded_bytes(image, width, height):
+    """Kích thước buffer decode của chính Blender: 4 B/px (8-bit), 16 B/px (float)"""
+    return width * height * (16 if getattr(image, "is_float", False) else 4)
+
+def free_if_loaded_here(image, had_data):
+    """Giải phóng buffer nếu chính lần xuất này đã load ảnh.
+    Ảnh user đã mở sẵn (hoặc đang sửa: dirty) thì giữ nguyên."""
+    if had_data or getattr(image, "is_dirty", False):
+        return
+    try:
+        image.buffers_free()
+    except Exception as e:
+        print(f"[QEMP] buffers_free lỗi với {image.name}: {e}")
+
+# =========================
+#   UDIM
+# =========================
+
+# bpy không có API đọc pixel từng tile: mỗi tile được load thành 1 ảnh tạm
+# (tile packed đi qua 1 file tạm), đọc xong xoá ngay.
+
+def udim_tiles(image):
+    """Số tile UDIM -> ImageTile; rỗng với ảnh thường"""
+    if not image or getattr(image, "source", 'FILE') != 'TILED':
+        return {}
+    return {tile.number: tile for tile in image.tiles}
+
+def tile_packed_data(image, number):
+    for item in getattr(image, "packed_files", ()):
+        if getattr(item, "tile_number", 0) == number:
+            return item.packed_file.data
+    return None
+
+def tile_filepath(image, number):
+    path = bpy.path.abspath(image.filepath_raw, library=getattr(image, "library", None))
+    u, v = (number - 1001) % 10 + 1, (number - 1001) // 10 + 1
+    return path.replace("<UDIM>", str(number)).replace("<UVTILE>", f"u{u}_v{v}")
+
+def tile_content_hash(image, number):
+    """Như image_content_hash nhưng cho 1 tile: dữ liệu packed hoặc kích thước+mtime file tile"""
+    h = hashlib.blake2b(digest_size=16)
+    data = tile_packed_data(image, number)
+    if data is not None:
+        h.update(b"packed:")
+        h.update(data)
+        return h.hexdigest()
+    try:
+        path = tile_filepath(image, number)
+        st = os.stat(path)
+        h.update(f"file:{path}|{st.st_size}|{st.st_mtime_ns}".encode())
+    except (OSError, TypeError):
+        h.update(f"{image_content_hash(image)}|{number}".encode())
+    return h.hexdigest()
+
+def tile_dimensions(image, number):
+    """(rộng, cao) của 1 tile, từ header dữ liệu packed nếu có (không decode)"""
+    data = tile_packed_data(image, number)
+    if data is not None:
+        ext = os.path.splitext(image.filepath_raw or "")[1].lower()
+        size = header_size(data[:HEADER_BYTES], FORMAT_OF_EXT.get(ext))
+        if size:
+            return size[:2]
+    return tuple(udim_tiles(image)[number].size)
+
+def open_tile(image, number):
+    """Load 1 tile thành ảnh tạm. Trả về (ảnh, hàm dọn dẹp xoá ảnh + file tạm)."""
+    data = tile_packed_data(image, number)
+    tmp = None
+    if data is not None:
+        fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(image.filepath_raw or "")[1] or ".png",
+                                   prefix="qemp_tile_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = tmp
+    else:
+        path = tile_filepath(image, number)
+    tile_image = bpy.data.images.load(path, check_existing=False)
+    try:
+        tile_image.colorspace_settings.name = image.colorspace_settings.name
+    except Exception:
+        pass
+
+    def cleanup():
+        try:
+            bpy.data.images.remove(tile_image)
+        finally:
+            if tmp:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+    return tile_image, cleanup
+
+# =========================
+#   LOD (chuỗi mip)
+# =========================
+
+# Mỗi output có thể kèm các mức 1/2, 1/4, ... (`<tên>_<cạnh dài>.ext`), tính từ
+# đúng buffer đã decode cho file gốc: 1 task dựng cả chuỗi bằng cách lọc nối
+# tiếp (mức sau từ mức trước), mỗi mức encode + ghi ở 1 task riêng, song song.
+# Lọc trong không gian tuyến tính: dữ liệu sRGB được đổi sang linear trước và
+# đổi lại sau; normal map lọc trên vector [-1, 1] rồi chuẩn hoá lại độ dài.
+
+def lod_path(filepath, size, tile=None):
+    """`Mat_Normal.png` -> `Mat_Normal_1024.png` (UDIM: `Mat_X_1024.1001.png`)"""
+    root, ext = os.path.splitext(filepath)
+    if tile is not None:
+        root = root[:-len(f".{tile}")]
+        return f"{root}_{size}.{tile}{ext}"
+    return f"{root}_{size}{ext}"
+
+def lod_mode(map_type, image=None):
+    """Cách lọc: 'NORMAL' (chuẩn hoá vector), 'SRGB' (lọc trong linear) hoặc 'LINEAR'"""
+    if map_type == "Normal":
+        return 'NORMAL'
+    if image is not None and not getattr(image, "is_float", False):
+        if getattr(getattr(image, "colorspace_settings", None), "name", "") == 'sRGB':
+            return 'SRGB'
+    return 'LINEAR'
+
+def plan_lods(filepath, width, height, channels, fmt, props, tile=None):
+    """Các file LOD của 1 output: đường dẫn, độ phân giải, dung lượng ước tính"""
+    return [{"path": lod_path(filepath, max(w, h), tile), "width": w, "height": h,
+             "bytes": estimate_bytes(w, h, channels, fmt)}
+            for w, h in lod_sizes(width, height, props.lod_levels, props.lod_min_size)]
+
+def encode_lod_and_write(filepath, fmt, chain, level, options=None):
+    """Chạy trong worker: chờ task dựng chuỗi (luôn được xếp hàng trước) rồi encode 1 mức"""
+    return encode_output(filepath, fmt, chain.result()[level], options)
+
+def submit_lods(job, pool, lods, make_base, *args):
+    """Xếp các mức LOD của job vào pool: 1 task dựng chuỗi từ buffer đã có,
+    mỗi mức 1 task encode + ghi (thu gọn như output chính). lods = [(lod, target, on_done)]"""
+    if not lods:
+        return
+    chain = pool.executor.submit(build_lod_chain, make_base, args, len(lods), job["lod_mode"], job["lod_filter"])
+    for level, (lod, target, on_done) in enumerate(lods):
+        width, height = lod["width"], lod["height"]
+        # mức đầu giữ thêm bản float để lọc (cỡ mức gốc)
+        memory = width * height * 4 + (width * height * 4 * 4 * 4 if level == 0 else 0)
+        pool.submit(f"{job['label']} {max(width, height)}", lod["path"], encode_lod_and_write,
+                    target, job["format"], chain, level, output_options(job, pool, [lod["path"]]),
+                    on_done=on_done, weight=lod["bytes"], memory=memory)
+
+def save_lods_inline(job, pool, lods, base, float_buffer=False):
+    """LOD cho định dạng phải lưu bằng image.save() (JPEG, ảnh float): dựng chuỗi
+    trên main thread rồi lưu từng mức qua ảnh tạm"""
+    if not lods:
+        return
+    chain = Future()
+    try:
+        if base is None:
+            raise RuntimeError("Không đọc được pixel ảnh để tạo LOD")
+        chain.set_result(lod_chain(base, len(lods), job["lod_mode"], job["lod_filter"],
+                                   as_uint8=base.dtype == np.uint8))
+    except Exception as e:
+        chain.set_exception(e)
+    for level, (lod, target, on_done) in enumerate(lods):
+        pool.run_inline(f"{job['label']} {max(lod['width'], lod['height'])}", lod["path"], save_lod_with_blender,
+                        chain, level, target, job["format"], float_buffer, on_done=on_done, weight=lod["bytes"])
+
+def save_lod_with_blender(chain, level, target, image_format, float_buffer):
+    return save_array_with_blender(chain.result()[level], target, image_format, float_buffer)
+
+def save_array_with_blender(arr, target, image_format, float_buffer=False):
+    """Lưu mảng (height, width, c) uint8 hoặc float (hàng dưới lên trên) qua 1 ảnh tạm"""
+    height, width, channels = arr.shape
+    image = bpy.data.images.new(name="qemp_tmp", width=width, height=height,
+                                alpha=channels in (2, 4), float_buffer=float_buffer)
+    try:
+        rgba = np.empty(width * height * 4, dtype=PIXEL_DTYPE)
+        if arr.dtype == np.uint8:
+            expand_uint8(arr, rgba)
+        else:
+            view = rgba.reshape(height, width, 4)
+            view[..., 3] = 1.0
+            view[..., :channels] = arr
+        write_pixels(image, rgba)
+        save = save_to_entry if isinstance(target, ArchiveEntry) else save_with_blender
+        return save(image, target, image_format)
+    finally:
+        bpy.data.images.remove(image)
+
+# =========================
+#   Encoders (không dùng bpy, chạy được trong worker thread)
+# =========================
+
+# Các định dạng encode được ngoài main thread; còn lại (JPEG) vẫn qua image.save()
+THREAD_FORMATS = {'PNG', 'TARGA', 'TIFF', 'BMP'}
+
+def to_uint8(pixels, width, height, src_channels, out_channels):
+    """Buffer float32 phẳng của Blender -> mảng uint8 (height, width, out_channels).
+    Hàng vẫn theo thứ tự của Blender (dưới lên trên)."""
+    arr = pixels.reshape(height, width, src_channels)[..., :out_channels]
+    arr = np.clip(arr, 0.0, 1.0)
+    arr *= 255.0
+    arr += 0.5
+    return arr.astype(np.uint8)
+
+# Thu gọn map: 1 lượt theo dải STRIP_ROWS hàng trên mảng uint8 (mảng so sánh tạm chỉ cỡ 1 dải),
+# dừng sớm khi không còn gì để thu gọn (ảnh màu thường chỉ tốn vài dải đầu).
+CHANNEL_NAMES = ("L", "LA", "RGB", "RGBA")
+
+def analyze_map(img):
+    """(1 màu, xám trong RGB, alpha toàn 255) của mảng uint8 (height, width, c)"""
+    height, width, c = img.shape
+    first = img[0, 0]
+    constant, gray, opaque = True, c >= 3, c in (2, 4)
+    for y in range(0, height, STRIP_ROWS):
+        strip = img[y:y + STRIP_ROWS]
+        if constant:
+            constant = bool((strip == first).all())
+        if gray:
+            gray = bool((strip[..., 1] == strip[..., 0]).all() and (strip[..., 2] == strip[..., 0]).all())
+        if opaque:
+            opaque = bool((strip[..., c - 1] == 255).all())
+        if not (constant or gray or opaque):
+            break
+    return constant, gray, opaque
+
+LA_WIDENED_FORMATS = {'TARGA', 'BMP'}  # không có dạng xám + alpha: encoder ghi LA thành BGRA
+
+def optimize_map(img, mode, fmt=None):
+    """Thu gọn mảng uint8 theo props.optimize. Trả về (mảng, giá trị 0..1 từng kênh nếu map 1 màu).
+    `fmt` TGA / BMP: không thu RGBA về LA (encoder nới lại thành BGRA, không bớt byte nào)."""
+    if mode == 'OFF':
+        return img, None
+    with PROFILE.stage("optimize"):
+        constant, gray, opaque = analyze_map(img)
+        c = img.shape[2]
+        keep = [0] if gray or c <= 2 else [0, 1, 2]
+        if c in (2, 4) and not opaque:
+            keep.append(c - 1)
+        if len(keep) == 2 and fmt in LA_WIDENED_FORMATS:
+            keep = list(range(c))
+        if constant and mode != 'CHANNELS':
+            img = img[:1, :1]
+            PROFILE.count("maps.constant")
+        if len(keep) < c:
+            img = img[..., keep]
+            PROFILE.count("maps.reduced")
+        value = tuple(round(int(v) / 255.0, 4) for v in img[0, 0]) if constant else None
+        return np.ascontiguousarray(img), value
+
+def encode_output(filepath, fmt, img, options=None):
+    """Chạy trong worker: thu gọn map, encode với mức nén của loại map, ghi file.
+    options (output_options): optimize, level; với SIDECAR thêm constants + outputs."""
+    if not options:
+        return write_output(filepath, encode_image(fmt, img))
+    img, value = optimize_map(img, options.get("optimize", 'OFF'), fmt)
+    if value is not None and "constants" in options:
+        for path in options["outputs"]:
+            options["constants"][path] = {"value": list(value), "channels": CHANNEL_NAMES[len(value) - 1]}
+    return write_output(filepath, encode_image(fmt, img, options.get("level")))
+
+def encode_and_write(filepath, fmt, pixels, width, height, src_channels, out_channels, options=None):
+    """Chạy trong worker: quantize + encode + ghi file"""
+    img = to_uint8(pixels, width, height, src_channels, out_channels)
+    return encode_output(filepath, fmt, img, options)
+
+def encode_uint8_and_write(filepath, fmt, img, options=None):
+    """Chạy trong worker: encode mảng uint8 đã quantize sẵn (texture ghép kênh) + ghi file"""
+    return encode_output(filepath, fmt, img, options)
+
+def snapshot_image(image, fmt):
+    """Chụp pixel trên main thread để worker encode.
+    None nếu phải dùng image.save() (JPEG, ảnh float, ảnh không có dữ liệu)."""
+    if fmt not in THREAD_FORMATS or getattr(image, "is_float", False):
+        return None
+    width, height = image.size
+    channels = getattr(image, "channels", 4)
+    if width * height == 0 or pixel_count(image) != width * height * channels:
+        return None
+    out_channels = min({8: 1, 24: 3, 32: 4}.get(getattr(image, "depth", 32), 4), channels)
+    return read_pixels(image), width, height, channels, out_channels
+
+# =========================
+#   Manifest (xuất tăng dần)
+# =========================
+
+def image_source_id(image):
+    """Định danh nguồn của ảnh (tên, đường dẫn, thư viện link)"""
+    library = getattr(image, "library", None)
+    return {
+        "name": image.name,
+        "filepath": getattr(image, "filepath", "") or "",
+        "library": getattr(library, "filepath", "") if library else "",
+    }
+
+def image_content_hash(image):
+    """Hash nội dung ảnh: dữ liệu packed, hoặc kích thước+mtime file nguồn,
+    hoặc pixel (ảnh generated / đã sửa trong Blender)"""
+    h = hashlib.blake2b(digest_size=16)
+    if not getattr(image, "is_dirty", False):
+        packed = getattr(image, "packed_file", None)
+        if packed:
+            h.update(b"packed:")
+            h.update(packed.data)
+            return h.hexdigest()
+        if getattr(image, "source", 'FILE') in ('FILE', 'TILED'):
+            try:
+                path = bpy.path.abspath(image.filepath, library=getattr(image, "library", None))
+                st = os.stat(path)
+                h.update(f"file:{path}|{st.st_size}|{st.st_mtime_ns}".encode())
+                return h.hexdigest()
+            except (OSError, TypeError):
+                pass
+    had_data = image_has_data(image)
+    h.update(b"pixels:")
+    h.update(repr(tuple(image.size)).encode())
+    if pixel_count(image):
+        h.update(read_pixels(image))
+    free_if_loaded_here(image, had_data)
+    return h.hexdigest()
+
+def export_settings(props):
+    """Các thiết lập preset ảnh hưởng tới nội dung file xuất"""
+    settings = {"preset": props.preset, "prefix": props.prefix, "suffix": props.suffix}
+    if props.lod_levels:
+        settings["lod"] = [props.lod_levels, props.lod_min_size, props.lod_filter]
+    return settings
+
+def encode_options(props, map_type, fmt):
+    """Tuỳ chọn encode khác mặc định của 1 output (mức nén theo loại map, thu gọn map).
+    Nằm trong record: đổi tuỳ chọn thì output được xuất lại; rỗng thì record như trước."""
+    options = {}
+    level = getattr(props, f"png_level_{map_group(map_type)}")
+    if fmt in PNG_LEVEL_FORMATS and level != PNG_LEVEL_DEFAULT:
+        options["level"] = level
+    if props.optimize != 'OFF' and fmt in THREAD_FORMATS:
+        options["optimize"] = props.optimize
+    return options
+
+def output_options(job, pool, outputs):
+    """options cho encode_output của job; SIDECAR: map 1 màu được ghi vào pool.constants theo `outputs`"""
+    options = job["record"].get("encode")
+    if not options:
+        return None
+    options = dict(options)
+    if options.get("optimize") == 'SIDECAR':
+        options["constants"] = pool.constants
+        options["outputs"] = outputs
+    return options
+
+CONSTANTS_NAME = "qemp_constants.json"
+
+def constants_json(constants):
+    """Sidecar: output -> giá trị từng kênh (0..1) của map 1 màu"""
+    return json.dumps({"version": 1, "maps": dict(sorted(constants.items()))}, indent=1).encode("utf-8")
+
+# =========================
+#   Archive (zip / tar.zst)
+# =========================
+
+def save_to_entry(image, entry, image_format):
+    """image.save() chỉ ghi được ra file: JPEG / ảnh float đi qua 1 file tạm,
+    xóa ngay sau khi đã thêm vào archive"""
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(entry.names[0])[1], prefix="qemp_")
+    os.close(fd)
+    try:
+        save_with_blender(image, tmp, image_format)
+        with open(tmp, 'rb') as f:
+            return entry.write(f.read())
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+# =========================
+#   Ước tính (dry run)
+# =========================
+
+# dung lượng file / dữ liệu 8-bit thô, chỉ dùng để ước tính
+SIZE_RATIO = {'PNG': 0.6, 'JPEG': 0.15, 'TARGA': 1.0, 'BMP': 1.0, 'TIFF': 0.6}
+HEADER_BYTES = 256 * 1024  # đủ để gặp SOF của JPEG có thumbnail EXIF
+FORMAT_OF_EXT = {"." + ext: fmt for fmt, ext in EXT_MAP.items()}  # TGA không có magic: nhận theo đuôi file
+def image_dimensions(image):
+    """(rộng, cao, số kênh) lấy từ header file nguồn/packed để khỏi decode ảnh;
+    image.size (load cả ảnh) chỉ là phương án cuối"""
+    if not getattr(image, "is_dirty", False) and not getattr(image, "is_float", False):
+        fmt = FORMAT_OF_EXT.get(os.path.splitext(getattr(image, "filepath", "") or "")[1].lower())
+        size = None
+        packed = getattr(image, "packed_file", None)
+        if packed:
+            size = header_size(packed.data[:HEADER_BYTES], fmt)
+        elif getattr(image, "source", 'FILE') == 'FILE':
+            try:
+                path = bpy.path.abspath(image.filepath, library=getattr(image, "library", None))
+                with open(path, "rb") as f:
+                    size = header_size(f.read(HEADER_BYTES), fmt)
+            except (OSError, TypeError):
+                pass
+        if size:
+            return size
+    width, height = image.size
+    return width, height, {8: 1, 24: 3, 32: 4}.get(getattr(image, "depth", 32), 4)
+
+def estimate_bytes(width, height, channels, fmt):
+    """Dung lượng file ước tính sau khi encode"""
+    if fmt == 'JPEG':
+        channels = min(channels, 3)
+    return int(width * height * channels * SIZE_RATIO.get(fmt, 1.0))
 
 # =========================
 #   Export Helpers
 # =========================
 
-def export_image(image, mat_name, suffix, props, export_dir, operator=None):
-    """Lưu 1 ảnh texture ra file"""
+def save_with_blender(image, filepath, image_format):
+    """image.save() – chỉ gọi trên main thread. Lưu ra file tạm rồi os.replace như write_atomic.
+    Trả lại filepath/định dạng gốc cho image sau khi lưu để việc xuất không
+    làm thay đổi file .blend (và định danh nguồn trong manifest)."""
+    old_path, old_format = image.filepath_raw, image.file_format
+    tmp = filepath + TMP_SUFFIX
+    try:
+        image.filepath_raw = tmp
+        image.file_format = image_format
+        with PROFILE.stage(f"save.{image_format}"):
+            image.save()
+        os.replace(tmp, filepath)
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+    finally:
+        try:
+            image.filepath_raw = old_path
+            image.file_format = old_format
+        except Exception:
+            pass
+
+def plan_image(image, mat_name, suffix, props, export_dir, manifest):
+    """Lập job xuất 1 ảnh texture (chưa ghi gì), None nếu không có ảnh"""
     if not image:
-        return
+        return None
     ext = EXT_MAP.get(props.image_format, props.image_format.lower())
     safe_mat = mat_name.replace('.', '_')
     filename = f"{props.prefix}{safe_mat}_{suffix}{props.suffix}.{ext}"
-    filepath = os.path.join(export_dir, filename)
+    # set absolute path for Blender
+    filepath = manifest.claim(bpy.path.abspath(os.path.join(export_dir, filename)))
+    fmt = props.image_format
+
+    had_data = image_has_data(image)
+    PROFILE.count("images")
+    with PROFILE.stage("plan.hash"):
+        content_hash = image_content_hash(image)
+    record = {
+        "source": image_source_id(image),
+        "hash": content_hash,
+        "format": fmt,
+        "settings": export_settings(props),
+    }
+    encode = encode_options(props, suffix, fmt)
+    if encode:
+        record["encode"] = encode
+    with PROFILE.stage("plan.header"):
+        width, height, channels = image_dimensions(image)
+    free_if_loaded_here(image, had_data)  # image.size (phương án cuối) có thể đã decode ảnh
+    lods = plan_lods(filepath, width, height, channels, fmt, props)
+    if all(manifest.is_current(lod["path"], record) for lod in lods) and manifest.skip(filepath, record):
+        action = "skip"
+    elif fmt in THREAD_FORMATS and not getattr(image, "is_float", False):
+        action = "encode"
+    else:
+        action = "save"
+
+    decoded = 0 if had_data else decoded_bytes(image, width, height)
+    snapshot = width * height * getattr(image, "channels", 4) * np.dtype(PIXEL_DTYPE).itemsize
+    if lods and action == "save":
+        snapshot *= 2  # save: đọc pixel + bản float để lọc, trên main thread
+    return {
+        "kind": "image",
+        "label": suffix,
+        "image": image,
+        "material": mat_name,
+        "map_type": suffix,
+        "path": filepath,
+        "format": fmt,
+        "action": action,
+        "width": width,
+        "height": height,
+        "bytes": estimate_bytes(width, height, channels, fmt),
+        "memory": decoded + (snapshot if action == "encode" or lods else 0),
+        "record": record,
+        "lods": lods,
+        "lod_mode": lod_mode(suffix, image),
+        "lod_filter": props.lod_filter,
+    }
 
+def export_image(job, pool, on_done, target, lods=(), options=None):
+    """Lưu 1 ảnh texture ra `target` (encode ở worker nếu định dạng cho phép),
+    cùng các mức LOD tính từ cùng 1 lần đọc pixel"""
+    image, filepath, fmt = job["image"], job["path"], job["format"]
+    # decode xảy ra ở đây (image.pixels / image.save()), giải phóng ngay sau đó
+    had_data = image_has_data(image)
+    decoded = 0 if had_data else decoded_bytes(image, job["width"], job["height"])
+    pool.budget.acquire(decoded)
     try:
-        # set absolute path for Blender
-        image.filepath_raw = bpy.path.abspath(filepath)
-        image.file_format = props.image_format
-        image.save()
-        if operator:
-            operator.report({'INFO'}, f"✅ Xuất {suffix}: {filepath}")
-    except Exception as e:
-        if operator:
-            operator.report({'ERROR'}, f"❌ Lỗi khi lưu {suffix}: {filepath} ({str(e)})")
+        snap = None
+        if job["action"] == "encode":
+            try:
+                snap = snapshot_image(image, fmt)
+            except Exception:
+                snap = None
+        if snap is None:
+            save = save_to_entry if isinstance(target, ArchiveEntry) else save_with_blender
+            pool.run_inline(job["label"], filepath, save, image, target, fmt,
+                            on_done=on_done, weight=job["bytes"])
+            if lods:
+                width, height = image.size
+                channels = getattr(image, "channels", 4)
+                base = None  # không đọc được pixel: lỗi báo ở từng mức
+                if width * height and pixel_count(image) == width * height * channels:
+                    base = read_pixels(image).reshape(height, width, channels)
+                save_lods_inline(job, pool, lods, base, getattr(image, "is_float", False))
+        else:
+            pool.submit(job["label"], filepath, encode_and_write, target, fmt, *snap, options,
+                        on_done=on_done, weight=job["bytes"], memory=snap[0].nbytes)
+            submit_lods(job, pool, lods, to_uint8, *snap)
+    finally:
+        free_if_loaded_here(image, had_data)
+        pool.budget.release(decoded)
 
-def export_packed_mrao(mat, mat_dir, props, operator=None):
-    """Tạo ảnh packed M=R=A (R->R, G->Roughness, B->AO)"""
+def find_image_maps(nodes, keywords):
+    """1 lượt duyệt node: tên nguồn -> ảnh TEX_IMAGE đầu tiên có 1 trong các từ khoá
+    của nguồn đó trong tên ảnh/node/label. keywords = {tên nguồn: (từ khoá, ...)}"""
+    found = dict.fromkeys(keywords)
+    missing = list(keywords)
+    for node in nodes:
+        if not missing:
+            break
+        if node.type != 'TEX_IMAGE' or not node.image:
+            continue
+        names = ((node.image.name or "").lower(), (node.name or "").lower(), (node.label or "").lower())
+        for source in list(missing):
+            if any(keyword in n for keyword in keywords[source] for n in names):
+                found[source] = node.image
+                missing.remove(source)
+    return found
+
+def plan_preset_outputs(mat, mat_dir, props, manifest, preset, operator=None):
+    """Job cho các output của preset: xuất nguyên ảnh nguồn hoặc ghép kênh,
+    cộng các ảnh còn lại nếu preset có "others"."""
     if not getattr(mat, "node_tree", None):
         if operator:
             operator.report({'WARNING'}, f"Material {mat.name} không có node tree.")
-        return
+        return []
 
-    nodes = mat.node_tree.nodes
+    outputs = preset["outputs"]
+    needed = {output["source"] for output in outputs if "source" in output}
+    needed.update(parse_channel(spec)[0] for output in outputs for spec in output.get("channels", ()))
+    needed.discard(None)
+    keywords = dict(SOURCE_KEYWORDS)
+    keywords.update((name, tuple(k.lower() for k in words)) for name, words in preset.get("sources", {}).items())
+    images = find_image_maps(mat.node_tree.nodes, {name: keywords.get(name, (name.lower(),)) for name in needed})
 
-    def find_image_map(keyword):
-        for node in nodes:
-            if node.type == 'TEX_IMAGE' and node.image:
-                if keyword in (node.image.name or "").upper() or keyword in (node.name or "").upper() or keyword in (node.label or "").upper():
-                    return node.image
-        return None
+    plan = []
+    for output in outputs:
+        if "source" in output:
+            plan.append(plan_image(images[output["source"]], mat.name, output["suffix"], props, mat_dir, manifest))
+        else:
+            plan.extend(plan_swizzle(mat, mat_dir, props, manifest, output, images,
+                                     preset.get("fallback", {}), operator))
+    if preset.get("others"):
+        used = {img.name for img in images.values() if img}
+        plan.extend(plan_material_images(mat, mat_dir, props, manifest, skip_images=used,
+                                         skip_suffixes={output["suffix"] for output in outputs}))
+    return plan
 
-    img_metallic = find_image_map("METAL")
-    img_roughness = find_image_map("ROUGH")
-    img_ao = find_image_map("AO")
+def plan_swizzle(mat, mat_dir, props, manifest, output, images, fallback, operator=None):
+    """Lập job texture ghép kênh: 1 job, hoặc 1 job mỗi tile nếu ảnh nguồn
+    là UDIM (`<mat>_<suffix>.1001.ext`). Rỗng nếu material không có ảnh nguồn nào."""
+    specs = [parse_channel(spec) for spec in output["channels"]]
+    names = list(dict.fromkeys(name for name, _, _, _ in specs if name))
+    sources = tuple(images[name] for name in names)
 
-    if not any([img_metallic, img_roughness, img_ao]):
+    if not any(sources):
         if operator:
-            operator.report({'WARNING'}, f"Không tìm thấy METAL / ROUGH / AO trong {mat.name}")
-        return
+            operator.report({'WARNING'}, f"Không tìm thấy {' / '.join(names)} cho {output['suffix']} trong {mat.name}")
+        return []
 
-    base_img = img_metallic or img_roughness or img_ao
-    width, height = base_img.size
+    tiles = sorted(set().union(*(udim_tiles(img) for img in sources if img)))
+    jobs = [plan_swizzle_job(mat, mat_dir, props, manifest, output, specs, names, sources, fallback, tile)
+            for tile in tiles or [None]]
+    return [job for job in jobs if job]
 
-    for img in (img_metallic, img_roughness, img_ao):
-        if img and img.size != (width, height):
-            if operator:
-                operator.report({'WARNING'}, f"Kích thước ảnh không khớp trong {mat.name}. Bỏ packing.")
-            return
+def swizzle_target_size(sizes, props):
+    """Kích thước texture ghép kênh theo props.mrao_target: ảnh nguồn lớn nhất,
+    nhỏ nhất, hoặc cạnh dài = props.mrao_size (giữ tỉ lệ ảnh nguồn lớn nhất)"""
+    if props.mrao_target == 'FIXED':
+        width, height = max(sizes, key=lambda size: size[0] * size[1])
+        scale = props.mrao_size / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    pick = max if props.mrao_target == 'LARGEST' else min
+    return pick(sizes, key=lambda size: size[0] * size[1])
 
-    packed_img = bpy.data.images.new(
-        name=f"{mat.name}_Packed_MRAO",
-        width=width,
-        height=height,
-        alpha=False,
-        float_buffer=False
-    )
+def plan_swizzle_job(mat, mat_dir, props, manifest, output, specs, names, sources, fallback, tile):
+    """Job ghép kênh cho cả ảnh (tile=None) hoặc 1 tile UDIM. Ảnh nguồn không
+    phải UDIM dùng chung cho mọi tile; nguồn thiếu (hoặc ảnh UDIM thiếu tile này)
+    thì kênh lấy giá trị fallback của preset."""
+    if tile is not None:
+        sources = tuple(img if img and (not udim_tiles(img) or tile in udim_tiles(img)) else None
+                        for img in sources)
+    present = [img for img in sources if img]
+    had_data = [image_has_data(img) for img in present]
+    sizes = [None if not img else tuple(tile_dimensions(img, tile) if tile is not None and udim_tiles(img)
+                                        else image_dimensions(img)[:2])
+             for img in sources]
+    for img, had in zip(present, had_data):
+        free_if_loaded_here(img, had)
 
-    def get_gray_pixels(image):
-        if not image:
-            return np.zeros((width * height,), dtype=float)
-        raw = list(image.pixels[:])
-        if len(raw) < width * height * 4:
-            return np.zeros((width * height,), dtype=float)
-        arr = np.array(raw, dtype=float)
-        return arr[0::4]
+    # mỗi ảnh nguồn: các kênh đầu ra lấy từ nó; nguồn thiếu / hằng số: giá trị cố định
+    taps = [[] for _ in sources]
+    constants = []
+    for index, (name, channel, invert, value) in enumerate(specs):
+        if name is not None and sources[names.index(name)]:
+            taps[names.index(name)].append((index, channel, invert))
+            continue
+        if name is not None:
+            value = float(fallback.get(name, 0.0))
+        constants.append((index, 1.0 - value if invert else value))
 
-    r_chan = get_gray_pixels(img_metallic)
-    g_chan = get_gray_pixels(img_roughness)
-    b_chan = get_gray_pixels(img_ao)
+    suffix = output["suffix"]
+    label = suffix if tile is None else f"{suffix} {tile}"
+    # kích thước khác nhau (hoặc khác kích thước cố định): resample kênh lệch thay vì bỏ material
+    width, height = swizzle_target_size([size for size in sizes if size], props)
+    resampled = [f"{name} {size[0]}x{size[1]}" for name, size in zip(names, sizes)
+                 if size and size != (width, height)]
 
-    new_pixels = np.empty((width * height * 4,), dtype=float)
-    new_pixels[0::4] = r_chan
-    new_pixels[1::4] = g_chan
-    new_pixels[2::4] = b_chan
-    new_pixels[3::4] = 1.0
+    ext = EXT_MAP.get(props.image_format, props.image_format.lower())
+    stem = f"{props.prefix}{mat.name.replace('.', '_')}_{suffix}{props.suffix}"
+    filename = f"{stem}.{ext}" if tile is None else f"{stem}.{tile}.{ext}"
+    filepath = bpy.path.abspath(os.path.join(mat_dir, filename))
+    if tile is None:
+        filepath = manifest.claim(filepath)
+    else:
+        manifest.names.reserve(filepath)  # tile giữ đúng mẫu <stem>.<tile>.ext của bộ UDIM
+    fmt = props.image_format
 
-    packed_img.pixels = new_pixels.tolist()
+    def content_hash(img):
+        if not img:
+            return "-"
+        return tile_content_hash(img, tile) if tile is not None and udim_tiles(img) else image_content_hash(img)
 
-    ext = EXT_MAP.get(props.image_format, props.image_format.lower())
-    filename = f"{props.prefix}{mat.name.replace('.', '_')}_packedMRAO{props.suffix}.{ext}"
-    filepath = os.path.join(mat_dir, filename)
+    record = {
+        "source": [image_source_id(img) if img else None for img in sources],
+        "hash": hashlib.blake2b("|".join(content_hash(img) for img in sources).encode(),
+                                digest_size=16).hexdigest(),
+        "format": fmt,
+        "settings": export_settings(props),
+        "channels": [str(spec) for spec in output["channels"]],
+    }
+    if constants:
+        record["constants"] = [list(constant) for constant in constants]  # so sánh với bản JSON
+    if tile is not None:
+        record["tile"] = tile
+    if resampled:
+        record["resample"] = f"{width}x{height}:{props.mrao_filter}"
+    encode = encode_options(props, suffix, fmt)
+    if encode:
+        record["encode"] = encode
+    largest = max(size[0] * size[1] for size in sizes if size)
+    out_channels = len(specs)
+    lods = plan_lods(filepath, width, height, out_channels, fmt, props, tile)
+    current = all(manifest.is_current(lod["path"], record) for lod in lods) and manifest.skip(filepath, record)
+    return {
+        "kind": "swizzle",
+        "label": label,
+        "sources": sources,
+        "source_names": names,
+        "source_sizes": sizes,
+        "taps": taps,
+        "constants": constants,
+        "channels": out_channels,
+        "resampled": resampled,
+        "filter": props.mrao_filter,
+        "tile": tile,
+        "material": mat.name,
+        "map_type": suffix,
+        "path": filepath,
+        "format": fmt,
+        "action": "skip" if current else ("encode" if fmt in THREAD_FORMATS else "save"),
+        "width": width,
+        "height": height,
+        "bytes": estimate_bytes(width, height, out_channels, fmt),
+        # buffer đọc float32 RGBA (ảnh nguồn lớn nhất) + kết quả uint8 + tối đa 1 ảnh nguồn decode cùng lúc
+        "memory": swizzle_memory_budget(width, height, largest, out_channels)
+                  + (0 if all(had_data) else largest * 4),
+        "record": record,
+        "lods": lods,
+        "lod_mode": lod_mode(suffix),
+        "lod_filter": props.lod_filter,
+    }
 
+def export_swizzled(job, pool, on_done, target, operator=None, lods=(), options=None):
+    """Ghép kênh các ảnh nguồn vào 1 mảng uint8 rồi encode/lưu ra `target`"""
+    mat_name, filepath, fmt, tile = job["material"], job["path"], job["format"], job.get("tile")
+    width, height, label, map_type = job["width"], job["height"], job["label"], job["map_type"]
+    budget = pool.budget
+
+    # 1 buffer đọc dùng lại cho mọi ảnh nguồn; mỗi ảnh nguồn được đọc 1 lần và mọi
+    # kênh đầu ra lấy từ nó được tính trong cùng 1 lượt theo dải (xem Pixel I/O).
+    # Ảnh nguồn được đọc lần lượt, ảnh nào exporter tự load thì giải phóng ngay sau khi đọc.
+    t_start = time.perf_counter()
+    npix = width * height
+    largest = max(size[0] * size[1] for size in job["source_sizes"] if size)
+    held = swizzle_memory_budget(width, height, largest, job["channels"])  # kết quả + buffer đọc
+    budget.acquire(held)
     try:
-        packed_img.filepath_raw = bpy.path.abspath(filepath)
-        packed_img.file_format = props.image_format
-        packed_img.save()
-        if operator:
-            operator.report({'INFO'}, f"✅ Xuất packed MRAO: {filepath}")
-    except Exception as e:
+        packed = np.zeros((height, width, job["channels"]), dtype=np.uint8)
+        for index, value in job["constants"]:
+            packed[..., index] = int(value * 255.0 + 0.5)
+        scratch = None
+        resampled = []
+        for offset, image in enumerate(job["sources"]):
+            if not image:
+                continue
+            cleanup = None
+            if tile is not None and udim_tiles(image):
+                image, cleanup = open_tile(image, tile)
+                had_data = False
+            else:
+                had_data = image_has_data(image)
+            src_width, src_height = job["source_sizes"][offset]
+            decoded = 0 if had_data else decoded_bytes(image, src_width, src_height)
+            budget.acquire(decoded)
+            try:
+                src_width, src_height = image.size
+                channels = getattr(image, "channels", 4)
+                if pixel_count(image) < src_width * src_height * channels:
+                    continue
+                taps = []
+                for index, channel, invert in job["taps"][offset]:
+                    if channel < channels:
+                        taps.append((channel, packed[..., index], invert))
+                    else:  # ảnh không có alpha: alpha = 1
+                        packed[..., index] = 0 if invert else 255
+                if not taps:
+                    continue
+                scratch = read_pixels(image, scratch)
+                if (src_width, src_height) == (width, height):
+                    quantize_channels(scratch, channels, width, taps)
+                else:
+                    resample_channels(scratch, channels, src_width, src_height, taps, filter_name=job["filter"])
+                    resampled.append(f"{job['source_names'][offset]} {src_width}x{src_height}")
+            finally:
+                if cleanup:
+                    cleanup()
+                else:
+                    free_if_loaded_here(image, had_data)
+                budget.release(decoded)
+        scratch = None
+        elapsed = time.perf_counter() - t_start
         if operator:
-            operator.report({'ERROR'}, f"❌ Lỗi khi lưu packed MRAO {filepath}: {str(e)}")
-    finally:
+            mp = max(npix / 1_000_000, 1e-6)
+            where = mat_name if tile is None else f"{mat_name} tile {tile}"
+            operator.report({'INFO'}, f"{map_type} {where}: {width}x{height}, "
+                                      f"{elapsed * 1000 / mp:.1f} ms/MP, "
+                                      f"~{held / 2**20:.0f} MB buffer")
+            if resampled:
+                operator.report({'INFO'}, f"{map_type} {where}: resample {', '.join(resampled)} "
+                                          f"→ {width}x{height} ({job['filter'].lower()})")
+        budget.release(held - packed.nbytes)  # buffer đọc đã bỏ
+        held = packed.nbytes
+
+        if fmt in THREAD_FORMATS:
+            # encode thẳng từ mảng uint8, không cần tạo image tạm trong Blender;
+            # từ đây pool giữ kết quả
+            budget.release(held)
+            held = 0
+            pool.submit(label, filepath, encode_uint8_and_write, target, fmt, packed, options,
+                        on_done=on_done, weight=job["bytes"], memory=packed.nbytes)
+            submit_lods(job, pool, lods, np.asarray, packed)
+            return
+
+        packed_img = bpy.data.images.new(
+            name=f"{mat_name}_{map_type}",
+            width=width,
+            height=height,
+            alpha=job["channels"] == 4,
+            float_buffer=False
+        )
         try:
-            bpy.data.images.remove(packed_img)
-        except Exception:
-            pass
+            rgba = np.empty(npix * 4, dtype=PIXEL_DTYPE)
+            budget.acquire(rgba.nbytes)
+            held += rgba.nbytes
+            write_pixels(packed_img, expand_uint8(packed, rgba))
+            rgba = None
+            save = save_to_entry if isinstance(target, ArchiveEntry) else save_with_blender
+            pool.run_inline(label, filepath, save, packed_img, target, fmt,
+                            on_done=on_done, weight=job["bytes"])
+            save_lods_inline(job, pool, lods, packed)
+            packed = None
+        finally:
+            try:
+                bpy.data.images.remove(packed_img)
+            except Exception:
+                pass
+    finally:
+        budget.release(held)
+
+def run_job(job, pool, manifest, store, operator=None, archive=None):
+    """Thực hiện 1 job trong kế hoạch. Job mang blob ghi ra <blob>.part,
+    xong thì link các file output của nhóm. Xuất archive thì ghi vào entry
+    (cả nhóm dedupe là 1 nội dung dưới nhiều tên)."""
+    if archive is not None:
+        names = [archive.name(path) for path, _ in job.get("links", [(job["path"], None)])]
+        target = ArchiveEntry(archive, names)
+
+        def on_done(entry=target):
+            extra = len(entry.names) - 1
+            store.deduped += extra
+            store.saved += entry.size * extra
+            if extra:
+                store.linked["tar hardlink" if archive.kind == 'TAR_ZST' else "zip entry"] += extra
+    elif job.get("blob"):
+        if job["action"] == "link":
+            pool.run_inline(job["label"], job["path"], store.publish, job, manifest, kind="linked", weight=job["bytes"])
+            return
+        target = job["blob"] + ".part"
+
+        def on_done(job=job):
+            store.publish(job, manifest)
+    else:
+        target = job["path"]
+
+        def on_done(filepath=job["path"], record=job["record"]):
+            manifest.record(filepath, record)
+
+    # mức LOD (job có LOD không nằm trong nhóm dedupe): mỗi mức 1 file / entry riêng
+    lods = []
+    for lod in job.get("lods", ()):
+        if archive is not None:
+            lods.append((lod, ArchiveEntry(archive, [archive.name(lod["path"])]), None))
+        else:
+            def lod_done(filepath=lod["path"], record=job["record"]):
+                manifest.record(filepath, record)
+            lods.append((lod, lod["path"], lod_done))
+
+    options = output_options(job, pool, [path for path, _ in job.get("links", [(job["path"], None)])])
+    if job["kind"] == "swizzle":
+        export_swizzled(job, pool, on_done, target, operator, lods, options)
+    elif job["kind"] == "atlas":
+        export_atlas_map(job, pool, on_done, target, lods, options)
+    elif job["kind"] == "atlas_layout":
+        pool.submit(job["label"], job["path"], write_output, target, job["data"],
+                    on_done=on_done, weight=job["bytes"])
+    else:
+        export_image(job, pool, on_done, target, lods, options)
 
 # =========================
 #   Export Main
 # =========================
 
-def export_maps(objects, props, operator=None):
+def start_export(objects, props, operator=None, materials=None):
+    """Lập kế hoạch xuất cho `objects` (None = cả scene), hoặc đúng danh sách `materials`,
+    trả về ExportRun (chưa ghi gì).
+    Xuất archive luôn ghi lại toàn bộ archive: không bỏ qua theo manifest, không dùng blob trên đĩa."""
+    PROFILE.start(props.profile)
     base_export_dir = bpy.path.abspath(props.directory)
-    os.makedirs(base_export_dir, exist_ok=True)
+    archive = None
+    if props.output != 'FOLDER':
+        archive = ArchiveWriter(base_export_dir, props.output, props.archive_level)
+    manifest = ExportManifest(base_export_dir, props.incremental and archive is None, on_disk=archive is None)
+    with PROFILE.stage("plan"):
+        plan = plan_exports(objects, props, base_export_dir, manifest, operator, materials)
+    store = BlobStore(base_export_dir, props.dedupe)
+    with PROFILE.stage("plan.dedupe"):
+        dedupe_plan(plan, store, manifest.names, reuse=archive is None)
+    return QEMPExportRun(plan, props, manifest, operator, store, archive)
+
+def export_maps(objects, props, operator=None, dry_run=None):
+    """Xuất map của mọi material trên `objects` (None = cả scene). Trả về số file ghi/bỏ qua, danh sách lỗi
+    và kế hoạch xuất. Dry run (mặc định theo props.dry_run): chỉ lập kế hoạch, không ghi gì."""
+    return run_export(start_export(objects, props, operator), props, operator, dry_run)
+
+def run_export(run, props, operator=None, dry_run=None):
+    """Chạy một mạch ExportRun của export_maps / export_atlas, hoặc chỉ in kế hoạch (dry run)"""
+    if dry_run is None:
+        dry_run = props.dry_run
+    if dry_run:
+        summary = plan_summary(run.plan)
+        archive = run.archive.path if run.archive is not None else None
+        print_plan(summary, archive or run.manifest.root)
+        t = summary["totals"]
+        if operator:
+            operator.report({'INFO'}, f"Dry run: {t['jobs']} file ({t['link'] + t['dedupe']} dùng chung nội dung), "
+                                      f"bỏ qua {t['skip']} file không đổi, "
+                                      f"ước tính ~{t['bytes'] / 1048576:.1f} MB (xem Console).")
+        return {
+            "dry_run": True,
+            "plan": summary,
+            "exported": 0,
+            "skipped": run.manifest.skipped,
+            "failed": [],
+            "export_dir": run.manifest.root,
+            "archive": archive,
+            "profile": dry_run_profile(),
+            **run.info,
+        }
+
+    try:
+        while run.jobs:
+            run.run_next()
+    finally:
+        run.finish()
+    result = run.result()
+    report_result(result, operator)
+    return result
+
+def report_result(result, operator=None):
+    if operator:
+        if result.get("cancelled"):
+            operator.report({'WARNING'}, f"Đã hủy: ghi xong {result['exported']} file trước khi dừng.")
+        else:
+            operator.report({'INFO'}, f"Đã ghi {result['exported']} file, bỏ qua {result['skipped']} file không đổi, "
+                                      f"RAM pixel đỉnh ~{result['peak_memory'] / 1048576:.0f} MB.")
+            if result.get("atlas"):
+                atlas = result["atlas"]
+                width, height = atlas["resolution"]
+                operator.report({'INFO'}, f"Atlas {width}x{height}: {atlas['materials']} material "
+                                          f"→ {atlas['export_dir']}")
+            if result.get("archive"):
+                operator.report({'INFO'}, f"Archive: {result['archive']}")
+            if result["deduped"]:
+                modes = ", ".join(f"{n} {m}" for m, n in result["link_modes"].items())
+                operator.report({'INFO'}, f"{result['deduped']} file dùng chung nội dung ({modes}), "
+                                          f"tiết kiệm ~{result['dedupe_saved_bytes'] / 1048576:.1f} MB.")
+            if result.get("profile"):
+                operator.report({'INFO'}, f"Profiling: {result['profile']['wall_seconds']:.2f} s "
+                                          "(tóm tắt trong panel, report JSON/CSV: xem Console).")
+
+    if result["failed"] and operator:
+        operator.report({'WARNING'}, f"Có {len(result['failed'])} lỗi khi xuất (xem Console).")
+        print("[QEMP] Failed list:")
+        for fentry in result["failed"]:
+            print(fentry)
+
+def plan_exports(objects, props, base_export_dir, manifest, operator=None, materials=None):
+    """Duyệt material trên main thread, lập danh sách job (chưa ghi gì ra đĩa)"""
+    plan = []
+    preset = active_preset(props)
+    if materials is None:
+        with PROFILE.stage("plan.materials"):
+            materials = object_materials(objects)
+    PROFILE.count("materials", len(materials))
+    for mat in materials:
+        # Thư mục riêng cho từng material
+        mat_dir = os.path.join(base_export_dir, mat.name.replace(".", "_"))
+
+        if preset.get("outputs"):
+            plan.extend(plan_preset_outputs(mat, mat_dir, props, manifest, preset, operator))
+        else:
+            plan.extend(plan_material_images(mat, mat_dir, props, manifest))
+    return [job for job in plan if job]
+
+def object_materials(objects=None):
+    """Material dùng node của `objects` (None = mọi object của scene hiện tại), mỗi material
+    1 lần, theo thứ tự bpy.data.materials.
+    Duyệt theo material chứ không theo object: 1 lần bpy.data.user_map cho material ->
+    data block (mesh, curve...) / object gắn material trực tiếp, 1 lần nữa cho data block ->
+    object dùng nó, rồi mỗi material chỉ cần tìm ra 1 object trong phạm vi. 100k instance
+    dùng chung 50 mesh chỉ tốn vài lượt kiểm tra, không phải 100k lượt duyệt material_slots.
+    Object có slot link == 'OBJECT' (user trực tiếp của material) che material của mesh ở
+    slot đó: chỉ những object này mới duyệt material_slots (slot.material đã resolve link),
+    material của data block chỉ tính qua object không che slot nào."""
+    mats = [mat for mat in bpy.data.materials if getattr(mat, "use_nodes", False)]
+    if not mats:
+        return []
+    mat_users = bpy.data.user_map(subset=mats)
+    overriding = {user for users in mat_users.values() for user in users if isinstance(user, bpy.types.Object)}
+    data_blocks = {user for users in mat_users.values() for user in users if not isinstance(user, bpy.types.Object)}
+    data_users = bpy.data.user_map(subset=list(data_blocks)) if data_blocks else {}
+
+    if objects is None:
+        scene = bpy.context.scene
+        collections = {scene.collection, *scene.collection.children_recursive}
+
+        def in_scope(obj):
+            return any(coll in collections for coll in obj.users_collection)
+
+        def data_in_scope(data):
+            return any(in_scope(user) for user in data_users.get(data, ())
+                       if isinstance(user, bpy.types.Object) and user not in overriding)
+    else:
+        # chọn nhiều object: chỉ gom object + data của chúng 1 lần
+        selected = set(objects)
+        selected_data = {obj.data for obj in selected
+                         if getattr(obj, "data", None) is not None and obj not in overriding}
+
+        def in_scope(obj):
+            return obj in selected
+
+        def data_in_scope(data):
+            return data in selected_data
+
+    used = {slot.material for obj in overriding if in_scope(obj) for slot in obj.material_slots if slot.material}
+    return [mat for mat in mats
+            if mat in used or any(data_in_scope(user) for user in mat_users.get(mat, ())
+                                  if not isinstance(user, bpy.types.Object))]
+
+def node_map_type(node):
+    """Loại map của 1 TEX_IMAGE node, đoán từ tên ảnh / tên node / label (None nếu không rõ)"""
+    # kiểm tra cả image.name, node.name và node.label để bắt tên
+    checks = " ".join([
+        (node.image.name or "").lower(),
+        (node.name or "").lower(),
+        (node.label or "").lower()
+    ])
 
-    exported_mats = set()
-    for obj in objects:
-        if not getattr(obj, "material_slots", None):
+    if any(k in checks for k in ("base", "albedo", "diffuse")):
+        return "BaseColor"
+    if "normal" in checks:
+        return "Normal"
+    if "rough" in checks:
+        return "Roughness"
+    if "metal" in checks:
+        return "Metallic"
+    if any(k in checks for k in ("ao", "occlusion", "ambient")):
+        return "AO"
+    if any(k in checks for k in ("emis", "emit")):
+        return "Emissive"
+    if any(k in checks for k in ("height", "disp", "displacement")):
+        return "Height"
+    if any(k in checks for k in ("alpha", "opacity", "trans")):
+        return "Opacity"
+    if "spec" in checks:
+        return "Specular"
+    return None
+
+def plan_material_images(mat, mat_dir, props, manifest, skip_images=(), skip_suffixes=()):
+    """Job xuất nguyên từng ảnh của material, đặt tên theo loại map nhận diện từ tên.
+    skip_images / skip_suffixes: ảnh và loại map preset đã xuất theo cách khác."""
+    # Lấy tất cả TEX_IMAGE node (không cần nối vào BSDF)
+    if not getattr(mat, "node_tree", None):
+        return []
+
+    plan = []
+    tex_nodes = [n for n in mat.node_tree.nodes if n.type == "TEX_IMAGE" and getattr(n, "image", None)]
+    exported_images = set(skip_images)  # tránh xuất trùng cùng 1 image nhiều lần
+
+    for node in tex_nodes:
+        img = node.image
+        if not img:
+            continue
+        # tránh trùng
+        if img.name in exported_images:
+            continue
+        exported_images.add(img.name)
+
+        suffix = node_map_type(node)
+        if suffix is None:
+            # Nếu không nằm trong danh sách loại map, xuất theo tên gốc (tiện cho trường hợp custom)
+            # Bạn có thể bỏ dòng này nếu không muốn xuất file lạ
+            suffix = (img.name or "texture").replace(" ", "_")
+        if suffix in skip_suffixes:
+            continue
+        plan.append(plan_image(img, mat.name, suffix, props, mat_dir, manifest))
+    return plan
+
+def plan_summary(plan):
+    """Bản JSON của kế hoạch + tổng (report dry run, batch CLI)"""
+    jobs = []
+    totals = dict.fromkeys(("jobs", "encode", "save", "link", "dedupe", "skip", "bytes", "dedupe_bytes"), 0)
+    for job in plan:
+        jobs.append({
+            "path": job["path"],
+            "material": job["material"],
+            "map_type": job["map_type"],
+            "format": job["format"],
+            "resolution": [job["width"], job["height"]],
+            "bytes": job["bytes"],
+            "action": job["action"],
+            "reencode": job["action"] in ("encode", "save"),
+        })
+        if job.get("resampled"):
+            jobs[-1]["resampled"] = job["resampled"]
+        if job.get("lods"):
+            jobs[-1]["lods"] = [{"path": lod["path"], "resolution": [lod["width"], lod["height"]],
+                                 "bytes": lod["bytes"]} for lod in job["lods"]]
+        totals[job["action"]] += 1
+        if job["action"] == "skip":
             continue
-        for slot in obj.material_slots:
-            mat = slot.material
-            if not mat or not getattr(mat, "use_nodes", False):
+        totals["jobs"] += job_files(job)
+        if job["action"] in ("link", "dedupe"):
+            totals["dedupe_bytes"] += job["bytes"]  # lấy từ kho blob
+        else:
+            totals["bytes"] += job_bytes(job)
+    return {"jobs": jobs, "totals": totals}
+
+def print_plan(summary, export_dir):
+    print(f"[QEMP] Dry run → {export_dir}")
+    for job in summary["jobs"]:
+        width, height = job["resolution"]
+        print(f"[QEMP]   {job['action']:<6} {job['map_type']:<10} {job['format']:<5} "
+              f"{width}x{height:<6} ~{job['bytes'] / 1048576:8.2f} MB  {job['path']}")
+        if job.get("resampled"):
+            print(f"[QEMP]          resample {', '.join(job['resampled'])} → {width}x{height}")
+        for lod in job.get("lods", ()):
+            w, h = lod["resolution"]
+            print(f"[QEMP]            LOD {w}x{h:<6} ~{lod['bytes'] / 1048576:8.2f} MB  {lod['path']}")
+    t = summary["totals"]
+    print(f"[QEMP] {t['jobs']} file ({t['link'] + t['dedupe']} dùng chung nội dung), bỏ qua {t['skip']}, "
+          f"ước tính ~{t['bytes'] / 1048576:.1f} MB (tiết kiệm ~{t['dedupe_bytes'] / 1048576:.1f} MB)")
+
+# =========================
+#   Atlas (gộp nhiều material)
+# =========================
+
+# Mỗi material chiếm 1 ô (cỡ ảnh lớn nhất của nó) ở cùng vị trí trong mọi atlas,
+# mỗi loại map 1 atlas: <thư mục xuất>/<tên atlas>/<tên atlas>_<MapType>.ext, kèm
+# <tên atlas>.json chứa offset/scale UV của từng material (uv' = uv * scale + offset,
+# gốc UV ở góc dưới trái như Blender). Xếp ô bằng skyline bottom-left; ô được
+# quantize/resample thẳng vào view của atlas (không có ảnh trung gian), viền
+# `atlas_padding` px lặp pixel mép để mip không lem màu ô bên cạnh.
+# Mỗi atlas và file layout là 1 job của ExportRun (thư mục gốc: <thư mục xuất>/<tên atlas>),
+# nên atlas dùng chung archive, manifest (xuất tăng dần), kho blob và chạy modal như export_maps.
+ATLAS_LAYOUT_VERSION = 1
+ATLAS_MAP_TYPES = ("BaseColor", "Normal", "Roughness", "Metallic", "AO", "Emissive", "Height", "Opacity", "Specular")
+# màu nền cho material không có map đó (uint8 RGBA, gần giá trị mặc định của Principled BSDF)
+ATLAS_FILL = {
+    "BaseColor": (231, 231, 231, 255),
+    "Normal": (128, 128, 255, 255),
+    "Roughness": (128, 128, 128, 255),
+    "AO": (255, 255, 255, 255),
+    "Opacity": (255, 255, 255, 255),
+}
+
+def atlas_sources(objects):
+    """[(material, {loại map: ảnh})] của các material có ít nhất 1 map atlas dùng được
+    (ảnh UDIM không gộp được vào atlas)"""
+    found = []
+    for mat in object_materials(objects):
+        if not getattr(mat, "node_tree", None):
+            continue
+        maps = {}
+        for node in mat.node_tree.nodes:
+            if node.type != 'TEX_IMAGE' or not getattr(node, "image", None):
                 continue
-            if mat.name in exported_mats:
+            if getattr(node.image, "source", 'FILE') == 'TILED':
                 continue
-            exported_mats.add(mat.name)
+            map_type = node_map_type(node)
+            if map_type is not None and map_type not in maps:
+                maps[map_type] = node.image
+        if maps:
+            found.append((mat, maps))
+    return found
+
+def atlas_channels(map_type, fmt):
+    return 4 if map_type == "BaseColor" and fmt != 'JPEG' else 3
+
+def blit_tile(atlas, rect, pixels, channels, src_width, src_height, filter_name):
+    """Ảnh nguồn (buffer float phẳng) -> ô `rect` của atlas uint8, resample nếu khác cỡ"""
+    x, y, w, h = rect
+    tile = atlas[y:y + h, x:x + w]
+    taps = []
+    for c in range(tile.shape[2]):
+        if c < 3:
+            taps.append((0 if channels < 3 else c, tile[..., c], False))  # ảnh xám: R = G = B
+        elif channels in (2, 4):
+            taps.append((channels - 1, tile[..., c], False))
+        else:
+            tile[..., c] = 255  # nguồn không có alpha
+    if (src_width, src_height) == (w, h):
+        quantize_channels(pixels, channels, src_width, taps)
+    else:
+        resample_channels(pixels, channels, src_width, src_height, taps, filter_name)
+
+def extend_tile_edges(atlas, rect, padding):
+    """Lặp pixel mép của ô ra viền `padding` px quanh nó"""
+    if not padding:
+        return
+    x, y, w, h = rect
+    height, width = atlas.shape[:2]
+    y0, y1 = max(0, y - padding), min(height, y + h + padding)
+    x0, x1 = max(0, x - padding), min(width, x + w + padding)
+    atlas[y0:y, x:x + w] = atlas[y:y + 1, x:x + w]
+    atlas[y + h:y1, x:x + w] = atlas[y + h - 1:y + h, x:x + w]
+    atlas[y0:y1, x0:x] = atlas[y0:y1, x:x + 1]
+    atlas[y0:y1, x + w:x1] = atlas[y0:y1, x + w - 1:x + w]
+
+def plan_atlas(objects, props):
+    """Chọn material, xếp ô và đặt tên file (chưa đọc pixel nào)"""
+    sources = atlas_sources(objects)
+    if not sources:
+        raise ValueError("Không có material nào có texture để gộp atlas")
+    sizes = []
+    image_sizes = {}  # tên ảnh -> (rộng, cao)
+    for mat, maps in sources:
+        for image in maps.values():
+            if image.name not in image_sizes:
+                image_sizes[image.name] = tuple(image_dimensions(image)[:2])
+        sizes.append(max((image_sizes[image.name] for image in maps.values()), key=lambda d: d[0] * d[1]))
+    width, height, scale, rects = atlas_layout(sizes, props.atlas_size, props.atlas_padding)
+    name = props.atlas_name or "Atlas"
+    export_dir = os.path.join(bpy.path.abspath(props.directory), name)
+    ext = EXT_MAP.get(props.image_format, props.image_format.lower())
+    map_types = [t for t in ATLAS_MAP_TYPES if any(t in maps for _, maps in sources)]
+    return {
+        "name": name,
+        "export_dir": export_dir,
+        "format": props.image_format,
+        "width": width,
+        "height": height,
+        "scale": scale,
+        "padding": props.atlas_padding,
+        "sources": sources,
+        "image_sizes": image_sizes,
+        "rects": rects,
+        "maps": {t: os.path.join(export_dir, f"{props.prefix}{name}_{t}{props.suffix}.{ext}") for t in map_types},
+    }
 
-            # Thư mục riêng cho từng material
-            mat_dir = os.path.join(base_export_dir, mat.name.replace(".", "_"))
-            os.makedirs(mat_dir, exist_ok=True)
+def atlas_layout_json(atlas):
+    width, height = atlas["width"], atlas["height"]
+    return {
+        "version": ATLAS_LAYOUT_VERSION,
+        "size": [width, height],
+        "padding": atlas["padding"],
+        "scale": atlas["scale"],
+        "maps": {t: os.path.basename(path) for t, path in atlas["maps"].items()},
+        "materials": {
+            mat.name: {
+                "rect": list(rect),
+                "offset": [rect[0] / width, rect[1] / height],
+                "scale": [rect[2] / width, rect[3] / height],
+                "maps": sorted(maps),
+            }
+            for (mat, maps), rect in zip(atlas["sources"], atlas["rects"])
+        },
+    }
 
-            if props.preset == "PACKED_MRAO":
-                export_packed_mrao(mat, mat_dir, props, operator)
+def plan_atlas_jobs(atlas, props, manifest):
+    """Job của mỗi atlas + file layout JSON. Record gồm hash mọi ảnh nguồn của loại map
+    và vị trí ô: đổi ảnh, material hay cách xếp thì atlas được xuất lại."""
+    fmt = atlas["format"]
+    width, height = atlas["width"], atlas["height"]
+    layout = {"size": [width, height], "padding": atlas["padding"], "rects": [list(r) for r in atlas["rects"]],
+              "filter": props.mrao_filter}
+    hashes = {}  # tên ảnh -> hash (ảnh dùng chung cho nhiều material chỉ hash 1 lần)
+    plan = []
+    for map_type in list(atlas["maps"]):
+        path = atlas["maps"][map_type] = manifest.claim(atlas["maps"][map_type])
+        images = [maps.get(map_type) for _, maps in atlas["sources"]]
+        for image in images:
+            if image is not None and image.name not in hashes:
+                with PROFILE.stage("plan.hash"):
+                    hashes[image.name] = image_content_hash(image)
+        key = "|".join(hashes[image.name] if image is not None else "-" for image in images)
+        key += "|" + json.dumps(layout, sort_keys=True)
+        record = {
+            "source": [image_source_id(image) if image is not None else None for image in images],
+            "hash": hashlib.blake2b(key.encode(), digest_size=16).hexdigest(),
+            "format": fmt,
+            "settings": export_settings(props),
+        }
+        encode = encode_options(props, map_type, fmt)
+        if encode:
+            record["encode"] = encode
+        channels = atlas_channels(map_type, fmt)
+        lods = plan_lods(path, width, height, channels, fmt, props)
+        current = all(manifest.is_current(lod["path"], record) for lod in lods) and manifest.skip(path, record)
+        largest = max(w * h for w, h in (atlas["image_sizes"][image.name] for image in images if image is not None))
+        plan.append({
+            "kind": "atlas",
+            "label": f"Atlas {map_type}",
+            "atlas": atlas,
+            "filter": props.mrao_filter,
+            "material": atlas["name"],
+            "map_type": map_type,
+            "path": path,
+            "format": fmt,
+            "action": "skip" if current else ("encode" if fmt in THREAD_FORMATS else "save"),
+            "width": width,
+            "height": height,
+            "bytes": estimate_bytes(width, height, channels, fmt),
+            # atlas uint8 + buffer đọc float32 RGBA của ảnh nguồn lớn nhất
+            "memory": width * height * channels + largest * 16,
+            "record": record,
+            "lods": lods,
+            "lod_mode": lod_mode(map_type, next(image for image in images if image is not None)),
+            "lod_filter": props.lod_filter,
+        })
+
+    path = atlas["layout"] = manifest.claim(os.path.join(atlas["export_dir"], f"{atlas['name']}.json"))
+    data = json.dumps(atlas_layout_json(atlas), indent=1).encode("utf-8")  # sau claim: tên map đã chốt
+    record = {
+        "source": atlas["name"],
+        "hash": hashlib.blake2b(data, digest_size=16).hexdigest(),
+        "format": "JSON",
+        "settings": export_settings(props),
+    }
+    plan.append({
+        "kind": "atlas_layout",
+        "label": "Atlas layout",
+        "data": data,
+        "material": atlas["name"],
+        "map_type": "Layout",
+        "path": path,
+        "format": "JSON",
+        "action": "skip" if manifest.skip(path, record) else "encode",
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+        "memory": 0,
+        "record": record,
+    })
+    return plan
+
+def build_atlas(atlas, map_type, filter_name, failed):
+    """Main thread: đọc ảnh nguồn của 1 loại map, blit vào 1 mảng uint8 (hàng dưới lên trên)"""
+    channels = atlas_channels(map_type, atlas["format"])
+    fill = ATLAS_FILL.get(map_type, (0, 0, 0, 255))[:channels]
+    canvas = np.empty((atlas["height"], atlas["width"], channels), dtype=np.uint8)
+    canvas[...] = fill
+    buf = None
+    placed = {}  # (ảnh, cỡ ô) -> ô đã blit: material dùng chung ảnh chỉ copy lại
+    for (mat, maps), rect in zip(atlas["sources"], atlas["rects"]):
+        image = maps.get(map_type)
+        if image is not None:
+            key = (image.name, rect[2], rect[3])
+            if key in placed:
+                x, y, w, h = placed[key]
+                canvas[rect[1]:rect[1] + h, rect[0]:rect[0] + w] = canvas[y:y + h, x:x + w]
             else:
-                # Lấy tất cả TEX_IMAGE node (không cần nối vào BSDF)
-                if not getattr(mat, "node_tree", None):
-                    continue
+                had_data = image_has_data(image)
+                try:
+                    width, height = image.size
+                    src_channels = getattr(image, "channels", 4)
+                    if width * height == 0 or pixel_count(image) != width * height * src_channels:
+                        raise RuntimeError("Ảnh không có dữ liệu pixel")
+                    buf = read_pixels(image, buf)
+                    blit_tile(canvas, rect, buf, src_channels, width, height, filter_name)
+                    placed[key] = rect
+                except Exception as e:
+                    failed.append((f"{mat.name} / {map_type}", str(e)))
+                    print(f"[QEMP] Atlas: bỏ qua {image.name} ({mat.name}, {map_type}): {e}")
+                finally:
+                    free_if_loaded_here(image, had_data)
+        extend_tile_edges(canvas, rect, atlas["padding"])
+    return canvas
+
+def export_atlas_map(job, pool, on_done, target, lods=(), options=None):
+    """Dựng 1 atlas trên main thread (đọc pixel) rồi encode + ghi ở worker,
+    song song với việc dựng atlas kế tiếp"""
+    fmt = job["format"]
+    pool.budget.acquire(job["memory"])
+    try:
+        with PROFILE.stage("atlas.build"):
+            canvas = build_atlas(job["atlas"], job["map_type"], job["filter"], pool.failed)
+    finally:
+        pool.budget.release(job["memory"])
+    if fmt in THREAD_FORMATS:
+        pool.submit(job["label"], job["path"], encode_uint8_and_write, target, fmt, canvas, options,
+                    on_done=on_done, weight=job["bytes"], memory=canvas.nbytes)
+        submit_lods(job, pool, lods, np.asarray, canvas)
+    else:
+        pool.run_inline(job["label"], job["path"], save_array_with_blender, canvas, target, fmt,
+                        on_done=on_done, weight=job["bytes"])
+        save_lods_inline(job, pool, lods, canvas)
 
-                tex_nodes = [n for n in mat.node_tree.nodes if n.type == "TEX_IMAGE" and getattr(n, "image", None)]
-                exported_images = set()  # tránh xuất trùng cùng 1 image nhiều lần
-
-                for node in tex_nodes:
-                    img = node.image
-                    if not img:
-                        continue
-                    # tránh trùng
-                    if img.name in exported_images:
-                        continue
-                    exported_images.add(img.name)
-
-                    # kiểm tra cả image.name, node.name và node.label để bắt tên
-                    checks = " ".join([
-                        (img.name or "").lower(),
-                        (node.name or "").lower(),
-                        (node.label or "").lower()
-                    ])
-
-                    if any(k in checks for k in ("base", "albedo", "diffuse")):
-                        export_image(img, mat.name, "BaseColor", props, mat_dir, operator)
-                    elif "normal" in checks:
-                        export_image(img, mat.name, "Normal", props, mat_dir, operator)
-                    elif "rough" in checks:
-                        export_image(img, mat.name, "Roughness", props, mat_dir, operator)
-                    elif "metal" in checks:
-                        export_image(img, mat.name, "Metallic", props, mat_dir, operator)
-                    elif any(k in checks for k in ("ao", "occlusion", "ambient")):
-                        export_image(img, mat.name, "AO", props, mat_dir, operator)
-                    elif any(k in checks for k in ("emis", "emit")):
-                        export_image(img, mat.name, "Emissive", props, mat_dir, operator)
-                    elif any(k in checks for k in ("height", "disp", "displacement")):
-                        export_image(img, mat.name, "Height", props, mat_dir, operator)
-                    elif any(k in checks for k in ("alpha", "opacity", "trans")):
-                        export_image(img, mat.name, "Opacity", props, mat_dir, operator)
-                    elif "spec" in checks:
-                        export_image(img, mat.name, "Specular", props, mat_dir, operator)
-                    else:
-                        # Nếu không nằm trong danh sách trên, xuất theo tên gốc (tiện cho trường hợp custom)
-                        # Bạn có thể bỏ dòng này nếu không muốn xuất file lạ
-                        safe_name = (img.name or "texture").replace(" ", "_")
-                        export_image(img, mat.name, safe_name, props, mat_dir, operator)
+def atlas_summary(atlas):
+    """Bản JSON của atlas dự kiến (dry run, batch CLI)"""
+    width, height = atlas["width"], atlas["height"]
+    per_map = estimate_bytes(width, height, 3, atlas["format"])
+    return {
+        "export_dir": atlas["export_dir"],
+        "resolution": [width, height],
+        "scale": atlas["scale"],
+        "materials": len(atlas["sources"]),
+        "maps": {t: os.path.basename(path) for t, path in atlas["maps"].items()},
+        "layout": os.path.basename(atlas["layout"]),
+        "bytes": per_map * len(atlas["maps"]),
+    }
+
+def start_atlas(objects, props, operator=None):
+    """Như start_export cho atlas: xếp ô, lập job mỗi loại map + layout, trả về ExportRun
+    (chưa ghi gì). Archive nằm cạnh thư mục atlas: <thư mục xuất>/<tên atlas>.zip."""
+    PROFILE.start(props.profile)
+    with PROFILE.stage("plan"):
+        atlas = plan_atlas(objects, props)
+    export_dir = atlas["export_dir"]
+    archive = None
+    if props.output != 'FOLDER':
+        archive = ArchiveWriter(export_dir, props.output, props.archive_level)
+    manifest = ExportManifest(export_dir, props.incremental and archive is None, on_disk=archive is None)
+    with PROFILE.stage("plan"):
+        plan = plan_atlas_jobs(atlas, props, manifest)
+    store = BlobStore(export_dir, props.dedupe)
+    with PROFILE.stage("plan.dedupe"):
+        dedupe_plan(plan, store, manifest.names, reuse=archive is None)
+    run = QEMPExportRun(plan, props, manifest, operator, store, archive)
+    run.info["atlas"] = atlas_summary(atlas)
+    print(f"[QEMP] Atlas {atlas['width']}x{atlas['height']} (tỉ lệ {atlas['scale']:.3f}), "
+          f"{len(atlas['sources'])} material, {len(atlas['maps'])} map → {archive.path if archive else export_dir}")
+    return run
+
+def export_atlas(objects, props, operator=None, dry_run=None):
+    """Gộp map của mọi material trên `objects` thành 1 atlas mỗi loại map + layout JSON,
+    theo output / xuất tăng dần / dedupe của props như export_maps"""
+    return run_export(start_atlas(objects, props, operator), props, operator, dry_run)
+
+# =========================
+#   Chạy kế hoạch (chặn, hoặc từng phần theo timer của modal)
+# =========================
+
+class QEMPExportRun(ExportRun):
+    """ExportRun của QEMP: thêm giá trị map 1 màu (SIDECAR) vào archive / sidecar + manifest"""
+
+    def __init__(self, plan, props, manifest, operator=None, store=None, archive=None):
+        super().__init__(plan, manifest, props.workers, props.memory_budget, store, archive, operator)
+        self.pool.constants = {}  # đường dẫn output -> giá trị map 1 màu (SIDECAR, worker ghi)
+        # blob -> giá trị map 1 màu theo manifest cũ: output chỉ được link lại (không encode) vẫn có giá trị
+        self.blob_constants = {entry["blob"]: entry["constant"] for entry in manifest.entries.values()
+                               if "constant" in entry and entry.get("blob")}
+
+    def queue(self, job):
+        run_job(job, self.pool, self.manifest, self.store, self.pool.operator, self.archive)
+
+    def archive_extras(self):
+        if self.pool.constants:
+            self.archive.add([CONSTANTS_NAME], constants_json(
+                {self.archive.name(path): value for path, value in self.pool.constants.items()}))
+
+    def close_folder(self):
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            self.save_constants()
+        except OSError as e:
+            print(f"[QEMP] Không ghi được {CONSTANTS_NAME}: {e}")
+        super().close_folder()
+
+    def save_constants(self):
+        """Giá trị map 1 màu (SIDECAR) nằm trong entry manifest của output, nên sidecar vẫn đủ
+        khi lần xuất tăng dần bỏ qua output không đổi. Không còn map nào thì xoá sidecar cũ."""
+        entries = self.manifest.entries
+        for path, value in self.pool.constants.items():
+            entry = entries.get(self.manifest.relpath(path))
+            if entry is not None:
+                entry["constant"] = value
+        for entry in entries.values():
+            if entry.get("blob") in self.blob_constants:
+                entry.setdefault("constant", self.blob_constants[entry["blob"]])
+        constants = {rel: entry["constant"] for rel, entry in entries.items() if "constant" in entry}
+        path = os.path.join(self.manifest.root, CONSTANTS_NAME)
+        if constants:
+            write_atomic(path, constants_json(constants))
+        elif self.manifest.names.exists(path):
+            os.remove(path)
 
 # =========================
 #   Operators
 # =========================
 
-class QEMP_OT_export_selected(bpy.types.Operator):
-    bl_idname = "qemp.export_selected"
-    bl_label = "Export Selected Objects"
+class QEMPExportOperator:
+    """Chung cho các operator xuất: execute chạy chặn (script, redo),
+    invoke (bấm nút trong panel) chạy modal theo timer, Esc để hủy.
+    selected_only: True = xuất object đang chọn, False = cả scene (gom material không cần duyệt object).
+    start() lập kế hoạch thành ExportRun (atlas ghi đè)."""
+
+    _timer = None
+    _run = None
+
+    @classmethod
+    def poll(cls, context):
+        return EXPORT_STATE["run"] is None  # mỗi lúc chỉ 1 lần xuất
+
+    def get_objects(self, context):
+        return list(context.selected_objects) if self.selected_only else None
+
+    def start(self, context, props):
+        return start_export(self.get_objects(context), props, self)
+
+    def start_or_report(self, context, props):
+        """ExportRun, None nếu output không dùng được hoặc không lập được kế hoạch (đã báo lỗi)"""
+        if not self.check_output(props):
+            return None
+        try:
+            return self.start(context, props)
+        except (ValueError, OSError) as e:
+            self.report({'ERROR'}, str(e))
+            return None
+
+    def check_output(self, props):
+        if props.output == 'TAR_ZST' and zstd_module() is None:
+            self.report({'ERROR'}, ZSTD_MISSING)
+            return False
+        return True
 
     def execute(self, context):
         props = context.scene.qemp_props
-        objects = context.selected_objects
-        export_maps(objects, props, self)
+        run = self.start_or_report(context, props)
+        if run is None:
+            return {'CANCELLED'}
+        run_export(run, props, self)
         return {'FINISHED'}
 
-class QEMP_OT_export_all(bpy.types.Operator):
+    def invoke(self, context, event):
+        props = context.scene.qemp_props
+        if props.dry_run:
+            return self.execute(context)
+        self._run = self.start_or_report(context, props)
+        if self._run is None:
+            return {'CANCELLED'}
+        if not self._run.jobs:
+            self._run.finish()
+            report_result(self._run.result(), self)
+            return {'FINISHED'}
+
+        EXPORT_STATE["run"] = self._run
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(MODAL_TIMER_SECONDS, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self._run.cancel()
+            self.finish_modal(context)
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        done = self._run.step()
+        tag_redraw_panels(context)
+        if done:
+            self.finish_modal(context)
+            return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+    def cancel(self, context):
+        # Blender tự dừng modal (mở file khác, đóng cửa sổ)
+        self._run.cancel()
+        self.finish_modal(context)
+
+    def finish_modal(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        try:
+            self._run.finish()
+        finally:
+            EXPORT_STATE["run"] = None
+        report_result(self._run.result(), self)
+        tag_redraw_panels(context)
+
+class QEMP_OT_export_selected(QEMPExportOperator, bpy.types.Operator):
+    bl_idname = "qemp.export_selected"
+    bl_label = "Export Selected Objects"
+    selected_only = True
+
+class QEMP_OT_export_all(QEMPExportOperator, bpy.types.Operator):
     bl_idname = "qemp.export_all"
     bl_label = "Export All Objects"
+    selected_only = False
 
-    def execute(self, context):
-        props = context.scene.qemp_props
-        objects = bpy.context.scene.objects
-        export_maps(objects, props, self)
-        return {'FINISHED'}
+class QEMP_OT_export_atlas(QEMPExportOperator, bpy.types.Operator):
+    bl_idname = "qemp.export_atlas"
+    bl_label = "Export Atlas (Selected)"
+    bl_description = "Gộp map của các material trên object đang chọn thành 1 atlas mỗi loại map + layout UV (JSON)"
+    selected_only = True
+
+    def start(self, context, props):
+        return start_atlas(self.get_objects(context), props, self)
+
+# =========================
+#   Tự xuất khi lưu (watch mode)
+# =========================
+
+# props.auto_export: mỗi lần lưu .blend chỉ xuất lại material đã thay đổi.
+# - depsgraph_update_post ghi lại material / ảnh / node group vừa được sửa
+# - save_post thêm ảnh is_dirty (pixel sửa chưa lưu) và ảnh có dữ liệu packed mới (so con trỏ +
+#   dung lượng packed_file, không đọc byte nào), rồi chỉ hẹn 1 timer: lưu file gần như không chậm thêm
+# - timer lập kế hoạch cho đúng các material đó và chạy từng bước như operator modal;
+#   hash dữ liệu packed / pixel trong manifest vẫn bỏ qua output có nội dung không đổi
+AUTO_EXPORT_RETRY = 1.0  # giây: đợi lần xuất thủ công đang chạy xong
+
+def packed_fingerprint(image):
+    """(con trỏ, dung lượng) của mọi dữ liệu packed: pack lại / thay dữ liệu thì khác"""
+    return tuple((item.packed_file.as_pointer(), item.packed_file.size)
+                 for item in getattr(image, "packed_files", ()) if item.packed_file)
+
+class AutoExport:
+    """Theo dõi thay đổi giữa các lần lưu, xuất lại phần thay đổi trong bpy.app.timers"""
+
+    def __init__(self):
+        self.run = None  # ExportRun đang chạy nền
+        self.reset()
+
+    def reset(self):
+        self.changed = {"materials": set(), "images": set(), "groups": set()}  # tên, từ depsgraph
+        self.queued = {"materials": set(), "images": set(), "groups": set()}  # đã lưu, chờ xuất
+        self.packed = {}  # tên ảnh -> packed_fingerprint lúc kiểm tra gần nhất
+
+    def baseline(self):
+        self.packed = {image.name: packed_fingerprint(image) for image in bpy.data.images}
+
+    def note_updates(self, updates):
+        """depsgraph_update_post: chỉ ghi tên, không duyệt gì thêm"""
+        for update in updates:
+            data = getattr(update.id, "original", update.id)
+            if isinstance(data, bpy.types.Material):
+                self.changed["materials"].add(data.name)
+            elif isinstance(data, bpy.types.Image):
+                self.changed["images"].add(data.name)
+            elif isinstance(data, bpy.types.NodeTree) and not data.is_embedded_data:
+                self.changed["groups"].add(data.name)  # node group: material dùng nó được tìm lúc xuất
+
+    def on_save(self):
+        """save_post: chốt những gì đã đổi tới lúc lưu rồi hẹn timer xuất"""
+        changed_images = self.changed["images"]
+        for image in bpy.data.images:
+            fingerprint = packed_fingerprint(image)
+            if self.packed.get(image.name, fingerprint) != fingerprint or getattr(image, "is_dirty", False):
+                changed_images.add(image.name)
+            self.packed[image.name] = fingerprint
+        for kind, names in self.changed.items():
+            self.queued[kind] |= names
+            names.clear()
+        if any(self.queued.values()) and not bpy.app.timers.is_registered(auto_export_tick):
+            bpy.app.timers.register(auto_export_tick, first_interval=0.0)
+
+    def changed_materials(self):
+        """Material của scene bị sửa trực tiếp, hoặc dùng ảnh / node group đã đổi"""
+        queued, self.queued = self.queued, {"materials": set(), "images": set(), "groups": set()}
+        result = []
+        for mat in object_materials():
+            if mat.name in queued["materials"] or any(
+                    (node.type == 'TEX_IMAGE' and node.image and node.image.name in queued["images"])
+                    or (node.type == 'GROUP' and node.node_tree and node.node_tree.name in queued["groups"])
+                    for node in mat.node_tree.nodes):
+                result.append(mat)
+        return result
+
+    def tick(self):
+        if self.run is None:
+            if EXPORT_STATE["run"] is not None:
+                return AUTO_EXPORT_RETRY  # đang xuất thủ công: đợi xong rồi xuất phần thay đổi
+            props = bpy.context.scene.qemp_props
+            if not props.auto_export or props.output != 'FOLDER' or props.dry_run:
+                self.queued = {"materials": set(), "images": set(), "groups": set()}
+                return None
+            materials = self.changed_materials()
+            if not materials:
+                return None
+            self.run = start_export(None, props, materials=materials)
+            EXPORT_STATE["run"] = self.run
+        done = self.run.step()
+        tag_redraw_panels(bpy.context)
+        if not done:
+            return MODAL_TIMER_SECONDS
+        self.finish()
+        # lưu thêm trong lúc đang xuất: xuất tiếp phần mới
+        return 0.0 if any(self.queued.values()) else None
+
+    def finish(self, cancel=False):
+        run, self.run = self.run, None
+        if run is None:
+            return
+        if cancel:
+            run.cancel()
+        try:
+            run.finish()
+        finally:
+            EXPORT_STATE["run"] = None
+        result = run.result()
+        print(f"[QEMP] Tự xuất khi lưu: {result['exported']} file, bỏ qua {result['skipped']} file không đổi"
+              + (", đã hủy" if result["cancelled"] else "")
+              + f" ({time.perf_counter() - run.started:.2f} s) → {result['export_dir']}")
+        for fentry in result["failed"]:
+            print("[QEMP]   lỗi:", fentry)
+
+AUTO_EXPORT = AutoExport()
+
+def auto_export_tick():
+    return AUTO_EXPORT.tick()
+
+@bpy.app.handlers.persistent
+def auto_export_depsgraph(scene, depsgraph):
+    props = getattr(scene, "qemp_props", None)
+    if props is not None and props.auto_export:
+        AUTO_EXPORT.note_updates(depsgraph.updates)
+
+@bpy.app.handlers.persistent
+def auto_export_save(*args):
+    props = getattr(bpy.context.scene, "qemp_props", None)
+    if props is not None and props.auto_export:
+        AUTO_EXPORT.on_save()
+
+@bpy.app.handlers.persistent
+def auto_export_load_pre(*args):
+    # ExportRun giữ tham chiếu tới ảnh của file cũ: ghi xong phần đã vào pool rồi dừng
+    AUTO_EXPORT.finish(cancel=True)
+
+@bpy.app.handlers.persistent
+def auto_export_load_post(*args):
+    AUTO_EXPORT.reset()
+    props = getattr(bpy.context.scene, "qemp_props", None)
+    if props is not None and props.auto_export:
+        AUTO_EXPORT.baseline()
+
+AUTO_EXPORT_HANDLERS = (
+    ("depsgraph_update_post", auto_export_depsgraph),
+    ("save_post", auto_export_save),
+    ("load_pre", auto_export_load_pre),
+    ("load_post", auto_export_load_post),
+)
 
 # =========================
 #   UI Panel (N-Panel)
@@ -294,15 +3531,72 @@ class QEMP_PT_panel(bpy.types.Panel):
         props = context.scene.qemp_props
 
         layout.prop(props, "preset")
+        layout.prop(props, "preset_file")
         layout.prop(props, "directory")
         layout.prop(props, "image_format")
+        if any("channels" in output for output in active_preset(props).get("outputs", ())):
+            row = layout.row(align=True)
+            row.prop(props, "mrao_target", text="")
+            sub = row.row(align=True)
+            sub.enabled = props.mrao_target == 'FIXED'
+            sub.prop(props, "mrao_size", text="")
+            layout.prop(props, "mrao_filter")
         layout.prop(props, "prefix")
         layout.prop(props, "suffix")
+        row = layout.row(align=True)
+        row.prop(props, "lod_levels")
+        sub = row.row(align=True)
+        sub.enabled = props.lod_levels > 0
+        sub.prop(props, "lod_filter", text="")
+        if props.lod_levels:
+            layout.prop(props, "lod_min_size")
+        layout.prop(props, "optimize")
+        if props.image_format in PNG_LEVEL_FORMATS:
+            row = layout.row(align=True)
+            row.label(text="Mức nén")
+            row.prop(props, "png_level_color")
+            row.prop(props, "png_level_normal")
+            row.prop(props, "png_level_data")
+        layout.prop(props, "workers")
+        layout.prop(props, "memory_budget")
+        layout.prop(props, "dedupe")
+        layout.prop(props, "incremental")
+        layout.prop(props, "auto_export")
+        row = layout.row(align=True)
+        row.prop(props, "output")
+        sub = row.row(align=True)
+        sub.enabled = props.output != 'FOLDER'
+        sub.prop(props, "archive_level")
+        row = layout.row(align=True)
+        row.prop(props, "dry_run")
+        row.prop(props, "profile")
 
         layout.separator()
         layout.operator("qemp.export_selected", icon="EXPORT")
         layout.operator("qemp.export_all", icon="FILE_FOLDER")
 
+        box = layout.box()
+        box.label(text="Atlas (gộp material đang chọn)", icon='TEXTURE')
+        box.prop(props, "atlas_name")
+        row = box.row(align=True)
+        row.prop(props, "atlas_size")
+        row.prop(props, "atlas_padding")
+        box.operator("qemp.export_atlas", icon="IMAGE_DATA")
+
+        run = EXPORT_STATE["run"]
+        if run is not None:
+            p = run.progress()
+            text = f"{p['done']}/{p['total']} · {p['bytes_written'] / 1048576:.1f} MB"
+            if p["eta"] is not None:
+                text += f" · còn ~{format_eta(p['eta'])}"
+            layout.progress(factor=p["fraction"], type='BAR', text=text)
+            if run is AUTO_EXPORT.run:
+                layout.label(text="Đang tự xuất phần thay đổi sau khi lưu…", icon='FILE_REFRESH')
+            else:
+                layout.label(text="Đang xuất… Esc để hủy", icon='CANCEL')
+        elif props.profile and EXPORT_STATE["profile"]:
+            draw_profile(layout.box(), EXPORT_STATE["profile"])
+
 # =========================
 #   Register
 # =========================
@@ -311,6 +3605,7 @@ classes = [
     QEMPProperties,
     QEMP_OT_export_selected,
     QEMP_OT_export_all,
+    QEMP_OT_export_atlas,
     QEMP_PT_panel
 ]
 
@@ -318,8 +3613,17 @@ def register():
     for cls in classes:
         bpy.utils.register_class(cls)
     bpy.types.Scene.qemp_props = bpy.props.PointerProperty(type=QEMPProperties)
+    for name, handler in AUTO_EXPORT_HANDLERS:
+        getattr(bpy.app.handlers, name).append(handler)
 
 def unregister():
+    for name, handler in AUTO_EXPORT_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if handler in handlers:
+            handlers.remove(handler)
+    if bpy.app.timers.is_registered(auto_export_tick):
+        bpy.app.timers.unregister(auto_export_tick)
+    AUTO_EXPORT.finish(cancel=True)
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.qemp_props
@@ -0,0 +1,657 @@
+"""Extract packed textures straight from a .blend file, without Blender.
+
+The file is memory-mapped (or streamed, for gzip / zstd compressed .blend
+files) and only its block headers and SDNA are walked: just enough to find
+materials, their Image Texture nodes and the PackedFile payloads of those
+images. Payloads are written byte-for-byte to
+
+    <out>/<Material>/<Material>_<MapType>.<ext>
+
+using the same naming and map-type detection as QUP_OT_export_packed_maps.
+
+    python blend_packed_reader.py scene.blend -o textures/
+    python blend_packed_reader.py scene.blend --list
+
+Importable without bpy; zstd files need the `zstandard` package
+(or Python 3.14+ `compression.zstd`).
+"""
+
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COPY_CHUNK = 1024 * 1024
+# streamed files: blocks up to this size are kept in memory during the first
+# pass (structs, node trees); bigger ones are payloads read in the second pass
+SMALL_BLOCK = 256 * 1024
+# bytes kept from both ends of big blocks, enough to sniff the image format
+SNIFF_BYTES = 32
+
+# magic bytes -> extension, checked in order
+PAYLOAD_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"v/1\x01", ".exr"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+    (b"#?RADIANCE", ".hdr"),
+    (b"#?RGBE", ".hdr"),
+    (b"BM", ".bmp"),
+)
+TGA_FOOTER = b"TRUEVISION-XFILE.\x00"
+
+
+class BlendError(Exception):
+    """Not a .blend file, or a structure this reader does not understand"""
+
+
+Field = namedtuple("Field", "offset type is_ptr count size")
+BlockRef = namedtuple("BlockRef", "code old sdna nr length offset data head tail")
+
+
+# ---------- Names (same rules as quick_unpack_pro.py) ----------
+def _clean_name(name):
+    # bpy.path.clean_name(): everything up to U+00FE except A-Z a-z 0-9 _ - becomes "_"
+    return "".join(c if (c.isascii() and (c.isalnum() or c in "_-")) or ord(c) > 0xFE else "_"
+                   for c in name)
+
+def sanitize_filename(name):
+    if name is None:
+        return "noname"
+    name = _clean_name(str(name))
+    name = re.sub(r'\s+', '_', name)
+    name = re.sub(r'[^A-Za-z0-9._-]', '', name)
+    if name == "":
+        return "noname"
+    return name
+
+def ensure_unique_path(path, reserved):
+    base, ext = os.path.splitext(path)
+    c = 1
+    new_path = path
+    while new_path in reserved or os.path.exists(new_path):
+        new_path = f"{base}_{c:03d}{ext}"
+        c += 1
+    reserved.add(new_path)
+    return new_path
+
+def payload_extension(head, tail, fallback=".png"):
+    for magic, ext in PAYLOAD_MAGIC:
+        if head[:len(magic)] == magic:
+            return ext
+    if head[8:12] == b"WEBP" and head[:4] == b"RIFF":
+        return ".webp"
+    if TGA_FOOTER in tail:  # data blocks are padded to 4 bytes
+        return ".tga"
+    return fallback
+
+
+# ---------- Low level I/O ----------
+def _zstd_reader(fileobj):
+    try:
+        import zstandard
+        # Blender writes seekable zstd: many frames, read them all
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    except ImportError:
+        pass
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd.ZstdFile(fileobj)
+    except ImportError:
+        raise BlendError("File .blend nén zstd cần package 'zstandard' (pip install zstandard)")
+
+def _corrupt_errors():
+    """What a truncated / corrupt file raises before BlendError gets a say: mmap
+    of an empty file, struct / index errors in a broken DNA1, the decompressors"""
+    errors = [ValueError, struct.error, IndexError, EOFError, zlib.error]
+    for name in ("zstandard", "compression.zstd"):
+        module = sys.modules.get(name)  # imported by _zstd_reader if the file needed it
+        if module is not None:
+            errors.append(module.ZstdError)
+    return tuple(errors)
+
+def _read_exact(stream, n):
+    """read() on decompressor streams may return short reads"""
+    parts = []
+    while n > 0:
+        chunk = stream.read(min(n, COPY_CHUNK))
+        if not chunk:
+            raise BlendError("Unexpected end of file")
+        parts.append(chunk)
+        n -= len(chunk)
+    return parts[0] if len(parts) == 1 else b"".join(parts)
+
+def _skip(stream, n):
+    while n > 0:
+        chunk = stream.read(min(n, COPY_CHUNK))
+        if not chunk:
+            raise BlendError("Unexpected end of file")
+        n -= len(chunk)
+
+
+# ---------- SDNA ----------
+class SDNA:
+    """Struct layouts from the DNA1 block (names, types, lengths, structs)"""
+
+    def __init__(self, data, endian, ptr_size):
+        self.endian = endian
+        self.ptr_size = ptr_size
+        pos = 0
+
+        def expect(tag):
+            nonlocal pos
+            pos = (pos + 3) & ~3
+            if data[pos:pos + 4] != tag:
+                raise BlendError(f"SDNA: expected {tag!r} at {pos}")
+            pos += 4
+
+        def read_strings():
+            nonlocal pos
+            count = struct.unpack_from(endian + "i", data, pos)[0]
+            pos += 4
+            out = []
+            for _ in range(count):
+                end = data.index(b"\0", pos)
+                out.append(bytes(data[pos:end]).decode("ascii", "replace"))
+                pos = end + 1
+            return out
+
+        if data[:4] != b"SDNA":
+            raise BlendError("DNA1 block without SDNA header")
+        pos = 4
+        expect(b"NAME")
+        names = read_strings()
+        expect(b"TYPE")
+        self.types = read_strings()
+        expect(b"TLEN")
+        self.type_lengths = struct.unpack_from(f"{endian}{len(self.types)}h", data, pos)
+        pos += 2 * len(self.types)
+        expect(b"STRC")
+        count = struct.unpack_from(endian + "i", data, pos)[0]
+        pos += 4
+
+        self.struct_names = []  # SDNA index -> struct name
+        self.structs = {}       # struct name -> {field name: Field}
+        for _ in range(count):
+            type_index, nfields = struct.unpack_from(endian + "hh", data, pos)
+            pos += 4
+            fields = {}
+            offset = 0
+            for _ in range(nfields):
+                ftype, fname = struct.unpack_from(endian + "hh", data, pos)
+                pos += 4
+                raw = names[fname]
+                is_ptr = raw.startswith("*") or raw.startswith("(")
+                count_ = 1
+                for dim in re.findall(r"\[(\d+)\]", raw):
+                    count_ *= int(dim)
+                clean = re.sub(r"\[.*", "", raw).strip("*()")
+                size = (ptr_size if is_ptr else self.type_lengths[ftype]) * count_
+                fields[clean] = Field(offset, self.types[ftype], is_ptr, count_, size)
+                offset += size
+            name = self.types[type_index]
+            self.struct_names.append(name)
+            self.structs[name] = fields
+        self._paths = {}
+
+    def field(self, struct_name, path):
+        """Resolve "id.name" style paths to (offset, Field); None if missing"""
+        key = (struct_name, path)
+        if key not in self._paths:
+            offset, current, found = 0, struct_name, None
+            for part in path.split("."):
+                fields = self.structs.get(current, {})
+                found = fields.get(part)
+                if found is None:
+                    break
+                offset += found.offset
+                current = found.type
+            self._paths[key] = (offset, found) if found is not None else None
+        return self._paths[key]
+
+    def has(self, struct_name, path):
+        return self.field(struct_name, path) is not None
+
+    def get(self, data, struct_name, path, default=None):
+        resolved = self.field(struct_name, path)
+        if resolved is None:
+            return default
+        offset, f = resolved
+        e = self.endian
+        if f.is_ptr:
+            return struct.unpack_from(e + ("Q" if self.ptr_size == 8 else "I"), data, offset)[0]
+        if f.type == "char" and f.count > 1:
+            raw = bytes(data[offset:offset + f.size])
+            return raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+        fmt = {"char": "b", "uchar": "B", "short": "h", "ushort": "H", "int": "i", "uint": "I",
+               "int8_t": "b", "uint8_t": "B", "int16_t": "h", "uint16_t": "H",
+               "int32_t": "i", "uint32_t": "I", "int64_t": "q", "uint64_t": "Q",
+               "float": "f", "double": "d"}.get(f.type)
+        if fmt is None:
+            return default
+        return struct.unpack_from(e + fmt, data, offset)[0]
+
+
+# ---------- Blend file ----------
+class BlendFile:
+    """Block index + SDNA of one .blend file.
+
+    Uncompressed files are memory-mapped and blocks are sliced on demand.
+    Compressed files are streamed: pass 1 keeps small blocks and DNA1,
+    pass 2 (`copy_payloads`) streams the big payload blocks to disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self.blocks = {}  # old pointer -> BlockRef
+        self.ids = []     # ID blocks in file order
+        self.sdna = None
+        self._file = open(path, "rb")
+        self._mm = None
+        magic = self._file.read(4)
+        self._file.seek(0)
+        try:
+            if magic[:2] == GZIP_MAGIC:
+                self.compression = "gzip"
+            elif magic == ZSTD_MAGIC:
+                self.compression = "zstd"
+            else:
+                self.compression = None
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._scan()
+        except BlendError:
+            self.close()
+            raise
+        except _corrupt_errors() as e:
+            self.close()
+            raise BlendError(f"{path}: file .blend hỏng hoặc bị cắt ({type(e).__name__}: {e})") from e
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_stream(self):
+        if self._mm is not None:
+            self._mm.seek(0)
+            return self._mm
+        self._file.seek(0)
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=self._file, mode="rb")
+        return _zstd_reader(self._file)
+
+    def _read_header(self, stream):
+        head = _read_exact(stream, 12)
+        if head[:7] != b"BLENDER":
+            raise BlendError(f"{self.path}: không phải file .blend")
+        if head[7:9].isdigit():
+            # "BLENDER17-01v0500": header size, file format version, endian, version
+            size = int(head[7:9])
+            head += _read_exact(stream, size - 12)
+            self.ptr_size = 8
+            self.endian = "<" if head[12:13] == b"v" else ">"
+            self.version = int(head[13:17])
+            large = int(head[10:12]) >= 1
+        else:
+            self.ptr_size = 8 if head[7:8] == b"-" else 4
+            self.endian = "<" if head[8:9] == b"v" else ">"
+            self.version = int(head[9:12])
+            large = False
+        if large:
+            # LargeBHead8: code, SDNAnr, old, len, nr
+            fmt = self.endian + "4siQqq"
+            self._bhead = (struct.calcsize(fmt), lambda raw: _unpack_large(fmt, raw))
+        else:
+            fmt = self.endian + "4si" + ("Q" if self.ptr_size == 8 else "I") + "ii"
+            self._bhead = (struct.calcsize(fmt), lambda raw: _unpack_small(fmt, raw))
+
+    def _iter_bheads(self, stream):
+        """Yield (code, old, sdna, nr, length, body_offset); caller consumes or skips the body"""
+        self._read_header(stream)
+        size, unpack = self._bhead
+        pos = stream.tell() if self._mm is not None else None
+        while True:
+            raw = stream.read(size)
+            if len(raw) < size:
+                return
+            code, old, sdna, nr, length = unpack(raw)
+            if code == b"ENDB":
+                return
+            if pos is not None:
+                pos += size
+            yield code, old, sdna, nr, length, pos
+            if pos is not None:
+                pos += length
+
+    def _scan(self):
+        stream = self._open_stream()
+        streamed = self._mm is None
+        dna = None
+        for code, old, sdna, nr, length, offset in self._iter_bheads(stream):
+            data = head = tail = None
+            if code == b"DNA1":
+                dna = _read_exact(stream, length)
+                continue
+            if not streamed:
+                stream.seek(length, os.SEEK_CUR)
+            elif length <= SMALL_BLOCK:
+                data = _read_exact(stream, length)
+            else:
+                head = _read_exact(stream, SNIFF_BYTES)
+                _skip(stream, length - 2 * SNIFF_BYTES)
+                tail = _read_exact(stream, SNIFF_BYTES)
+            ref = BlockRef(code, old, sdna, nr, length, offset, data, head, tail)
+            if old and old not in self.blocks:
+                self.blocks[old] = ref
+            if code[2:] == b"\0\0":  # ID blocks: two-letter code (IM, MA, ...)
+                self.ids.append(ref)
+        if dna is None:
+            raise BlendError(f"{self.path}: thiếu block DNA1")
+        self.sdna = SDNA(dna, self.endian, self.ptr_size)
+
+    # -- block access --
+    def data(self, ref):
+        if ref.data is not None:
+            return ref.data
+        if self._mm is not None:
+            return memoryview(self._mm)[ref.offset:ref.offset + ref.length]
+        raise BlendError("Block lớn chỉ đọc được qua copy_payloads()")
+
+    def struct_of(self, ref):
+        return self.sdna.struct_names[ref.sdna]
+
+    def deref(self, ptr):
+        """(block data, struct name) for an old pointer, or (None, None)"""
+        ref = self.blocks.get(ptr) if ptr else None
+        if ref is None or (ref.data is None and self._mm is None):
+            return None, None
+        return self.data(ref), self.struct_of(ref)
+
+    def walk_list(self, first):
+        """Follow next pointers of a ListBase"""
+        seen = set()
+        ptr = first
+        while ptr and ptr not in seen:
+            seen.add(ptr)
+            data, name = self.deref(ptr)
+            if data is None:
+                return
+            yield ptr, data, name
+            ptr = self.sdna.get(data, name, "next", 0)
+
+    def get(self, data, struct_name, path, default=None):
+        return self.sdna.get(data, struct_name, path, default)
+
+    def id_blocks(self, code2):
+        for ref in self.ids:
+            if ref.code[:2] == code2:
+                yield ref
+
+    # -- payloads --
+    def payload_info(self, ptr):
+        """(length, head, tail) of a raw data block without reading all of it"""
+        ref = self.blocks.get(ptr)
+        if ref is None:
+            return None
+        if ref.data is not None:
+            return ref.length, ref.data[:SNIFF_BYTES], ref.data[-SNIFF_BYTES:]
+        if self._mm is not None:
+            mm = self._mm
+            return (ref.length, mm[ref.offset:ref.offset + SNIFF_BYTES],
+                    mm[ref.offset + ref.length - SNIFF_BYTES:ref.offset + ref.length])
+        return ref.length, ref.head, ref.tail
+
+    def copy_payloads(self, targets, size_of=None):
+        """Write data blocks to files. targets: {old pointer: [paths]}.
+        `size_of` may cap the bytes written per pointer (PackedFile.size).
+        Returns {path: bytes written}."""
+        written = {}
+        pending = dict(targets)
+
+        def emit(ptr, chunks):
+            limit = (size_of or {}).get(ptr)
+            outs = [open(p, "wb") for p in pending.pop(ptr)]
+            total = 0
+            try:
+                for chunk in chunks:
+                    if limit is not None:
+                        chunk = chunk[:max(0, limit - total)]
+                    for f in outs:
+                        f.write(chunk)
+                    total += len(chunk)
+            finally:
+                for f in outs:
+                    f.close()
+            for f in outs:
+                written[f.name] = total
+
+        # in memory already (mmap or small block)
+        for ptr in list(pending):
+            ref = self.blocks.get(ptr)
+            if ref is not None and (ref.data is not None or self._mm is not None):
+                view = self.data(ref)
+                emit(ptr, (view[i:i + COPY_CHUNK] for i in range(0, ref.length, COPY_CHUNK)))
+
+        if pending:
+            # streamed file: second pass over the decompressed stream
+            stream = self._open_stream()
+            for code, old, sdna, nr, length, offset in self._iter_bheads(stream):
+                if old in pending:
+                    def chunks(n=length):
+                        while n > 0:
+                            chunk = _read_exact(stream, min(n, COPY_CHUNK))
+                            n -= len(chunk)
+                            yield chunk
+                    emit(old, chunks())
+                    if not pending:
+                        break
+                else:
+                    _skip(stream, length)
+        return written
+
+
+def _unpack_small(fmt, raw):
+    code, length, old, sdna, nr = struct.unpack(fmt, raw)
+    return code, old, sdna, nr, length
+
+def _unpack_large(fmt, raw):
+    code, sdna, old, length, nr = struct.unpack(fmt, raw)
+    return code, old, sdna, nr, length
+
+
+# ---------- Images / materials ----------
+def image_info(blend, ref):
+    """Name, source path and packed payload pointer of one Image ID block"""
+    data = blend.data(ref)
+    name = blend.get(data, "Image", "id.name", "")[2:]
+    filepath = blend.get(data, "Image", "filepath") or blend.get(data, "Image", "name", "") or ""
+    pf_ptr = 0
+    packed_path = ""
+    first = blend.get(data, "Image", "packedfiles.first", 0)
+    for _, ipf, ipf_name in blend.walk_list(first):
+        pf_ptr = blend.get(ipf, ipf_name, "packedfile", 0)
+        packed_path = blend.get(ipf, ipf_name, "filepath", "") or ""
+        break  # first tile / view, like Image.packed_file
+    if not pf_ptr:
+        pf_ptr = blend.get(data, "Image", "packedfile", 0)
+    payload, size = 0, 0
+    pf, pf_name = blend.deref(pf_ptr)
+    if pf is not None:
+        payload = blend.get(pf, pf_name, "data", 0)
+        size = blend.get(pf, pf_name, "size", 0)
+    return {"name": name, "filepath": packed_path or filepath, "payload": payload, "size": size}
+
+# idname -> Node.type for the nodes map-type detection cares about
+NODE_TYPES = {
+    "NodeReroute": "REROUTE",
+    "ShaderNodeSeparateRGB": "SEPRGB",
+    "ShaderNodeSeparateColor": "SEPARATE_COLOR",
+    "ShaderNodeMix": "MIX",
+    "ShaderNodeMixRGB": "MIX_RGB",
+    "ShaderNodeNormalMap": "NORMAL_MAP",
+    "ShaderNodeNormal": "NORMAL",
+}
+PASS_THROUGH_NODES = {'REROUTE', 'SEPRGB', 'SEPARATE_COLOR', 'MIX', 'MIX_RGB'}
+
+def _node_type(node):
+    return NODE_TYPES.get(node["idname"], node["idname"]) if node else ""
+
+def _map_type_from_targets(index, nodes, node_ptr, visited):
+    for to_socket_name, to_ptr in index.get(node_ptr, ()):
+        to_node = nodes.get(to_ptr)
+        socket_name = (to_socket_name or "").lower()
+        to_node_type = _node_type(to_node)
+        if "normal" in socket_name or "normal" in to_node_type.lower():
+            return "Normal"
+        if to_node_type in PASS_THROUGH_NODES:
+            if to_ptr not in visited:
+                visited.add(to_ptr)
+                found = _map_type_from_targets(index, nodes, to_ptr, visited)
+                if found:
+                    return found
+            continue
+        if "base" in socket_name or "color" in socket_name:
+            return "BaseColor"
+        if "rough" in socket_name:
+            return "Roughness"
+        if "metal" in socket_name:
+            return "Metallic"
+        if "alpha" in socket_name or "opacity" in socket_name:
+            return "Alpha"
+    return None
+
+def map_type_from_link(index, nodes, node_ptr):
+    """Same rules as quick_unpack_pro.map_type_from_link, on parsed nodes.
+    index: from-node pointer -> [(to socket name, to-node pointer)]"""
+    found = _map_type_from_targets(index, nodes, node_ptr, {node_ptr})
+    if found:
+        return found
+    node = nodes[node_ptr]
+    name_lower = (node["label"] or node["name"]).lower()
+    if "base" in name_lower or "albedo" in name_lower or "diffuse" in name_lower:
+        return "BaseColor"
+    if "norm" in name_lower:
+        return "Normal"
+    if "rough" in name_lower:
+        return "Roughness"
+    if "metal" in name_lower:
+        return "Metallic"
+    if "alpha" in name_lower or "opacity" in name_lower:
+        return "Alpha"
+    return "Misc"
+
+def material_textures(blend, ref):
+    """Yield (image pointer, map type) for Image Texture nodes of a material, in node order"""
+    data = blend.data(ref)
+    if blend.version < 500 and not blend.get(data, "Material", "use_nodes", 1):
+        return  # skipped by QUP too; Blender 5.0+ materials always use nodes
+    tree, tree_name = blend.deref(blend.get(data, "Material", "nodetree", 0))
+    if tree is None:
+        return
+    nodes = {}
+    order = []
+    for ptr, node, node_name in blend.walk_list(blend.get(tree, tree_name, "nodes.first", 0)):
+        nodes[ptr] = {
+            "idname": blend.get(node, node_name, "idname", "") or "",
+            "name": blend.get(node, node_name, "name", "") or "",
+            "label": blend.get(node, node_name, "label", "") or "",
+            "id": blend.get(node, node_name, "id", 0),
+        }
+        order.append(ptr)
+    outgoing = {}
+    for _, link, link_name in blend.walk_list(blend.get(tree, tree_name, "links.first", 0)):
+        sock, sock_name = blend.deref(blend.get(link, link_name, "tosock", 0))
+        to_socket = blend.get(sock, sock_name, "name", "") if sock is not None else ""
+        to_ptr = blend.get(link, link_name, "tonode", 0)
+        outgoing.setdefault(blend.get(link, link_name, "fromnode", 0), []).append((to_socket, to_ptr))
+    for ptr in order:
+        node = nodes[ptr]
+        if node["idname"] != "ShaderNodeTexImage" or not node["id"]:
+            continue
+        yield node["id"], map_type_from_link(outgoing, nodes, ptr)
+
+def plan_extraction(blend, out_dir):
+    """[(material, map type, image info, output path)] for every packed image texture"""
+    images = {ref.old: image_info(blend, ref) for ref in blend.id_blocks(b"IM")}
+    plan = []
+    exported_keys = set()
+    reserved = set()
+    for ref in blend.id_blocks(b"MA"):
+        mat_name = blend.get(blend.data(ref), "Material", "id.name", "")[2:]
+        mat_name_clean = sanitize_filename(mat_name)
+        for image_ptr, map_type in material_textures(blend, ref):
+            img = images.get(image_ptr)
+            if not img or not img["payload"]:
+                continue  # only packed
+            map_type_clean = sanitize_filename(map_type)
+            key = (mat_name_clean, map_type_clean, img["name"])
+            if key in exported_keys:
+                continue
+            exported_keys.add(key)
+            info = blend.payload_info(img["payload"])
+            if info is None:
+                continue
+            fallback = os.path.splitext(img["filepath"])[1].lower() or ".png"
+            ext = payload_extension(info[1], info[2], fallback)
+            filepath = os.path.join(out_dir, mat_name_clean, f"{mat_name_clean}_{map_type_clean}{ext}")
+            plan.append((mat_name, map_type, img, ensure_unique_path(filepath, reserved)))
+    return plan
+
+def extract_packed_maps(blend_path, out_dir):
+    """Write every packed image texture of blend_path under out_dir.
+    Returns a list of {material, map_type, image, path, bytes}."""
+    with BlendFile(blend_path) as blend:
+        plan = plan_extraction(blend, out_dir)
+        targets, sizes = {}, {}
+        for _, _, img, filepath in plan:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            targets.setdefault(img["payload"], []).append(filepath)
+            if img["size"]:
+                sizes[img["payload"]] = img["size"]
+        written = blend.copy_payloads(targets, sizes)
+    return [{"material": mat, "map_type": map_type, "image": img["name"],
+             "path": filepath, "bytes": written.get(filepath, 0)}
+            for mat, map_type, img, filepath in plan]
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất texture packed từ file .blend (không cần Blender).")
+    parser.add_argument("blend", nargs="+", help="File .blend (có thể nén gzip/zstd)")
+    parser.add_argument("-o", "--output", default="qup_export", help="Thư mục xuất")
+    parser.add_argument("--list", action="store_true", help="Chỉ liệt kê, không ghi file")
+    args = parser.parse_args(argv)
+
+    code = 0
+    for path in args.blend:
+        try:
+            if args.list:
+                with BlendFile(path) as blend:
+                    rows = [{"material": m, "map_type": t, "image": i["name"], "path": p, "bytes": i["size"]}
+                            for m, t, i, p in plan_extraction(blend, args.output)]
+            else:
+                rows = extract_packed_maps(path, args.output)
+        except (OSError, BlendError) as e:
+            print(f"[QUP] {path}: {e}", file=sys.stderr)
+            code = 1
+            continue
+        print(json.dumps({"file": path, "textures": rows}, ensure_ascii=False, indent=1))
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
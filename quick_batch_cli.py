@@ -0,0 +1,435 @@
+"""Headless batch export for Quick Unpack Pro / Quick Export Maps Pro.
+
+Controller (chia file .blend cho N tiến trình Blender chạy nền):
+
+    blender -b --python quick_batch_cli.py -- [options] FILE_OR_GLOB...
+    python quick_batch_cli.py --blender /path/to/blender [options] FILE_OR_GLOB...
+
+Mỗi file được xử lý trong một tiến trình Blender riêng:
+
+    blender -b --factory-startup FILE.blend --python quick_batch_cli.py -- --worker --result R.json ...
+
+Kết quả từng file được gom vào một JSON summary; exit code khác 0 nếu có lỗi.
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import bpy
+except ImportError:  # controller can run from a plain Python
+    bpy = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADDON_FILES = {
+    "unpack": "quick_unpack_pro.py",
+    "maps": "Quick Export Maps Pro.py",
+}
+DEFAULT_OUTPUT = {
+    "unpack": "//qup_export",
+    "maps": "//exported_maps/",
+}
+
+ARCHIVE_OUTPUTS = {"zip": 'ZIP', "tar.zst": 'TAR_ZST'}  # --archive -> add-on output enum
+PNG_LEVEL_GROUPS = ("color", "normal", "data")  # --png-level GROUP=N -> qemp_props.png_level_<GROUP>
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+# ---------- Arguments ----------
+def png_level(text):
+    """argparse type of --png-level: GROUP=N"""
+    group, _, level = text.partition("=")
+    if group not in PNG_LEVEL_GROUPS or not level.isdigit() or int(level) > 9:
+        raise argparse.ArgumentTypeError(f"cần {'|'.join(PNG_LEVEL_GROUPS)}=0..9, nhận '{text}'")
+    return group, int(level)
+
+def script_args(argv=None):
+    """Arguments after `--` when run by Blender, plain argv otherwise"""
+    argv = sys.argv if argv is None else argv
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    return argv[1:] if bpy is None else []
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="quick_batch_cli.py",
+        description="Xuất texture hàng loạt từ nhiều file .blend bằng Blender chạy nền.")
+    parser.add_argument("files", nargs="*", help="File .blend, glob (**/*.blend) hoặc thư mục")
+    parser.add_argument("--addon", choices=sorted(ADDON_FILES), default="unpack",
+                        help="unpack = Quick Unpack Pro (packed maps), maps = Quick Export Maps Pro")
+    parser.add_argument("--output", default="",
+                        help="Thư mục xuất gốc; mỗi .blend xuất vào <output>/<tên file>. "
+                             "Mặc định: thư mục mặc định của add-on cạnh từng file .blend")
+    parser.add_argument("--format", default="", help="PNG, JPEG, TARGA (+ BMP, TIFF với --addon maps)")
+    parser.add_argument("--preset", default="",
+                        help="DEFAULT, UNREAL_PBR, UNITY_HDRP, PACKED_MRAO hoặc ID trong --preset-file (--addon maps)")
+    parser.add_argument("--preset-file", default="", help="File JSON preset tự định nghĩa (--addon maps)")
+    parser.add_argument("--prefix", default=None, help="Prefix tên file (--addon maps)")
+    parser.add_argument("--suffix", default=None, help="Suffix tên file (--addon maps)")
+    parser.add_argument("--mrao-target", choices=("LARGEST", "SMALLEST", "FIXED"), default="",
+                        help="Độ phân giải chung khi ảnh nguồn của texture ghép kênh lệch size (--addon maps)")
+    parser.add_argument("--mrao-size", type=int, default=None, metavar="PX",
+                        help="Cạnh dài cho --mrao-target FIXED")
+    parser.add_argument("--mrao-filter", choices=("BOX", "BILINEAR", "LANCZOS"), default="",
+                        help="Bộ lọc resample MRAO")
+    parser.add_argument("--lod-levels", type=int, default=None, metavar="N",
+                        help="Xuất thêm N mức LOD 1/2, 1/4, ... của mỗi texture (_1024, _512...; 0 = tắt)")
+    parser.add_argument("--lod-min-size", type=int, default=None, metavar="PX",
+                        help="Bỏ mức LOD có cạnh dài nhỏ hơn giá trị này (mặc định theo add-on)")
+    parser.add_argument("--lod-filter", choices=("BOX", "KAISER"), default="", help="Bộ lọc thu nhỏ LOD")
+    parser.add_argument("--optimize", choices=("OFF", "CHANNELS", "SHRINK", "SIDECAR"), default="",
+                        help="Thu gọn map 1 màu / ảnh xám / alpha thừa (--addon maps, mặc định theo add-on)")
+    parser.add_argument("--png-level", type=png_level, action="append", default=[], metavar="GROUP=N",
+                        help="Mức nén PNG/TIFF theo nhóm map color, normal, data (lặp lại được; --addon maps)")
+    parser.add_argument("--atlas", action="store_true",
+                        help="Gộp map của mọi material thành 1 atlas mỗi loại map + layout UV JSON (--addon maps); "
+                             "với --archive: <thư mục xuất>/<tên atlas>.zip / .tar.zst")
+    parser.add_argument("--atlas-size", type=int, default=None, metavar="PX",
+                        help="Cạnh lớn nhất của atlas (mặc định theo add-on)")
+    parser.add_argument("--atlas-padding", type=int, default=None, metavar="PX", help="Viền quanh mỗi ô atlas")
+    parser.add_argument("--only-selected", action="store_true",
+                        help="Chỉ xuất material của object đang chọn trong file")
+    parser.add_argument("--no-incremental", action="store_true",
+                        help="Ghi lại mọi file, không bỏ qua file không đổi")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Không gộp texture trùng nội dung (mặc định: ghi 1 lần + hardlink)")
+    parser.add_argument("--archive", choices=sorted(ARCHIVE_OUTPUTS), default=None,
+                        help="Gói output của mỗi .blend vào 1 archive (<thư mục xuất>.zip / .tar.zst) thay vì thư mục")
+    parser.add_argument("--archive-level", type=int, default=None, metavar="N",
+                        help="Mức nén archive: zip 0-9, zstd 1-22 (mặc định theo add-on)")
+    parser.add_argument("--staged", action="store_true",
+                        help="Encode vào thư mục tạm local rồi copy lên --output (share mạng) nhiều luồng (--addon unpack)")
+    parser.add_argument("--stage-dir", default="", help="Thư mục local cho --staged (mặc định: temp hệ thống)")
+    parser.add_argument("--upload-streams", type=int, default=None, metavar="N",
+                        help="Số file copy lên share cùng lúc với --staged (mặc định theo add-on)")
+    parser.add_argument("--verify-hash", action="store_true",
+                        help="Với --staged: đọc lại file trên share để so hash (dung lượng luôn được kiểm tra)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ lập kế hoạch + ước tính dung lượng, không ghi file (kế hoạch nằm trong summary)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Ghi thời gian từng giai đoạn + bộ đếm vào <thư mục xuất>/q*_profile.json/.csv "
+                             "(report cũng nằm trong summary)")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Số tiến trình Blender chạy song song")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Số luồng encode trong mỗi tiến trình (0 = theo số CPU)")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MB",
+                        help="RAM pixel tối đa cho mỗi tiến trình (MB, 0 = không giới hạn; mặc định theo add-on)")
+    parser.add_argument("--timeout", type=float, default=0, help="Giới hạn giây cho mỗi file (0 = không giới hạn)")
+    parser.add_argument("--summary", default="", help="Ghi JSON summary ra file này (mặc định: stdout)")
+    parser.add_argument("--blender", default="", help="Đường dẫn Blender (mặc định: Blender đang chạy hoặc 'blender')")
+    # internal: one .blend inside a worker process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", default="", help=argparse.SUPPRESS)
+    return parser
+
+def expand_files(patterns):
+    """Expand globs / directories into a sorted, de-duplicated list of .blend files"""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.blend")
+        matches = glob.glob(pattern, recursive=True) or ([pattern] if os.path.isfile(pattern) else [])
+        for path in matches:
+            if path.lower().endswith(".blend"):
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+def output_dir_for(args, blend_path):
+    if not args.output:
+        return DEFAULT_OUTPUT[args.addon]
+    stem = os.path.splitext(os.path.basename(blend_path))[0]
+    return os.path.join(os.path.abspath(args.output), stem)
+
+# ---------- Worker (inside Blender) ----------
+def load_addon(kind):
+    """Import + register an add-on file from this folder (file names may contain spaces)"""
+    path = os.path.join(HERE, ADDON_FILES[kind])
+    spec = importlib.util.spec_from_file_location(f"quick_batch_{kind}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.register()
+    return module
+
+def selected_objects():
+    view_layer = bpy.context.view_layer
+    return [obj for obj in view_layer.objects if obj.select_get(view_layer=view_layer)]
+
+def run_unpack(module, args, export_dir):
+    scene = bpy.context.scene
+    scene.qup_export_dir = export_dir
+    if args.format:
+        scene.qup_format = args.format
+    scene.qup_only_selected = args.only_selected
+    scene.qup_incremental = not args.no_incremental
+    scene.qup_dedupe = not args.no_dedupe
+    scene.qup_workers = args.workers
+    if args.memory_budget is not None:
+        scene.qup_memory_budget = args.memory_budget
+    scene.qup_output = ARCHIVE_OUTPUTS.get(args.archive, 'FOLDER')
+    if args.archive_level is not None:
+        scene.qup_archive_level = args.archive_level
+    scene.qup_staged = args.staged
+    scene.qup_stage_dir = args.stage_dir
+    if args.upload_streams is not None:
+        scene.qup_upload_streams = args.upload_streams
+    scene.qup_upload_verify = args.verify_hash
+    if args.lod_levels is not None:
+        scene.qup_lod_levels = args.lod_levels
+    if args.lod_min_size is not None:
+        scene.qup_lod_min_size = args.lod_min_size
+    if args.lod_filter:
+        scene.qup_lod_filter = args.lod_filter
+    scene.qup_profile = args.profile
+
+    export_dir, warning, error = module.resolve_export_dir(export_dir, create=not args.dry_run and not args.archive)
+    if error:
+        raise RuntimeError(error)
+    if warning:
+        print("[QBATCH]", warning)
+    mats, error = module.gather_materials(bpy.context.view_layer.objects.active, args.only_selected)
+    if error:
+        raise RuntimeError(error)
+    return module.export_packed_maps(scene, mats, export_dir, dry_run=args.dry_run)
+
+def run_maps(module, args, export_dir):
+    props = bpy.context.scene.qemp_props
+    # preset first: its update callback resets format/prefix/suffix
+    # (and the preset file first of all, it defines the extra preset IDs)
+    if args.preset_file:
+        props.preset_file = os.path.abspath(args.preset_file)
+    if args.preset:
+        props.preset = args.preset
+    if args.format:
+        props.image_format = args.format
+    if args.prefix is not None:
+        props.prefix = args.prefix
+    if args.suffix is not None:
+        props.suffix = args.suffix
+    if args.mrao_target:
+        props.mrao_target = args.mrao_target
+    if args.mrao_size is not None:
+        props.mrao_size = args.mrao_size
+    if args.mrao_filter:
+        props.mrao_filter = args.mrao_filter
+    if args.lod_levels is not None:
+        props.lod_levels = args.lod_levels
+    if args.lod_min_size is not None:
+        props.lod_min_size = args.lod_min_size
+    if args.lod_filter:
+        props.lod_filter = args.lod_filter
+    if args.optimize:
+        props.optimize = args.optimize
+    for group, level in args.png_level:
+        setattr(props, f"png_level_{group}", level)
+    props.directory = export_dir
+    props.incremental = not args.no_incremental
+    props.dedupe = not args.no_dedupe
+    props.workers = args.workers
+    if args.memory_budget is not None:
+        props.memory_budget = args.memory_budget
+    props.output = ARCHIVE_OUTPUTS.get(args.archive, 'FOLDER')
+    if args.archive_level is not None:
+        props.archive_level = args.archive_level
+    if args.atlas_size is not None:
+        props.atlas_size = args.atlas_size
+    if args.atlas_padding is not None:
+        props.atlas_padding = args.atlas_padding
+    props.dry_run = args.dry_run
+    props.profile = args.profile
+    objects = selected_objects() if args.only_selected else None  # None: material của cả scene
+    if args.atlas:
+        return module.export_atlas(objects, props)
+    return module.export_maps(objects, props)
+
+def worker_main(args):
+    """Export the currently opened .blend and write a JSON result file"""
+    started = time.perf_counter()
+    result = {"file": bpy.data.filepath, "status": "ok"}
+    code = EXIT_OK
+    try:
+        module = load_addon(args.addon)
+        if args.archive == "tar.zst" and module.zstd_module() is None:
+            raise RuntimeError(module.ZSTD_MISSING)
+        export_dir = output_dir_for(args, bpy.data.filepath)
+        runner = run_unpack if args.addon == "unpack" else run_maps
+        stats = runner(module, args, export_dir)
+        result.update(stats)
+        result["failed"] = [list(f) for f in stats.get("failed", [])]
+        if result["failed"]:
+            result["status"] = "failed"
+            code = EXIT_FAILED
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result.update(status="error", error=str(e))
+        code = EXIT_FAILED
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    if args.result:
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    return code
+
+# ---------- Controller ----------
+def blender_binary(args):
+    if args.blender:
+        return args.blender
+    if bpy is not None and getattr(bpy.app, "binary_path", ""):
+        return bpy.app.binary_path
+    return "blender"
+
+def worker_command(args, blend_path, result_path):
+    forward = ["--worker", "--result", result_path, "--addon", args.addon,
+               "--workers", str(args.workers)]
+    if args.memory_budget is not None:
+        forward += ["--memory-budget", str(args.memory_budget)]
+    if args.archive:
+        forward += ["--archive", args.archive]
+    if args.archive_level is not None:
+        forward += ["--archive-level", str(args.archive_level)]
+    if args.upload_streams is not None:
+        forward += ["--upload-streams", str(args.upload_streams)]
+    if args.mrao_size is not None:
+        forward += ["--mrao-size", str(args.mrao_size)]
+    if args.lod_levels is not None:
+        forward += ["--lod-levels", str(args.lod_levels)]
+    if args.lod_min_size is not None:
+        forward += ["--lod-min-size", str(args.lod_min_size)]
+    if args.atlas_size is not None:
+        forward += ["--atlas-size", str(args.atlas_size)]
+    if args.atlas_padding is not None:
+        forward += ["--atlas-padding", str(args.atlas_padding)]
+    for flag, value in (("--output", args.output), ("--format", args.format), ("--preset", args.preset),
+                        ("--prefix", args.prefix), ("--suffix", args.suffix), ("--stage-dir", args.stage_dir),
+                        ("--preset-file", args.preset_file),
+                        ("--mrao-target", args.mrao_target), ("--mrao-filter", args.mrao_filter),
+                        ("--lod-filter", args.lod_filter), ("--optimize", args.optimize)):
+        if value is not None and value != "":
+            forward += [flag, value]
+    for group, level in args.png_level:
+        forward += ["--png-level", f"{group}={level}"]
+    if args.atlas:
+        forward.append("--atlas")
+    if args.only_selected:
+        forward.append("--only-selected")
+    if args.no_incremental:
+        forward.append("--no-incremental")
+    if args.no_dedupe:
+        forward.append("--no-dedupe")
+    if args.staged:
+        forward.append("--staged")
+    if args.verify_hash:
+        forward.append("--verify-hash")
+    if args.dry_run:
+        forward.append("--dry-run")
+    if args.profile:
+        forward.append("--profile")
+    return [blender_binary(args), "-b", "--factory-startup", blend_path,
+            "--python", os.path.abspath(__file__), "--"] + forward
+
+def run_one(args, blend_path, tmp_dir, index):
+    result_path = os.path.join(tmp_dir, f"{index:05d}.json")
+    cmd = worker_command(args, blend_path, result_path)
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              timeout=args.timeout or None)
+        returncode, log = proc.returncode, proc.stdout.decode("utf-8", "replace")
+    except subprocess.TimeoutExpired as e:
+        returncode, log = None, (e.stdout or b"").decode("utf-8", "replace") + "\n[timeout]"
+    except OSError as e:
+        returncode, log = None, str(e)
+
+    result = {"file": blend_path, "status": "error"}
+    try:
+        with open(result_path, encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        result["error"] = "Worker không trả kết quả (Blender crash / timeout?)"
+        result["log_tail"] = log[-4000:]
+    result["file"] = blend_path
+    result["returncode"] = returncode
+    result["wall_seconds"] = round(time.perf_counter() - started, 3)
+    if returncode != 0 and result.get("status") == "ok":
+        result["status"] = "error"
+    return result
+
+def controller_main(args):
+    files = expand_files(args.files)
+    if not files:
+        print("[QBATCH] Không tìm thấy file .blend nào.", file=sys.stderr)
+        return EXIT_USAGE
+
+    jobs = queue.Queue()
+    for index, path in enumerate(files):
+        jobs.put((index, path))
+    results = [None] * len(files)
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="qbatch_") as tmp_dir:
+        def drain():
+            while True:
+                try:
+                    index, path = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                results[index] = run_one(args, path, tmp_dir, index)
+                r = results[index]
+                print(f"[QBATCH] {r['status']:>6} {path} "
+                      f"(exported {r.get('exported', 0)}, skipped {r.get('skipped', 0)}, "
+                      f"failed {len(r.get('failed', []))})", flush=True)
+
+        threads = [threading.Thread(target=drain, daemon=True) for _ in range(max(1, min(args.jobs, len(files))))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    summary = {
+        "addon": args.addon,
+        "files": results,
+        "totals": {
+            "files": len(results),
+            "ok": sum(1 for r in results if r["status"] == "ok"),
+            "failed_files": sum(1 for r in results if r["status"] != "ok"),
+            "exported": sum(r.get("exported", 0) for r in results),
+            "skipped": sum(r.get("skipped", 0) for r in results),
+            "deduped": sum(r.get("deduped", 0) for r in results),
+            "dedupe_saved_bytes": sum(r.get("dedupe_saved_bytes", 0) for r in results),
+            "failed_textures": sum(len(r.get("failed", [])) for r in results),
+            "estimated_bytes": sum(r.get("plan", {}).get("totals", {}).get("bytes", r.get("estimated_bytes", 0))
+                                   for r in results),
+            "seconds": round(time.perf_counter() - started, 3),
+        },
+    }
+    text = json.dumps(summary, indent=1, ensure_ascii=False)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[QBATCH] Summary → {args.summary}")
+    else:
+        print(text)
+    return EXIT_OK if summary["totals"]["failed_files"] == 0 else EXIT_FAILED
+
+def main(argv=None):
+    args = build_parser().parse_args(script_args(argv))
+    if args.worker:
+        if bpy is None:
+            print("[QBATCH] --worker phải chạy bên trong Blender.", file=sys.stderr)
+            return EXIT_USAGE
+        return worker_main(args)
+    return controller_main(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
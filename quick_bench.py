@@ -0,0 +1,491 @@
+"""Benchmark Quick Unpack Pro / Quick Export Maps Pro trên scene tổng hợp (Blender chạy nền).
+
+    python quick_bench.py --blender /path/to/blender [options]
+    blender -b --python quick_bench.py -- [options]
+
+1. Một tiến trình Blender dựng scene tổng hợp (số material, độ phức tạp node tree,
+   tỉ lệ ảnh packed / ảnh file ngoài, tỉ lệ texture dùng chung, độ phân giải 1K-8K)
+   rồi lưu thành bench_scene.blend (hoặc dùng --scene FILE.blend có sẵn).
+2. Mỗi case (unpack, maps:<PRESET>, atlas) chạy trong một tiến trình Blender riêng,
+   xuất --repeat lần qua đúng code path của quick_batch_cli.py với profiling bật:
+   thời gian từng lần + từng giai đoạn, peak RSS của tiến trình.
+3. Kết quả ghi ra JSON (--out). Với --baseline, so median thời gian + peak RSS
+   từng case với file kết quả cũ; exit code 1 nếu chậm / tốn RAM hơn --threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)  # `blender --python` does not add the script folder
+
+import quick_batch_cli as batch
+from quick_batch_cli import EXIT_FAILED, EXIT_OK, EXIT_USAGE, bpy
+
+try:
+    import numpy as np
+except ImportError:  # only the scene generator (inside Blender, which bundles numpy) needs it
+    np = None
+
+RESULT_VERSION = 1
+SCENE_NAME = "bench_scene.blend"
+DEFAULT_CASES = "unpack,maps:DEFAULT,maps:PACKED_MRAO"
+# one texture per map kind and material; image names carry the map type,
+# that is how Quick Export Maps Pro classifies them
+MAP_KINDS = ("albedo", "rough", "metal", "ao", "normal")
+BSDF_INPUTS = {"albedo": "Base Color", "rough": "Roughness", "metal": "Metallic"}
+# what Quick Unpack Pro must classify each kind as (ao stays unconnected -> Misc)
+EXPECTED_MAP_TYPES = {"albedo": "BaseColor", "rough": "Roughness", "metal": "Metallic", "ao": "Misc",
+                      "normal": "Normal"}
+NOISE_TILE = 256
+
+# ---------- Arguments ----------
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="quick_bench.py",
+        description="Đo thời gian + RAM của các exporter trên scene tổng hợp, so với baseline.")
+    scene = parser.add_argument_group("scene tổng hợp")
+    scene.add_argument("--materials", type=int, default=50, help="Số material")
+    scene.add_argument("--resolutions", default="1024,2048",
+                       help="Cạnh ảnh (px), xoay vòng theo material, vd 1024,2048,4096,8192")
+    scene.add_argument("--node-depth", type=int, default=2,
+                       help="Số node chèn giữa mỗi texture và BSDF (+ bấy nhiêu node không nối)")
+    scene.add_argument("--packed", type=float, default=1.0, help="Tỉ lệ ảnh packed (còn lại là file PNG ngoài)")
+    scene.add_argument("--shared", type=float, default=0.2,
+                       help="Tỉ lệ material dùng chung bộ texture thay vì có bộ riêng")
+    scene.add_argument("--seed", type=int, default=1, help="Seed của nội dung ảnh + phân bổ packed/shared")
+    scene.add_argument("--scene", default="", help="Dùng file .blend có sẵn thay vì dựng scene tổng hợp")
+    parser.add_argument("--cases", default=DEFAULT_CASES,
+                        help="Các case, cách nhau dấu phẩy: unpack, maps:<PRESET>, atlas")
+    parser.add_argument("--format", default="PNG", help="Định dạng xuất (PNG, JPEG, TARGA...)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần xuất mỗi case (lấy median)")
+    parser.add_argument("--workers", type=int, default=0, help="Số luồng encode (0 = theo số CPU)")
+    parser.add_argument("--export-args", default="",
+                        help="Option thêm cho quick_batch_cli.py, viết dạng --export-args=\"...\" "
+                             "vì giá trị bắt đầu bằng '-', vd --export-args=\"--lod-levels 2 --no-dedupe\"")
+    parser.add_argument("--work-dir", default="",
+                        help="Thư mục cho scene + output (mặc định: thư mục tạm, xóa khi xong)")
+    parser.add_argument("--out", default="", help="Ghi JSON kết quả ra file này (mặc định: stdout)")
+    parser.add_argument("--baseline", default="", help="File kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Chậm / tốn RAM hơn baseline quá tỉ lệ này là regression (0.10 = 10%%)")
+    parser.add_argument("--timeout", type=float, default=0, help="Giới hạn giây cho mỗi tiến trình (0 = không)")
+    parser.add_argument("--blender", default="", help="Đường dẫn Blender (mặc định: Blender đang chạy hoặc 'blender')")
+    parser.add_argument("--generate", default="", help=argparse.SUPPRESS)  # worker: build + save the scene
+    parser.add_argument("--worker", default="", help=argparse.SUPPRESS)  # worker: run one case
+    parser.add_argument("--result", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--out-dir", default="", help=argparse.SUPPRESS)
+    return parser
+
+def scene_params(args):
+    return {
+        "materials": args.materials,
+        "resolutions": parse_resolutions(args.resolutions),
+        "node_depth": args.node_depth,
+        "packed": args.packed,
+        "shared": args.shared,
+        "seed": args.seed,
+    }
+
+def parse_resolutions(text):
+    return [int(size) for size in text.split(",") if size.strip()]
+
+def parse_case(case):
+    """'unpack' / 'maps:PRESET' / 'atlas' -> quick_batch_cli.py arguments"""
+    kind, _, preset = case.partition(":")
+    if kind == "unpack":
+        return ["--addon", "unpack"]
+    if kind == "maps":
+        return ["--addon", "maps"] + (["--preset", preset] if preset else [])
+    if kind == "atlas":
+        return ["--addon", "maps", "--atlas"]
+    raise ValueError(f"Case không hợp lệ: {case}")
+
+# ---------- Synthetic scene (inside Blender) ----------
+def synth_pixels(rng, size, kind):
+    """(size, size, 4) float32: gradient + tiled noise, so encoders see
+    realistic (compressible, not constant) content"""
+    noise = rng.random((NOISE_TILE, NOISE_TILE), dtype=np.float32)
+    reps = -(-size // NOISE_TILE)
+    noise = np.tile(noise, (reps, reps))[:size, :size]
+    ramp = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    out = np.empty((size, size, 4), dtype=np.float32)
+    if kind == "normal":
+        out[..., 0] = noise
+        out[..., 0] *= 0.2
+        out[..., 0] += 0.4
+        out[..., 1] = out[..., 0].T if size > 1 else out[..., 0]
+        out[..., 2] = 1.0
+    else:
+        out[..., 0] = noise
+        out[..., 0] *= 0.3
+        out[..., 0] += ramp[None, :] * 0.35
+        out[..., 0] += ramp[:, None] * 0.35
+        if kind == "albedo":
+            out[..., 1] = out[..., 0]
+            out[..., 1] *= 0.8
+            out[..., 2] = out[..., 0].T
+        else:
+            out[..., 1] = out[..., 0]
+            out[..., 2] = out[..., 0]
+    out[..., 3] = 1.0
+    return out
+
+def make_image(name, size, kind, rng, packed, tex_dir):
+    img = bpy.data.images.new(name, width=size, height=size, alpha=False)
+    if kind != "albedo":
+        img.colorspace_settings.name = 'Non-Color'
+    img.pixels.foreach_set(synth_pixels(rng, size, kind).ravel())
+    if packed:
+        img.pack()  # generated pixels are packed as PNG
+    else:
+        img.filepath_raw = os.path.join(tex_dir, f"{name}.png")
+        img.file_format = 'PNG'
+        img.save()
+    img.buffers_free()
+    return img
+
+def chain_nodes(nodes, links, socket, depth, x, y):
+    """Insert `depth` reroutes after `socket` (pass-through for the map type
+    classifier, like real node trees), returns the last output"""
+    for i in range(depth):
+        node = nodes.new("NodeReroute")
+        node.location = (x + 180 * i, y)
+        links.new(socket, node.inputs[0])
+        socket = node.outputs[0]
+    return socket
+
+def build_material(name, images, depth):
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    bsdf = next(n for n in nodes if n.type == 'BSDF_PRINCIPLED')
+    for row, (kind, img) in enumerate(images.items()):
+        tex = nodes.new("ShaderNodeTexImage")
+        tex.image = img
+        tex.location = (-900 - 180 * depth, 300 - 280 * row)
+        out = chain_nodes(nodes, links, tex.outputs["Color"], depth, -700 - 180 * depth, 300 - 280 * row)
+        if kind == "normal":
+            normal_map = nodes.new("ShaderNodeNormalMap")
+            normal_map.location = (-250, 300 - 280 * row)
+            links.new(out, normal_map.inputs["Color"])
+            links.new(normal_map.outputs["Normal"], bsdf.inputs["Normal"])
+        elif kind in BSDF_INPUTS:
+            links.new(out, bsdf.inputs[BSDF_INPUTS[kind]])
+        # ao: left unconnected, like most downloaded material packs
+    for i in range(depth):
+        nodes.new("ShaderNodeMath").location = (-400, -1200 - 180 * i)  # unconnected clutter
+    return mat
+
+def generate_scene(params, blend_path):
+    """Build the synthetic scene described by `params` and save it to blend_path"""
+    bpy.ops.wm.read_homefile(use_empty=True)
+    rng = np.random.default_rng(params["seed"])
+    tex_dir = os.path.join(os.path.dirname(blend_path), "textures")
+    os.makedirs(tex_dir, exist_ok=True)
+    resolutions = params["resolutions"]
+    shared_sets = {}  # resolution -> texture set used by every "shared" material
+    collection = bpy.context.scene.collection
+    for i in range(params["materials"]):
+        size = resolutions[i % len(resolutions)]
+        shared = rng.random() < params["shared"]
+        if shared and size in shared_sets:
+            images = shared_sets[size]
+        else:
+            prefix = f"bench_shared_{size}" if shared else f"bench_{i:04d}"
+            images = {kind: make_image(f"{prefix}_{kind}", size, kind, rng, rng.random() < params["packed"], tex_dir)
+                      for kind in MAP_KINDS}
+            if shared:
+                shared_sets[size] = images
+        mat = build_material(f"BenchMat_{i:04d}", images, params["node_depth"])
+        mesh = bpy.data.meshes.new(f"BenchMesh_{i:04d}")
+        mesh.materials.append(mat)
+        collection.objects.link(bpy.data.objects.new(f"Bench_{i:04d}", mesh))
+    check_map_types()
+    bpy.ops.wm.save_as_mainfile(filepath=blend_path, compress=False)
+
+def check_map_types():
+    """Every texture must classify as its own kind: if the node chain hid the
+    BSDF socket, all maps would turn into BaseColor and the unpack case would
+    measure name collisions instead of the real export path"""
+    qup = batch.load_addon("unpack")
+    cache = {}
+    wrong = []
+    for mat in bpy.data.materials:
+        if not mat.use_nodes:
+            continue
+        types = qup.material_map_types(mat, cache)
+        for node in mat.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image:
+                expected = EXPECTED_MAP_TYPES[node.image.name.rsplit("_", 1)[1]]
+                if types.get(node.name) != expected:
+                    wrong.append(f"{mat.name}/{node.image.name}: {types.get(node.name)} (cần {expected})")
+    if wrong:
+        raise RuntimeError("Scene tổng hợp phân loại sai map type: " + ", ".join(wrong[:5]))
+
+def scene_stats():
+    images = [img for img in bpy.data.images if img.source == 'FILE']
+    return {
+        "materials": sum(1 for mat in bpy.data.materials if mat.use_nodes),
+        "images": len(images),
+        "packed": sum(1 for img in images if img.packed_file),
+        "megapixels": round(sum(img.size[0] * img.size[1] for img in images) / 1e6, 3),
+    }
+
+# ---------- Case worker (inside Blender) ----------
+def peak_rss():
+    """Peak resident set size of this process in bytes (None if unknown)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+def windows_peak_rss():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        return None
+
+def case_batch_args(args):
+    """quick_batch_cli.py arguments for one case: no incremental skip, profiling on"""
+    return (parse_case(args.worker) + ["--format", args.format, "--workers", str(args.workers),
+                                       "--no-incremental", "--profile"]
+            + shlex.split(args.export_args))
+
+def median_stages(runs):
+    """{stage: median seconds over the runs that have it}"""
+    names = {name for run in runs for name in run["stages"]}
+    stages = {name: statistics.median(run["stages"][name]["seconds"] for run in runs if name in run["stages"])
+              for name in names}
+    return {name: round(seconds, 6) for name, seconds in sorted(stages.items(), key=lambda item: -item[1])}
+
+def worker_main(args):
+    """Run one case --repeat times on the opened scene, write a JSON result"""
+    result = {"case": args.worker, "status": "ok"}
+    code = EXIT_OK
+    try:
+        bargs = batch.build_parser().parse_args(case_batch_args(args))
+        module = batch.load_addon(bargs.addon)
+        runner = batch.run_unpack if bargs.addon == "unpack" else batch.run_maps
+        result["scene"] = scene_stats()
+        result["rss_after_load"] = peak_rss()
+        runs = []
+        for index in range(args.repeat):
+            out_dir = os.path.join(args.out_dir, f"run{index}")
+            shutil.rmtree(out_dir, ignore_errors=True)
+            started = time.perf_counter()
+            stats = runner(module, bargs, out_dir)
+            seconds = time.perf_counter() - started
+            profile = stats.get("profile") or {}
+            runs.append({
+                "seconds": round(seconds, 4),
+                "exported": stats.get("exported", 0),
+                "failed": len(stats.get("failed", [])),
+                "bytes_written": stats.get("bytes_written", 0),
+                "stages": profile.get("stages", {}),
+                "counters": profile.get("counters", {}),
+            })
+            print(f"[QBENCH] {args.worker} run {index + 1}/{args.repeat}: {seconds:.3f} s", flush=True)
+            shutil.rmtree(out_dir, ignore_errors=True)
+        times = [run["seconds"] for run in runs]
+        result.update(
+            runs=runs,
+            median_seconds=round(statistics.median(times), 4),
+            min_seconds=min(times),
+            stages=median_stages(runs),
+            peak_rss=peak_rss(),
+        )
+        if any(run["failed"] for run in runs):
+            result["status"] = "failed"
+            code = EXIT_FAILED
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result.update(status="error", error=str(e))
+        code = EXIT_FAILED
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return code
+
+def generate_main(args):
+    generate_scene(scene_params(args), args.generate)
+    return EXIT_OK
+
+# ---------- Controller ----------
+def run_blender(args, cmd, log_name):
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=args.timeout or None)
+        return proc.returncode, proc.stdout.decode("utf-8", "replace")
+    except subprocess.TimeoutExpired as e:
+        return None, (e.stdout or b"").decode("utf-8", "replace") + "\n[timeout]"
+    except OSError as e:
+        return None, f"{log_name}: {e}"
+
+def script_command(args, blend_path, forward):
+    cmd = [batch.blender_binary(args), "-b", "--factory-startup"]
+    if blend_path:
+        cmd.append(blend_path)
+    return cmd + ["--python", os.path.abspath(__file__), "--"] + forward
+
+def build_scene(args, work_dir):
+    """Path of the .blend to benchmark: --scene, or a freshly generated one"""
+    if args.scene:
+        return os.path.abspath(args.scene)
+    blend_path = os.path.join(work_dir, SCENE_NAME)
+    forward = ["--generate", blend_path, "--materials", str(args.materials), "--resolutions", args.resolutions,
+               "--node-depth", str(args.node_depth), "--packed", str(args.packed), "--shared", str(args.shared),
+               "--seed", str(args.seed)]
+    started = time.perf_counter()
+    returncode, log = run_blender(args, script_command(args, None, forward), "generate")
+    if returncode != 0 or not os.path.isfile(blend_path):
+        print(log[-4000:], file=sys.stderr)
+        raise RuntimeError("Không dựng được scene tổng hợp")
+    print(f"[QBENCH] Scene → {blend_path} ({time.perf_counter() - started:.1f} s)", flush=True)
+    return blend_path
+
+def run_case(args, blend_path, work_dir, case):
+    result_path = os.path.join(work_dir, f"{case.replace(':', '_')}.json")
+    forward = ["--worker", case, "--result", result_path, "--out-dir", os.path.join(work_dir, "out"),
+               "--format", args.format, "--repeat", str(args.repeat), "--workers", str(args.workers),
+               f"--export-args={args.export_args}"]
+    started = time.perf_counter()
+    returncode, log = run_blender(args, script_command(args, blend_path, forward), case)
+    result = {"case": case, "status": "error"}
+    try:
+        with open(result_path, encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        result["error"] = "Worker không trả kết quả (Blender crash / timeout?)"
+        result["log_tail"] = log[-4000:]
+    result["returncode"] = returncode
+    result["wall_seconds"] = round(time.perf_counter() - started, 3)
+    if returncode != 0 and result.get("status") == "ok":
+        result["status"] = "error"
+    return result
+
+def compare(results, baseline, threshold):
+    """Rows (case, metric, baseline, current, ratio, regression) for every case
+    both runs have. Times are compared on the median, memory on peak RSS."""
+    rows = []
+    for case, current in results["cases"].items():
+        previous = baseline.get("cases", {}).get(case)
+        if not previous or current.get("status") != "ok" or previous.get("status") != "ok":
+            continue
+        for metric in ("median_seconds", "peak_rss"):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            rows.append({"case": case, "metric": metric, "baseline": old, "current": new,
+                         "ratio": round(ratio, 4), "regression": ratio > 1.0 + threshold})
+    return rows
+
+def print_comparison(rows, threshold):
+    print(f"[QBENCH] So với baseline (ngưỡng +{threshold:.0%}):")
+    for row in rows:
+        if row["metric"] == "peak_rss":
+            old, new = f"{row['baseline'] / 1048576:.0f} MB", f"{row['current'] / 1048576:.0f} MB"
+        else:
+            old, new = f"{row['baseline']:.3f} s", f"{row['current']:.3f} s"
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"[QBENCH]   {row['case']:<22} {row['metric']:<15} {old:>10} → {new:>10} "
+              f"({row['ratio'] - 1.0:+.1%}) {flag}")
+
+def controller_main(args):
+    try:
+        cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+        for case in cases:
+            parse_case(case)
+        if not cases or args.repeat < 1 or not parse_resolutions(args.resolutions):
+            raise ValueError("Cần ít nhất 1 case, 1 độ phân giải và --repeat >= 1")
+    except ValueError as e:
+        print(f"[QBENCH] {e}", file=sys.stderr)
+        return EXIT_USAGE
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="qbench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        blend_path = build_scene(args, work_dir)
+        results = {
+            "version": RESULT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": {"platform": platform.platform(), "processor": platform.processor(),
+                        "cpus": os.cpu_count(), "blender": batch.blender_binary(args)},
+            "scene": {"file": args.scene} if args.scene else scene_params(args),
+            "settings": {"format": args.format, "repeat": args.repeat, "workers": args.workers,
+                         "export_args": args.export_args},
+            "cases": {},
+        }
+        for case in cases:
+            r = results["cases"][case] = run_case(args, blend_path, work_dir, case)
+            print(f"[QBENCH] {r['status']:>6} {case}: median {r.get('median_seconds', 0):.3f} s, "
+                  f"peak RSS {(r.get('peak_rss') or 0) / 1048576:.0f} MB", flush=True)
+    except RuntimeError as e:
+        print(f"[QBENCH] {e}", file=sys.stderr)
+        return EXIT_FAILED
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    code = EXIT_OK if all(r["status"] == "ok" for r in results["cases"].values()) else EXIT_FAILED
+    if baseline is not None:
+        if baseline.get("scene") != results["scene"] or baseline.get("settings") != results["settings"]:
+            print("[QBENCH] Cảnh báo: baseline dùng scene / thiết lập khác, so sánh có thể không có nghĩa.")
+        rows = compare(results, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        results["comparison"] = {"baseline": os.path.abspath(args.baseline), "threshold": args.threshold,
+                                 "rows": rows}
+        if any(row["regression"] for row in rows):
+            code = EXIT_FAILED
+
+    text = json.dumps(results, indent=1, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[QBENCH] Kết quả → {args.out}")
+    else:
+        print(text)
+    return code
+
+def main(argv=None):
+    args = build_parser().parse_args(batch.script_args(argv))
+    if args.generate or args.worker:
+        if bpy is None:
+            print("[QBENCH] --generate / --worker phải chạy bên trong Blender.", file=sys.stderr)
+            return EXIT_USAGE
+        return generate_main(args) if args.generate else worker_main(args)
+    return controller_main(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
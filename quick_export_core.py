@@ -0,0 +1,1491 @@
+"""Shared bpy-free code of Quick Unpack Pro and Quick Export Maps Pro: profiler,
+memory budget, channel resampling, LOD filters, image encoders and headers,
+atomic writes, the output name index, the manifest, the blob store, the archive
+writer, the export pool / run, export preset checks and atlas packing.
+
+Both add-ons install as single files and cannot import this module, so the
+block between the "quick_export_core" markers is copied into each of them.
+The block is split into sections and each add-on only gets the sections it
+uses (ADDONS). Edit it here, then
+
+    python quick_export_core.py          # refresh the copy in both add-ons
+    python quick_export_core.py --check  # exit 1 if a copy drifted
+
+Each add-on defines TMP_SUFFIX, MANIFEST_NAME, BLOB_DIR, LOG_PREFIX,
+PROFILE_NAME and blob_key(job) before the block; the defaults below only
+serve imports of this module (tests).
+"""
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import tarfile
+import threading
+import time
+import traceback
+import zipfile
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# add-on -> sections of the shared block it gets, in block order
+ADDONS = {
+    "quick_unpack_pro.py": ("base", "lod", "encode", "output", "run"),
+    "Quick Export Maps Pro.py": ("base", "resample", "lod", "encode", "output", "run", "presets", "atlas"),
+}
+SHARED_BEGIN = "# >>> quick_export_core: shared code, edit quick_export_core.py and run it to update >>>"
+SHARED_END = "# <<< quick_export_core <<<"
+SECTION = "# --- quick_export_core section: {} ---"
+SECTION_RE = re.compile(r"^# --- quick_export_core section: (\w+) ---$", re.M)
+
+TMP_SUFFIX = ".qexport-tmp"
+MANIFEST_NAME = ".qexport_manifest.json"
+BLOB_DIR = ".qexport_blobs"
+LOG_PREFIX = "[QX]"
+PROFILE_NAME = "qexport_profile"
+
+def blob_key(job):
+    """Same source content + same target format -> same output bytes"""
+    record = job["record"]
+    return hashlib.blake2b(f"{record['hash']}|{record['format']}".encode(), digest_size=16).hexdigest()
+
+# >>> quick_export_core: shared code, edit quick_export_core.py and run it to update >>>
+# --- quick_export_core section: base ---
+PIXEL_DTYPE = np.float32
+STRIP_ROWS = 256  # rows per strip for strip-wise passes: temporaries stay one strip big
+
+# ---------- Profiling ----------
+class _ProfileStage:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.started)
+
+NULL_STAGE = contextlib.nullcontext()
+
+class Profiler:
+    """Per-stage timings + counters of one export run, safe from worker threads.
+    Disabled: stage() is an empty context and count() does nothing."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start(False)
+
+    def start(self, enabled):
+        self.enabled = enabled
+        self.stages = {}  # name -> [calls, seconds]
+        self.counters = Counter()
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _ProfileStage(self, name) if self.enabled else NULL_STAGE
+
+    def add(self, name, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def report(self, **info):
+        """JSON-friendly: wall_seconds, `info`, stages (slowest first), counters"""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            return {
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                **info,
+                "stages": {name: {"calls": calls, "seconds": round(seconds, 6)} for name, (calls, seconds) in stages},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write(self, base, report):
+        """<base>.json + <base>.csv (kind, name, calls, value)"""
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        with open(base + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("kind", "name", "calls", "value"))
+            for name, stage in report["stages"].items():
+                writer.writerow(("stage", name, stage["calls"], stage["seconds"]))
+            for name, value in report["counters"].items():
+                writer.writerow(("counter", name, "", value))
+
+PROFILE = Profiler()  # the current run (one export at a time)
+
+# ---------- Memory budget ----------
+class MemoryBudget:
+    """Pixel memory held by the export itself: decoded buffers it loaded plus
+    snapshots / packed bytes waiting in the pool. limit_mb 0 = unlimited."""
+
+    def __init__(self, limit_mb=0):
+        self.limit = limit_mb * 1048576
+        self.in_use = 0
+        self.peak = 0
+
+    def fits(self, nbytes):
+        return not self.limit or self.in_use + nbytes <= self.limit
+
+    def acquire(self, nbytes):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def release(self, nbytes):
+        self.in_use -= nbytes
+
+def store_uint8(strip, out):
+    """Float 0..1 strip -> uint8 `out` (rounded, clamped); modifies `strip` in place"""
+    strip *= 255.0
+    strip += 0.5
+    np.clip(strip, 0.0, 255.0, out=strip)
+    out[...] = strip
+
+# --- quick_export_core section: resample ---
+# ---------- Channel packing / resampling ----------
+# taps = [(source channel, out (height, width) uint8, invert 1-x)]: every output
+# channel taken from one decoded source, written straight into `out`.
+def quantize_channels(pixels, channels, width, taps):
+    """Channels of a flat float buffer -> uint8. One pass in STRIP_ROWS strips:
+    every tap reads the source strip while it is still in cache, temporaries
+    stay one strip big."""
+    src = pixels.reshape(-1, width, channels)
+    height = src.shape[0]
+    tmp = np.empty((min(STRIP_ROWS, height), width), dtype=PIXEL_DTYPE)
+    with PROFILE.stage("pack.quantize"):
+        for y in range(0, height, STRIP_ROWS):
+            t = tmp[:min(STRIP_ROWS, height - y)]
+            for channel, out, invert in taps:
+                if invert:
+                    np.subtract(1.0, src[y:y + len(t), :, channel], out=t)
+                else:
+                    t[...] = src[y:y + len(t), :, channel]
+                store_uint8(t, out[y:y + len(t)])
+
+# separable resample filters: name -> (weight function, radius)
+def _box(x):
+    return ((x > -0.5) & (x <= 0.5)).astype(PIXEL_DTYPE)
+
+def _triangle(x):
+    return np.maximum(0.0, 1.0 - np.abs(x))
+
+def _lanczos3(x):
+    return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+RESAMPLE_FILTERS = {'BOX': (_box, 0.5), 'BILINEAR': (_triangle, 1.0), 'LANCZOS': (_lanczos3, 3.0)}
+
+def resample_weights(n_in, n_out, filter_name):
+    """Indices + weights (n_out, taps) for one axis. Downscaling widens the filter
+    by the scale (anti-aliased, like PIL); edges repeat the border pixel."""
+    fn, support = RESAMPLE_FILTERS[filter_name]
+    scale = n_in / n_out
+    fscale = max(scale, 1.0)
+    support *= fscale
+    centers = (np.arange(n_out) + 0.5) * scale
+    taps = int(np.ceil(2 * support)) + 1
+    idx = np.ceil(centers - support - 0.5).astype(np.int64)[:, None] + np.arange(taps)
+    weights = fn((idx + 0.5 - centers[:, None]) / fscale).astype(PIXEL_DTYPE)
+    # drop taps that weigh 0 on every row (each tap is one pass over the strip)
+    keep = weights.any(axis=0)
+    idx, weights = idx[:, keep], weights[:, keep]
+    total = weights.sum(axis=1, keepdims=True)
+    weights /= np.where(total == 0, 1.0, total)
+    return np.clip(idx, 0, n_in - 1), weights
+
+def resample_channels(pixels, channels, src_width, src_height, taps, filter_name='BILINEAR'):
+    """quantize_channels for a source (src_height, src_width) of another size than
+    `out`. Vertical then horizontal pass per STRIP_ROWS output rows, one gather +
+    multiply-add per filter tap; BOX at an integer factor only adds strided views."""
+    with PROFILE.stage("pack.resample"):
+        _resample_channels(pixels, channels, src_width, src_height, taps, filter_name)
+
+def _resample_channels(pixels, channels, src_width, src_height, taps, filter_name):
+    src = pixels.reshape(src_height, src_width, channels)
+    height, width = taps[0][1].shape
+    box = filter_name == 'BOX' and src_height % height == 0 and src_width % width == 0
+    if box:
+        fy, fx = src_height // height, src_width // width
+    else:
+        yi, yw = resample_weights(src_height, height, filter_name)
+        xi, xw = resample_weights(src_width, width, filter_name)
+        rows_buf = np.empty((2, min(STRIP_ROWS, height), src_width), dtype=PIXEL_DTYPE)
+    cols_buf = np.empty((2, min(STRIP_ROWS, height), width), dtype=PIXEL_DTYPE)
+    for y in range(0, height, STRIP_ROWS):
+        n = min(STRIP_ROWS, height - y)
+        for channel, out, invert in taps:
+            plane = src[..., channel]
+            strip, tap = cols_buf[0, :n], cols_buf[1, :n]
+            strip.fill(0.0)
+            if box:
+                for dy in range(fy):
+                    for dx in range(fx):
+                        strip += plane[y * fy + dy:(y + n) * fy:fy, dx::fx]
+                strip *= 1.0 / (fy * fx)
+            else:
+                rows, rows_tap = rows_buf[0, :n], rows_buf[1, :n]
+                rows.fill(0.0)
+                for k in range(yi.shape[1]):
+                    # plane is a strided view (one channel of RGBA): fancy indexing beats np.take(out=) here
+                    np.multiply(plane[yi[y:y + n, k]], yw[y:y + n, k, None], out=rows_tap)
+                    rows += rows_tap
+                for k in range(xi.shape[1]):
+                    np.take(rows, xi[:, k], axis=1, out=tap)
+                    tap *= xw[:, k]
+                    strip += tap
+            if invert:
+                np.subtract(1.0, strip, out=strip)
+            store_uint8(strip, out[y:y + n])
+
+# --- quick_export_core section: lod ---
+# ---------- LOD filters ----------
+# Each level is filtered from the previous one in linear space: sRGB data is
+# linearized first and re-encoded after; normal maps are filtered as [-1, 1]
+# vectors and renormalized.
+LOD_KAISER_RADIUS = 4  # source pixels on each side
+LOD_KAISER_BETA = 4.0
+
+def lod_sizes(width, height, levels, min_size=1):
+    """Sizes below the source: halved (rounded up) per level, stopping after
+    `levels` or once the long side drops below min_size"""
+    sizes = []
+    while len(sizes) < levels and max(width, height) > 1:
+        width, height = max(1, (width + 1) // 2), max(1, (height + 1) // 2)
+        if max(width, height) < min_size:
+            break
+        sizes.append((width, height))
+    return sizes
+
+def srgb_to_linear(x):
+    return np.where(x <= 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4).astype(PIXEL_DTYPE)
+
+def linear_to_srgb(x):
+    x = np.maximum(x, 0.0)
+    return np.where(x <= 0.0031308, x * 12.92, 1.055 * x ** (1 / 2.4) - 0.055).astype(PIXEL_DTYPE)
+
+SRGB_TO_LINEAR_U8 = srgb_to_linear(np.arange(256, dtype=PIXEL_DTYPE) / 255.0)
+NORMAL_FROM_U8 = np.arange(256, dtype=PIXEL_DTYPE) * (2.0 / 255.0) - 1.0
+LINEAR_TO_SRGB_BITS = 14  # linear -> sRGB uint8 through a 2^14 entry table: < 0.25 LSB off in the darks
+LINEAR_TO_SRGB_U8 = (linear_to_srgb(np.arange(2 ** LINEAR_TO_SRGB_BITS, dtype=PIXEL_DTYPE)
+                                    / (2 ** LINEAR_TO_SRGB_BITS - 1)) * 255.0 + 0.5).astype(np.uint8)
+
+def _lod_taps(filter_name):
+    """Offset pairs (source rows/columns) and weights for one output pixel. Its
+    centre sits between source offsets 0 and 1, so the filter is symmetric
+    around 0.5: add each pair first, multiply once."""
+    if filter_name == 'BOX':
+        return ((0, 1),), (0.5,)
+    r = LOD_KAISER_RADIUS
+    offsets = np.arange(1 - r, 1)
+    x = offsets - 0.5
+    window = np.i0(LOD_KAISER_BETA * np.sqrt(np.clip(1.0 - (x / r) ** 2, 0.0, None))) / np.i0(LOD_KAISER_BETA)
+    weights = np.sinc(x / 2.0) * window
+    return tuple((int(d), int(1 - d)) for d in offsets), tuple(weights / (2 * weights.sum()))
+
+def halve(arr, axis, filter_name):
+    """Halve `arr` along `axis`. Each tap pair is two strided views added, scaled
+    and accumulated; the few edge rows whose taps fall outside repeat the border."""
+    n = arr.shape[axis]
+    if n == 1:
+        return arr
+    m = (n + 1) // 2
+    shape = list(arr.shape)
+    shape[axis] = m
+    out = np.zeros(shape, dtype=PIXEL_DTYPE)
+    src, dst = np.moveaxis(arr, axis, 0), np.moveaxis(out, axis, 0)
+    tmp = np.empty_like(dst)
+    for (first, second), weight in zip(*_lod_taps(filter_name)):
+        lo = min(m, max(0, (1 - first) // 2))  # first output row with 2i + first >= 0
+        hi = min(m, (n - 1 - second) // 2 + 1)  # and 2i + second <= n - 1
+        if hi > lo:
+            np.add(src[2 * lo + first:2 * hi + first - 1:2], src[2 * lo + second:2 * hi + second - 1:2],
+                   out=tmp[lo:hi])
+            tmp[lo:hi] *= weight
+            dst[lo:hi] += tmp[lo:hi]
+        for i in (*range(lo), *range(max(hi, lo), m)):
+            dst[i] += weight * (src[min(max(2 * i + first, 0), n - 1)] + src[min(2 * i + second, n - 1)])
+    return out
+
+def lod_decode(base, mode):
+    """Source level (uint8, or float 0..1, shaped (h, w, c)) -> float32 to filter"""
+    rgb = min(base.shape[2], 3)
+    lut = {'SRGB': SRGB_TO_LINEAR_U8, 'NORMAL': NORMAL_FROM_U8 if rgb == 3 else None}.get(mode)
+    if base.dtype == np.uint8 and lut is not None:
+        work = lut[base]  # one table gather for every channel, alpha redone below
+        if base.shape[2] > rgb:
+            np.multiply(base[..., rgb:], 1.0 / 255.0, out=work[..., rgb:])
+        return work
+    if base.dtype == np.uint8:
+        work = base.astype(PIXEL_DTYPE)
+        work *= 1.0 / 255.0
+    else:
+        work = base.astype(PIXEL_DTYPE)
+        if mode == 'SRGB':
+            work[..., :rgb] = srgb_to_linear(work[..., :rgb])
+    if mode == 'NORMAL' and rgb == 3:
+        work[..., :3] *= 2.0
+        work[..., :3] -= 1.0
+    return work
+
+def lod_encode(work, mode, as_uint8):
+    """Inverse of lod_decode. Normals are renormalized in `work` too, so the
+    next level is filtered from unit vectors."""
+    rgb = min(work.shape[2], 3)
+    if mode == 'SRGB' and as_uint8:
+        out = np.empty(work.shape, dtype=np.uint8)
+        if work.shape[2] > rgb:
+            store_uint8(work[..., rgb:].copy(), out[..., rgb:])
+        scaled = work[..., :rgb] * (2 ** LINEAR_TO_SRGB_BITS - 1)
+        scaled += 0.5
+        np.clip(scaled, 0.0, 2 ** LINEAR_TO_SRGB_BITS - 1, out=scaled)
+        out[..., :rgb] = LINEAR_TO_SRGB_U8[scaled.astype(np.uint16)]
+        return out
+    out = work.copy()
+    if mode == 'NORMAL' and rgb == 3:
+        length = np.sqrt(np.einsum('...i,...i->...', work[..., :3], work[..., :3]))[..., None]
+        work[..., :3] /= np.maximum(length, 1e-8)
+        out[..., :3] = work[..., :3] * 0.5 + 0.5
+    elif mode == 'SRGB':
+        out[..., :rgb] = linear_to_srgb(work[..., :rgb])
+    if not as_uint8:
+        return np.clip(out, 0.0, None if mode == 'LINEAR' else 1.0, out=out)
+    np.clip(out, 0.0, 1.0, out=out)
+    out *= 255.0
+    out += 0.5
+    return out.astype(np.uint8)
+
+def lod_chain(base, levels, mode, filter_name, as_uint8=True):
+    """`levels` levels below `base` (h, w, c), each filtered from the previous one"""
+    with PROFILE.stage("lod.filter"):
+        work = lod_decode(base, mode)
+        chain = []
+        for _ in range(levels):
+            work = halve(halve(work, 0, filter_name), 1, filter_name)
+            chain.append(lod_encode(work, mode, as_uint8))
+    return chain
+
+def build_lod_chain(make_base, args, levels, mode, filter_name):
+    """Worker: uint8 source level = make_base(*args), then the whole chain"""
+    return lod_chain(make_base(*args), levels, mode, filter_name)
+
+# --- quick_export_core section: encode ---
+# ---------- Encoders (uint8 (h, w, c), rows bottom-up like Blender) ----------
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+def encode_png(img, level=6):
+    h, w, c = img.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[c]
+    rows = img[::-1].reshape(h, w * c)
+    # "Up" filter on every row: vectorized, and compresses textures better than
+    # "None". Filtered + compressed in STRIP_ROWS strips, so the temporary is
+    # one strip, not a second copy of the image.
+    comp = zlib.compressobj(level)
+    idat = []
+    filtered = np.empty((min(STRIP_ROWS, h), w * c + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    for y in range(0, h, STRIP_ROWS):
+        f = filtered[:min(STRIP_ROWS, h - y)]
+        if y == 0:
+            f[0, 1:] = rows[0]
+            np.subtract(rows[1:len(f)], rows[:len(f) - 1], out=f[1:, 1:])
+        else:
+            np.subtract(rows[y:y + len(f)], rows[y - 1:y + len(f) - 1], out=f[:, 1:])
+        idat.append(comp.compress(f))
+    idat.append(comp.flush())
+    ihdr = struct.pack(">IIBBBBB", w, h, 8, color_type, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", ihdr),
+        _png_chunk(b"IDAT", b"".join(idat)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+def encode_tga(img):
+    h, w, c = img.shape
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    if c == 1:
+        image_type, data = 3, img
+    else:
+        image_type, data = 2, img[..., [2, 1, 0, 3][:c]]
+    descriptor = 8 if c == 4 else 0  # alpha bits, bottom-left origin
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0, w, h, c * 8, descriptor)
+    return header + data.tobytes()
+
+def encode_tiff(img, level=6):
+    h, w, c = img.shape
+    strip = zlib.compress(img[::-1].tobytes(), level)
+    tags = [
+        (256, 4, 1, w),
+        (257, 4, 1, h),
+        (258, 3, c, None),                 # BitsPerSample
+        (259, 3, 1, 8),                    # Deflate
+        (262, 3, 1, 2 if c >= 3 else 1),   # RGB / BlackIsZero
+        (273, 4, 1, None),                 # StripOffsets
+        (277, 3, 1, c),
+        (278, 4, 1, h),
+        (279, 4, 1, len(strip)),
+        (284, 3, 1, 1),
+    ]
+    if c in (2, 4):
+        tags.append((338, 3, 1, 2))        # ExtraSamples: unassociated alpha
+    ifd_size = 2 + 12 * len(tags) + 4
+    bits_offset = 8 + ifd_size
+    bits = struct.pack(f"<{c}H", *([8] * c)) if c > 2 else b""
+    strip_offset = bits_offset + len(bits)
+
+    entries = []
+    for tag, typ, count, value in tags:
+        if tag == 258:
+            if c > 2:
+                entries.append(struct.pack("<HHII", tag, typ, count, bits_offset))
+            else:
+                entries.append(struct.pack("<HHI", tag, typ, count) + struct.pack("<2H", 8, 8 if c == 2 else 0))
+            continue
+        if tag == 273:
+            value = strip_offset
+        if typ == 3:
+            entries.append(struct.pack("<HHIH2x", tag, typ, count, value))
+        else:
+            entries.append(struct.pack("<HHII", tag, typ, count, value))
+    ifd = struct.pack("<H", len(tags)) + b"".join(entries) + struct.pack("<I", 0)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + bits + strip
+
+BMP_GRAY_PALETTE = bytes(v for i in range(256) for v in (i, i, i, 0))  # BGR0 entries
+
+def encode_bmp(img):
+    """BI_RGB, bottom-up: 1 channel as 8-bit with a gray palette, RGB(A) as
+    24 / 32-bit BGR(A). Gray + alpha has no BMP form and is widened to BGRA."""
+    h, w, c = img.shape
+    palette = BMP_GRAY_PALETTE if c == 1 else b""
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    data = img[..., [0] if c == 1 else [2, 1, 0, 3][:c]].reshape(h, w * c)
+    pad = (-w * c) % 4
+    if pad:
+        data = np.pad(data, ((0, 0), (0, pad)))
+    data = data.tobytes()
+    offset = 14 + 40 + len(palette)
+    header = b"BM" + struct.pack("<IHHI", offset + len(data), 0, 0, offset)
+    info = struct.pack("<IiiHHIIiiII", 40, w, h, 1, c * 8, 0, len(data), 2835, 2835, len(palette) // 4, 0)
+    return header + info + palette + data
+
+ENCODERS = {
+    'PNG': encode_png,
+    'TARGA': encode_tga,
+    'TIFF': encode_tiff,
+    'BMP': encode_bmp,
+}
+
+def encode_image(fmt, img, level=None):
+    """level: zlib level for PNG / TIFF, None = encoder default"""
+    with PROFILE.stage(f"encode.{fmt}"):
+        if level is not None:
+            return ENCODERS[fmt](img, level)
+        return ENCODERS[fmt](img)
+
+# ---------- Image headers ----------
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def header_size(data, fmt=None):
+    """(width, height, channels) from a PNG / JPEG / BMP header (found by their
+    magic) or a TGA header (fmt 'TARGA': TGA has no magic), None if unknown.
+    Avoids image.size, which decodes the whole image."""
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            width, height = struct.unpack(">II", data[16:24])
+            return width, height, {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(data[25], 4)
+        if data[:3] == b'\xff\xd8\xff':
+            i = 2
+            while i + 10 <= len(data) and data[i] == 0xFF:
+                marker = data[i + 1]
+                if marker == 0xFF:
+                    i += 1
+                    continue
+                if marker in JPEG_SOF:
+                    height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                    return width, height, data[i + 9]
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+            return None
+        if data[:2] == b'BM':
+            width, height = struct.unpack("<ii", data[18:26])
+            return width, abs(height), max(1, struct.unpack("<H", data[28:30])[0] // 8)
+        if fmt == 'TARGA':
+            width, height = struct.unpack("<HH", data[12:16])
+            return width, height, max(1, data[16] // 8)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+# --- quick_export_core section: output ---
+# ---------- Output files (atomic, collision-aware) ----------
+# Every output is written to <name><TMP_SUFFIX> next to its target and moved in
+# place with os.replace: a crash or error leaves a temp file behind, never a
+# truncated output. os.replace also swaps an earlier output that is a
+# hardlink / symlink into the blob store without writing through it.
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@contextlib.contextmanager
+def atomic_file(filepath, buffering=-1):
+    """open(filepath, 'wb') that only replaces filepath once the block completes"""
+    tmp = filepath + TMP_SUFFIX
+    try:
+        with open(tmp, 'wb', buffering=buffering) as f:
+            yield f
+        os.replace(tmp, filepath)
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+
+def write_atomic(filepath, data):
+    with atomic_file(filepath) as f:
+        f.write(data)
+    return len(data)
+
+def write_output(target, data):
+    """Write encoded bytes to a file path or an ArchiveEntry, returns bytes written"""
+    PROFILE.count("bytes_written", len(data))
+    with PROFILE.stage("write"):
+        if isinstance(target, ArchiveEntry):
+            return target.write(data)
+        return write_atomic(target, data)
+
+class NameIndex:
+    """File names of every output folder, listed once with os.scandir.
+    Existence, size and collision checks are looked up in memory instead of
+    one stat per file (a round-trip each on a network share)."""
+
+    def __init__(self, on_disk=True):
+        self.on_disk = on_disk  # False (archive): only avoid names used by this run
+        self.folders = {}  # folder -> {name: DirEntry}, None if it does not exist
+        self.reserved = set()  # paths used by this run
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def listing(self, folder):
+        key = self.key(folder)
+        if key not in self.folders:
+            entries = None
+            if self.on_disk:
+                PROFILE.count("scandir")
+                try:
+                    with os.scandir(folder) as it:
+                        entries = {os.path.normcase(entry.name): entry for entry in it}
+                except OSError:
+                    pass
+            self.folders[key] = entries
+        return self.folders[key]
+
+    def entry(self, path):
+        entries = self.listing(os.path.dirname(path))
+        return entries.get(os.path.normcase(os.path.basename(path))) if entries else None
+
+    def exists(self, path):
+        return self.entry(path) is not None
+
+    def size(self, path):
+        """Size when listed (cached by scandir on Windows), None if missing"""
+        entry = self.entry(path)
+        try:
+            return entry.stat().st_size if entry is not None else None
+        except OSError:
+            return None
+
+    def reserve(self, path):
+        self.reserved.add(self.key(path))
+
+    def unique(self, path, reusable=None):
+        """`path`, or `path_001`, `_002`... not used by this run and not on disk,
+        except files reusable(path) allows to overwrite (the add-on's own outputs)"""
+        base, ext = os.path.splitext(path)
+        candidate, c = path, 1
+        while self.key(candidate) in self.reserved or (
+                self.exists(candidate) and not (reusable and reusable(candidate))):
+            candidate = f"{base}_{c:03d}{ext}"
+            c += 1
+        self.reserve(candidate)
+        return candidate
+
+    def missing_folders(self, folders):
+        """Folders of `folders` that do not exist yet (listed ones are skipped)"""
+        return sorted(folder for folder in set(folders) if self.listing(folder) is None)
+
+    def created(self, folder):
+        self.folders[self.key(folder)] = {}
+
+# ---------- Manifest (incremental export) ----------
+MANIFEST_VERSION = 1
+
+class ExportManifest:
+    """Manifest in the export root: output file -> source, content hash, format
+    and settings. Unchanged outputs are skipped on the next run. `names` indexes
+    the output folders (on_disk=False: archive output, files on disk don't matter)."""
+
+    def __init__(self, root, incremental=True, on_disk=True):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.incremental = incremental
+        self.entries = {}
+        self.skipped = 0
+        self.names = NameIndex(on_disk)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        self.by_key = None  # (record key, ext) -> previous output, built on first previous_path()
+
+    def relpath(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def claim(self, filepath):
+        """Collision-free output path: overwrites an earlier output listed in the
+        manifest, gets _001, _002... next to foreign files or this run's outputs"""
+        return self.names.unique(filepath, lambda path: self.relpath(path) in self.entries)
+
+    def previous_path(self, key, ext):
+        """Previous output of record `key` if it is still on disk, so a rerun
+        overwrites its own file (even a _001 one). Also used without incremental."""
+        if self.by_key is None:
+            self.by_key = {(tuple(e.get("key", ())), os.path.splitext(rel)[1]): rel
+                           for rel, e in self.entries.items()}
+        rel = self.by_key.get((tuple(key), ext))
+        if not rel:
+            return None
+        path = os.path.join(self.root, *rel.split("/"))
+        return path if self.names.exists(path) else None
+
+    def is_current(self, filepath, record):
+        """Output on disk still matches `record` (nothing counted)"""
+        if not self.incremental:
+            return False
+        entry = self.entries.get(self.relpath(filepath))
+        if not entry or any(entry.get(k) != v for k, v in record.items()):
+            return False
+        return self.names.size(filepath) == entry.get("bytes")
+
+    def skip(self, filepath, record):
+        if not self.is_current(filepath, record):
+            return False
+        self.skipped += 1
+        return True
+
+    def record(self, filepath, record, size=None):
+        entry = dict(record)
+        entry["bytes"] = os.path.getsize(filepath) if size is None else size
+        self.entries[self.relpath(filepath)] = entry
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+# ---------- Content-addressed blobs (dedupe) ----------
+FICLONE = 0x40049409  # linux/fs.h
+
+def _reflink(src, dst):
+    import fcntl  # ImportError on Windows -> next mode
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+
+def _symlink(src, dst):
+    os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+# tried in order; a mode that fails once is not retried in the same run
+LINKERS = (
+    ("hardlink", os.link),
+    ("reflink", _reflink),
+    ("symlink", _symlink),
+    ("copy", shutil.copyfile),
+)
+
+class BlobStore:
+    """Content-addressed store in <export root>/<BLOB_DIR>. Each unique output
+    is encoded and written once, every output using it is linked to the blob."""
+
+    def __init__(self, root, enabled=True):
+        self.dir = os.path.join(root, BLOB_DIR)
+        self.enabled = enabled
+        self.modes = [name for name, _ in LINKERS]  # still usable on this filesystem
+        self.linked = Counter()  # mode -> outputs
+        self.deduped = 0  # extra outputs of a group (the carrier job counts the first)
+        self.saved = 0  # bytes not encoded / written again
+
+    def path(self, key, ext):
+        return os.path.join(self.dir, key + ext)
+
+    def link(self, blob, dst):
+        """Make dst a link (or copy) of blob, replacing dst atomically"""
+        tmp = dst + ".qlink"
+        for name, fn in LINKERS:
+            if name not in self.modes:
+                continue
+            try:
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                fn(blob, tmp)
+                os.replace(tmp, dst)
+                self.linked[name] += 1
+                return name
+            except (OSError, ImportError) as e:
+                if name == "copy":
+                    raise
+                print(f"{LOG_PREFIX} Không dùng được {name} ({e}), thử cách khác")
+                self.modes.remove(name)
+        raise OSError(f"Không link được {blob} -> {dst}")
+
+    def publish(self, job, manifest):
+        """Main thread, after the carrier job: move the finished blob in place
+        and link every output of the group to it (ExportRun created the folders)"""
+        blob = job["blob"]
+        reused = job["action"] == "link"
+        if not reused:
+            os.replace(blob + ".part", blob)
+        size = os.path.getsize(blob)
+        for i, (path, record) in enumerate(job["links"]):
+            with PROFILE.stage("blob.link"):
+                self.link(blob, path)
+            manifest.record(path, dict(record, blob=manifest.relpath(blob)), size)
+            if i:
+                self.deduped += 1
+            if i or reused:
+                self.saved += size
+
+    def prune(self, manifest):
+        """Drop blobs no manifest entry points to any more, and leftover .part files"""
+        if not os.path.isdir(self.dir):
+            return
+        used = {entry.get("blob") for entry in manifest.entries.values()}
+        for entry in os.scandir(self.dir):
+            if manifest.relpath(entry.path) not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"{LOG_PREFIX} Không xoá được blob thừa {entry.path}: {e}")
+
+def dedupe_plan(plan, store, names, reuse=True):
+    """Group jobs with identical output (blob_key). The first job of a group (the
+    carrier) writes one blob, the others become "dedupe" and are linked to it.
+    Content whose blob survives from an earlier run is only linked ("link").
+    reuse=False (archive output): groups only, blobs on disk are ignored."""
+    if not store.enabled:
+        return
+    groups = {}
+    for job in plan:
+        # LOD jobs write several files from one decode: not shared
+        if job["action"] != "skip" and not job.get("lods"):
+            groups.setdefault(blob_key(job), []).append(job)
+    for key, jobs in groups.items():
+        carrier = jobs[0]
+        blob = store.path(key, os.path.splitext(carrier["path"])[1])
+        reused = reuse and names.exists(blob)
+        if len(jobs) < 2 and not reused:
+            continue  # unique content: write it directly
+        carrier["blob"] = blob
+        carrier["links"] = [(job["path"], job["record"]) for job in jobs]
+        if reused:
+            carrier["action"] = "link"
+            carrier["memory"] = 0
+        for job in jobs[1:]:
+            job["action"] = "dedupe"
+
+# ---------- Archive output (zip / tar.zst) ----------
+ARCHIVE_EXT = {'ZIP': ".zip", 'TAR_ZST': ".tar.zst"}
+STORED_EXTS = {".png", ".jpg"}  # already compressed: deflating again only costs time
+ZSTD_MISSING = "Xuất .tar.zst cần package 'zstandard' (pip install zstandard), hoặc chọn .zip"
+
+def archive_path(export_dir, kind):
+    """export dir "//maps/" -> archive "//maps.zip" next to it"""
+    return export_dir.rstrip("/\\") + ARCHIVE_EXT[kind]
+
+def zstd_module():
+    """`zstandard` package, else Python 3.14+ `compression.zstd`, else None"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        pass
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        return None
+
+def zstd_stream_writer(fileobj, level):
+    """zstd compressing writer over fileobj (multi-threaded with `zstandard`)"""
+    zstd = zstd_module()
+    if zstd is None:
+        raise RuntimeError(ZSTD_MISSING)
+    if hasattr(zstd, "ZstdCompressor"):
+        return zstd.ZstdCompressor(level=level, threads=-1).stream_writer(fileobj)
+    return zstd.ZstdFile(fileobj, "w", level=level)
+
+class ArchiveWriter:
+    """Streams outputs into one zip / tar.zst instead of the export dir.
+    Entries keep the folder layout (Material/Material_MapType.ext). Workers add
+    encoded bytes under a lock; nothing is written to disk besides the archive
+    (<archive>.part until close()). Opened on the first entry, so dry runs and
+    empty exports create no file."""
+
+    def __init__(self, root, kind, level):
+        self.root = root
+        self.kind = kind
+        self.level = level
+        self.path = archive_path(root, kind)
+        self.lock = threading.Lock()
+        self.zip = self.tar = self.stream = None
+        self.entries = 0
+
+    def name(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def open(self):
+        try:
+            with PROFILE.stage("makedirs"):
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        except OSError as e:
+            raise OSError(f"Không tạo được thư mục cho archive: {e}") from e
+        tmp = self.path + ".part"
+        if self.kind == 'ZIP':
+            level = min(self.level, 9)
+            self.zip = zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED,
+                                       compresslevel=level or None)
+        else:
+            self.stream = zstd_stream_writer(open(tmp, "wb"), max(self.level, 1))
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add(self, names, data):
+        """One payload under one or more entry names (dedupe group).
+        tar stores the extra names as hardlinks, zip repeats the data."""
+        with self.lock:
+            if self.zip is None and self.tar is None:
+                self.open()
+            now = time.time()
+            for i, name in enumerate(names):
+                if self.zip is not None:
+                    stored = os.path.splitext(name)[1].lower() in STORED_EXTS
+                    self.zip.writestr(name, data, compress_type=zipfile.ZIP_STORED if stored else None)
+                    continue
+                info = tarfile.TarInfo(name)
+                info.mtime = now
+                info.mode = 0o644
+                if i:
+                    info.type = tarfile.LNKTYPE
+                    info.linkname = names[0]
+                    self.tar.addfile(info)
+                else:
+                    info.size = len(data)
+                    self.tar.addfile(info, io.BytesIO(data))
+            self.entries += len(names)
+        return len(data)
+
+    def close(self):
+        """Finish the archive and move it into place (no-op if never opened)"""
+        with self.lock:
+            if self.zip is not None:
+                self.zip.close()
+            elif self.tar is not None:
+                self.tar.close()
+                self.stream.close()
+            else:
+                return
+            os.replace(self.path + ".part", self.path)
+
+class ArchiveEntry:
+    """Write target of one job in archive mode: the output name plus the
+    names of its dedupe group"""
+
+    def __init__(self, archive, names):
+        self.archive = archive
+        self.names = names
+        self.size = 0
+
+    def write(self, data):
+        self.size = self.archive.add(self.names, data)
+        return self.size
+
+# --- quick_export_core section: run ---
+# ---------- Export pool ----------
+class ExportPool:
+    """Main thread snapshots pixels / packed bytes, worker threads encode + write.
+    Results are collected in submit order so `failed` and the reports stay
+    deterministic. `kind` counts successful jobs ("encoded", "copied", "linked")."""
+
+    def __init__(self, workers=0, budget=None, operator=None, failed=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix=LOG_PREFIX.strip("[]").lower())
+        self.budget = budget or MemoryBudget()
+        self.operator = operator  # reports every file written / failed when set
+        self.pending = deque()  # (label, filepath, kind, future, on_done, weight, memory)
+        self.failed = [] if failed is None else failed
+        self.counts = Counter()  # successful jobs per kind
+        self.done_weight = 0  # estimated bytes of collected jobs (progress)
+        self.bytes_written = 0
+
+    def submit(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0, memory=0):
+        """`memory`: bytes the queued buffer holds until the job is collected"""
+        self.budget.acquire(memory)
+        self.pending.append((label, filepath, kind, self.executor.submit(fn, *args), on_done, weight, memory))
+        # bound queued snapshots so memory does not grow with image count
+        while len(self.pending) > self.workers * 2:
+            self.collect_one()
+
+    def run_inline(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0):
+        """Main-thread-only job (image.save()), queued to keep report order"""
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        self.pending.append((label, filepath, kind, fut, on_done, weight, 0))
+
+    def has_capacity(self):
+        return len(self.pending) < self.workers * 2
+
+    def collect_ready(self):
+        """Collect finished jobs at the head of the queue without blocking"""
+        while self.pending and self.pending[0][3].done():
+            self.collect_one()
+
+    def collect_one(self):
+        label, filepath, kind, fut, on_done, weight, memory = self.pending.popleft()
+        self.done_weight += weight
+        self.budget.release(memory)
+        try:
+            written = fut.result()
+            if on_done:
+                on_done()
+            self.counts[kind] += 1
+            # archive entries have no file of their own: use the size the job reported
+            self.bytes_written += written if isinstance(written, int) else os.path.getsize(filepath)
+            if self.operator:
+                self.operator.report({'INFO'}, f"✅ Xuất {label}: {filepath}")
+        except Exception as e:
+            self.fail(label, filepath, e)
+
+    def fail(self, label, filepath, error):
+        self.failed.append((filepath, str(error)))
+        print(f"{LOG_PREFIX} Lỗi khi lưu {label} -> {filepath}: {error}")
+        print("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+        if self.operator:
+            self.operator.report({'ERROR'}, f"❌ Lỗi khi lưu {label}: {filepath} ({error})")
+
+    def close(self):
+        while self.pending:
+            self.collect_one()
+        self.executor.shutdown(wait=True)
+
+# ---------- Profile report ----------
+def finish_profile(base, **info):
+    """Write the report of the run that just ended (when enabled); the panel shows it"""
+    if not PROFILE.enabled:
+        return None
+    report = PROFILE.report(**info)
+    try:
+        PROFILE.write(base, report)
+        print(f"{LOG_PREFIX} Profiling {report['wall_seconds']:.2f} s → {base}.json / .csv")
+    except OSError as e:
+        print(f"{LOG_PREFIX} Không ghi được report profiling {base}: {e}")
+    EXPORT_STATE["profile"] = report
+    return report
+
+def dry_run_profile():
+    """A dry run writes nothing: its report (plan stages only) is only shown in the panel"""
+    if not PROFILE.enabled:
+        return None
+    EXPORT_STATE["profile"] = PROFILE.report(dry_run=True)
+    return EXPORT_STATE["profile"]
+
+# ---------- Execution (blocking, or stepped from a modal timer) ----------
+MODAL_TIMER_SECONDS = 0.05
+MODAL_BATCH = 4  # jobs queued per timer tick
+MODAL_TICK_SECONDS = 0.04  # main-thread budget per tick (snapshots, image.save())
+
+# run: the modal export in progress (the panel draws its progress)
+# profile: profile report of the last export (the panel draws a summary)
+EXPORT_STATE = {"run": None, "profile": None}
+
+def safe_makedirs(path):
+    """Try create directory, returns (success, used_path, message)"""
+    try:
+        with PROFILE.stage("makedirs"):
+            os.makedirs(path, exist_ok=True)
+        return True, path, ""
+    except Exception as e:
+        # detect probable network path issue on Windows
+        msg = str(e).lower()
+        winerr = getattr(e, "winerror", None)
+        network_issue = (winerr == 53) or ("network path" in msg) or path.startswith('\\\\')
+        return False, path, str(e) + (" (network?)" if network_issue else "")
+
+def job_files(job):
+    """Files a job writes: its output + one per LOD level"""
+    return 1 + len(job.get("lods", ()))
+
+def job_bytes(job):
+    return job["bytes"] + sum(lod["bytes"] for lod in job.get("lods", ()))
+
+def execution_order(plan):
+    """Jobs to run, largest first so big encodes start early and the tail is
+    made of small ones (stable: ties keep plan order)"""
+    return sorted((job for job in plan if job["action"] not in ("skip", "dedupe")), key=lambda job: -job["bytes"])
+
+class ExportRun:
+    """Runs a plan job by job, largest first. The blocking export drives it to
+    the end in one go; the modal operator calls step() from a timer instead.
+    Each add-on subclasses it: queue(job) hands one job to its run_job()."""
+
+    # result() keys copied into the profile report
+    profile_keys = ("exported", "deduped", "skipped", "cancelled", "bytes_written", "peak_memory")
+
+    def __init__(self, plan, manifest, workers=0, memory_mb=0, store=None, archive=None, operator=None,
+                 failed=None):
+        self.plan = plan
+        self.jobs = deque(execution_order(plan))
+        self.total = sum(job_files(job) for job in self.jobs)
+        self.total_bytes = sum(job_bytes(job) for job in self.jobs)
+        self.manifest = manifest
+        self.export_dir = manifest.root
+        self.store = store or BlobStore(self.export_dir, enabled=False)
+        self.archive = archive  # ArchiveWriter, or None to write into export_dir
+        self.budget = MemoryBudget(memory_mb)
+        self.pool = ExportPool(workers, self.budget, operator, failed)
+        self.failed = self.pool.failed
+        self.folders = None  # output folder -> makedirs error, filled before the first write
+        self.dropped = 0  # jobs that never reached the pool
+        self.cancelled = False
+        self.started = time.perf_counter()
+        self.profile = None  # profile report, after finish()
+        self.info = {}  # added to the profile report and the result (atlas: its summary)
+
+    def queue(self, job):
+        """Hand one planned job to the pool"""
+        raise NotImplementedError
+
+    def next_job(self, wait=True):
+        """Largest queued job that fits the memory budget. Waits for queued
+        writes to release memory (wait=True) or returns None (modal tick).
+        A job bigger than the whole budget runs once nothing else is in flight."""
+        while True:
+            for i, job in enumerate(self.jobs):
+                if self.budget.fits(job["memory"]):
+                    del self.jobs[i]
+                    return job
+            if not self.pool.pending:
+                return self.jobs.popleft()
+            if not wait:
+                return None
+            self.pool.collect_one()
+
+    def run_next(self, wait=True):
+        """Queue the next job (blocks only when the pool is full or over budget).
+        Returns False when a modal tick has to wait for memory instead."""
+        job = self.next_job(wait)
+        if job is None:
+            return False
+        if self.folders is None:
+            self.create_folders()
+        if os.path.dirname(job.get("blob") or job["path"]) in self.folders:
+            self.dropped += 1  # reported once by create_folders
+            return True
+        try:
+            self.queue(job)
+        except Exception as e:
+            self.dropped += 1
+            self.pool.fail(job["label"], job["path"], e)
+        return True
+
+    def create_folders(self):
+        """makedirs every output folder of the plan in one pass before the first
+        write (folders the name index could list already exist)"""
+        self.folders = {}
+        if self.archive is not None:
+            return
+        wanted = set()
+        for job in self.plan:
+            if job["action"] == "skip":
+                continue
+            wanted.add(os.path.dirname(job.get("blob") or job["path"]))
+            wanted.update(os.path.dirname(path) for path, _ in job.get("links", ()))
+        names = self.manifest.names
+        for folder in names.missing_folders(wanted):
+            ok, _, msg = safe_makedirs(folder)
+            if ok:
+                names.created(folder)
+                continue
+            self.folders[folder] = msg
+            self.failed.append((folder, f"Không tạo được thư mục: {msg}"))
+            print(f"{LOG_PREFIX} Không tạo được thư mục {folder}: {msg}")
+
+    def step(self, max_jobs=MODAL_BATCH, budget=MODAL_TICK_SECONDS):
+        """Queue a bounded batch without waiting on workers.
+        Returns True once every job is written."""
+        deadline = time.perf_counter() + budget
+        self.pool.collect_ready()
+        queued = 0
+        while self.jobs and queued < max_jobs and self.pool.has_capacity() and time.perf_counter() < deadline:
+            if not self.run_next(wait=False):
+                break
+            queued += 1
+        self.pool.collect_ready()
+        return not self.jobs and not self.pool.pending
+
+    def cancel(self):
+        """Drop jobs not started yet. Writes already queued still finish and
+        are recorded, so the export dir + manifest stay consistent."""
+        self.cancelled = True
+        self.jobs.clear()
+
+    def progress(self):
+        done = self.total - sum(job_files(job) for job in self.jobs) - len(self.pool.pending)
+        if self.total_bytes:
+            fraction = self.pool.done_weight / self.total_bytes
+        else:
+            fraction = done / self.total if self.total else 1.0
+        elapsed = time.perf_counter() - self.started
+        eta = elapsed * (1.0 - fraction) / fraction if fraction > 0 else None
+        return {
+            "done": done,
+            "total": self.total,
+            "fraction": min(fraction, 1.0),
+            "bytes_written": self.pool.bytes_written,
+            "eta": eta,
+        }
+
+    def finish(self):
+        """Wait for queued writes, then close the archive or save the manifest,
+        and write the profile report"""
+        try:
+            self.pool.close()
+        finally:
+            if self.archive is not None:
+                try:
+                    self.close_archive()
+                finally:
+                    self.write_profile()
+            else:
+                self.close_folder()
+
+    def close_archive(self):
+        try:
+            self.archive_extras()
+            with PROFILE.stage("archive.close"):
+                self.archive.close()
+        except (OSError, RuntimeError, zipfile.BadZipFile, tarfile.TarError) as e:
+            self.failed.append((self.archive.path, str(e)))
+            print(f"{LOG_PREFIX} Không đóng được archive {self.archive.path}: {e}")
+
+    def archive_extras(self):
+        """Entries added after the last job, right before the archive is closed"""
+
+    def close_folder(self):
+        """Drop unused blobs, save the manifest, then write the profile report"""
+        try:
+            try:
+                os.makedirs(self.export_dir, exist_ok=True)
+                self.store.prune(self.manifest)
+                with PROFILE.stage("manifest.save"):
+                    self.manifest.save()
+            except OSError as e:
+                print(f"{LOG_PREFIX} Không ghi được manifest {self.manifest.path}: {e}")
+        finally:
+            self.write_profile()
+
+    def profile_base(self):
+        if self.archive is not None:
+            return f"{self.archive.path}.profile"
+        return os.path.join(self.export_dir, PROFILE_NAME)
+
+    def write_profile(self):
+        result = self.result()
+        self.profile = finish_profile(
+            self.profile_base(), export_dir=self.export_dir, workers=self.pool.workers, jobs=self.total,
+            **{key: result[key] for key in self.profile_keys}, failed=len(self.failed), **self.info)
+
+    def result(self):
+        deduped = self.store.deduped + self.pool.counts["linked"]  # outputs served from blobs
+        return {
+            "exported": sum(self.pool.counts.values()) + self.store.deduped,
+            "deduped": deduped,
+            "dedupe_saved_bytes": self.store.saved,
+            "link_modes": dict(self.store.linked),
+            "skipped": self.manifest.skipped,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "bytes_written": self.pool.bytes_written,
+            "estimated_bytes": self.total_bytes,
+            "peak_memory": self.budget.peak,
+            "export_dir": self.export_dir,
+            "archive": self.archive.path if self.archive is not None and self.archive.entries else None,
+            "profile": self.profile,
+            **self.info,
+        }
+
+# ---------- Panel helpers ----------
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def tag_redraw_panels(context):
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+PROFILE_PANEL_STAGES = 6
+PROFILE_PANEL_COUNTERS = ("images", "bytes_read", "bytes_written", "scandir")
+
+def draw_profile(box, report):
+    box.label(text=f"Lần xuất gần nhất: {report['wall_seconds']:.2f} s", icon='TIME')
+    col = box.column(align=True)
+    for name, stage in list(report["stages"].items())[:PROFILE_PANEL_STAGES]:
+        row = col.row()
+        row.label(text=name)
+        row.label(text=f"{stage['seconds']:.3f} s × {stage['calls']}")
+    counters = report["counters"]
+    col = box.column(align=True)
+    for name in PROFILE_PANEL_COUNTERS:
+        if name in counters:
+            value = counters[name]
+            row = col.row()
+            row.label(text=name)
+            row.label(text=f"{value / 1048576:.1f} MB" if name.startswith("bytes") else str(value))
+
+# --- quick_export_core section: presets ---
+# ---------- Export presets (formats, source keywords, channel specs) ----------
+EXT_MAP = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "TARGA": "tga",
+    "BMP": "bmp",
+    "TIFF": "tif",
+}
+
+# source name -> keywords that find its image in a material (image / node name, label)
+SOURCE_KEYWORDS = {
+    "BaseColor": ("base", "albedo", "diffuse"),
+    "Normal": ("normal",),
+    "Roughness": ("rough",),
+    "Metallic": ("metal",),
+    "AO": ("ao", "occlusion", "ambient"),
+    "Emissive": ("emis", "emit"),
+    "Height": ("height", "disp", "displacement"),
+    "Opacity": ("alpha", "opacity", "trans"),
+    "Specular": ("spec",),
+    "DetailMask": ("detail",),
+}
+
+CHANNEL_INDEX = {"r": 0, "g": 1, "b": 2, "a": 3}
+
+def parse_channel(spec):
+    """Kênh trong preset -> (nguồn, kênh nguồn, đảo 1-x, hằng số):
+    0.5 -> (None, 0, False, 0.5), "1-Normal.g" -> ("Normal", 1, True, None)"""
+    if isinstance(spec, (int, float)):
+        if not 0.0 <= spec <= 1.0:
+            raise ValueError(f"hằng số kênh phải trong 0..1: {spec!r}")
+        return None, 0, False, float(spec)
+    text = spec.strip()
+    invert = text.startswith("1-")
+    source, _, channel = text[2:].strip().partition(".") if invert else text.partition(".")
+    if not source or (channel and channel.lower() not in CHANNEL_INDEX):
+        raise ValueError(f"kênh không hợp lệ: {spec!r}")
+    return source, CHANNEL_INDEX.get(channel.lower(), 0), invert, None
+
+def validate_preset(key, preset):
+    """Check one preset read from a file (ValueError naming the preset and the
+    output index), returns the preset itself. Output sources must be known:
+    SOURCE_KEYWORDS or the preset's own "sources"."""
+    if preset.get("image_format", "PNG") not in EXT_MAP:
+        raise ValueError(f"preset {key}: image_format không hỗ trợ: {preset['image_format']!r}")
+    known = set(SOURCE_KEYWORDS) | set(preset.get("sources", {}))
+    suffixes = set()
+    for i, output in enumerate(preset.get("outputs", ())):
+        suffix = output.get("suffix")
+        where = f"preset {key} output {i} ({suffix})"
+        if not suffix or suffix in suffixes:
+            raise ValueError(f"{where}: thiếu 'suffix' hoặc trùng")
+        suffixes.add(suffix)
+        if "source" in output:
+            sources = [output["source"]]
+        else:
+            channels = output.get("channels") or ()
+            if len(channels) not in (3, 4):
+                raise ValueError(f"{where}: cần 'source' hoặc 3-4 kênh (R, G, B[, A])")
+            try:
+                specs = [parse_channel(spec) for spec in channels]
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}") from None
+            sources = [source for source, _, _, constant in specs if constant is None]
+        for source in sources:
+            if not isinstance(source, str) or source not in known:
+                raise ValueError(f"{where}: không có nguồn {source!r} (có: {', '.join(sorted(known))}; "
+                                 "thêm nguồn mới trong \"sources\")")
+    for name, value in preset.get("fallback", {}).items():
+        if not 0.0 <= float(value) <= 1.0:
+            raise ValueError(f"preset {key}: fallback {name} phải trong 0..1")
+    return preset
+
+# --- quick_export_core section: atlas ---
+# ---------- Atlas packing ----------
+def pack_skyline(sizes, width, height):
+    """Place (width, height) tiles in a width x height frame, skyline bottom-left:
+    tallest first, each where its top ends lowest (then leftmost).
+    [(x, y)] in the order of `sizes`, None if they do not fit."""
+    skyline = [[0, 0, width]]  # adjacent [x, y, width] segments covering the whole width
+    positions = [None] * len(sizes)
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        w, h = sizes[i]
+        best = None
+        for start, (x, _, _) in enumerate(skyline):
+            if x + w > width:
+                break
+            y = 0
+            j = start
+            while j < len(skyline) and skyline[j][0] < x + w:
+                y = max(y, skyline[j][1])
+                j += 1
+            if y + h <= height and (best is None or (y + h, x) < best[:2]):
+                best = (y + h, x, start, y)
+        if best is None:
+            return None
+        top, x, start, y = best
+        positions[i] = (x, y)
+        # the tile becomes one segment; trim the segments it covers
+        skyline.insert(start, [x, top, w])
+        j = start + 1
+        while j < len(skyline) and skyline[j][0] < x + w:
+            cut = x + w - skyline[j][0]
+            if skyline[j][2] <= cut:
+                del skyline[j]
+                continue
+            skyline[j][0] += cut
+            skyline[j][2] -= cut
+            break
+        # merge neighbours of the same height
+        j = 1
+        while j < len(skyline):
+            if skyline[j][1] == skyline[j - 1][1]:
+                skyline[j - 1][2] += skyline[j][2]
+                del skyline[j]
+            else:
+                j += 1
+    return positions
+
+def _pow2(n):
+    return 1 << max(0, int(np.ceil(np.log2(max(n, 1)))))
+
+def atlas_layout(sizes, max_size, padding):
+    """Atlas size (powers of 2, the smallest that fits) + scale + tile positions.
+    If max_size x max_size is too small every tile is scaled down alike and packed again.
+    (width, height, scale, [(x, y, width, height)] without padding)."""
+    scale = 1.0
+    while True:
+        tiles = [(max(1, int(w * scale)), max(1, int(h * scale))) for w, h in sizes]
+        padded = [(w + 2 * padding, h + 2 * padding) for w, h in tiles]
+        area = sum(w * h for w, h in padded)
+        side = _pow2(max(np.sqrt(area), *(max(w, h) for w, h in padded)))
+        candidates = []
+        while side <= max_size:
+            candidates += [(side, side // 2), (side, side)]
+            side *= 2
+        for width, height in candidates:
+            if width * height < area or height < max(h for _, h in padded) or width < max(w for w, _ in padded):
+                continue
+            positions = pack_skyline(padded, width, height)
+            if positions is not None:
+                rects = [(x + padding, y + padding, w, h) for (x, y), (w, h) in zip(positions, tiles)]
+                return width, height, scale, rects
+        if all(w == 1 and h == 1 for w, h in tiles):
+            raise ValueError(f"{len(sizes)} ô không vừa atlas {max_size}px (giảm viền hoặc tăng kích thước atlas)")
+        # shrink by the area ratio (at least 10%) and try again
+        scale *= min(0.9, float(np.sqrt(max_size * max_size / area)))
+# <<< quick_export_core <<<
+
+
+# ---------- Vendoring ----------
+def _read(path):
+    """(text with \\n newlines, the file's own newline)"""
+    with open(path, encoding="utf-8", newline="") as f:
+        text = f.read()
+    return text.replace("\r\n", "\n"), "\r\n" if "\r\n" in text else "\n"
+
+def _span(text, path):
+    """(start, end) of the shared block, markers included"""
+    start = text.find("\n" + SHARED_BEGIN + "\n")
+    end = text.find("\n" + SHARED_END + "\n", start + 1)
+    if start < 0 or end < 0:
+        raise ValueError(f"{path}: thiếu dòng đánh dấu {SHARED_BEGIN!r} / {SHARED_END!r}")
+    return start + 1, end + 1 + len(SHARED_END)
+
+def shared_sections():
+    """{section name: its code, marker line included}, in block order"""
+    text, _ = _read(os.path.abspath(__file__))
+    start, end = _span(text, __file__)
+    body = text[start + len(SHARED_BEGIN) + 1:end - len(SHARED_END)]
+    marks = list(SECTION_RE.finditer(body))
+    ends = [mark.start() for mark in marks[1:]] + [len(body)]
+    return {mark.group(1): body[mark.start():stop] for mark, stop in zip(marks, ends)}
+
+def shared_block(sections=None):
+    """The block as copied into an add-on using `sections` (None: all of them)"""
+    parts = shared_sections()
+    order = list(parts)
+    names = order if sections is None else sorted(sections, key=order.index)
+    return SHARED_BEGIN + "\n" + "".join(parts[name] for name in names) + SHARED_END
+
+def vendor(path, check=False, sections=None):
+    """Copy the shared block into the add-on at `path`: only the sections
+    ADDONS lists for it (every section for other files). True if its copy was
+    already identical; check=True only compares."""
+    text, newline = _read(path)
+    start, end = _span(text, path)
+    block = shared_block(sections or ADDONS.get(os.path.basename(path)))
+    if text[start:end] == block:
+        return True
+    if not check:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write((text[:start] + block + text[end:]).replace("\n", newline))
+    return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chép phần code dùng chung vào các add-on.")
+    parser.add_argument("--check", action="store_true", help="Chỉ kiểm tra, exit 1 nếu có add-on bị lệch")
+    args = parser.parse_args(argv)
+    here = os.path.dirname(os.path.abspath(__file__))
+    stale = [name for name in ADDONS if not vendor(os.path.join(here, name), args.check)]
+    for name in stale:
+        print(f"{'Lệch' if args.check else 'Đã cập nhật'}: {name}")
+    return 1 if args.check and stale else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
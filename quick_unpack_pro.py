@@ -1,6 +1,6 @@
 bl_info = {
     "name": "Quick Unpack Pro (Full)",
-    "author": "Lumorx Studio"
+    "author": "Lumorx Studio",
     "version": (1, 0),
     "blender": (4, 0, 0),
     "location": "3D View > N-Panel > Quick Tool",
@@ -9,9 +9,1177 @@ bl_info = {
 }
 
 import bpy
+import contextlib
+import csv
+import hashlib
+import io
+import json
 import os
 import re
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
 import traceback
+import zipfile
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# ---------- Shared export code ----------
+# Profiler, memory budget, LOD filters, encoders, image headers, atomic writes,
+# name index, manifest, blob store, archive writer, export pool / run and the
+# panel helpers are generated from quick_export_core.py (only the sections this
+# add-on uses). They use these names:
+LOG_PREFIX = "[QUP]"
+TMP_SUFFIX = ".qup-tmp"
+MANIFEST_NAME = ".qup_manifest.json"
+BLOB_DIR = ".qup_blobs"
+# qup_profile (or --profile in the batch CLI) writes qup_profile.json + .csv
+# into the export dir (next to the archive for archive output): seconds and
+# calls per stage (plan.*, read_pixels, encode.<fmt>, save.<fmt>, lod.filter,
+# write, makedirs, upload.copy, blob.link, manifest.save) plus counters.
+# Nested stages are also part of their parent; worker stages add up across
+# threads, so their sum can exceed wall_seconds.
+PROFILE_NAME = "qup_profile"
+
+def blob_key(job):
+    """Same packed content + same target format -> same output bytes"""
+    record = job["record"]
+    return hashlib.blake2b(f"{record['hash']}|{record['format']}".encode(), digest_size=16).hexdigest()
+
+# >>> quick_export_core: shared code, edit quick_export_core.py and run it to update >>>
+# --- quick_export_core section: base ---
+PIXEL_DTYPE = np.float32
+STRIP_ROWS = 256  # rows per strip for strip-wise passes: temporaries stay one strip big
+
+# ---------- Profiling ----------
+class _ProfileStage:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.started)
+
+NULL_STAGE = contextlib.nullcontext()
+
+class Profiler:
+    """Per-stage timings + counters of one export run, safe from worker threads.
+    Disabled: stage() is an empty context and count() does nothing."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start(False)
+
+    def start(self, enabled):
+        self.enabled = enabled
+        self.stages = {}  # name -> [calls, seconds]
+        self.counters = Counter()
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _ProfileStage(self, name) if self.enabled else NULL_STAGE
+
+    def add(self, name, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def report(self, **info):
+        """JSON-friendly: wall_seconds, `info`, stages (slowest first), counters"""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            return {
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                **info,
+                "stages": {name: {"calls": calls, "seconds": round(seconds, 6)} for name, (calls, seconds) in stages},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write(self, base, report):
+        """<base>.json + <base>.csv (kind, name, calls, value)"""
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        with open(base + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("kind", "name", "calls", "value"))
+            for name, stage in report["stages"].items():
+                writer.writerow(("stage", name, stage["calls"], stage["seconds"]))
+            for name, value in report["counters"].items():
+                writer.writerow(("counter", name, "", value))
+
+PROFILE = Profiler()  # the current run (one export at a time)
+
+# ---------- Memory budget ----------
+class MemoryBudget:
+    """Pixel memory held by the export itself: decoded buffers it loaded plus
+    snapshots / packed bytes waiting in the pool. limit_mb 0 = unlimited."""
+
+    def __init__(self, limit_mb=0):
+        self.limit = limit_mb * 1048576
+        self.in_use = 0
+        self.peak = 0
+
+    def fits(self, nbytes):
+        return not self.limit or self.in_use + nbytes <= self.limit
+
+    def acquire(self, nbytes):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def release(self, nbytes):
+        self.in_use -= nbytes
+
+def store_uint8(strip, out):
+    """Float 0..1 strip -> uint8 `out` (rounded, clamped); modifies `strip` in place"""
+    strip *= 255.0
+    strip += 0.5
+    np.clip(strip, 0.0, 255.0, out=strip)
+    out[...] = strip
+
+# --- quick_export_core section: lod ---
+# ---------- LOD filters ----------
+# Each level is filtered from the previous one in linear space: sRGB data is
+# linearized first and re-encoded after; normal maps are filtered as [-1, 1]
+# vectors and renormalized.
+LOD_KAISER_RADIUS = 4  # source pixels on each side
+LOD_KAISER_BETA = 4.0
+
+def lod_sizes(width, height, levels, min_size=1):
+    """Sizes below the source: halved (rounded up) per level, stopping after
+    `levels` or once the long side drops below min_size"""
+    sizes = []
+    while len(sizes) < levels and max(width, height) > 1:
+        width, height = max(1, (width + 1) // 2), max(1, (height + 1) // 2)
+        if max(width, height) < min_size:
+            break
+        sizes.append((width, height))
+    return sizes
+
+def srgb_to_linear(x):
+    return np.where(x <= 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4).astype(PIXEL_DTYPE)
+
+def linear_to_srgb(x):
+    x = np.maximum(x, 0.0)
+    return np.where(x <= 0.0031308, x * 12.92, 1.055 * x ** (1 / 2.4) - 0.055).astype(PIXEL_DTYPE)
+
+SRGB_TO_LINEAR_U8 = srgb_to_linear(np.arange(256, dtype=PIXEL_DTYPE) / 255.0)
+NORMAL_FROM_U8 = np.arange(256, dtype=PIXEL_DTYPE) * (2.0 / 255.0) - 1.0
+LINEAR_TO_SRGB_BITS = 14  # linear -> sRGB uint8 through a 2^14 entry table: < 0.25 LSB off in the darks
+LINEAR_TO_SRGB_U8 = (linear_to_srgb(np.arange(2 ** LINEAR_TO_SRGB_BITS, dtype=PIXEL_DTYPE)
+                                    / (2 ** LINEAR_TO_SRGB_BITS - 1)) * 255.0 + 0.5).astype(np.uint8)
+
+def _lod_taps(filter_name):
+    """Offset pairs (source rows/columns) and weights for one output pixel. Its
+    centre sits between source offsets 0 and 1, so the filter is symmetric
+    around 0.5: add each pair first, multiply once."""
+    if filter_name == 'BOX':
+        return ((0, 1),), (0.5,)
+    r = LOD_KAISER_RADIUS
+    offsets = np.arange(1 - r, 1)
+    x = offsets - 0.5
+    window = np.i0(LOD_KAISER_BETA * np.sqrt(np.clip(1.0 - (x / r) ** 2, 0.0, None))) / np.i0(LOD_KAISER_BETA)
+    weights = np.sinc(x / 2.0) * window
+    return tuple((int(d), int(1 - d)) for d in offsets), tuple(weights / (2 * weights.sum()))
+
+def halve(arr, axis, filter_name):
+    """Halve `arr` along `axis`. Each tap pair is two strided views added, scaled
+    and accumulated; the few edge rows whose taps fall outside repeat the border."""
+    n = arr.shape[axis]
+    if n == 1:
+        return arr
+    m = (n + 1) // 2
+    shape = list(arr.shape)
+    shape[axis] = m
+    out = np.zeros(shape, dtype=PIXEL_DTYPE)
+    src, dst = np.moveaxis(arr, axis, 0), np.moveaxis(out, axis, 0)
+    tmp = np.empty_like(dst)
+    for (first, second), weight in zip(*_lod_taps(filter_name)):
+        lo = min(m, max(0, (1 - first) // 2))  # first output row with 2i + first >= 0
+        hi = min(m, (n - 1 - second) // 2 + 1)  # and 2i + second <= n - 1
+        if hi > lo:
+            np.add(src[2 * lo + first:2 * hi + first - 1:2], src[2 * lo + second:2 * hi + second - 1:2],
+                   out=tmp[lo:hi])
+            tmp[lo:hi] *= weight
+            dst[lo:hi] += tmp[lo:hi]
+        for i in (*range(lo), *range(max(hi, lo), m)):
+            dst[i] += weight * (src[min(max(2 * i + first, 0), n - 1)] + src[min(2 * i + second, n - 1)])
+    return out
+
+def lod_decode(base, mode):
+    """Source level (uint8, or float 0..1, shaped (h, w, c)) -> float32 to filter"""
+    rgb = min(base.shape[2], 3)
+    lut = {'SRGB': SRGB_TO_LINEAR_U8, 'NORMAL': NORMAL_FROM_U8 if rgb == 3 else None}.get(mode)
+    if base.dtype == np.uint8 and lut is not None:
+        work = lut[base]  # one table gather for every channel, alpha redone below
+        if base.shape[2] > rgb:
+            np.multiply(base[..., rgb:], 1.0 / 255.0, out=work[..., rgb:])
+        return work
+    if base.dtype == np.uint8:
+        work = base.astype(PIXEL_DTYPE)
+        work *= 1.0 / 255.0
+    else:
+        work = base.astype(PIXEL_DTYPE)
+        if mode == 'SRGB':
+            work[..., :rgb] = srgb_to_linear(work[..., :rgb])
+    if mode == 'NORMAL' and rgb == 3:
+        work[..., :3] *= 2.0
+        work[..., :3] -= 1.0
+    return work
+
+def lod_encode(work, mode, as_uint8):
+    """Inverse of lod_decode. Normals are renormalized in `work` too, so the
+    next level is filtered from unit vectors."""
+    rgb = min(work.shape[2], 3)
+    if mode == 'SRGB' and as_uint8:
+        out = np.empty(work.shape, dtype=np.uint8)
+        if work.shape[2] > rgb:
+            store_uint8(work[..., rgb:].copy(), out[..., rgb:])
+        scaled = work[..., :rgb] * (2 ** LINEAR_TO_SRGB_BITS - 1)
+        scaled += 0.5
+        np.clip(scaled, 0.0, 2 ** LINEAR_TO_SRGB_BITS - 1, out=scaled)
+        out[..., :rgb] = LINEAR_TO_SRGB_U8[scaled.astype(np.uint16)]
+        return out
+    out = work.copy()
+    if mode == 'NORMAL' and rgb == 3:
+        length = np.sqrt(np.einsum('...i,...i->...', work[..., :3], work[..., :3]))[..., None]
+        work[..., :3] /= np.maximum(length, 1e-8)
+        out[..., :3] = work[..., :3] * 0.5 + 0.5
+    elif mode == 'SRGB':
+        out[..., :rgb] = linear_to_srgb(work[..., :rgb])
+    if not as_uint8:
+        return np.clip(out, 0.0, None if mode == 'LINEAR' else 1.0, out=out)
+    np.clip(out, 0.0, 1.0, out=out)
+    out *= 255.0
+    out += 0.5
+    return out.astype(np.uint8)
+
+def lod_chain(base, levels, mode, filter_name, as_uint8=True):
+    """`levels` levels below `base` (h, w, c), each filtered from the previous one"""
+    with PROFILE.stage("lod.filter"):
+        work = lod_decode(base, mode)
+        chain = []
+        for _ in range(levels):
+            work = halve(halve(work, 0, filter_name), 1, filter_name)
+            chain.append(lod_encode(work, mode, as_uint8))
+    return chain
+
+def build_lod_chain(make_base, args, levels, mode, filter_name):
+    """Worker: uint8 source level = make_base(*args), then the whole chain"""
+    return lod_chain(make_base(*args), levels, mode, filter_name)
+
+# --- quick_export_core section: encode ---
+# ---------- Encoders (uint8 (h, w, c), rows bottom-up like Blender) ----------
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+def encode_png(img, level=6):
+    h, w, c = img.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[c]
+    rows = img[::-1].reshape(h, w * c)
+    # "Up" filter on every row: vectorized, and compresses textures better than
+    # "None". Filtered + compressed in STRIP_ROWS strips, so the temporary is
+    # one strip, not a second copy of the image.
+    comp = zlib.compressobj(level)
+    idat = []
+    filtered = np.empty((min(STRIP_ROWS, h), w * c + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    for y in range(0, h, STRIP_ROWS):
+        f = filtered[:min(STRIP_ROWS, h - y)]
+        if y == 0:
+            f[0, 1:] = rows[0]
+            np.subtract(rows[1:len(f)], rows[:len(f) - 1], out=f[1:, 1:])
+        else:
+            np.subtract(rows[y:y + len(f)], rows[y - 1:y + len(f) - 1], out=f[:, 1:])
+        idat.append(comp.compress(f))
+    idat.append(comp.flush())
+    ihdr = struct.pack(">IIBBBBB", w, h, 8, color_type, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", ihdr),
+        _png_chunk(b"IDAT", b"".join(idat)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+def encode_tga(img):
+    h, w, c = img.shape
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    if c == 1:
+        image_type, data = 3, img
+    else:
+        image_type, data = 2, img[..., [2, 1, 0, 3][:c]]
+    descriptor = 8 if c == 4 else 0  # alpha bits, bottom-left origin
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0, w, h, c * 8, descriptor)
+    return header + data.tobytes()
+
+def encode_tiff(img, level=6):
+    h, w, c = img.shape
+    strip = zlib.compress(img[::-1].tobytes(), level)
+    tags = [
+        (256, 4, 1, w),
+        (257, 4, 1, h),
+        (258, 3, c, None),                 # BitsPerSample
+        (259, 3, 1, 8),                    # Deflate
+        (262, 3, 1, 2 if c >= 3 else 1),   # RGB / BlackIsZero
+        (273, 4, 1, None),                 # StripOffsets
+        (277, 3, 1, c),
+        (278, 4, 1, h),
+        (279, 4, 1, len(strip)),
+        (284, 3, 1, 1),
+    ]
+    if c in (2, 4):
+        tags.append((338, 3, 1, 2))        # ExtraSamples: unassociated alpha
+    ifd_size = 2 + 12 * len(tags) + 4
+    bits_offset = 8 + ifd_size
+    bits = struct.pack(f"<{c}H", *([8] * c)) if c > 2 else b""
+    strip_offset = bits_offset + len(bits)
+
+    entries = []
+    for tag, typ, count, value in tags:
+        if tag == 258:
+            if c > 2:
+                entries.append(struct.pack("<HHII", tag, typ, count, bits_offset))
+            else:
+                entries.append(struct.pack("<HHI", tag, typ, count) + struct.pack("<2H", 8, 8 if c == 2 else 0))
+            continue
+        if tag == 273:
+            value = strip_offset
+        if typ == 3:
+            entries.append(struct.pack("<HHIH2x", tag, typ, count, value))
+        else:
+            entries.append(struct.pack("<HHII", tag, typ, count, value))
+    ifd = struct.pack("<H", len(tags)) + b"".join(entries) + struct.pack("<I", 0)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + bits + strip
+
+BMP_GRAY_PALETTE = bytes(v for i in range(256) for v in (i, i, i, 0))  # BGR0 entries
+
+def encode_bmp(img):
+    """BI_RGB, bottom-up: 1 channel as 8-bit with a gray palette, RGB(A) as
+    24 / 32-bit BGR(A). Gray + alpha has no BMP form and is widened to BGRA."""
+    h, w, c = img.shape
+    palette = BMP_GRAY_PALETTE if c == 1 else b""
+    if c == 2:
+        img, c = img[..., [0, 0, 0, 1]], 4
+    data = img[..., [0] if c == 1 else [2, 1, 0, 3][:c]].reshape(h, w * c)
+    pad = (-w * c) % 4
+    if pad:
+        data = np.pad(data, ((0, 0), (0, pad)))
+    data = data.tobytes()
+    offset = 14 + 40 + len(palette)
+    header = b"BM" + struct.pack("<IHHI", offset + len(data), 0, 0, offset)
+    info = struct.pack("<IiiHHIIiiII", 40, w, h, 1, c * 8, 0, len(data), 2835, 2835, len(palette) // 4, 0)
+    return header + info + palette + data
+
+ENCODERS = {
+    'PNG': encode_png,
+    'TARGA': encode_tga,
+    'TIFF': encode_tiff,
+    'BMP': encode_bmp,
+}
+
+def encode_image(fmt, img, level=None):
+    """level: zlib level for PNG / TIFF, None = encoder default"""
+    with PROFILE.stage(f"encode.{fmt}"):
+        if level is not None:
+            return ENCODERS[fmt](img, level)
+        return ENCODERS[fmt](img)
+
+# ---------- Image headers ----------
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def header_size(data, fmt=None):
+    """(width, height, channels) from a PNG / JPEG / BMP header (found by their
+    magic) or a TGA header (fmt 'TARGA': TGA has no magic), None if unknown.
+    Avoids image.size, which decodes the whole image."""
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            width, height = struct.unpack(">II", data[16:24])
+            return width, height, {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(data[25], 4)
+        if data[:3] == b'\xff\xd8\xff':
+            i = 2
+            while i + 10 <= len(data) and data[i] == 0xFF:
+                marker = data[i + 1]
+                if marker == 0xFF:
+                    i += 1
+                    continue
+                if marker in JPEG_SOF:
+                    height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                    return width, height, data[i + 9]
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+            return None
+        if data[:2] == b'BM':
+            width, height = struct.unpack("<ii", data[18:26])
+            return width, abs(height), max(1, struct.unpack("<H", data[28:30])[0] // 8)
+        if fmt == 'TARGA':
+            width, height = struct.unpack("<HH", data[12:16])
+            return width, height, max(1, data[16] // 8)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+# --- quick_export_core section: output ---
+# ---------- Output files (atomic, collision-aware) ----------
+# Every output is written to <name><TMP_SUFFIX> next to its target and moved in
+# place with os.replace: a crash or error leaves a temp file behind, never a
+# truncated output. os.replace also swaps an earlier output that is a
+# hardlink / symlink into the blob store without writing through it.
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@contextlib.contextmanager
+def atomic_file(filepath, buffering=-1):
+    """open(filepath, 'wb') that only replaces filepath once the block completes"""
+    tmp = filepath + TMP_SUFFIX
+    try:
+        with open(tmp, 'wb', buffering=buffering) as f:
+            yield f
+        os.replace(tmp, filepath)
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+
+def write_atomic(filepath, data):
+    with atomic_file(filepath) as f:
+        f.write(data)
+    return len(data)
+
+def write_output(target, data):
+    """Write encoded bytes to a file path or an ArchiveEntry, returns bytes written"""
+    PROFILE.count("bytes_written", len(data))
+    with PROFILE.stage("write"):
+        if isinstance(target, ArchiveEntry):
+            return target.write(data)
+        return write_atomic(target, data)
+
+class NameIndex:
+    """File names of every output folder, listed once with os.scandir.
+    Existence, size and collision checks are looked up in memory instead of
+    one stat per file (a round-trip each on a network share)."""
+
+    def __init__(self, on_disk=True):
+        self.on_disk = on_disk  # False (archive): only avoid names used by this run
+        self.folders = {}  # folder -> {name: DirEntry}, None if it does not exist
+        self.reserved = set()  # paths used by this run
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def listing(self, folder):
+        key = self.key(folder)
+        if key not in self.folders:
+            entries = None
+            if self.on_disk:
+                PROFILE.count("scandir")
+                try:
+                    with os.scandir(folder) as it:
+                        entries = {os.path.normcase(entry.name): entry for entry in it}
+                except OSError:
+                    pass
+            self.folders[key] = entries
+        return self.folders[key]
+
+    def entry(self, path):
+        entries = self.listing(os.path.dirname(path))
+        return entries.get(os.path.normcase(os.path.basename(path))) if entries else None
+
+    def exists(self, path):
+        return self.entry(path) is not None
+
+    def size(self, path):
+        """Size when listed (cached by scandir on Windows), None if missing"""
+        entry = self.entry(path)
+        try:
+            return entry.stat().st_size if entry is not None else None
+        except OSError:
+            return None
+
+    def reserve(self, path):
+        self.reserved.add(self.key(path))
+
+    def unique(self, path, reusable=None):
+        """`path`, or `path_001`, `_002`... not used by this run and not on disk,
+        except files reusable(path) allows to overwrite (the add-on's own outputs)"""
+        base, ext = os.path.splitext(path)
+        candidate, c = path, 1
+        while self.key(candidate) in self.reserved or (
+                self.exists(candidate) and not (reusable and reusable(candidate))):
+            candidate = f"{base}_{c:03d}{ext}"
+            c += 1
+        self.reserve(candidate)
+        return candidate
+
+    def missing_folders(self, folders):
+        """Folders of `folders` that do not exist yet (listed ones are skipped)"""
+        return sorted(folder for folder in set(folders) if self.listing(folder) is None)
+
+    def created(self, folder):
+        self.folders[self.key(folder)] = {}
+
+# ---------- Manifest (incremental export) ----------
+MANIFEST_VERSION = 1
+
+class ExportManifest:
+    """Manifest in the export root: output file -> source, content hash, format
+    and settings. Unchanged outputs are skipped on the next run. `names` indexes
+    the output folders (on_disk=False: archive output, files on disk don't matter)."""
+
+    def __init__(self, root, incremental=True, on_disk=True):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.incremental = incremental
+        self.entries = {}
+        self.skipped = 0
+        self.names = NameIndex(on_disk)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        self.by_key = None  # (record key, ext) -> previous output, built on first previous_path()
+
+    def relpath(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def claim(self, filepath):
+        """Collision-free output path: overwrites an earlier output listed in the
+        manifest, gets _001, _002... next to foreign files or this run's outputs"""
+        return self.names.unique(filepath, lambda path: self.relpath(path) in self.entries)
+
+    def previous_path(self, key, ext):
+        """Previous output of record `key` if it is still on disk, so a rerun
+        overwrites its own file (even a _001 one). Also used without incremental."""
+        if self.by_key is None:
+            self.by_key = {(tuple(e.get("key", ())), os.path.splitext(rel)[1]): rel
+                           for rel, e in self.entries.items()}
+        rel = self.by_key.get((tuple(key), ext))
+        if not rel:
+            return None
+        path = os.path.join(self.root, *rel.split("/"))
+        return path if self.names.exists(path) else None
+
+    def is_current(self, filepath, record):
+        """Output on disk still matches `record` (nothing counted)"""
+        if not self.incremental:
+            return False
+        entry = self.entries.get(self.relpath(filepath))
+        if not entry or any(entry.get(k) != v for k, v in record.items()):
+            return False
+        return self.names.size(filepath) == entry.get("bytes")
+
+    def skip(self, filepath, record):
+        if not self.is_current(filepath, record):
+            return False
+        self.skipped += 1
+        return True
+
+    def record(self, filepath, record, size=None):
+        entry = dict(record)
+        entry["bytes"] = os.path.getsize(filepath) if size is None else size
+        self.entries[self.relpath(filepath)] = entry
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+# ---------- Content-addressed blobs (dedupe) ----------
+FICLONE = 0x40049409  # linux/fs.h
+
+def _reflink(src, dst):
+    import fcntl  # ImportError on Windows -> next mode
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+
+def _symlink(src, dst):
+    os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+# tried in order; a mode that fails once is not retried in the same run
+LINKERS = (
+    ("hardlink", os.link),
+    ("reflink", _reflink),
+    ("symlink", _symlink),
+    ("copy", shutil.copyfile),
+)
+
+class BlobStore:
+    """Content-addressed store in <export root>/<BLOB_DIR>. Each unique output
+    is encoded and written once, every output using it is linked to the blob."""
+
+    def __init__(self, root, enabled=True):
+        self.dir = os.path.join(root, BLOB_DIR)
+        self.enabled = enabled
+        self.modes = [name for name, _ in LINKERS]  # still usable on this filesystem
+        self.linked = Counter()  # mode -> outputs
+        self.deduped = 0  # extra outputs of a group (the carrier job counts the first)
+        self.saved = 0  # bytes not encoded / written again
+
+    def path(self, key, ext):
+        return os.path.join(self.dir, key + ext)
+
+    def link(self, blob, dst):
+        """Make dst a link (or copy) of blob, replacing dst atomically"""
+        tmp = dst + ".qlink"
+        for name, fn in LINKERS:
+            if name not in self.modes:
+                continue
+            try:
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                fn(blob, tmp)
+                os.replace(tmp, dst)
+                self.linked[name] += 1
+                return name
+            except (OSError, ImportError) as e:
+                if name == "copy":
+                    raise
+                print(f"{LOG_PREFIX} Không dùng được {name} ({e}), thử cách khác")
+                self.modes.remove(name)
+        raise OSError(f"Không link được {blob} -> {dst}")
+
+    def publish(self, job, manifest):
+        """Main thread, after the carrier job: move the finished blob in place
+        and link every output of the group to it (ExportRun created the folders)"""
+        blob = job["blob"]
+        reused = job["action"] == "link"
+        if not reused:
+            os.replace(blob + ".part", blob)
+        size = os.path.getsize(blob)
+        for i, (path, record) in enumerate(job["links"]):
+            with PROFILE.stage("blob.link"):
+                self.link(blob, path)
+            manifest.record(path, dict(record, blob=manifest.relpath(blob)), size)
+            if i:
+                self.deduped += 1
+            if i or reused:
+                self.saved += size
+
+    def prune(self, manifest):
+        """Drop blobs no manifest entry points to any more, and leftover .part files"""
+        if not os.path.isdir(self.dir):
+            return
+        used = {entry.get("blob") for entry in manifest.entries.values()}
+        for entry in os.scandir(self.dir):
+            if manifest.relpath(entry.path) not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"{LOG_PREFIX} Không xoá được blob thừa {entry.path}: {e}")
+
+def dedupe_plan(plan, store, names, reuse=True):
+    """Group jobs with identical output (blob_key). The first job of a group (the
+    carrier) writes one blob, the others become "dedupe" and are linked to it.
+    Content whose blob survives from an earlier run is only linked ("link").
+    reuse=False (archive output): groups only, blobs on disk are ignored."""
+    if not store.enabled:
+        return
+    groups = {}
+    for job in plan:
+        # LOD jobs write several files from one decode: not shared
+        if job["action"] != "skip" and not job.get("lods"):
+            groups.setdefault(blob_key(job), []).append(job)
+    for key, jobs in groups.items():
+        carrier = jobs[0]
+        blob = store.path(key, os.path.splitext(carrier["path"])[1])
+        reused = reuse and names.exists(blob)
+        if len(jobs) < 2 and not reused:
+            continue  # unique content: write it directly
+        carrier["blob"] = blob
+        carrier["links"] = [(job["path"], job["record"]) for job in jobs]
+        if reused:
+            carrier["action"] = "link"
+            carrier["memory"] = 0
+        for job in jobs[1:]:
+            job["action"] = "dedupe"
+
+# ---------- Archive output (zip / tar.zst) ----------
+ARCHIVE_EXT = {'ZIP': ".zip", 'TAR_ZST': ".tar.zst"}
+STORED_EXTS = {".png", ".jpg"}  # already compressed: deflating again only costs time
+ZSTD_MISSING = "Xuất .tar.zst cần package 'zstandard' (pip install zstandard), hoặc chọn .zip"
+
+def archive_path(export_dir, kind):
+    """export dir "//maps/" -> archive "//maps.zip" next to it"""
+    return export_dir.rstrip("/\\") + ARCHIVE_EXT[kind]
+
+def zstd_module():
+    """`zstandard` package, else Python 3.14+ `compression.zstd`, else None"""
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        pass
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        return None
+
+def zstd_stream_writer(fileobj, level):
+    """zstd compressing writer over fileobj (multi-threaded with `zstandard`)"""
+    zstd = zstd_module()
+    if zstd is None:
+        raise RuntimeError(ZSTD_MISSING)
+    if hasattr(zstd, "ZstdCompressor"):
+        return zstd.ZstdCompressor(level=level, threads=-1).stream_writer(fileobj)
+    return zstd.ZstdFile(fileobj, "w", level=level)
+
+class ArchiveWriter:
+    """Streams outputs into one zip / tar.zst instead of the export dir.
+    Entries keep the folder layout (Material/Material_MapType.ext). Workers add
+    encoded bytes under a lock; nothing is written to disk besides the archive
+    (<archive>.part until close()). Opened on the first entry, so dry runs and
+    empty exports create no file."""
+
+    def __init__(self, root, kind, level):
+        self.root = root
+        self.kind = kind
+        self.level = level
+        self.path = archive_path(root, kind)
+        self.lock = threading.Lock()
+        self.zip = self.tar = self.stream = None
+        self.entries = 0
+
+    def name(self, filepath):
+        return os.path.relpath(filepath, self.root).replace(os.sep, "/")
+
+    def open(self):
+        try:
+            with PROFILE.stage("makedirs"):
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        except OSError as e:
+            raise OSError(f"Không tạo được thư mục cho archive: {e}") from e
+        tmp = self.path + ".part"
+        if self.kind == 'ZIP':
+            level = min(self.level, 9)
+            self.zip = zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED,
+                                       compresslevel=level or None)
+        else:
+            self.stream = zstd_stream_writer(open(tmp, "wb"), max(self.level, 1))
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add(self, names, data):
+        """One payload under one or more entry names (dedupe group).
+        tar stores the extra names as hardlinks, zip repeats the data."""
+        with self.lock:
+            if self.zip is None and self.tar is None:
+                self.open()
+            now = time.time()
+            for i, name in enumerate(names):
+                if self.zip is not None:
+                    stored = os.path.splitext(name)[1].lower() in STORED_EXTS
+                    self.zip.writestr(name, data, compress_type=zipfile.ZIP_STORED if stored else None)
+                    continue
+                info = tarfile.TarInfo(name)
+                info.mtime = now
+                info.mode = 0o644
+                if i:
+                    info.type = tarfile.LNKTYPE
+                    info.linkname = names[0]
+                    self.tar.addfile(info)
+                else:
+                    info.size = len(data)
+                    self.tar.addfile(info, io.BytesIO(data))
+            self.entries += len(names)
+        return len(data)
+
+    def close(self):
+        """Finish the archive and move it into place (no-op if never opened)"""
+        with self.lock:
+            if self.zip is not None:
+                self.zip.close()
+            elif self.tar is not None:
+                self.tar.close()
+                self.stream.close()
+            else:
+                return
+            os.replace(self.path + ".part", self.path)
+
+class ArchiveEntry:
+    """Write target of one job in archive mode: the output name plus the
+    names of its dedupe group"""
+
+    def __init__(self, archive, names):
+        self.archive = archive
+        self.names = names
+        self.size = 0
+
+    def write(self, data):
+        self.size = self.archive.add(self.names, data)
+        return self.size
+
+# --- quick_export_core section: run ---
+# ---------- Export pool ----------
+class ExportPool:
+    """Main thread snapshots pixels / packed bytes, worker threads encode + write.
+    Results are collected in submit order so `failed` and the reports stay
+    deterministic. `kind` counts successful jobs ("encoded", "copied", "linked")."""
+
+    def __init__(self, workers=0, budget=None, operator=None, failed=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix=LOG_PREFIX.strip("[]").lower())
+        self.budget = budget or MemoryBudget()
+        self.operator = operator  # reports every file written / failed when set
+        self.pending = deque()  # (label, filepath, kind, future, on_done, weight, memory)
+        self.failed = [] if failed is None else failed
+        self.counts = Counter()  # successful jobs per kind
+        self.done_weight = 0  # estimated bytes of collected jobs (progress)
+        self.bytes_written = 0
+
+    def submit(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0, memory=0):
+        """`memory`: bytes the queued buffer holds until the job is collected"""
+        self.budget.acquire(memory)
+        self.pending.append((label, filepath, kind, self.executor.submit(fn, *args), on_done, weight, memory))
+        # bound queued snapshots so memory does not grow with image count
+        while len(self.pending) > self.workers * 2:
+            self.collect_one()
+
+    def run_inline(self, label, filepath, fn, *args, kind="encoded", on_done=None, weight=0):
+        """Main-thread-only job (image.save()), queued to keep report order"""
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        self.pending.append((label, filepath, kind, fut, on_done, weight, 0))
+
+    def has_capacity(self):
+        return len(self.pending) < self.workers * 2
+
+    def collect_ready(self):
+        """Collect finished jobs at the head of the queue without blocking"""
+        while self.pending and self.pending[0][3].done():
+            self.collect_one()
+
+    def collect_one(self):
+        label, filepath, kind, fut, on_done, weight, memory = self.pending.popleft()
+        self.done_weight += weight
+        self.budget.release(memory)
+        try:
+            written = fut.result()
+            if on_done:
+                on_done()
+            self.counts[kind] += 1
+            # archive entries have no file of their own: use the size the job reported
+            self.bytes_written += written if isinstance(written, int) else os.path.getsize(filepath)
+            if self.operator:
+                self.operator.report({'INFO'}, f"✅ Xuất {label}: {filepath}")
+        except Exception as e:
+            self.fail(label, filepath, e)
+
+    def fail(self, label, filepath, error):
+        self.failed.append((filepath, str(error)))
+        print(f"{LOG_PREFIX} Lỗi khi lưu {label} -> {filepath}: {error}")
+        print("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+        if self.operator:
+            self.operator.report({'ERROR'}, f"❌ Lỗi khi lưu {label}: {filepath} ({error})")
+
+    def close(self):
+        while self.pending:
+            self.collect_one()
+        self.executor.shutdown(wait=True)
+
+# ---------- Profile report ----------
+def finish_profile(base, **info):
+    """Write the report of the run that just ended (when enabled); the panel shows it"""
+    if not PROFILE.enabled:
+        return None
+    report = PROFILE.report(**info)
+    try:
+        PROFILE.write(base, report)
+        print(f"{LOG_PREFIX} Profiling {report['wall_seconds']:.2f} s → {base}.json / .csv")
+    except OSError as e:
+        print(f"{LOG_PREFIX} Không ghi được report profiling {base}: {e}")
+    EXPORT_STATE["profile"] = report
+    return report
+
+def dry_run_profile():
+    """A dry run writes nothing: its report (plan stages only) is only shown in the panel"""
+    if not PROFILE.enabled:
+        return None
+    EXPORT_STATE["profile"] = PROFILE.report(dry_run=True)
+    return EXPORT_STATE["profile"]
+
+# ---------- Execution (blocking, or stepped from a modal timer) ----------
+MODAL_TIMER_SECONDS = 0.05
+MODAL_BATCH = 4  # jobs queued per timer tick
+MODAL_TICK_SECONDS = 0.04  # main-thread budget per tick (snapshots, image.save())
+
+# run: the modal export in progress (the panel draws its progress)
+# profile: profile report of the last export (the panel draws a summary)
+EXPORT_STATE = {"run": None, "profile": None}
+
+def safe_makedirs(path):
+    """Try create directory, returns (success, used_path, message)"""
+    try:
+        with PROFILE.stage("makedirs"):
+            os.makedirs(path, exist_ok=True)
+        return True, path, ""
+    except Exception as e:
+        # detect probable network path issue on Windows
+        msg = str(e).lower()
+        winerr = getattr(e, "winerror", None)
+        network_issue = (winerr == 53) or ("network path" in msg) or path.startswith('\\\\')
+        return False, path, str(e) + (" (network?)" if network_issue else "")
+
+def job_files(job):
+    """Files a job writes: its output + one per LOD level"""
+    return 1 + len(job.get("lods", ()))
+
+def job_bytes(job):
+    return job["bytes"] + sum(lod["bytes"] for lod in job.get("lods", ()))
+
+def execution_order(plan):
+    """Jobs to run, largest first so big encodes start early and the tail is
+    made of small ones (stable: ties keep plan order)"""
+    return sorted((job for job in plan if job["action"] not in ("skip", "dedupe")), key=lambda job: -job["bytes"])
+
+class ExportRun:
+    """Runs a plan job by job, largest first. The blocking export drives it to
+    the end in one go; the modal operator calls step() from a timer instead.
+    Each add-on subclasses it: queue(job) hands one job to its run_job()."""
+
+    # result() keys copied into the profile report
+    profile_keys = ("exported", "deduped", "skipped", "cancelled", "bytes_written", "peak_memory")
+
+    def __init__(self, plan, manifest, workers=0, memory_mb=0, store=None, archive=None, operator=None,
+                 failed=None):
+        self.plan = plan
+        self.jobs = deque(execution_order(plan))
+        self.total = sum(job_files(job) for job in self.jobs)
+        self.total_bytes = sum(job_bytes(job) for job in self.jobs)
+        self.manifest = manifest
+        self.export_dir = manifest.root
+        self.store = store or BlobStore(self.export_dir, enabled=False)
+        self.archive = archive  # ArchiveWriter, or None to write into export_dir
+        self.budget = MemoryBudget(memory_mb)
+        self.pool = ExportPool(workers, self.budget, operator, failed)
+        self.failed = self.pool.failed
+        self.folders = None  # output folder -> makedirs error, filled before the first write
+        self.dropped = 0  # jobs that never reached the pool
+        self.cancelled = False
+        self.started = time.perf_counter()
+        self.profile = None  # profile report, after finish()
+        self.info = {}  # added to the profile report and the result (atlas: its summary)
+
+    def queue(self, job):
+        """Hand one planned job to the pool"""
+        raise NotImplementedError
+
+    def next_job(self, wait=True):
+        """Largest queued job that fits the memory budget. Waits for queued
+        writes to release memory (wait=True) or returns None (modal tick).
+        A job bigger than the whole budget runs once nothing else is in flight."""
+        while True:
+            for i, job in enumerate(self.jobs):
+                if self.budget.fits(job["memory"]):
+                    del self.jobs[i]
+                    return job
+            if not self.pool.pending:
+                return self.jobs.popleft()
+            if not wait:
+                return None
+            self.pool.collect_one()
+
+    def run_next(self, wait=True):
+        """Queue the next job (blocks only when the pool is full or over budget).
+        Returns False when a modal tick has to wait for memory instead."""
+        job = self.next_job(wait)
+        if job is None:
+            return False
+        if self.folders is None:
+            self.create_folders()
+        if os.path.dirname(job.get("blob") or job["path"]) in self.folders:
+            self.dropped += 1  # reported once by create_folders
+            return True
+        try:
+            self.queue(job)
+        except Exception as e:
+            self.dropped += 1
+            self.pool.fail(job["label"], job["path"], e)
+        return True
+
+    def create_folders(self):
+        """makedirs every output folder of the plan in one pass before the first
+        write (folders the name index could list already exist)"""
+        self.folders = {}
+        if self.archive is not None:
+            return
+        wanted = set()
+        for job in self.plan:
+            if job["action"] == "skip":
+                continue
+            wanted.add(os.path.dirname(job.get("blob") or job["path"]))
+            wanted.update(os.path.dirname(path) for path, _ in job.get("links", ()))
+        names = self.manifest.names
+        for folder in names.missing_folders(wanted):
+            ok, _, msg = safe_makedirs(folder)
+            if ok:
+                names.created(folder)
+                continue
+            self.folders[folder] = msg
+            self.failed.append((folder, f"Không tạo được thư mục: {msg}"))
+            print(f"{LOG_PREFIX} Không tạo được thư mục {folder}: {msg}")
+
+    def step(self, max_jobs=MODAL_BATCH, budget=MODAL_TICK_SECONDS):
+        """Queue a bounded batch without waiting on workers.
+        Returns True once every job is written."""
+        deadline = time.perf_counter() + budget
+        self.pool.collect_ready()
+        queued = 0
+        while self.jobs and queued < max_jobs and self.pool.has_capacity() and time.perf_counter() < deadline:
+            if not self.run_next(wait=False):
+                break
+            queued += 1
+        self.pool.collect_ready()
+        return not self.jobs and not self.pool.pending
+
+    def cancel(self):
+        """Drop jobs not started yet. Writes already queued still finish and
+        are recorded, so the export dir + manifest stay consistent."""
+        self.cancelled = True
+        self.jobs.clear()
+
+    def progress(self):
+        done = self.total - sum(job_files(job) for job in self.jobs) - len(self.pool.pending)
+        if self.total_bytes:
+            fraction = self.pool.done_weight / self.total_bytes
+        else:
+            fraction = done / self.total if self.total else 1.0
+        elapsed = time.perf_counter() - self.started
+        eta = elapsed * (1.0 - fraction) / fraction if fraction > 0 else None
+        return {
+            "done": done,
+            "total": self.total,
+            "fraction": min(fraction, 1.0),
+            "bytes_written": self.pool.bytes_written,
+            "eta": eta,
+        }
+
+    def finish(self):
+        """Wait for queued writes, then close the archive or save the manifest,
+        and write the profile report"""
+        try:
+            self.pool.close()
+        finally:
+            if self.archive is not None:
+                try:
+                    self.close_archive()
+                finally:
+                    self.write_profile()
+            else:
+                self.close_folder()
+
+    def close_archive(self):
+        try:
+            self.archive_extras()
+            with PROFILE.stage("archive.close"):
+                self.archive.close()
+        except (OSError, RuntimeError, zipfile.BadZipFile, tarfile.TarError) as e:
+            self.failed.append((self.archive.path, str(e)))
+            print(f"{LOG_PREFIX} Không đóng được archive {self.archive.path}: {e}")
+
+    def archive_extras(self):
+        """Entries added after the last job, right before the archive is closed"""
+
+    def close_folder(self):
+        """Drop unused blobs, save the manifest, then write the profile report"""
+        try:
+            try:
+                os.makedirs(self.export_dir, exist_ok=True)
+                self.store.prune(self.manifest)
+                with PROFILE.stage("manifest.save"):
+                    self.manifest.save()
+            except OSError as e:
+                print(f"{LOG_PREFIX} Không ghi được manifest {self.manifest.path}: {e}")
+        finally:
+            self.write_profile()
+
+    def profile_base(self):
+        if self.archive is not None:
+            return f"{self.archive.path}.profile"
+        return os.path.join(self.export_dir, PROFILE_NAME)
+
+    def write_profile(self):
+        result = self.result()
+        self.profile = finish_profile(
+            self.profile_base(), export_dir=self.export_dir, workers=self.pool.workers, jobs=self.total,
+            **{key: result[key] for key in self.profile_keys}, failed=len(self.failed), **self.info)
+
+    def result(self):
+        deduped = self.store.deduped + self.pool.counts["linked"]  # outputs served from blobs
+        return {
+            "exported": sum(self.pool.counts.values()) + self.store.deduped,
+            "deduped": deduped,
+            "dedupe_saved_bytes": self.store.saved,
+            "link_modes": dict(self.store.linked),
+            "skipped": self.manifest.skipped,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "bytes_written": self.pool.bytes_written,
+            "estimated_bytes": self.total_bytes,
+            "peak_memory": self.budget.peak,
+            "export_dir": self.export_dir,
+            "archive": self.archive.path if self.archive is not None and self.archive.entries else None,
+            "profile": self.profile,
+            **self.info,
+        }
+
+# ---------- Panel helpers ----------
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def tag_redraw_panels(context):
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+PROFILE_PANEL_STAGES = 6
+PROFILE_PANEL_COUNTERS = ("images", "bytes_read", "bytes_written", "scandir")
+
+def draw_profile(box, report):
+    box.label(text=f"Lần xuất gần nhất: {report['wall_seconds']:.2f} s", icon='TIME')
+    col = box.column(align=True)
+    for name, stage in list(report["stages"].items())[:PROFILE_PANEL_STAGES]:
+        row = col.row()
+        row.label(text=name)
+        row.label(text=f"{stage['seconds']:.3f} s × {stage['calls']}")
+    counters = report["counters"]
+    col = box.column(align=True)
+    for name in PROFILE_PANEL_COUNTERS:
+        if name in counters:
+            value = counters[name]
+            row = col.row()
+            row.label(text=name)
+            row.label(text=f"{value / 1048576:.1f} MB" if name.startswith("bytes") else str(value))
+
+# <<< quick_export_core <<<
 
 # ---------- Helpers ----------
 def sanitize_filename(name: str) -> str:
@@ -24,28 +1192,54 @@ def sanitize_filename(name: str) -> str:
         return "noname"
     return name
 
-def map_type_from_link(mat, tex_node):
+# nodes a texture signal passes through on its way to the BSDF input
+PASS_THROUGH_NODES = {'REROUTE', 'SEPRGB', 'SEPARATE_COLOR', 'MIX', 'MIX_RGB'}
+
+def build_link_index(node_tree):
+    """from-node name -> [(to_node, to_socket)] in link order, built once per material"""
+    index = {}
+    for link in node_tree.links:
+        from_node = getattr(link, "from_node", None)
+        if from_node is None:
+            continue
+        index.setdefault(from_node.name, []).append(
+            (getattr(link, "to_node", None), getattr(link, "to_socket", None)))
+    return index
+
+def _map_type_from_targets(index, node_name, visited):
+    """Follow outgoing links (through reroute/separate/mix) to the socket that names the map"""
+    for to_node, to_socket in index.get(node_name, ()):
+        socket_name = (to_socket.name if to_socket else "").lower()
+        to_node_type = to_node.type if to_node else ""
+
+        # Check normal map specially
+        if "normal" in socket_name or "normal" in to_node_type.lower():
+            return "Normal"
+        if to_node_type in PASS_THROUGH_NODES:
+            if to_node.name not in visited:
+                visited.add(to_node.name)
+                found = _map_type_from_targets(index, to_node.name, visited)
+                if found:
+                    return found
+            continue
+        if "base" in socket_name or "color" in socket_name:
+            return "BaseColor"
+        if "rough" in socket_name:
+            return "Roughness"
+        if "metal" in socket_name:
+            return "Metallic"
+        if "alpha" in socket_name or "opacity" in socket_name:
+            return "Alpha"
+    return None
+
+def map_type_from_link(mat, tex_node, index=None):
     """Try detect map type by following node links to sockets / normal map node"""
     try:
-        nt = mat.node_tree
-        for link in nt.links:
-            if link.from_node == tex_node:
-                to_socket = getattr(link, "to_socket", None)
-                to_node = getattr(link, "to_node", None)
-                socket_name = (to_socket.name if to_socket else "").lower()
-                to_node_type = (to_node.type if to_node else "").lower()
-
-                # Check normal map specially
-                if "normal" in socket_name or "normal" in to_node_type or (to_node and to_node.type == 'NORMAL_MAP'):
-                    return "Normal"
-                if "base" in socket_name or "color" in socket_name:
-                    return "BaseColor"
-                if "rough" in socket_name:
-                    return "Roughness"
-                if "metal" in socket_name:
-                    return "Metallic"
-                if "alpha" in socket_name or "opacity" in socket_name:
-                    return "Alpha"
+        if index is None:
+            index = build_link_index(mat.node_tree)
+        found = _map_type_from_targets(index, tex_node.name, {tex_node.name})
+        if found:
+            return found
         # not found: try check node label/name for hints
         name_lower = (getattr(tex_node, "label", "") or getattr(tex_node, "name", "")).lower()
         if "base" in name_lower or "albedo" in name_lower or "diffuse" in name_lower:
@@ -62,161 +1256,933 @@ def map_type_from_link(mat, tex_node):
         pass
     return "Misc"
 
-def ensure_unique_path(path):
-    base, ext = os.path.splitext(path)
-    c = 1
-    new_path = path
-    while os.path.exists(new_path):
-        new_path = f"{base}_{c:03d}{ext}"
-        c += 1
-    return new_path
+def material_map_types(mat, cache):
+    """{tex node name: map type} for a material, classified once per export run"""
+    types = cache.get(mat.name)
+    if types is None:
+        types = {}
+        try:
+            index = build_link_index(mat.node_tree)
+            for node in mat.node_tree.nodes:
+                if node.type == 'TEX_IMAGE':
+                    types[node.name] = map_type_from_link(mat, node, index)
+        except Exception:
+            pass
+        cache[mat.name] = types
+    return types
 
-def safe_makedirs(path):
-    """Try create directory, returns (success, used_path, message)"""
+# magic bytes đầu file packed -> định dạng Blender
+PACKED_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+)
+TGA_FOOTER = b'TRUEVISION-XFILE.\x00'
+WRITE_CHUNK = 1024 * 1024
+
+def packed_format(img, data):
+    """Detect real format of packed bytes; None if unknown (needs re-encode)"""
+    for magic, fmt in PACKED_MAGIC:
+        if data[:len(magic)] == magic:
+            return fmt
+    if data[-len(TGA_FOOTER):] == TGA_FOOTER:
+        return 'TARGA'
+    # TGA v1 has no signature: trust the image's own format + extension
+    src_ext = os.path.splitext(getattr(img, "filepath", "") or "")[1].lower()
+    if getattr(img, "file_format", "") == 'TARGA' and src_ext == '.tga':
+        return 'TARGA'
+    return None
+
+def can_copy_packed(img, fmt, data=None):
+    """Packed bytes can be written as-is (no decode/encode) for target fmt?"""
+    if getattr(img, "is_dirty", False):
+        return None  # pixels edited after packing -> bytes are stale
+    if len(getattr(img, "packed_files", ())) > 1:
+        return None  # UDIM / multiview: several payloads
+    if data is None:
+        data = img.packed_file.data
+    if packed_format(img, data) != fmt:
+        return None
+    return data
+
+def write_packed_bytes(data, filepath):
+    """Write packed payload straight to disk in chunks, returns bytes written"""
+    PROFILE.count("bytes_written", len(data))
+    with PROFILE.stage("write"):
+        if isinstance(filepath, ArchiveEntry):
+            return filepath.write(data)
+        view = memoryview(data)
+        with atomic_file(filepath, buffering=WRITE_CHUNK) as f:
+            for start in range(0, len(view), WRITE_CHUNK):
+                f.write(view[start:start + WRITE_CHUNK])
+        return len(view)
+
+def save_with_blender(img, filepath, fmt):
+    """img.save() path (main thread only), through a temp name like every other
+    write. Restores the image's own path and format afterwards so exporting
+    does not modify the .blend."""
+    old_path, old_format = img.filepath_raw, img.file_format
+    tmp = filepath + TMP_SUFFIX
     try:
-        os.makedirs(path, exist_ok=True)
-        return True, path, ""
-    except Exception as e:
-        # detect probable network path issue on Windows
-        msg = str(e).lower()
-        winerr = getattr(e, "winerror", None)
-        network_issue = (winerr == 53) or ("network path" in msg) or path.startswith('\\\\')
-        return False, path, str(e) + (" (network?)" if network_issue else "")
+        img.filepath_raw = tmp
+        # try set file_format safely
+        try:
+            img.file_format = fmt
+        except Exception:
+            img.file_format = 'PNG'
+        with PROFILE.stage(f"save.{fmt}"):
+            img.save()
+        size = os.path.getsize(tmp)
+        os.replace(tmp, filepath)
+        return size
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+    finally:
+        try:
+            img.filepath_raw = old_path
+            img.file_format = old_format
+        except Exception:
+            pass
 
-# ---------- Operator ----------
-class QUP_OT_export_packed_maps(bpy.types.Operator):
-    bl_idname = "qup.export_packed_maps"
-    bl_label = "Xuất Packed Maps"
-    bl_description = "Xuất các texture đã pack theo từng thư mục material, tên: Material_MapType.ext"
+# ---------- LOD chain ----------
+# Optional 1/2, 1/4, ... copies of every output (`<name>_<long side>.ext`), built
+# from the buffer already decoded for the output itself: one task filters the
+# whole chain (each level from the previous one), one task per level encodes
+# and writes it, in parallel. Filtering happens in linear space: sRGB data is
+# linearized first and re-encoded after; normal maps are filtered as [-1, 1]
+# vectors and renormalized.
 
-    def execute(self, context):
-        scene = context.scene
-        raw_path = scene.qup_export_dir
-        if not raw_path:
-            self.report({'ERROR'}, "Chưa chọn thư mục xuất!")
-            return {'CANCELLED'}
+def lod_path(filepath, size):
+    """`Mat_Normal.png` -> `Mat_Normal_1024.png`"""
+    root, ext = os.path.splitext(filepath)
+    return f"{root}_{size}{ext}"
 
-        # resolve path (support //)
-        export_dir = bpy.path.abspath(raw_path)
+def lod_mode(map_type, img=None):
+    """'NORMAL' (renormalized vectors), 'SRGB' (filtered in linear) or 'LINEAR'"""
+    if map_type == "Normal":
+        return 'NORMAL'
+    if img is not None and not getattr(img, "is_float", False):
+        if getattr(getattr(img, "colorspace_settings", None), "name", "") == 'sRGB':
+            return 'SRGB'
+    return 'LINEAR'
 
-        # attempt create
-        ok, used_path, msg = safe_makedirs(export_dir)
-        if not ok:
-            # fallback: if .blend saved use //qup_unpacked_textures, else Desktop fallback
-            print(f"[QUP] Cannot create export_dir {export_dir}: {msg}")
-            if bpy.data.filepath:
-                fallback = bpy.path.abspath("//qup_unpacked_textures")
-            else:
-                fallback = os.path.join(os.path.expanduser("~"), "Desktop", "qup_unpacked_textures")
-            ok2, used2, msg2 = safe_makedirs(fallback)
-            if not ok2:
-                self.report({'ERROR'}, f"Không tạo được thư mục export: {msg}\nFallback failed: {msg2}")
-                print("[QUP] Fallback also failed:", msg2)
-                return {'CANCELLED'}
-            else:
-                self.report({'WARNING'}, f"Không truy cập được đường dẫn đã chọn. Sẽ xuất sang: {fallback}")
-                export_dir = fallback
+def plan_lods(filepath, width, height, channels, fmt, scene, record):
+    """LOD outputs of one job: path, resolution, estimated bytes, manifest record"""
+    lods = []
+    for w, h in lod_sizes(width, height, scene.qup_lod_levels, scene.qup_lod_min_size):
+        size = max(w, h)
+        lods.append({"path": lod_path(filepath, size), "width": w, "height": h,
+                     "bytes": encoded_bytes(w, h, channels, fmt),
+                     "record": dict(record, key=record["key"] + [size])})
+    return lods
 
-        fmt = scene.qup_format  # 'PNG','JPEG','TARGA'
-        ext_map = {'PNG': '.png', 'JPEG': '.jpg', 'TARGA': '.tga'}
-        ext = ext_map.get(fmt, '.png')
+def encode_lod_and_write(filepath, fmt, chain, level):
+    """Worker: wait for the chain task (always queued first), encode one level"""
+    return write_output(filepath, encode_image(fmt, chain.result()[level]))
 
-        only_selected = scene.qup_only_selected
+def submit_lods(job, pool, lods, make_base, *args):
+    """Queue a job's LOD levels: one task builds the chain from the buffer the
+    job already has, one task per level encodes + writes it.
+    lods = [(lod, target, on_done)]"""
+    if not lods:
+        return
+    chain = pool.executor.submit(build_lod_chain, make_base, args, len(lods), job["lod_mode"], job["lod_filter"])
+    for level, (lod, target, on_done) in enumerate(lods):
+        width, height = lod["width"], lod["height"]
+        # the first level also holds the float chain being filtered (source sized)
+        memory = width * height * 4 + (width * height * 4 * 4 * 4 if level == 0 else 0)
+        pool.submit(f"{job['label']} {max(width, height)}", lod["path"], encode_lod_and_write,
+                    target, job["format"], chain, level, on_done=on_done, weight=lod["bytes"], memory=memory)
 
-        # gather materials to process
-        mats_to_process = []
-        if only_selected:
-            obj = context.object
-            if not obj:
-                self.report({'ERROR'}, "Không có object đang chọn.")
-                return {'CANCELLED'}
-            # collect materials from object (active or slots)
-            mats = []
-            if getattr(obj, "active_material", None):
-                mats.append(obj.active_material)
-            for slot in getattr(obj, "material_slots", []):
-                if slot.material and slot.material not in mats:
-                    mats.append(slot.material)
-            if not mats:
-                self.report({'ERROR'}, "Object đang chọn không có material hợp lệ.")
-                return {'CANCELLED'}
-            mats_to_process = mats
+def save_lods_inline(job, pool, lods, base, float_buffer=False):
+    """LODs for formats only img.save() writes (JPEG, float images): build the
+    chain on the main thread, save each level through a temp image"""
+    if not lods:
+        return
+    chain = Future()
+    try:
+        if base is None:
+            raise RuntimeError("Không đọc được pixel ảnh để tạo LOD")
+        chain.set_result(lod_chain(base, len(lods), job["lod_mode"], job["lod_filter"],
+                                   as_uint8=base.dtype == np.uint8))
+    except Exception as e:
+        chain.set_exception(e)
+    for level, (lod, target, on_done) in enumerate(lods):
+        pool.run_inline(f"{job['label']} {max(lod['width'], lod['height'])}", lod["path"], save_lod_with_blender,
+                        chain, level, target, job["format"], float_buffer,
+                        on_done=on_done, weight=lod["bytes"])
+
+def save_lod_with_blender(chain, level, target, fmt, float_buffer):
+    level_img = chain.result()[level]
+    height, width, channels = level_img.shape
+    img = bpy.data.images.new(name="qup_lod", width=width, height=height,
+                              alpha=channels in (2, 4), float_buffer=float_buffer)
+    try:
+        rgba = np.ones((height, width, 4), dtype=np.float32)
+        if level_img.dtype == np.uint8:
+            rgba[..., :channels] = level_img
+            rgba[..., :channels] *= 1.0 / 255.0
         else:
-            mats_to_process = [m for m in bpy.data.materials if m is not None]
+            rgba[..., :channels] = level_img
+        if channels == 1:
+            rgba[..., 1:3] = rgba[..., :1]
+        img.pixels.foreach_set(rgba.ravel())
+        save = save_to_entry if isinstance(target, ArchiveEntry) else save_with_blender
+        return save(img, target, fmt)
+    finally:
+        bpy.data.images.remove(img)
 
-        exported = 0
-        failed = []
-        exported_keys = set()  # prevent dupe exports: (mat_clean, map_type, img.name)
+# ---------- Encoding ----------
+# formats encoded in worker threads by the shared encoders, the rest via img.save()
+THREAD_FORMATS = {'PNG', 'TARGA'}
 
-        for mat in mats_to_process:
-            if mat is None:
-                continue
-            if not getattr(mat, "use_nodes", False):
-                continue
+def read_pixels(img):
+    """(height, width, channels) float32 copy of the decoded pixels, None without pixel data"""
+    width, height = img.size
+    channels = getattr(img, "channels", 4)
+    count = width * height * channels
+    if count == 0 or len(img.pixels) != count:
+        return None
+    buf = np.empty(count, dtype=np.float32)
+    with PROFILE.stage("read_pixels"):
+        img.pixels.foreach_get(buf)
+    PROFILE.count("bytes_read", buf.nbytes)
+    return buf.reshape(height, width, channels)
 
-            mat_name_clean = sanitize_filename(mat.name)
-            mat_folder = os.path.join(export_dir, mat_name_clean)
-            ok_m, used_m, msg_m = safe_makedirs(mat_folder)
-            if not ok_m:
-                failed.append((mat.name, f"Không tạo thư mục material: {msg_m}"))
-                print(f"[QUP] Failed to create mat folder {mat_folder}: {msg_m}")
-                continue
+def snapshot_pixels(img, fmt):
+    """Copy pixels on the main thread for a worker to encode.
+    None when img.save() must be used (JPEG, float images, no pixel data)."""
+    if fmt not in THREAD_FORMATS or getattr(img, "is_float", False):
+        return None
+    pixels = read_pixels(img)
+    if pixels is None:
+        return None
+    height, width, channels = pixels.shape
+    out_channels = min({8: 1, 24: 3, 32: 4}.get(getattr(img, "depth", 32), 4), channels)
+    return pixels, width, height, channels, out_channels
+
+def quantize_snapshot(pixels, width, height, src_channels, out_channels):
+    """Worker: snapshot -> (height, width, out_channels) uint8"""
+    with PROFILE.stage("quantize"):
+        arr = pixels.reshape(height, width, src_channels)[..., :out_channels]
+        arr = np.clip(arr, 0.0, 1.0)
+        arr *= 255.0
+        arr += 0.5
+        return arr.astype(np.uint8)
+
+def encode_and_write(filepath, fmt, pixels, width, height, src_channels, out_channels):
+    """Worker: quantize to 8 bit, encode, write"""
+    data = encode_image(fmt, quantize_snapshot(pixels, width, height, src_channels, out_channels))
+    return write_output(filepath, data)
 
+# ---------- Memory budget ----------
+def image_has_data(img):
+    """Decoded buffer already resident (opened by the user / another tool)?"""
+    return getattr(img, "has_data", True)
+
+def decoded_bytes(img, width, height):
+    """Size of Blender's own decoded buffer: 4 B/px byte, 16 B/px float"""
+    return width * height * (16 if getattr(img, "is_float", False) else 4)
+
+def free_if_loaded_here(img, had_data):
+    """Release the decoded buffer if this export loaded it. Images the user
+    already had loaded (or edited: dirty) are left alone."""
+    if had_data or getattr(img, "is_dirty", False):
+        return
+    try:
+        img.buffers_free()
+    except Exception as e:
+        print(f"[QUP] buffers_free failed for {img.name}: {e}")
+
+# ---------- Manifest (incremental export) ----------
+def packed_content_hash(img, data):
+    """Hash of the packed payload, or of the pixels if edited since packing"""
+    h = hashlib.blake2b(digest_size=16)
+    if getattr(img, "is_dirty", False):
+        h.update(b"pixels:")
+        h.update(repr(tuple(img.size)).encode())
+        count = len(img.pixels)
+        if count:
+            buf = np.empty(count, dtype=np.float32)
+            img.pixels.foreach_get(buf)
+            h.update(buf)
+    else:
+        h.update(b"packed:")
+        h.update(data)
+    return h.hexdigest()
+
+# ---------- Archive output (zip / tar.zst) ----------
+def save_to_entry(img, entry, fmt):
+    """img.save() only writes files: JPEG / float images go through one temp
+    file that is removed again right after it is added"""
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(entry.names[0])[1], prefix="qup_")
+    os.close(fd)
+    try:
+        save_with_blender(img, tmp, fmt)
+        with open(tmp, 'rb') as f:
+            return entry.write(f.read())
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+# ---------- Staged upload (network shares) ----------
+UPLOAD_CHUNK = 4 * 1024 * 1024
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 0.5  # seconds, doubled after every failed attempt
+UPLOAD_TICK_SECONDS = 0.25
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def copy_verified(src, dst, verify_hash=False, retries=UPLOAD_RETRIES, progress=None):
+    """Worker: copy src to dst through <dst>.upload, check the size (and the
+    hash, read back from the share) before os.replace. Retries with backoff.
+    `progress(n)` gets bytes sent, negative when a failed attempt is rolled back."""
+    size = os.path.getsize(src)
+    tmp = dst + ".upload"
+    for attempt in range(retries + 1):
+        sent = 0
+        try:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            h = hashlib.blake2b(digest_size=16)
+            with open(src, 'rb') as fi, open(tmp, 'wb', buffering=UPLOAD_CHUNK) as fo:
+                for chunk in iter(lambda: fi.read(UPLOAD_CHUNK), b""):
+                    fo.write(chunk)
+                    h.update(chunk)
+                    sent += len(chunk)
+                    if progress:
+                        progress(len(chunk))
+            if os.path.getsize(tmp) != size:
+                raise OSError(f"size mismatch after copy: {os.path.getsize(tmp)} != {size}")
+            if verify_hash and file_digest(tmp) != h.hexdigest():
+                raise OSError("hash mismatch after copy")
+            os.replace(tmp, dst)
+            return size
+        except OSError as e:
+            if progress and sent:
+                progress(-sent)
             try:
-                nodes = mat.node_tree.nodes
-            except Exception as e:
-                failed.append((mat.name, f"Không đọc node_tree: {e}"))
-                continue
+                os.remove(tmp)
+            except OSError:
+                pass
+            if attempt == retries:
+                raise
+            print(f"[QUP] Upload {dst} failed ({e}), retry {attempt + 1}/{retries}")
+            time.sleep(UPLOAD_BACKOFF * 2 ** attempt)
 
-            for node in nodes:
-                try:
-                    if node.type != 'TEX_IMAGE':
-                        continue
-                    img = getattr(node, "image", None)
-                    if not img:
-                        continue
-                    if not getattr(img, "packed_file", None):
-                        continue  # only packed
-
-                    map_type = map_type_from_link(mat, node)
-                    map_type_clean = sanitize_filename(map_type)
-
-                    key = (mat_name_clean, map_type_clean, img.name)
-                    if key in exported_keys:
-                        continue
-
-                    base_name = f"{mat_name_clean}_{map_type_clean}"
-                    filename = base_name + ext
-                    filepath = os.path.join(mat_folder, filename)
-                    filepath = ensure_unique_path(filepath)
-
-                    # set and save
+def profiled_copy(*args):
+    with PROFILE.stage("upload.copy"):
+        return copy_verified(*args)
+
+class StagedUploader:
+    """Staged writes: the export encodes into a local scratch dir at full speed,
+    copier threads then move every file to the (network) export dir with
+    several concurrent streams. A job's on_done (manifest record, blob
+    publish) only runs once its copy is verified."""
+
+    def __init__(self, export_dir, failed, streams=4, scratch="", verify_hash=False):
+        self.export_dir = export_dir
+        self.failed = failed
+        self.streams = max(1, streams)
+        self.scratch = scratch
+        self.verify_hash = verify_hash
+        self.root = None  # local staging dir, created on first use
+        self.executor = None
+        self.pending = deque()  # (label, local, dest, future, then)
+        self.lock = threading.Lock()
+        self.total = 0
+        self.total_bytes = 0
+        self.sent_bytes = 0
+        self.uploaded = 0
+        self.errors = 0
+        self.staging = True  # export still writing; False once every job is staged
+        self.on_finished = None  # called after the last verified copy (manifest save)
+
+    def local_path(self, dest):
+        """Staging path mirroring `dest` below the export dir"""
+        if self.root is None:
+            self.root = tempfile.mkdtemp(prefix="qup_stage_", dir=self.scratch or None)
+            self.executor = ThreadPoolExecutor(max_workers=self.streams, thread_name_prefix="qup_upload")
+        local = os.path.join(self.root, os.path.relpath(dest, self.export_dir))
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        return local
+
+    def stage(self, label, dest, on_done):
+        """Write target + on_done for a job: write locally, upload when written"""
+        local = self.local_path(dest)
+
+        def staged(local=local):
+            self.upload(label, local, dest, on_done)
+        return local, staged
+
+    def progress(self, n):
+        with self.lock:
+            self.sent_bytes += n
+
+    def upload(self, label, local, dest, then=None):
+        size = os.path.getsize(local)
+        self.total += 1
+        self.total_bytes += size
+        fut = self.executor.submit(profiled_copy, local, dest, self.verify_hash, UPLOAD_RETRIES, self.progress)
+        self.pending.append((label, local, dest, fut, then))
+
+    def collect_one(self):
+        label, local, dest, fut, then = self.pending.popleft()
+        try:
+            fut.result()
+            if then:
+                then()
+            self.uploaded += 1
+        except Exception as e:
+            self.errors += 1
+            self.failed.append((label, f"upload {dest}: {e}"))
+            print(f"[QUP] Upload failed {local} -> {dest}: {e}")
+        try:
+            os.remove(local)
+        except OSError:
+            pass
+
+    def collect_ready(self):
+        while self.pending and self.pending[0][3].done():
+            self.collect_one()
+
+    def busy(self):
+        return self.staging or bool(self.pending)
+
+    def close(self):
+        """Wait for every copy, run on_finished, drop the staging dir"""
+        self.staging = False
+        try:
+            while self.pending:
+                self.collect_one()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+        finally:
+            if self.root is not None:
+                shutil.rmtree(self.root, ignore_errors=True)
+            if self.on_finished:
+                self.on_finished()
+
+    def progress_info(self):
+        fraction = self.sent_bytes / self.total_bytes if self.total_bytes else 0.0
+        return {
+            "done": self.uploaded,
+            "total": self.total,
+            "fraction": min(fraction, 1.0),
+            "bytes_sent": self.sent_bytes,
+            "total_bytes": self.total_bytes,
+        }
+
+# ---------- Plan (dry run + cost estimate) ----------
+# encoded size / raw 8-bit size, only used for the estimate
+SIZE_RATIO = {'PNG': 0.6, 'JPEG': 0.15, 'TARGA': 1.0}
+def source_size(img, data):
+    """(width, height, channels) of a packed image, from the header when possible"""
+    size = header_size(data, packed_format(img, data))
+    if size is None:
+        width, height = img.size
+        size = (width, height, 4 if getattr(img, "depth", 32) == 32 else 3)
+    return size
+
+def encoded_bytes(width, height, channels, fmt):
+    if fmt == 'JPEG':
+        channels = min(channels, 3)
+    return int(width * height * channels * SIZE_RATIO.get(fmt, 1.0))
+
+def estimate_job(img, fmt, data, action):
+    """(width, height, estimated output bytes) of one job"""
+    width, height, channels = source_size(img, data)
+    if action == "copy":
+        return width, height, len(data)
+    return width, height, encoded_bytes(width, height, channels, fmt)
+
+def job_memory(img, action, width, height, data, had_data):
+    """Peak bytes one job holds: the packed bytes for a copy, else Blender's
+    decoded buffer (only if the export has to load it) + float32 snapshot"""
+    if action == "copy":
+        return len(data)
+    decoded = 0 if had_data else decoded_bytes(img, width, height)
+    if action == "save":
+        return decoded
+    return decoded + width * height * getattr(img, "channels", 4) * 4
+
+def plan_packed_maps(scene, mats_to_process, export_dir, manifest, failed):
+    """Decide every output up front, without writing anything: target path,
+    map type, action (copy / encode / save / skip), resolution and estimated bytes.
+    Collisions are resolved against manifest.names (one listing per folder)."""
+    fmt = scene.qup_format  # 'PNG','JPEG','TARGA'
+    ext_map = {'PNG': '.png', 'JPEG': '.jpg', 'TARGA': '.tga'}
+    ext = ext_map.get(fmt, '.png')
+
+    plan = []
+    exported_keys = set()  # prevent dupe exports: (mat_clean, map_type, img.name)
+    names = manifest.names
+    map_type_cache = {}  # material name -> {tex node name: map type}
+
+    for mat in mats_to_process:
+        if mat is None:
+            continue
+        if not getattr(mat, "use_nodes", False):
+            continue
+
+        mat_name_clean = sanitize_filename(mat.name)
+        mat_folder = os.path.join(export_dir, mat_name_clean)
+        try:
+            nodes = mat.node_tree.nodes
+        except Exception as e:
+            failed.append((mat.name, f"Không đọc node_tree: {e}"))
+            continue
+        PROFILE.count("materials")
+        with PROFILE.stage("plan.map_types"):
+            map_types = material_map_types(mat, map_type_cache)
+
+        for node in nodes:
+            try:
+                if node.type != 'TEX_IMAGE':
+                    continue
+                img = getattr(node, "image", None)
+                if not img:
+                    continue
+                if not getattr(img, "packed_file", None):
+                    continue  # only packed
+
+                map_type = map_types.get(node.name) or map_type_from_link(mat, node)
+                map_type_clean = sanitize_filename(map_type)
+
+                key = (mat_name_clean, map_type_clean, img.name)
+                if key in exported_keys:
+                    continue
+                exported_keys.add(key)
+
+                PROFILE.count("images")
+                had_data = image_has_data(img)
+                data = img.packed_file.data
+                with PROFILE.stage("plan.hash"):
+                    content_hash = packed_content_hash(img, data)
+                record = {
+                    "key": list(key),
+                    "source": {"name": img.name, "filepath": img.filepath or ""},
+                    "hash": content_hash,
+                    "format": fmt,
+                }
+                if scene.qup_lod_levels:
+                    record["lod"] = [scene.qup_lod_levels, scene.qup_lod_min_size, scene.qup_lod_filter]
+
+                # rerun: reuse this key's previous output (skip it if unchanged)
+                filepath = manifest.previous_path(key, ext)
+                reused = bool(filepath) and names.key(filepath) not in names.reserved
+                if reused:
+                    names.reserve(filepath)
+                else:
+                    filepath = os.path.join(mat_folder, f"{mat_name_clean}_{map_type_clean}{ext}")
+                    with PROFILE.stage("plan.unique_path"):
+                        filepath = names.unique(filepath)
+                lods = []
+                if scene.qup_lod_levels:
+                    lods = plan_lods(filepath, *source_size(img, data), fmt, scene, record)
+                    for lod in lods:
+                        names.reserve(lod["path"])
+                action = None
+                if reused and all(manifest.is_current(lod["path"], lod["record"]) for lod in lods) \
+                        and manifest.skip(filepath, record):
+                    action = "skip"
+
+                if action is None:
+                    raw = None
                     try:
-                        img.filepath_raw = filepath
-                        # try set file_format safely
-                        try:
-                            img.file_format = fmt
-                        except Exception:
-                            img.file_format = 'PNG'
-                        img.save()
-                        exported += 1
-                        exported_keys.add(key)
-                    except Exception as e_img:
-                        tb = traceback.format_exc()
-                        failed.append((img.name, str(e_img)))
-                        print(f"[QUP] Failed saving image {img.name} -> {filepath}: {e_img}")
-                        print(tb)
-                except Exception as e_node:
-                    tb = traceback.format_exc()
-                    failed.append((getattr(node, "name", "node"), str(e_node)))
-                    print(f"[QUP] Node loop error in material {mat.name}: {e_node}")
-                    print(tb)
+                        with PROFILE.stage("plan.copy_check"):
+                            raw = can_copy_packed(img, fmt, data)
+                    except Exception as e_raw:
+                        print(f"[QUP] Raw copy check failed for {img.name}, re-encoding: {e_raw}")
+                    if raw is not None:
+                        action = "copy"
+                    elif fmt in THREAD_FORMATS and not getattr(img, "is_float", False):
+                        action = "encode"
+                    else:
+                        action = "save"
+
+                width, height, est = estimate_job(img, fmt, data, action)
+                memory = job_memory(img, action, width, height, data, had_data)
+                if lods and action != "skip":
+                    # the chain needs the decoded pixels even when the file itself is a copy
+                    lod_memory = job_memory(img, "encode", width, height, data, had_data)
+                    memory = memory + lod_memory if action == "copy" else max(memory, lod_memory)
+                free_if_loaded_here(img, had_data)  # img.size fallback may have decoded it
+                plan.append({
+                    "label": img.name,
+                    "image": img,
+                    "material": mat.name,
+                    "map_type": map_type_clean,
+                    "path": filepath,
+                    "format": fmt,
+                    "action": action,
+                    "width": width,
+                    "height": height,
+                    "bytes": est,
+                    "memory": memory,
+                    "record": record,
+                    "lods": lods,
+                    "lod_mode": lod_mode(map_type_clean, img),
+                    "lod_filter": scene.qup_lod_filter,
+                })
+            except Exception as e_node:
+                tb = traceback.format_exc()
+                failed.append((getattr(node, "name", "node"), str(e_node)))
+                print(f"[QUP] Node loop error in material {mat.name}: {e_node}")
+                print(tb)
+    return plan
+
+def plan_summary(plan):
+    """JSON-friendly view of a plan + totals (dry run report, batch CLI)"""
+    jobs = []
+    totals = Counter()
+    for job in plan:
+        reencode = job["action"] in ("encode", "save")
+        jobs.append({
+            "path": job["path"],
+            "material": job["material"],
+            "map_type": job["map_type"],
+            "format": job["format"],
+            "resolution": [job["width"], job["height"]],
+            "bytes": job["bytes"],
+            "action": job["action"],
+            "reencode": reencode,
+        })
+        if job.get("lods"):
+            jobs[-1]["lods"] = [{"path": lod["path"], "resolution": [lod["width"], lod["height"]],
+                                 "bytes": lod["bytes"]} for lod in job["lods"]]
+        totals[job["action"]] += 1
+        if job["action"] == "skip":
+            continue
+        totals["jobs"] += job_files(job)
+        if job["action"] in ("link", "dedupe"):
+            totals["dedupe_bytes"] += job["bytes"]  # served from the blob store
+        else:
+            totals["bytes"] += job_bytes(job)
+            totals["reencode"] += reencode + len(job.get("lods", ()))
+    return {"jobs": jobs, "totals": {k: totals[k] for k in
+                                     ("jobs", "copy", "encode", "save", "link", "dedupe", "skip",
+                                      "reencode", "bytes", "dedupe_bytes")}}
+
+def print_plan(summary, export_dir):
+    print(f"[QUP] Dry run → {export_dir}")
+    for job in summary["jobs"]:
+        width, height = job["resolution"]
+        print(f"[QUP]   {job['action']:<6} {job['map_type']:<10} {job['format']:<5} "
+              f"{width}x{height:<6} ~{job['bytes'] / 1048576:8.2f} MB  {job['path']}")
+        for lod in job.get("lods", ()):
+            w, h = lod["resolution"]
+            print(f"[QUP]            LOD {w}x{h:<6} ~{lod['bytes'] / 1048576:8.2f} MB  {lod['path']}")
+    t = summary["totals"]
+    print(f"[QUP] {t['jobs']} file ({t['copy']} copy, {t['reencode']} encode lại, "
+          f"{t['link'] + t['dedupe']} dùng chung nội dung), bỏ qua {t['skip']}, "
+          f"ước tính ~{t['bytes'] / 1048576:.1f} MB (tiết kiệm ~{t['dedupe_bytes'] / 1048576:.1f} MB)")
+
+def run_job(job, pool, manifest, store, archive=None, uploader=None):
+    """Queue one planned job: snapshot on the main thread, encode/write in the pool.
+    Blob carriers write <blob>.part and link their outputs once it is done.
+    With an archive the bytes go into entries instead (a dedupe group is one
+    payload under several names). With an uploader the job writes into the
+    staging dir and on_done waits for the verified copy."""
+    img, filepath, fmt = job["image"], job["path"], job["format"]
+    save = save_with_blender
+    if archive is not None:
+        names = [archive.name(path) for path, _ in job.get("links", [(filepath, None)])]
+        target = ArchiveEntry(archive, names)
+        save = save_to_entry
+
+        def on_done(entry=target):
+            extra = len(entry.names) - 1
+            store.deduped += extra
+            store.saved += entry.size * extra
+            if extra:
+                store.linked["tar hardlink" if archive.kind == 'TAR_ZST' else "zip entry"] += extra
+    elif job.get("blob"):
+        if job["action"] == "link":
+            pool.run_inline(img.name, filepath, store.publish, job, manifest, kind="linked", weight=job["bytes"])
+            return
+        target = job["blob"] + ".part"
+
+        def on_done(job=job):
+            store.publish(job, manifest)
+    else:
+        target = filepath
+
+        def on_done(filepath=filepath, record=job["record"]):
+            manifest.record(filepath, record)
+    if uploader is not None and archive is None:
+        target, on_done = uploader.stage(img.name, target, on_done)
+    lods = []  # (lod, target, on_done) per level
+    for lod in job.get("lods", ()):
+        if archive is not None:
+            lods.append((lod, ArchiveEntry(archive, [archive.name(lod["path"])]), None))
+            continue
+
+        def lod_done(filepath=lod["path"], record=lod["record"]):
+            manifest.record(filepath, record)
+        lod_target, lod_done = lod["path"], lod_done
+        if uploader is not None:
+            lod_target, lod_done = uploader.stage(img.name, lod_target, lod_done)
+        lods.append((lod, lod_target, lod_done))
+
+    copied = False
+    if job["action"] == "copy":
+        # re-check: the image may have been edited since planning
+        raw = can_copy_packed(img, fmt)
+        if raw is not None:
+            PROFILE.count("bytes_read", len(raw))
+            pool.submit(img.name, filepath, write_packed_bytes, raw, target,
+                        kind="copied", on_done=on_done, weight=job["bytes"], memory=len(raw))
+            if not lods:
+                return
+            copied = True  # the LOD chain still needs the decoded pixels
+
+    # decoding happens here (img.pixels / img.save()); drop it again right after
+    had_data = image_has_data(img)
+    decoded = 0 if had_data else decoded_bytes(img, job["width"], job["height"])
+    pool.budget.acquire(decoded)
+    try:
+        snap = snapshot_pixels(img, fmt) if job["action"] != "save" else None
+        if snap is not None:
+            if not copied:
+                pool.submit(img.name, filepath, encode_and_write, target, fmt, *snap,
+                            on_done=on_done, weight=job["bytes"], memory=snap[0].nbytes)
+            submit_lods(job, pool, lods, quantize_snapshot, *snap)
+        else:
+            if not copied:
+                pool.run_inline(img.name, filepath, save, img, target, fmt,
+                                on_done=on_done, weight=job["bytes"])
+            if lods:
+                save_lods_inline(job, pool, lods, read_pixels(img), getattr(img, "is_float", False))
+    finally:
+        free_if_loaded_here(img, had_data)
+        pool.budget.release(decoded)
+
+# ---------- Execution (blocking, or stepped from a modal timer) ----------
+class QUPExportRun(ExportRun):
+    """ExportRun of packed maps. With an uploader the jobs write into the staging
+    dir and the manifest follows the last verified copy to export_dir."""
+
+    profile_keys = ExportRun.profile_keys + ("copied", "uploaded")
+
+    def __init__(self, plan, manifest, workers=0, memory_mb=0, store=None, archive=None, failed=None,
+                 uploader=None):
+        super().__init__(plan, manifest, workers, memory_mb, store, archive, failed=failed)
+        self.uploader = uploader  # StagedUploader: write locally, copy to export_dir in the background
+
+    def queue(self, job):
+        run_job(job, self.pool, self.manifest, self.store, self.archive, self.uploader)
+
+    def close_folder(self):
+        if self.uploader is None:
+            super().close_folder()
+            return
+        # everything is staged; the manifest (and the profile) follow the last verified copy
+        self.uploader.staging = False
+        self.uploader.on_finished = super().close_folder
+
+    def result(self):
+        return dict(
+            super().result(),
+            copied=self.pool.counts["copied"],
+            uploaded=self.uploader.uploaded if self.uploader is not None else 0,
+            upload_pending=len(self.uploader.pending) if self.uploader is not None else 0,
+        )
+
+# ---------- Export ----------
+def resolve_export_dir(raw_path, create=True):
+    """Resolve + create export dir, with local fallback.
+    Returns (export_dir, warning, error). create=False (dry run) only resolves."""
+    # resolve path (support //)
+    export_dir = bpy.path.abspath(raw_path)
+    if not create:
+        return export_dir, "", ""
+
+    # attempt create
+    ok, used_path, msg = safe_makedirs(export_dir)
+    if ok:
+        return export_dir, "", ""
+    # fallback: if .blend saved use //qup_unpacked_textures, else Desktop fallback
+    print(f"[QUP] Cannot create export_dir {export_dir}: {msg}")
+    if bpy.data.filepath:
+        fallback = bpy.path.abspath("//qup_unpacked_textures")
+    else:
+        fallback = os.path.join(os.path.expanduser("~"), "Desktop", "qup_unpacked_textures")
+    ok2, used2, msg2 = safe_makedirs(fallback)
+    if not ok2:
+        print("[QUP] Fallback also failed:", msg2)
+        return None, "", f"Không tạo được thư mục export: {msg}\nFallback failed: {msg2}"
+    return fallback, f"Không truy cập được đường dẫn đã chọn. Sẽ xuất sang: {fallback}", ""
+
+def gather_materials(obj, only_selected):
+    """Materials to process. Returns (materials, error)."""
+    if not only_selected:
+        return [m for m in bpy.data.materials if m is not None], ""
+    if not obj:
+        return [], "Không có object đang chọn."
+    # collect materials from object (active or slots)
+    mats = []
+    if getattr(obj, "active_material", None):
+        mats.append(obj.active_material)
+    for slot in getattr(obj, "material_slots", []):
+        if slot.material and slot.material not in mats:
+            mats.append(slot.material)
+    if not mats:
+        return [], "Object đang chọn không có material hợp lệ."
+    return mats, ""
+
+def start_export(scene, mats_to_process, export_dir):
+    """Plan an export of `mats_to_process`; returns its ExportRun (nothing written yet).
+    Archive output rewrites the whole archive: no incremental skip, no blobs on disk."""
+    failed = []
+    PROFILE.start(scene.qup_profile)
+    archive = None
+    if scene.qup_output != 'FOLDER':
+        archive = ArchiveWriter(export_dir, scene.qup_output, scene.qup_archive_level)
+    manifest = ExportManifest(export_dir, scene.qup_incremental and archive is None, on_disk=archive is None)
+    with PROFILE.stage("plan"):
+        plan = plan_packed_maps(scene, mats_to_process, export_dir, manifest, failed)
+    store = BlobStore(export_dir, scene.qup_dedupe)
+    with PROFILE.stage("plan.dedupe"):
+        dedupe_plan(plan, store, manifest.names, reuse=archive is None)
+    uploader = None
+    if scene.qup_staged and archive is None:
+        scratch = bpy.path.abspath(scene.qup_stage_dir) if scene.qup_stage_dir else ""
+        uploader = StagedUploader(export_dir, failed, scene.qup_upload_streams, scratch, scene.qup_upload_verify)
+    return QUPExportRun(plan, manifest, scene.qup_workers, scene.qup_memory_budget, store, archive, failed,
+                        uploader)
+
+def export_packed_maps(scene, mats_to_process, export_dir, dry_run=False):
+    """Export packed textures of `mats_to_process` into export_dir/<Material>/.
+    With dry_run only the plan is built and printed, nothing is written.
+    Returns counts + failed list + plan summary (used by the operator and the batch CLI)."""
+    run = start_export(scene, mats_to_process, export_dir)
+    if dry_run:
+        summary = plan_summary(run.plan)
+        archive = run.archive.path if run.archive is not None else None
+        print_plan(summary, archive or export_dir)
+        return {
+            "dry_run": True,
+            "plan": summary,
+            "exported": 0,
+            "copied": 0,
+            "skipped": run.manifest.skipped,
+            "failed": run.failed,
+            "export_dir": export_dir,
+            "archive": archive,
+            "profile": dry_run_profile(),
+        }
+
+    try:
+        while run.jobs:
+            run.run_next()
+    finally:
+        run.finish()
+        if run.uploader is not None:
+            run.uploader.close()  # blocking callers (scripts, batch CLI) wait for the copies
+    return run.result()
+
+# ---------- Operator ----------
+EXPORT_STATE["upload"] = None  # background copy after a staged export (read by the panel)
+
+def upload_tick():
+    """bpy.app.timers callback: collect verified copies, finish once all are done"""
+    uploader = EXPORT_STATE["upload"]
+    if uploader is None:
+        return None
+    uploader.collect_ready()
+    tag_redraw_panels(bpy.context)
+    if uploader.pending:
+        return UPLOAD_TICK_SECONDS
+    EXPORT_STATE["upload"] = None
+    uploader.close()
+    print(f"[QUP] Upload done: {uploader.uploaded}/{uploader.total} file → {uploader.export_dir}"
+          + (f", {uploader.errors} lỗi (xem Console)" if uploader.errors else ""))
+    return None
+
+def start_upload_tick(uploader):
+    """Copies still running after staging: keep collecting them from a timer"""
+    if not uploader.pending:
+        uploader.close()
+        return
+    EXPORT_STATE["upload"] = uploader
+    bpy.app.timers.register(upload_tick, first_interval=UPLOAD_TICK_SECONDS)
+
+class QUP_OT_export_packed_maps(bpy.types.Operator):
+    bl_idname = "qup.export_packed_maps"
+    bl_label = "Xuất Packed Maps"
+    bl_description = ("Xuất các texture đã pack theo từng thư mục material, tên: Material_MapType.ext. "
+                      "Chạy nền, Esc để hủy")
+
+    _timer = None
+    _run = None
+
+    @classmethod
+    def poll(cls, context):
+        # one export at a time, also while the previous one is still copying
+        return EXPORT_STATE["run"] is None and EXPORT_STATE["upload"] is None
+
+    def prepare(self, context):
+        """Resolve dir + materials. Returns (export_dir, materials) or None after reporting."""
+        scene = context.scene
+        raw_path = scene.qup_export_dir
+        if not raw_path:
+            self.report({'ERROR'}, "Chưa chọn thư mục xuất!")
+            return None
+
+        if scene.qup_output == 'TAR_ZST' and zstd_module() is None:
+            self.report({'ERROR'}, ZSTD_MISSING)
+            return None
+        # archive output only needs the archive's parent folder, created on the first entry
+        export_dir, warning, error = resolve_export_dir(
+            raw_path, create=not scene.qup_dry_run and scene.qup_output == 'FOLDER')
+        if error:
+            self.report({'ERROR'}, error)
+            return None
+        if warning:
+            self.report({'WARNING'}, warning)
+
+        # gather materials to process
+        mats_to_process, error = gather_materials(context.object, scene.qup_only_selected)
+        if error:
+            self.report({'ERROR'}, error)
+            return None
+        return export_dir, mats_to_process
+
+    def report_result(self, result):
+        exported, copied, failed = result["exported"], result["copied"], result["failed"]
+        export_dir = result.get("archive") or result["export_dir"]
 
         # reporting
-        if exported:
-            self.report({'INFO'}, f"Đã xuất {exported} texture → {export_dir}")
+        if result.get("dry_run"):
+            t = result["plan"]["totals"]
+            self.report({'INFO'}, f"Dry run: {t['jobs']} file ({t['copy']} copy, {t['reencode']} encode lại, "
+                                  f"{t['link'] + t['dedupe']} dùng chung), bỏ qua {t['skip']}, "
+                                  f"ước tính ~{t['bytes'] / 1048576:.1f} MB → {export_dir} (xem Console)")
+        elif result.get("cancelled"):
+            self.report({'WARNING'}, f"Đã hủy: xuất xong {exported} texture trước khi dừng → {export_dir}")
+        elif exported or result["skipped"]:
+            encoded = exported - copied - result["deduped"]
+            self.report({'INFO'}, f"Đã xuất {exported} texture ({copied} copy nguyên bản, {encoded} encode lại), "
+                                  f"bỏ qua {result['skipped']} không đổi, RAM pixel đỉnh ~{result['peak_memory'] / 1048576:.0f} MB "
+                                  f"→ {export_dir}")
+            if result["deduped"]:
+                modes = ", ".join(f"{n} {m}" for m, n in result["link_modes"].items())
+                self.report({'INFO'}, f"{result['deduped']} file dùng chung nội dung ({modes}), "
+                                      f"tiết kiệm ~{result['dedupe_saved_bytes'] / 1048576:.1f} MB")
         else:
             self.report({'WARNING'}, "Không tìm thấy texture packed để xuất.")
+        if result.get("upload_pending"):
+            self.report({'INFO'}, f"Đang copy nền {result['upload_pending']} file lên {export_dir} (tiến trình trong panel)")
+        if result.get("profile"):
+            self.report({'INFO'}, f"Profiling: {result['profile']['wall_seconds']:.2f} s "
+                                  f"(tóm tắt trong panel, report JSON/CSV: xem Console)")
 
         if failed:
             self.report({'WARNING'}, f"Có {len(failed)} lỗi khi xuất (xem Console).")
@@ -224,8 +2190,68 @@ class QUP_OT_export_packed_maps(bpy.types.Operator):
             for fentry in failed:
                 print(fentry)
 
+    def execute(self, context):
+        """Blocking export (scripts, redo)"""
+        prepared = self.prepare(context)
+        if prepared is None:
+            return {'CANCELLED'}
+        export_dir, mats_to_process = prepared
+        self.report_result(export_packed_maps(context.scene, mats_to_process, export_dir,
+                                              dry_run=context.scene.qup_dry_run))
         return {'FINISHED'}
 
+    def invoke(self, context, event):
+        """From the UI: plan now, write from a timer so Blender stays usable"""
+        if context.scene.qup_dry_run:
+            return self.execute(context)
+        prepared = self.prepare(context)
+        if prepared is None:
+            return {'CANCELLED'}
+        export_dir, mats_to_process = prepared
+        self._run = start_export(context.scene, mats_to_process, export_dir)
+        if not self._run.jobs:
+            self._run.finish()
+            if self._run.uploader is not None:
+                self._run.uploader.close()
+            self.report_result(self._run.result())
+            return {'FINISHED'}
+
+        EXPORT_STATE["run"] = self._run
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(MODAL_TIMER_SECONDS, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self._run.cancel()
+            self.finish_modal(context)
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        done = self._run.step()
+        tag_redraw_panels(context)
+        if done:
+            self.finish_modal(context)
+            return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+    def cancel(self, context):
+        # modal aborted by Blender (file load, window closed)
+        self._run.cancel()
+        self.finish_modal(context)
+
+    def finish_modal(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        try:
+            self._run.finish()
+        finally:
+            EXPORT_STATE["run"] = None
+            if self._run.uploader is not None:
+                start_upload_tick(self._run.uploader)  # staging done: return, copy in the background
+        self.report_result(self._run.result())
+        tag_redraw_panels(context)
+
 
 # ---------- UI Panel in N-Panel ----------
 class QUP_PT_panel(bpy.types.Panel):
@@ -242,7 +2268,50 @@ class QUP_PT_panel(bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(scene, "qup_format", text="Định dạng")
         row.prop(scene, "qup_only_selected", text="Chỉ material chọn")
+        row = layout.row(align=True)
+        row.prop(scene, "qup_workers", text="Số luồng")
+        row.prop(scene, "qup_incremental", text="Chỉ xuất thay đổi")
+        layout.prop(scene, "qup_memory_budget", text="RAM tối đa (MB)")
+        layout.prop(scene, "qup_dedupe", text="Gộp texture trùng nội dung (hardlink)")
+        row = layout.row(align=True)
+        row.prop(scene, "qup_lod_levels", text="Mức LOD")
+        sub = row.row(align=True)
+        sub.enabled = scene.qup_lod_levels > 0
+        sub.prop(scene, "qup_lod_filter", text="")
+        if scene.qup_lod_levels:
+            layout.prop(scene, "qup_lod_min_size", text="Cạnh nhỏ nhất (px)")
+        row = layout.row(align=True)
+        row.prop(scene, "qup_output", text="Xuất ra")
+        sub = row.row(align=True)
+        sub.enabled = scene.qup_output != 'FOLDER'
+        sub.prop(scene, "qup_archive_level", text="Mức nén")
+        layout.prop(scene, "qup_staged", text="Ghi vào ổ local trước, copy lên share sau")
+        if scene.qup_staged:
+            box = layout.box()
+            box.prop(scene, "qup_stage_dir", text="Thư mục tạm")
+            row = box.row(align=True)
+            row.prop(scene, "qup_upload_streams", text="Luồng copy")
+            row.prop(scene, "qup_upload_verify", text="Kiểm tra hash")
+        row = layout.row(align=True)
+        row.prop(scene, "qup_dry_run", text="Dry run (chỉ ước tính, không ghi)")
+        row.prop(scene, "qup_profile", text="Đo thời gian")
         layout.operator("qup.export_packed_maps", icon="EXPORT")
+        run = EXPORT_STATE["run"]
+        if run is not None:
+            p = run.progress()
+            text = f"{p['done']}/{p['total']} · {p['bytes_written'] / 1048576:.1f} MB"
+            if p["eta"] is not None:
+                text += f" · còn ~{format_eta(p['eta'])}"
+            layout.progress(factor=p["fraction"], type='BAR', text=text)
+            layout.label(text="Đang xuất… Esc để hủy", icon='CANCEL')
+        uploader = EXPORT_STATE["upload"]
+        if uploader is not None:
+            p = uploader.progress_info()
+            layout.progress(factor=p["fraction"], type='BAR',
+                            text=f"Copy lên share {p['done']}/{p['total']} · "
+                                 f"{p['bytes_sent'] / 1048576:.1f}/{p['total_bytes'] / 1048576:.1f} MB")
+        if scene.qup_profile and EXPORT_STATE["profile"] and run is None:
+            draw_profile(layout.box(), EXPORT_STATE["profile"])
         layout.separator()
         layout.label(text="Tên file: Material_MapType.ext")
         layout.label(text="Map types: BaseColor, Roughness, Metallic, Normal, Alpha, Misc")
@@ -274,10 +2343,116 @@ def register():
         description="Nếu bật: chỉ xuất material của object đang chọn (active + slots)",
         default=False
     )
+    bpy.types.Scene.qup_incremental = bpy.props.BoolProperty(
+        name="Incremental",
+        description="Bỏ qua file có nguồn và nội dung không đổi so với lần xuất trước (theo manifest)",
+        default=True
+    )
+    bpy.types.Scene.qup_workers = bpy.props.IntProperty(
+        name="Workers",
+        description="Số luồng encode/ghi file song song (0 = theo số CPU)",
+        default=0,
+        min=0,
+        max=64
+    )
+    bpy.types.Scene.qup_memory_budget = bpy.props.IntProperty(
+        name="Memory Budget (MB)",
+        description="Giới hạn RAM pixel mà lần xuất giữ cùng lúc (buffer đã decode + buffer chờ ghi). "
+                    "Ảnh lớn hơn giới hạn vẫn được xuất, nhưng một mình. 0 = không giới hạn",
+        default=4096,
+        min=0
+    )
+    bpy.types.Scene.qup_dedupe = bpy.props.BoolProperty(
+        name="Dedupe",
+        description="Texture trùng nội dung chỉ ghi 1 lần vào thư mục ẩn .qup_blobs, các file còn lại là "
+                    "hardlink (hoặc reflink / symlink / bản copy nếu ổ đĩa không hỗ trợ)",
+        default=True
+    )
+    bpy.types.Scene.qup_lod_levels = bpy.props.IntProperty(
+        name="LOD Levels",
+        description="Xuất thêm N mức 1/2, 1/4, ... của mỗi texture (`_1024`, `_512`...), "
+                    "tính từ cùng buffer đã decode. 0 = tắt",
+        default=0,
+        min=0,
+        max=12
+    )
+    bpy.types.Scene.qup_lod_min_size = bpy.props.IntProperty(
+        name="LOD Min Size",
+        description="Không xuất mức LOD có cạnh dài nhỏ hơn giá trị này (px)",
+        default=64,
+        min=1
+    )
+    bpy.types.Scene.qup_lod_filter = bpy.props.EnumProperty(
+        name="LOD Filter",
+        items=[('BOX', 'Box', 'Trung bình 2x2: nhanh, hơi mềm'),
+               ('KAISER', 'Kaiser', 'Sinc cửa sổ Kaiser 8 tap: giữ chi tiết tốt hơn')],
+        default='BOX'
+    )
+    bpy.types.Scene.qup_output = bpy.props.EnumProperty(
+        name="Output",
+        description="Ghi file vào thư mục xuất, hoặc gói tất cả vào 1 archive cạnh thư mục đó "
+                    "(cùng cấu trúc Material/Material_MapType.ext, không tạo file trung gian)",
+        items=[('FOLDER', 'Thư mục', 'Ghi từng file vào thư mục xuất'),
+               ('ZIP', '.zip', 'Một file zip (PNG/JPEG lưu không nén lại)'),
+               ('TAR_ZST', '.tar.zst', 'Một file tar nén zstd (cần package zstandard)')],
+        default='FOLDER'
+    )
+    bpy.types.Scene.qup_archive_level = bpy.props.IntProperty(
+        name="Archive Level",
+        description="Mức nén archive: zip 0-9 (0 = không nén), zstd 1-22",
+        default=3,
+        min=0,
+        max=22
+    )
+    bpy.types.Scene.qup_staged = bpy.props.BoolProperty(
+        name="Staged Upload",
+        description="Encode vào thư mục tạm trên ổ local, rồi copy nền lên thư mục xuất (share mạng) "
+                    "bằng nhiều luồng, có thử lại và kiểm tra dung lượng. Nút xuất trả về ngay khi ghi local xong",
+        default=False
+    )
+    bpy.types.Scene.qup_stage_dir = bpy.props.StringProperty(
+        name="Staging Dir",
+        description="Thư mục local để ghi tạm (trống = thư mục temp của hệ thống)",
+        subtype='DIR_PATH',
+        default=""
+    )
+    bpy.types.Scene.qup_upload_streams = bpy.props.IntProperty(
+        name="Upload Streams",
+        description="Số file copy lên share cùng lúc",
+        default=4,
+        min=1,
+        max=16
+    )
+    bpy.types.Scene.qup_upload_verify = bpy.props.BoolProperty(
+        name="Verify Hash",
+        description="Sau khi copy, đọc lại file trên share để so hash (chậm hơn: tải lại toàn bộ dữ liệu). "
+                    "Dung lượng luôn được kiểm tra",
+        default=False
+    )
+    bpy.types.Scene.qup_dry_run = bpy.props.BoolProperty(
+        name="Dry Run",
+        description="Chỉ lập danh sách file sẽ xuất (đường dẫn, định dạng, độ phân giải, dung lượng ước tính), không ghi gì ra đĩa",
+        default=False
+    )
+    bpy.types.Scene.qup_profile = bpy.props.BoolProperty(
+        name="Profile",
+        description="Ghi thời gian từng giai đoạn + bộ đếm (ảnh, byte đọc/ghi, thời gian encode theo định dạng, "
+                    "số lần stat) vào qup_profile.json/.csv trong thư mục xuất, tóm tắt hiện trong panel",
+        default=False
+    )
 
 def unregister():
+    # finish a background copy before the add-on goes away
+    if bpy.app.timers.is_registered(upload_tick):
+        bpy.app.timers.unregister(upload_tick)
+    uploader, EXPORT_STATE["upload"] = EXPORT_STATE["upload"], None
+    if uploader is not None:
+        uploader.close()
     # delete props first
-    for prop in ("qup_export_dir", "qup_format", "qup_only_selected"):
+    for prop in ("qup_export_dir", "qup_format", "qup_only_selected", "qup_workers", "qup_incremental", "qup_dry_run",
+                 "qup_memory_budget", "qup_dedupe", "qup_output", "qup_archive_level", "qup_staged", "qup_stage_dir",
+                 "qup_upload_streams", "qup_upload_verify", "qup_lod_levels", "qup_lod_min_size", "qup_lod_filter",
+                 "qup_profile"):
         if hasattr(bpy.types.Scene, prop):
             try:
                 delattr(bpy.types.Scene, prop)
@@ -0,0 +1,240 @@
+"""blend_packed_reader against small .blend files written by BlendWriter"""
+
+import gzip
+import json
+import os
+import re
+import struct
+
+import pytest
+
+import blend_packed_reader as bpr
+
+# struct name -> [(type, field as written in SDNA)], nested structs first
+STRUCTS = {
+    "ListBase": [("void", "*first"), ("void", "*last")],
+    "ID": [("void", "*next"), ("void", "*prev"), ("char", "name[66]")],
+    "PackedFile": [("int", "size"), ("int", "seek"), ("void", "*data")],
+    "ImagePackedFile": [("ImagePackedFile", "*next"), ("ImagePackedFile", "*prev"),
+                        ("PackedFile", "*packedfile"), ("char", "filepath[1024]")],
+    "Image": [("ID", "id"), ("char", "filepath[1024]"), ("PackedFile", "*packedfile"),
+              ("ListBase", "packedfiles")],
+    "bNodeSocket": [("bNodeSocket", "*next"), ("bNodeSocket", "*prev"), ("char", "name[64]")],
+    "bNode": [("bNode", "*next"), ("bNode", "*prev"), ("char", "name[64]"), ("char", "idname[64]"),
+              ("char", "label[64]"), ("ID", "*id")],
+    "bNodeLink": [("bNodeLink", "*next"), ("bNodeLink", "*prev"), ("bNode", "*fromnode"),
+                  ("bNode", "*tonode"), ("bNodeSocket", "*fromsock"), ("bNodeSocket", "*tosock")],
+    "bNodeTree": [("ID", "id"), ("ListBase", "nodes"), ("ListBase", "links")],
+    "Material": [("ID", "id"), ("char", "use_nodes"), ("char", "pad[7]"), ("bNodeTree", "*nodetree")],
+}
+BASIC = {"char": 1, "int": 4, "void": 0}
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4 + b"odd"
+TGA = bytes(range(7, 250)) * 3 + b"\0" * 8 + bpr.TGA_FOOTER
+BIG_JPEG = b"\xff\xd8\xff\xe0" + bytes(i * 7 % 251 for i in range(bpr.SMALL_BLOCK + 12345))
+
+
+class BlendWriter:
+    """Little-endian .blend with 8-byte pointers; large=True writes the
+    Blender 5.0 header and LargeBHead8 block headers"""
+
+    def __init__(self, large=False):
+        self.large = large
+        self.blocks = []
+        self.last_ptr = 0x1000
+        self.types = list(BASIC) + list(STRUCTS)
+        self.names = list(dict.fromkeys(f for fields in STRUCTS.values() for _, f in fields))
+        self.lengths = dict(BASIC)
+        for name, fields in STRUCTS.items():
+            self.lengths[name] = sum(self.field_size(t, f) for t, f in fields)
+
+    def field_size(self, ftype, fname):
+        count = 1
+        for dim in re.findall(r"\[(\d+)\]", fname):
+            count *= int(dim)
+        return (8 if fname.startswith("*") else self.lengths[ftype]) * count
+
+    def ptr(self):
+        self.last_ptr += 0x10
+        return self.last_ptr
+
+    def pack(self, sname, **values):
+        out = b""
+        for ftype, fname in STRUCTS[sname]:
+            size = self.field_size(ftype, fname)
+            value = values.get(re.sub(r"\[.*", "", fname).strip("*"))
+            if fname.startswith("*"):
+                out += struct.pack("<Q", value or 0)
+            elif ftype in STRUCTS:
+                out += value or bytes(size)
+            elif "[" in fname:
+                out += (value or "").encode().ljust(size, b"\0")
+            else:
+                out += struct.pack("<b" if ftype == "char" else "<i", value or 0)
+        return out
+
+    def add(self, code, sname, data, ptr):
+        self.blocks.append((code, ptr, list(STRUCTS).index(sname) if sname else 0, data))
+
+    def image(self, name, payload, filepath):
+        img, ipf, pf, data = (self.ptr() for _ in range(4))
+        self.add(b"IM\0\0", "Image", self.pack("Image", id=self.pack("ID", name="IM" + name), filepath=filepath,
+                                               packedfiles=self.pack("ListBase", first=ipf, last=ipf)), img)
+        self.add(b"DATA", "ImagePackedFile", self.pack("ImagePackedFile", packedfile=pf, filepath=filepath), ipf)
+        self.add(b"DATA", "PackedFile", self.pack("PackedFile", size=len(payload), data=data), pf)
+        self.add(b"DATA", None, payload, data)
+        return img
+
+    def material(self, name, textures, use_nodes=True):
+        """textures: [(image pointer, node name, Principled BSDF input or None)]"""
+        mat, tree, bsdf = self.ptr(), self.ptr(), self.ptr()
+        nodes = [(bsdf, {"name": "Principled BSDF", "idname": "ShaderNodeBsdfPrincipled"})]
+        links, sockets = [], {}
+        for image, node_name, socket in textures:
+            node = self.ptr()
+            nodes.append((node, {"name": node_name, "idname": "ShaderNodeTexImage", "id": image}))
+            if socket:
+                sockets.setdefault(socket, self.ptr())
+                links.append((self.ptr(), node, sockets[socket]))
+        for i, (ptr, values) in enumerate(nodes):
+            self.add(b"DATA", "bNode", self.pack("bNode", next=nodes[i + 1][0] if i + 1 < len(nodes) else 0,
+                                                 **values), ptr)
+        for i, (ptr, node, socket) in enumerate(links):
+            self.add(b"DATA", "bNodeLink", self.pack("bNodeLink", next=links[i + 1][0] if i + 1 < len(links) else 0,
+                                                     fromnode=node, tonode=bsdf, tosock=socket), ptr)
+        for socket, ptr in sockets.items():
+            self.add(b"DATA", "bNodeSocket", self.pack("bNodeSocket", name=socket), ptr)
+        self.add(b"DATA", "bNodeTree", self.pack("bNodeTree", nodes=self.pack("ListBase", first=nodes[0][0]),
+                                                 links=self.pack("ListBase", first=links[0][0] if links else 0)), tree)
+        self.add(b"MA\0\0", "Material", self.pack("Material", id=self.pack("ID", name="MA" + name),
+                                                  use_nodes=int(use_nodes), nodetree=tree), mat)
+
+    def sdna(self):
+        def strings(tag, items):
+            return tag + struct.pack("<i", len(items)) + b"".join(s.encode() + b"\0" for s in items)
+
+        def align(data):
+            return data + bytes(-len(data) % 4)
+
+        dna = align(b"SDNA" + strings(b"NAME", self.names))
+        dna = align(dna + strings(b"TYPE", self.types))
+        dna = align(dna + b"TLEN" + struct.pack(f"<{len(self.types)}h", *(self.lengths[t] for t in self.types)))
+        dna += b"STRC" + struct.pack("<i", len(STRUCTS))
+        for name, fields in STRUCTS.items():
+            dna += struct.pack("<hh", self.types.index(name), len(fields))
+            for ftype, fname in fields:
+                dna += struct.pack("<hh", self.types.index(ftype), self.names.index(fname))
+        return dna
+
+    def tobytes(self):
+        out = b"BLENDER17-01v0500" if self.large else b"BLENDER-v402"
+        for code, ptr, sdna, data in self.blocks + [(b"DNA1", 0, 0, self.sdna()), (b"ENDB", 0, 0, b"")]:
+            data += bytes(-len(data) % 4)
+            if self.large:
+                out += struct.pack("<4siQqq", code, sdna, ptr, len(data), 1)
+            else:
+                out += struct.pack("<4siQii", code, len(data), ptr, sdna, 1)
+            out += data
+        return out
+
+
+def write_blend(path, data, compression):
+    if compression == "gzip":
+        data = gzip.compress(data)
+    elif compression == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        # Blender writes seekable zstd: one frame per chunk
+        cctx = zstandard.ZstdCompressor()
+        data = b"".join(cctx.compress(data[i:i + 65536]) for i in range(0, len(data), 65536))
+    path.write_bytes(data)
+    return str(path)
+
+def scene(large=False):
+    w = BlendWriter(large)
+    base = w.image("albedo.png", PNG, "//textures/albedo.png")
+    normal = w.image("normal", BIG_JPEG, "//textures/normal")
+    rough = w.image("rough", TGA, "//textures/rough")
+    w.material("Wood Floor.001", [(base, "Image Texture", "Base Color"),
+                                  (normal, "Image Texture.001", "Normal"),
+                                  (rough, "Roughness", None)])
+    return w
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+@pytest.mark.parametrize("large", [False, True], ids=["small_bhead", "large_bhead"])
+def test_extract_is_byte_identical(tmp_path, compression, large):
+    path = write_blend(tmp_path / "scene.blend", scene(large).tobytes(), compression)
+    out = tmp_path / "out"
+    rows = bpr.extract_packed_maps(path, str(out))
+
+    expected = {
+        "Wood_Floor_001/Wood_Floor_001_BaseColor.png": PNG,
+        "Wood_Floor_001/Wood_Floor_001_Normal.jpg": BIG_JPEG,
+        "Wood_Floor_001/Wood_Floor_001_Roughness.tga": TGA,
+    }
+    written = {p.relative_to(out).as_posix(): p.read_bytes() for p in out.rglob("*") if p.is_file()}
+    assert written == expected
+    assert [(r["material"], r["map_type"], r["bytes"]) for r in rows] == [
+        ("Wood Floor.001", "BaseColor", len(PNG)),
+        ("Wood Floor.001", "Normal", len(BIG_JPEG)),
+        ("Wood Floor.001", "Roughness", len(TGA)),
+    ]
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+def test_big_payloads_are_streamed_in_a_second_pass(tmp_path, compression):
+    path = write_blend(tmp_path / "scene.blend", scene().tobytes(), compression)
+    with bpr.BlendFile(path) as blend:
+        assert blend.compression == compression
+        big = [ref for ref in blend.blocks.values() if ref.length > bpr.SMALL_BLOCK]
+        assert len(big) == 1
+        # mmap slices on demand; compressed files keep only the sniffed ends
+        assert big[0].data is None
+        assert (big[0].head is not None) == (compression is not None)
+        assert bpr.payload_extension(*blend.payload_info(big[0].old)[1:]) == ".jpg"
+
+@pytest.mark.parametrize("large, exported", [(False, False), (True, True)], ids=["4.x", "5.0"])
+def test_materials_without_nodes_follow_qup(tmp_path, large, exported):
+    w = scene(large)
+    w.material("Flat", [(w.image("flat.png", PNG, "//flat.png"), "Image Texture", "Base Color")],
+               use_nodes=False)
+    path = write_blend(tmp_path / "scene.blend", w.tobytes(), None)
+    with bpr.BlendFile(path) as blend:
+        materials = {mat for mat, _, _, _ in bpr.plan_extraction(blend, str(tmp_path))}
+    assert materials == ({"Wood Floor.001", "Flat"} if exported else {"Wood Floor.001"})
+
+def test_same_map_type_gets_numbered_names(tmp_path):
+    w = BlendWriter()
+    first, second = w.image("a.png", PNG, "//a.png"), w.image("b.png", PNG, "//b.png")
+    w.material("M", [(first, "Image Texture", "Base Color"), (second, "Image Texture.001", "Base Color")])
+    path = write_blend(tmp_path / "scene.blend", w.tobytes(), None)
+    with bpr.BlendFile(path) as blend:
+        paths = [p for _, _, _, p in bpr.plan_extraction(blend, "out")]
+    assert paths == [os.path.join("out", "M", "M_BaseColor.png"), os.path.join("out", "M", "M_BaseColor_001.png")]
+
+def corrupt_dna(data):
+    strc = data.rindex(b"STRC")
+    return data[:strc + 4] + struct.pack("<i", 1 << 20) + data[strc + 8:]  # more structs than bytes
+
+@pytest.mark.parametrize("damage, compression", [
+    (lambda data: b"", None),
+    (corrupt_dna, None),
+    (lambda data: data[:len(data) // 2], "gzip"),
+    (lambda data: data[:len(data) // 2], "zstd"),
+    (lambda data: data[:8] + bytes(64) + data[72:], "zstd"),
+], ids=["empty", "dna1", "gzip_truncated", "zstd_truncated", "zstd_corrupt"])
+def test_damaged_files_raise_blend_error(tmp_path, damage, compression):
+    path = write_blend(tmp_path / "scene.blend", scene().tobytes(), compression)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(damage(data))
+    with pytest.raises(bpr.BlendError):
+        bpr.BlendFile(path)
+
+def test_cli_moves_on_after_a_damaged_file(tmp_path, capsys):
+    empty = tmp_path / "empty.blend"
+    empty.write_bytes(b"")
+    good = write_blend(tmp_path / "scene.blend", scene().tobytes(), None)
+    assert bpr.main([str(empty), good, "-o", str(tmp_path / "out"), "--list"]) == 1
+    out, err = capsys.readouterr()
+    assert str(empty) in err and json.loads(out)["file"] == good
@@ -0,0 +1,506 @@
+"""quick_export_core: vendored copies, encoders, resampling, LODs, presets, output
+names, manifest, blob store, archives, atlas packing"""
+
+import ast
+import builtins
+import io
+import os
+import shutil
+import struct
+import symtable
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+import quick_export_core as core
+
+ROOT = os.path.dirname(core.__file__)
+
+
+@pytest.mark.parametrize("addon", core.ADDONS)
+def test_addon_copy_is_in_sync(addon):
+    # fails after editing either copy by hand: run `python quick_export_core.py`
+    assert core.vendor(os.path.join(ROOT, addon), check=True)
+
+def module_names(source):
+    """Names a module binds at top level: imports, defs, classes, assignments"""
+    names = set()
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Assign):
+            names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    return names
+
+def global_reads(table):
+    """Global names read anywhere in a symbol table and its nested scopes"""
+    names = {sym.get_name() for sym in table.get_symbols()
+             if sym.is_referenced() and (sym.is_global() or table.get_type() == "module")}
+    for child in table.get_children():
+        names |= global_reads(child)
+    return names
+
+@pytest.mark.parametrize("addon", core.ADDONS)
+def test_addon_gets_only_its_sections_and_they_resolve(addon):
+    block = core.shared_block(core.ADDONS[addon])
+    assert core.SECTION_RE.findall(block) == list(core.ADDONS[addon])
+    with open(os.path.join(ROOT, addon), encoding="utf-8") as f:
+        defined = module_names(f.read()) | set(dir(builtins))
+    assert global_reads(symtable.symtable(block, addon, "exec")) - defined == set()
+
+def test_vendor_rewrites_only_the_block_and_keeps_newlines(tmp_path):
+    path = tmp_path / "addon.py"
+    stale = "\r\n".join(["head = 1", core.SHARED_BEGIN, "old = 1", core.SHARED_END, "tail = 2", ""])
+    path.write_bytes(stale.encode())
+    assert not core.vendor(str(path), check=True)
+    assert path.read_bytes() == stale.encode()
+
+    assert not core.vendor(str(path))
+    data = path.read_bytes()
+    assert data.startswith(b"head = 1\r\n" + core.SHARED_BEGIN.encode() + b"\r\n")
+    assert data.endswith(core.SHARED_END.encode() + b"\r\ntail = 2\r\n")
+    assert b"old = 1" not in data and b"\n" not in data.replace(b"\r\n", b"")
+    assert core.vendor(str(path))
+
+
+# ---------- encoders ----------
+def decoded(fmt, img):
+    """What a reader sees: rows top-down, and the channels the format stores"""
+    c = img.shape[2]
+    if fmt in ('BMP', 'TARGA') and c == 2:
+        img = img[..., [0, 0, 0, 1][:c + 2]]  # gray expanded to RGB(A)
+    if fmt == 'BMP' and c > 1:
+        img = img[..., :3]  # Pillow ignores BI_RGB alpha, checked separately
+    return img[::-1]
+
+def bmp_alpha(data, width, height):
+    offset = struct.unpack_from("<I", data, 10)[0]
+    rows = np.frombuffer(data, np.uint8, offset=offset).reshape(height, -1)
+    return rows[:, :width * 4].reshape(height, width, 4)[..., 3]
+
+@pytest.mark.parametrize("fmt", list(core.ENCODERS))
+@pytest.mark.parametrize("channels", [1, 2, 3, 4])
+@pytest.mark.parametrize("height, width", [(1, 1), (5, 7), (core.STRIP_ROWS * 2 + 3, 3)])
+def test_encoder_round_trip(fmt, channels, height, width):
+    image = pytest.importorskip("PIL.Image")
+    rng = np.random.default_rng(channels * 1000 + height)
+    img = rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+    data = core.encode_image(fmt, img)
+    with image.open(io.BytesIO(data)) as im:
+        pixels = np.asarray(im)
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    np.testing.assert_array_equal(pixels, decoded(fmt, img))
+    if fmt == 'BMP' and channels in (2, 4):
+        np.testing.assert_array_equal(bmp_alpha(data, width, height), img[..., -1])
+
+def test_bmp_gray_is_one_byte_per_pixel():
+    # the L maps optimize_map reduces to must not be widened back to 24-bit
+    gray, rgb = (core.encode_bmp(np.zeros((4, 5, c), np.uint8)) for c in (1, 3))
+    assert len(gray) == 14 + 40 + 256 * 4 + 4 * 8 and len(rgb) == 14 + 40 + 4 * 16
+    assert core.header_size(gray) == (5, 4, 1)
+
+@pytest.mark.parametrize("fmt", ['PNG', 'TIFF'])
+def test_compression_level_keeps_pixels(fmt):
+    image = pytest.importorskip("PIL.Image")
+    img = np.tile(np.arange(97, dtype=np.uint8)[None, :, None], (31, 1, 3))
+    sizes = []
+    for level in (0, 9):
+        data = core.encode_image(fmt, img, level)
+        with image.open(io.BytesIO(data)) as im:
+            np.testing.assert_array_equal(np.asarray(im), img[::-1])
+        sizes.append(len(data))
+    assert sizes[1] < sizes[0]
+
+@pytest.mark.parametrize("fmt", ['PNG', 'TARGA', 'BMP'])
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_header_size_reads_encoded_headers(fmt, channels):
+    data = core.encode_image(fmt, np.zeros((5, 7, channels), np.uint8))
+    width, height, stored = core.header_size(data, fmt)
+    assert (width, height) == (7, 5) and stored >= channels
+    # TGA has no magic: only read when the caller names the format
+    assert (core.header_size(data) is None) == (fmt == 'TARGA')
+    assert core.header_size(data[:10], fmt) is None
+
+
+# ---------- channel packing / resampling ----------
+def pillow_resize(plane, width, height, filter_name):
+    image = pytest.importorskip("PIL.Image")
+    resample = {'BOX': image.BOX, 'BILINEAR': image.BILINEAR, 'LANCZOS': image.LANCZOS}[filter_name]
+    out = np.asarray(image.fromarray(np.ascontiguousarray(plane), "F").resize((width, height), resample))
+    return (np.clip(out, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+def edge(n_in, n_out, filter_name):
+    """Output pixels whose filter reaches past the source edge: the border is
+    repeated here, Pillow renormalizes the taps inside instead"""
+    scale = n_in / n_out
+    return int(np.ceil(core.RESAMPLE_FILTERS[filter_name][1] * max(scale, 1.0) / scale)) + 1
+
+@pytest.mark.parametrize("filter_name", list(core.RESAMPLE_FILTERS))
+@pytest.mark.parametrize("n_in, n_out", [(1, 1), (7, 3), (3, 7), (1000, 999), (5, 640)])
+def test_resample_weights(filter_name, n_in, n_out):
+    idx, weights = core.resample_weights(n_in, n_out, filter_name)
+    assert idx.shape == weights.shape and len(idx) == n_out
+    assert idx.min() >= 0 and idx.max() < n_in
+    np.testing.assert_allclose(weights.sum(axis=1), 1.0, rtol=1e-5)
+
+@pytest.mark.parametrize("filter_name", list(core.RESAMPLE_FILTERS))
+@pytest.mark.parametrize("src, dst", [((61, 45), (29, 33)), ((16, 9), (48, 27)),
+                                      ((40, 700), (17, core.STRIP_ROWS * 2 + 7))])
+def test_resample_matches_pillow_inside(filter_name, src, dst):
+    (src_width, src_height), (width, height) = src, dst
+    pixels = np.random.default_rng(width).random((src_height, src_width, 4), dtype=np.float32)
+    out, inverted = np.empty((height, width), np.uint8), np.empty((height, width), np.uint8)
+    core.resample_channels(pixels.reshape(-1), 4, src_width, src_height,
+                           [(2, out, False), (2, inverted, True)], filter_name)
+    expected = pillow_resize(pixels[..., 2], width, height, filter_name)
+    my, mx = edge(src_height, height, filter_name), edge(src_width, width, filter_name)
+    np.testing.assert_array_equal(out[my:-my, mx:-mx], expected[my:-my, mx:-mx])
+    assert np.abs(out.astype(int) + inverted - 255).max() <= 1
+
+def test_resample_box_integer_factor_is_block_mean():
+    pixels = np.random.default_rng(3).random((9, 12, 2), dtype=np.float32)
+    out = np.empty((3, 4), np.uint8)
+    core.resample_channels(pixels.reshape(-1), 2, 12, 9, [(1, out, False)], 'BOX')
+    mean = pixels[..., 1].reshape(3, 3, 4, 3).mean(axis=(1, 3))
+    np.testing.assert_array_equal(out, (mean * 255.0 + 0.5).astype(np.uint8))
+
+def test_quantize_channels_rounds_clamps_and_inverts():
+    height = core.STRIP_ROWS + 5
+    pixels = np.random.default_rng(4).uniform(-0.2, 1.2, (height, 3, 4)).astype(np.float32)
+    taps = [(0, np.empty((height, 3), np.uint8), False), (3, np.empty((height, 3), np.uint8), True)]
+    core.quantize_channels(pixels.reshape(-1), 4, 3, taps)
+    for channel, out, invert in taps:
+        plane = 1.0 - pixels[..., channel] if invert else pixels[..., channel]
+        np.testing.assert_array_equal(out, (np.clip(plane * 255.0 + 0.5, 0, 255)).astype(np.uint8))
+
+
+# ---------- LOD chains ----------
+def test_lod_sizes_round_odd_sides_up():
+    assert core.lod_sizes(7, 5, 4) == [(4, 3), (2, 2), (1, 1)]  # stops at 1x1
+    assert core.lod_sizes(7, 5, 4, min_size=2) == [(4, 3), (2, 2)]
+    assert core.lod_sizes(1, 1, 3) == []
+
+@pytest.mark.parametrize("mode, expected", [('SRGB', 188), ('LINEAR', 128)])
+def test_srgb_lods_average_in_linear_light(mode, expected):
+    base = np.array([[[0], [255]], [[255], [0]]], np.uint8).repeat(3, axis=2)
+    [level] = core.lod_chain(base, 1, mode, 'BOX')
+    assert level.shape == (1, 1, 3)
+    np.testing.assert_allclose(level, expected, atol=1)
+
+@pytest.mark.parametrize("filter_name", ['BOX', 'KAISER'])
+def test_normal_lods_stay_unit_length_on_odd_sizes(filter_name):
+    vectors = np.random.default_rng(5).normal(size=(5, 7, 3))
+    vectors[..., 2] = np.abs(vectors[..., 2]) + 0.5  # tangent space: z points out
+    vectors /= np.linalg.norm(vectors, axis=2, keepdims=True)
+    base = (vectors * 127.5 + 128.0).clip(0, 255).astype(np.uint8)
+    chain = core.lod_chain(base, 3, 'NORMAL', filter_name)
+    assert [level.shape[1::-1] for level in chain] == core.lod_sizes(7, 5, 3)
+    for level in chain:
+        lengths = np.linalg.norm(level.astype(np.float64) * (2.0 / 255.0) - 1.0, axis=2)
+        np.testing.assert_allclose(lengths, 1.0, atol=0.02)
+    halved = core.halve(core.lod_decode(base, 'NORMAL'), 1, filter_name)
+    assert halved.shape == (5, 4, 3)
+
+
+# ---------- export presets ----------
+def preset(*outputs, **extra):
+    return {"name": "Test", "outputs": list(outputs), **extra}
+
+def test_validate_preset_accepts_known_and_declared_sources():
+    ok = preset({"suffix": "BaseColor", "source": "BaseColor"},
+                {"suffix": "Mask", "channels": ["Metallic", "AO", "1-Gloss.g", 1.0]},
+                sources={"Gloss": ["gloss"]})
+    assert core.validate_preset("MINE", ok) is ok
+
+@pytest.mark.parametrize("output, index", [
+    ({"suffix": "Base", "source": "BaseColour"}, 1),  # typo: would export nothing
+    ({"suffix": "Base", "source": ""}, 1),
+    ({"suffix": "Base", "source": None}, 1),
+    ({"suffix": "Base"}, 1),  # neither source nor channels
+    ({"suffix": "ORM", "channels": ["AO", "Rough", "Metallic"]}, 1),
+])
+def test_validate_preset_rejects_unknown_or_missing_source(output, index):
+    with pytest.raises(ValueError, match=rf"preset MINE output {index} "):
+        core.validate_preset("MINE", preset({"suffix": "Normal", "source": "Normal"}, output))
+
+def test_validate_preset_names_the_output_of_a_bad_channel():
+    with pytest.raises(ValueError, match=r"preset MINE output 0 \(X\): kênh không hợp lệ"):
+        core.validate_preset("MINE", preset({"suffix": "X", "channels": ["AO.q", 1, 0]}))
+
+
+# ---------- output files and names ----------
+def test_atomic_file_keeps_the_old_output_on_error(tmp_path):
+    path = str(tmp_path / "Mat_BaseColor.png")
+    core.write_atomic(path, b"old")
+    with pytest.raises(RuntimeError):
+        with core.atomic_file(path) as f:
+            f.write(b"half")
+            raise RuntimeError("encoder died")
+    assert open(path, "rb").read() == b"old" and os.listdir(tmp_path) == ["Mat_BaseColor.png"]
+
+def test_claim_avoids_foreign_files_and_this_runs_outputs(tmp_path):
+    (tmp_path / "Mat").mkdir()
+    (tmp_path / "Mat" / "Mat_BaseColor.png").write_bytes(b"not ours")
+    manifest = core.ExportManifest(str(tmp_path))
+    path = str(tmp_path / "Mat" / "Mat_BaseColor.png")
+    first, second = manifest.claim(path), manifest.claim(path)
+    assert [os.path.basename(p) for p in (first, second)] == ["Mat_BaseColor_001.png", "Mat_BaseColor_002.png"]
+    assert manifest.claim(str(tmp_path / "Mat" / "Mat_Normal.png")).endswith("Mat_Normal.png")
+
+def test_claim_reuses_own_outputs_across_reruns(tmp_path):
+    (tmp_path / "Mat").mkdir()
+    (tmp_path / "Mat" / "Mat_BaseColor.png").write_bytes(b"not ours")
+    path = str(tmp_path / "Mat" / "Mat_BaseColor.png")
+    for run in range(3):
+        manifest = core.ExportManifest(str(tmp_path))
+        target = manifest.previous_path(["Mat", "BaseColor"], ".png") or path
+        claimed = manifest.claim(target)
+        assert os.path.basename(claimed) == "Mat_BaseColor_001.png", run  # not _002, _003...
+        core.write_atomic(claimed, b"ours %d" % run)
+        manifest.record(claimed, record())
+        manifest.save()
+    assert sorted(os.listdir(tmp_path / "Mat")) == ["Mat_BaseColor.png", "Mat_BaseColor_001.png"]
+    assert (tmp_path / "Mat" / "Mat_BaseColor.png").read_bytes() == b"not ours"
+
+def test_name_index_lists_each_folder_once(tmp_path, monkeypatch):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "x.png").write_bytes(b"12345")
+    names = core.NameIndex()
+    calls = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: calls.append(path) or scandir(path))
+    assert names.exists(str(tmp_path / "a" / "x.png")) and names.size(str(tmp_path / "a" / "x.png")) == 5
+    assert not names.exists(str(tmp_path / "a" / "y.png"))
+    missing = [str(tmp_path / "a"), str(tmp_path / "b"), str(tmp_path / "b")]
+    assert names.missing_folders(missing) == [str(tmp_path / "b")]
+    names.created(str(tmp_path / "b"))
+    assert names.missing_folders(missing) == [] and len(calls) == 2  # a, b
+
+def test_name_index_off_disk_only_tracks_this_run(tmp_path):
+    (tmp_path / "x.png").write_bytes(b"")
+    names = core.NameIndex(on_disk=False)
+    assert not names.exists(str(tmp_path / "x.png"))
+    assert names.unique(str(tmp_path / "x.png")).endswith("x.png")
+    assert names.unique(str(tmp_path / "x.png")).endswith("x_001.png")
+
+
+# ---------- manifest (incremental export) ----------
+def record(h="aa", **extra):
+    return {"key": ["Mat", "BaseColor"], "hash": h, "format": "PNG", **extra}
+
+def exported(root, rel, data=b"png"):
+    """One finished run: `rel` written under `root` and saved in the manifest"""
+    manifest = core.ExportManifest(str(root))
+    path = os.path.join(str(root), *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    core.write_atomic(path, data)
+    manifest.record(path, record())
+    manifest.save()
+    return path
+
+def test_manifest_skips_only_unchanged_outputs(tmp_path):
+    path = exported(tmp_path, "Mat/Mat_BaseColor.png")
+    manifest = core.ExportManifest(str(tmp_path))
+    assert manifest.is_current(path, record())
+    assert not manifest.is_current(path, record("bb"))  # new source content
+    assert not manifest.is_current(path, record(format="TARGA"))  # record keys are all compared
+    assert not manifest.is_current(path.replace("Mat_", "Other_"), record())
+    assert manifest.skip(path, record()) and not manifest.skip(path, record("bb"))
+    assert manifest.skipped == 1
+    assert not core.ExportManifest(str(tmp_path), incremental=False).is_current(path, record())
+
+def test_manifest_sees_outputs_changed_on_disk(tmp_path):
+    path = exported(tmp_path, "Mat/Mat_BaseColor.png")
+    with open(path, "ab") as f:
+        f.write(b"edited")
+    assert not core.ExportManifest(str(tmp_path)).is_current(path, record())
+    os.remove(path)
+    assert not core.ExportManifest(str(tmp_path)).is_current(path, record())
+
+def test_manifest_previous_path_finds_the_output_of_a_record(tmp_path):
+    path = exported(tmp_path, "Mat/Mat_BaseColor_001.png")
+    manifest = core.ExportManifest(str(tmp_path), incremental=False)
+    assert manifest.previous_path(["Mat", "BaseColor"], ".png") == path
+    assert manifest.previous_path(["Mat", "BaseColor"], ".tga") is None  # format changed
+    assert manifest.previous_path(["Mat", "Normal"], ".png") is None
+    os.remove(path)
+    assert core.ExportManifest(str(tmp_path)).previous_path(["Mat", "BaseColor"], ".png") is None
+
+@pytest.mark.parametrize("content", [b"{broken", b'{"version": 999, "files": {"a.png": {}}}', b"[]"])
+def test_manifest_ignores_unreadable_or_foreign_files(tmp_path, content):
+    (tmp_path / core.MANIFEST_NAME).write_bytes(content)
+    manifest = core.ExportManifest(str(tmp_path))
+    assert manifest.entries == {} and not manifest.is_current(str(tmp_path / "a.png"), {})
+
+
+# ---------- blob store (dedupe) ----------
+def job(root, rel, h="aa", **extra):
+    path = os.path.join(str(root), *rel.split("/"))
+    return {"action": "encode", "path": path, "record": record(h), "memory": 100, **extra}
+
+def test_dedupe_plan_groups_identical_outputs(tmp_path):
+    store = core.BlobStore(str(tmp_path))
+    a, b, c = job(tmp_path, "A/A.png"), job(tmp_path, "B/B.png"), job(tmp_path, "C/C.png", "cc")
+    lod = job(tmp_path, "D/D.png", lods=[{}])
+    core.dedupe_plan([a, b, c, lod], store, core.NameIndex())
+    assert (a["action"], b["action"], c["action"], lod["action"]) == ("encode", "dedupe", "encode", "encode")
+    assert a["links"] == [(a["path"], a["record"]), (b["path"], b["record"])]
+    assert os.path.dirname(a["blob"]) == store.dir and "blob" not in c and "blob" not in lod
+
+def test_dedupe_plan_links_to_a_blob_left_by_an_earlier_run(tmp_path):
+    store = core.BlobStore(str(tmp_path))
+    single = job(tmp_path, "A/A.png")
+    os.makedirs(store.dir)
+    open(store.path(core.blob_key(single), ".png"), "wb").close()
+    core.dedupe_plan([single], store, core.NameIndex())
+    assert single["action"] == "link" and single["memory"] == 0 and single["links"] == [(single["path"], single["record"])]
+
+    again = job(tmp_path, "A/A.png")  # archive output: blobs on disk don't count
+    core.dedupe_plan([again], store, core.NameIndex(), reuse=False)
+    assert again["action"] == "encode" and "blob" not in again
+    disabled = [job(tmp_path, "A/A.png"), job(tmp_path, "B/B.png")]
+    core.dedupe_plan(disabled, core.BlobStore(str(tmp_path), enabled=False), core.NameIndex())
+    assert [j["action"] for j in disabled] == ["encode", "encode"]
+
+def publish_group(tmp_path, store, data=b"pixels"):
+    manifest = core.ExportManifest(str(tmp_path))
+    carrier, other = job(tmp_path, "A/A.png"), job(tmp_path, "B/B.png")
+    core.dedupe_plan([carrier, other], store, manifest.names)
+    for folder in (store.dir, tmp_path / "A", tmp_path / "B"):
+        os.makedirs(folder, exist_ok=True)
+    core.write_atomic(carrier["blob"] + ".part", data)
+    store.publish(carrier, manifest)
+    return manifest, carrier
+
+def test_publish_links_every_output_of_the_group(tmp_path):
+    store = core.BlobStore(str(tmp_path))
+    manifest, carrier = publish_group(tmp_path, store)
+    blob = carrier["blob"]
+    assert not os.path.exists(blob + ".part")
+    for path, _ in carrier["links"]:
+        assert open(path, "rb").read() == b"pixels" and os.path.samefile(path, blob)
+        assert manifest.entries[manifest.relpath(path)]["blob"] == manifest.relpath(blob)
+    assert (store.deduped, store.saved, dict(store.linked)) == (1, 6, {"hardlink": 2})
+
+def test_link_falls_back_to_copy_and_remembers_it(tmp_path, monkeypatch, capsys):
+    calls = []
+
+    def no_hardlink(src, dst):
+        calls.append(dst)
+        raise OSError("cross-device link")
+    monkeypatch.setattr(core, "LINKERS", (("hardlink", no_hardlink), ("copy", shutil.copyfile)))
+    store = core.BlobStore(str(tmp_path))
+    manifest, carrier = publish_group(tmp_path, store)
+    assert len(calls) == 1 and store.modes == ["copy"] and dict(store.linked) == {"copy": 2}
+    for path, _ in carrier["links"]:
+        assert open(path, "rb").read() == b"pixels" and not os.path.samefile(path, carrier["blob"])
+    assert "hardlink" in capsys.readouterr().out
+    assert not [name for name in os.listdir(tmp_path / "A") if name.endswith(".qlink")]
+
+def test_link_raises_when_even_copy_fails(tmp_path):
+    store = core.BlobStore(str(tmp_path))
+    blob = tmp_path / "blob.png"
+    blob.write_bytes(b"pixels")
+    with pytest.raises(OSError):
+        store.link(str(blob), str(tmp_path / "no_folder" / "out.png"))
+    assert store.modes == ["copy"] and not store.linked
+
+def test_prune_drops_unreferenced_blobs_and_parts(tmp_path):
+    store = core.BlobStore(str(tmp_path))
+    manifest, carrier = publish_group(tmp_path, store)
+    for name in ("stale.png", "crashed.png.part"):
+        open(os.path.join(store.dir, name), "wb").close()
+    store.prune(manifest)
+    assert os.listdir(store.dir) == [os.path.basename(carrier["blob"])]
+    manifest.entries.clear()
+    store.prune(manifest)
+    assert os.listdir(store.dir) == []
+
+
+# ---------- archive output ----------
+def write_archive(tmp_path, kind):
+    archive = core.ArchiveWriter(str(tmp_path / "maps"), kind, 3)
+    entry = core.ArchiveEntry(archive, [archive.name(str(tmp_path / "maps" / "A" / "A_BaseColor.png")),
+                                        archive.name(str(tmp_path / "maps" / "B" / "B_BaseColor.png"))])
+    assert entry.write(b"png bytes") == entry.size == 9
+    archive.add(["A/A_Roughness.tga"], b"tga bytes")
+    assert archive.entries == 3 and not os.path.exists(archive.path)  # <archive>.part until close()
+    archive.close()
+    assert os.listdir(tmp_path) == [os.path.basename(archive.path)]
+    return archive.path
+
+def test_archive_writes_nothing_without_entries(tmp_path):
+    archive = core.ArchiveWriter(str(tmp_path / "maps"), 'ZIP', 6)
+    archive.close()
+    assert os.listdir(tmp_path) == []
+
+def test_zip_archive_holds_every_name_of_a_group(tmp_path):
+    with zipfile.ZipFile(write_archive(tmp_path, 'ZIP')) as zf:
+        assert {info.filename: (zf.read(info), info.compress_type) for info in zf.infolist()} == {
+            "A/A_BaseColor.png": (b"png bytes", zipfile.ZIP_STORED),  # already compressed
+            "B/B_BaseColor.png": (b"png bytes", zipfile.ZIP_STORED),
+            "A/A_Roughness.tga": (b"tga bytes", zipfile.ZIP_DEFLATED),
+        }
+
+def test_tar_zst_round_trip_stores_a_group_as_hardlinks(tmp_path):
+    zstd = core.zstd_module()
+    if zstd is None:
+        pytest.skip(core.ZSTD_MISSING)
+    path = write_archive(tmp_path, 'TAR_ZST')
+    with open(path, "rb") as f:
+        if hasattr(zstd, "ZstdDecompressor"):
+            data = zstd.ZstdDecompressor().stream_reader(f).read()
+        else:
+            data = zstd.decompress(f.read())
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        members = tar.getmembers()
+        assert [(m.name, m.type) for m in members] == [
+            ("A/A_BaseColor.png", tarfile.REGTYPE), ("B/B_BaseColor.png", tarfile.LNKTYPE),
+            ("A/A_Roughness.tga", tarfile.REGTYPE)]
+        assert members[1].linkname == "A/A_BaseColor.png"
+        tar.extractall(tmp_path / "out", filter="data")
+    assert (tmp_path / "out" / "B" / "B_BaseColor.png").read_bytes() == b"png bytes"
+    assert (tmp_path / "out" / "A" / "A_Roughness.tga").read_bytes() == b"tga bytes"
+
+
+# ---------- atlas packing ----------
+def overlaps(rects):
+    return any(ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+               for i, (ax, ay, aw, ah) in enumerate(rects) for bx, by, bw, bh in rects[i + 1:])
+
+def test_pack_skyline_fits_or_reports_none():
+    sizes = [(3, 3), (1, 4), (4, 1), (2, 2), (1, 1), (5, 2)]
+    positions = core.pack_skyline(sizes, 8, 8)
+    rects = [(x, y, w, h) for (x, y), (w, h) in zip(positions, sizes)]
+    assert all(x >= 0 and y >= 0 and x + w <= 8 and y + h <= 8 for x, y, w, h in rects)
+    assert not overlaps(rects)
+    assert core.pack_skyline([(3, 3), (3, 3)], 4, 4) is None
+    assert core.pack_skyline([(5, 1)], 4, 4) is None
+
+@pytest.mark.parametrize("seed", range(5))
+def test_atlas_layout_is_tight_and_padded(seed):
+    rng = np.random.default_rng(seed)
+    sizes = [tuple(int(v) for v in rng.integers(1, 300, 2)) for _ in range(int(rng.integers(1, 12)))]
+    padding = int(rng.integers(0, 5))
+    width, height, scale, rects = core.atlas_layout(sizes, 4096, padding)
+    assert scale == 1.0 and [(w, h) for _, _, w, h in rects] == sizes
+    assert width & (width - 1) == 0 and height in (width, width // 2)
+    padded = [(x - padding, y - padding, w + 2 * padding, h + 2 * padding) for x, y, w, h in rects]
+    assert all(x >= 0 and y >= 0 and x + w <= width and y + h <= height for x, y, w, h in padded)
+    assert not overlaps(padded)
+
+def test_atlas_layout_scales_down_to_max_size():
+    sizes = [(512, 512)] * 5 + [(300, 100)]
+    width, height, scale, rects = core.atlas_layout(sizes, 1024, 2)
+    assert (width, height) <= (1024, 1024) and scale < 1.0
+    assert [(w, h) for _, _, w, h in rects] == [(max(1, int(w * scale)), max(1, int(h * scale))) for w, h in sizes]
+    assert not overlaps([(x - 2, y - 2, w + 4, h + 4) for x, y, w, h in rects])
+
+def test_atlas_layout_fails_when_padding_alone_does_not_fit():
+    with pytest.raises(ValueError):
+        core.atlas_layout([(4, 4)] * 20, 16, 2)